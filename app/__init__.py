@@ -1,4 +1,4 @@
-from flask import Flask
+from flask import Flask, g, session
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from datetime import datetime
@@ -7,14 +7,21 @@ from datetime import datetime
 db = SQLAlchemy()
 migrate = Migrate()
 
-def create_app(config_name='default'):
+def create_app(config_name='default', config_overrides=None):
     app = Flask(__name__)
     
-    # Load configuration from config.py
+    # Load configuration from config.py, then any overrides (e.g. for compute pool workers)
     from .config import config
     app.config.from_object(config[config_name])
+    app.config['CONFIG_NAME'] = config_name
+    if config_overrides:
+        app.config.update(config_overrides)
     config[config_name].init_app(app)
     
+    # JSON responses encode NumPy values, with orjson when available (JSON_BACKEND)
+    from .utils.json_provider import init_json
+    init_json(app)
+    
     # Initialize extensions with app
     db.init_app(app)
     migrate.init_app(app, db)
@@ -28,11 +35,41 @@ def create_app(config_name='default'):
     app.register_blueprint(data_bp, url_prefix='/data')
     app.register_blueprint(analysis_bp, url_prefix='/analysis')
     
+    # Opt-in request profiling (PROFILING)
+    from .utils.profiling import init_profiling
+    if init_profiling(app) is not None:
+        from .routes.debug import debug_bp
+        app.register_blueprint(debug_bp, url_prefix='/debug')
+    
+    # Opt-in Prometheus metrics (METRICS)
+    from .utils.metrics import init_metrics
+    if init_metrics(app) is not None:
+        from .routes.metrics import metrics_bp
+        app.register_blueprint(metrics_bp)
+    
+    # Opt-in worker processes for analysis API calculations (ANALYSIS_WORKERS)
+    from .utils.compute_pool import init_compute_pool
+    init_compute_pool(app)
+    
+    # Register CLI commands
+    from .cli import import_command, set_password_command, sync_oura_command
+    app.cli.add_command(import_command)
+    app.cli.add_command(set_password_command)
+    app.cli.add_command(sync_oura_command)
+    
+    # Scope each request's data to the user chosen in the session
+    @app.before_request
+    def load_user():
+        g.user_id = session.get('user_id')
+    
     # Register Jinja2 context processors
     @app.context_processor
     def utility_processor():
+        from .models.base import User, current_user_id
+        user = db.session.get(User, current_user_id())
         return {
-            'now': datetime.now
+            'now': datetime.now,
+            'current_username': user.username if user else ''
         }
     
     # Create database tables if they don't exist
@@ -0,0 +1,182 @@
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from flask import Flask, current_app, g
+from flask.cli import FlaskGroup, with_appcontext
+
+from . import db
+from .models.base import User
+from .utils.chronometer_importer import ChronometerImporter
+from .utils.oura_sync import OuraSyncScheduler
+
+
+def _expand_paths(patterns):
+    """Expand glob patterns into a sorted, de-duplicated list of files"""
+    paths = {}
+    for pattern in patterns:
+        matches = sorted(glob.glob(os.path.expanduser(pattern)))
+        if not matches:
+            raise click.BadParameter(f"No files match '{pattern}'", param_hint='PATTERNS')
+        paths.update(dict.fromkeys(matches))
+    return list(paths)
+
+
+def _init_worker():
+    """Give each worker process an app context for the importer's logging
+
+    Workers only parse files, so a bare app (no database) is enough.
+    """
+    Flask('health_tracker_import').app_context().push()
+
+
+def _parse_chronometer_file(path):
+    """Parse one Chronometer export; runs in a worker process"""
+    nutrition, categories, row_count = ChronometerImporter().process_csv(path)
+    return path, row_count, nutrition, categories
+
+
+def _merge(records, merged):
+    """Merge records into merged, keyed by (date, metric_name); later files win"""
+    for record in records:
+        merged[(record['date'], record['metric_name'])] = record
+
+
+def _collect(paths, result):
+    """Gather parse results in file order, reporting (and skipping) files that fail"""
+    parsed = []
+    for path in paths:
+        try:
+            parsed.append(result(path))
+        except Exception as e:
+            click.echo(f"Skipping '{path}': {e}", err=True)
+    return parsed
+
+
+@click.command('import')
+@click.argument('patterns', nargs=-1, required=True)
+@click.option('--categories', is_flag=True, help='Also store per-category energy totals.')
+@click.option('--workers', type=int, default=None,
+              help='Parser processes (default: one per CPU, at most one per file).')
+@click.option('--dry-run', is_flag=True, help='Parse and report without writing to the database.')
+@click.option('--user', 'username', default=None,
+              help='User to import for, created if needed (default: the default user).')
+@with_appcontext
+def import_command(patterns, categories, workers, dry_run, username):
+    """Bulk import Chronometer CSV exports matching PATTERNS.
+
+    Files are parsed in parallel and their daily totals merged, with later
+    files (patterns in the order given, each expanded in sorted order)
+    replacing earlier ones for the same day and metric, which is the same
+    result as importing them one at a time. Days whose totals are unchanged
+    since the last import are skipped, and the rest are written in a single
+    transaction.
+    """
+    paths = _expand_paths(patterns)
+    if username:
+        g.user_id = User.get_or_create(username).id
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+
+    start = time.perf_counter()
+    if workers == 1:
+        parsed = _collect(paths, _parse_chronometer_file)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = {path: executor.submit(_parse_chronometer_file, path) for path in paths}
+            parsed = _collect(paths, lambda path: futures[path].result())
+    parse_time = time.perf_counter() - start
+
+    total_rows = sum(row_count for _, row_count, _, _ in parsed)
+    merged = {}
+    for _, _, nutrition, category_data in parsed:
+        _merge(nutrition, merged)
+        if categories:
+            _merge(category_data, merged)
+    records = list(merged.values())
+
+    click.echo(
+        f"Parsed {len(parsed)}/{len(paths)} files with {workers} worker(s): {total_rows:,} rows, "
+        f"{total_bytes / 2 ** 20:.1f} MB in {parse_time:.2f} s "
+        f"({total_rows / max(parse_time, 1e-9):,.0f} rows/s, {total_bytes / 2 ** 20 / max(parse_time, 1e-9):.1f} MB/s)"
+    )
+
+    # Days whose totals match the last import's fingerprints are left alone
+    start = time.perf_counter()
+    changed, day_fingerprints = ChronometerImporter().store_changed_days(
+        records, data_kind='nutrition and food category' if categories else 'nutrition', dry_run=dry_run)
+    store_time = time.perf_counter() - start
+    days = len({record['date'] for record in records})
+    click.echo(f"{len(day_fingerprints):,} of {days:,} days changed since the last import")
+
+    if dry_run or not changed:
+        click.echo(f"{len(changed):,} daily records {'would be' if dry_run else 'were'} stored")
+        return
+
+    click.echo(
+        f"Stored {len(changed):,} daily records over {len(day_fingerprints):,} days in {store_time:.2f} s "
+        f"({len(changed) / max(store_time, 1e-9):,.0f} records/s)"
+    )
+
+
+def _report_sync(result):
+    click.echo(
+        f"user {result.user_id}: {result.status}, {result.row_count:,} records, "
+        f"{result.request_count} requests in {result.duration:.2f} s"
+    )
+
+
+@click.command('sync-oura')
+@click.option('--once', is_flag=True, help='Sync the accounts that are due, then exit.')
+@click.option('--workers', type=int, default=None, help='Accounts synced at once (default: OURA_SYNC_WORKERS).')
+@click.option('--interval', type=int, default=None,
+              help='Seconds between syncs of an account (default: OURA_SYNC_INTERVAL).')
+@with_appcontext
+def sync_oura_command(once, workers, interval):
+    """Periodically sync Oura data for every user with a stored token.
+
+    Each sync fetches the days since the account's last successful sync and
+    is recorded in the sync history. Runs until interrupted unless --once
+    is given.
+    """
+    scheduler = OuraSyncScheduler(current_app._get_current_object(), workers=workers, interval=interval)
+    if once:
+        # Sync every account now, rather than waiting for its jittered start
+        results = scheduler.run_once(now=float('inf'))
+        for result in results:
+            _report_sync(result)
+        click.echo(f"Synced {len(results)} account(s)")
+        return
+    
+    click.echo(f"Syncing Oura accounts every {scheduler.interval} s with {scheduler.workers} worker(s)")
+    try:
+        scheduler.run_forever(report=_report_sync)
+    except KeyboardInterrupt:
+        click.echo("Stopped")
+
+
+@click.command('set-password')
+@click.argument('username')
+@click.password_option(help='New password (prompted for if not given).')
+@with_appcontext
+def set_password_command(username, password):
+    """Set the password USERNAME signs in with, creating the user if needed."""
+    user = User.get_or_create(username)
+    user.set_password(password)
+    db.session.commit()
+    click.echo(f"Password set for {user.username}")
+
+
+def _create_cli_app():
+    from . import create_app
+    return create_app(os.environ.get('FLASK_ENV', 'development'))
+
+
+cli = FlaskGroup(create_app=_create_cli_app, help='Health Tracker management commands.')
+
+
+def main():
+    """Entry point for the health-tracker console script"""
+    cli()
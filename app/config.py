@@ -9,15 +9,76 @@ class Config:
     
     # File upload settings
     UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 64 * 1024 * 1024))  # bytes per request
     
     # Oura API settings
     OURA_API_BASE_URL = 'https://api.ouraring.com'
+    # Also store min/max/std of the per-session HR, HRV and respiration averages for each night
+    OURA_SESSION_STATS = os.environ.get('OURA_SESSION_STATS', '').lower() in ('1', 'true', 'yes')
+    
+    # On-disk cache of Oura API responses (defaults to <instance>/oura_cache)
+    OURA_RESPONSE_CACHE = os.environ.get('OURA_RESPONSE_CACHE', '').lower() in ('1', 'true', 'yes')
+    OURA_CACHE_DIR = os.environ.get('OURA_CACHE_DIR')
+    OURA_CACHE_TTL = int(os.environ.get('OURA_CACHE_TTL', 6 * 3600))  # seconds, for ranges ending recently
+    OURA_CACHE_SETTLE_DAYS = 2  # ranges ending this many days before the fetch never expire
+    
+    # Scheduled Oura syncs of every user with a stored token (health-tracker sync-oura)
+    OURA_SYNC_INTERVAL = int(os.environ.get('OURA_SYNC_INTERVAL', 3600))  # seconds between an account's syncs
+    OURA_SYNC_JITTER = int(os.environ.get('OURA_SYNC_JITTER', 600))  # seconds of random spread around that
+    OURA_SYNC_WORKERS = int(os.environ.get('OURA_SYNC_WORKERS', 4))
+    OURA_SYNC_LOOKBACK_DAYS = 30  # days fetched on an account's first sync
+    # Requests allowed per account per period; Oura allows 5000 per 5 minutes
+    OURA_SYNC_RATE_LIMIT = int(os.environ.get('OURA_SYNC_RATE_LIMIT', 5000))
+    OURA_SYNC_RATE_PERIOD = 300  # seconds
+    OURA_SYNC_MAX_WAIT = 30  # seconds a sync waits for its budget before being deferred
+    
+    # Resampling significance tests (bootstrap / permutation)
+    RESAMPLING_WORKERS = int(os.environ.get('RESAMPLING_WORKERS', 1))  # 1 runs inline
+    RESAMPLING_TIME_BUDGET = float(os.environ.get('RESAMPLING_TIME_BUDGET', 10.0))  # seconds per correlation
+    RESAMPLING_MAX_RESAMPLES = int(os.environ.get('RESAMPLING_MAX_RESAMPLES', 100000))  # larger requests are capped
+    
+    # Correlation tables and multiple correlations of at least this many metric pairs
+    # are split across a persistent pool of CORRELATION_WORKERS processes (1 runs inline)
+    CORRELATION_WORKERS = int(os.environ.get('CORRELATION_WORKERS', 1))
+    CORRELATION_POOL_MIN_PAIRS = int(os.environ.get('CORRELATION_POOL_MIN_PAIRS', 2000))
+    
+    # JSON encoder of responses: 'auto' (orjson when installed), 'orjson' or 'stdlib'
+    JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto')
+    
+    # Points per series in dashboard and metric data responses; longer series are downsampled
+    SERIES_MAX_POINTS = int(os.environ.get('SERIES_MAX_POINTS', 500))
+    
+    # Worker processes running analysis API calculations off the server's threads (0 runs them inline)
+    ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', 0))
+    ANALYSIS_TIMEOUT = float(os.environ.get('ANALYSIS_TIMEOUT', 120))  # seconds a request waits for a result
+    # Raising the workers' nice value favors light requests on a busy host, at the cost of calculation throughput
+    ANALYSIS_NICENESS = int(os.environ.get('ANALYSIS_NICENESS', 0))
+    # Calls other than resampling ones are offloaded once their recent calls averaged this much CPU time
+    ANALYSIS_POOL_MIN_MS = float(os.environ.get('ANALYSIS_POOL_MIN_MS', 250))
+    
+    # Opt-in request profiling: Server-Timing headers and /debug/perf
+    PROFILING = os.environ.get('PROFILING', '').lower() in ('1', 'true', 'yes')
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 1.0))  # fraction of requests profiled
+    PROFILING_SLOW_MS = float(os.environ.get('PROFILING_SLOW_MS', 500))  # logged as slow at or above this
+    PROFILING_SLOW_LOG_SIZE = 100  # slow requests kept for /debug/perf
+    # Peak memory via tracemalloc, which itself slows profiled requests several times over
+    PROFILING_TRACE_MEMORY = os.environ.get('PROFILING_TRACE_MEMORY', '').lower() in ('1', 'true', 'yes')
+    
+    # Opt-in Prometheus metrics at /metrics: request latency, import rows, cache hits, pool use
+    METRICS = os.environ.get('METRICS', '').lower() in ('1', 'true', 'yes')
+    
+    # Seconds a SQLite connection waits for another's write lock (e.g. concurrent syncs)
+    SQLITE_BUSY_TIMEOUT = 30
     
     @staticmethod
     def init_app(app):
         """Initialize application with this configuration"""
         # Create upload folder if it doesn't exist
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        
+        if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+            engine_options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+            engine_options.setdefault('connect_args', {}).setdefault('timeout', app.config['SQLITE_BUSY_TIMEOUT'])
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -28,6 +89,8 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     SERVER_NAME = 'localhost'
+    RESAMPLING_WORKERS = 1
+    CORRELATION_WORKERS = 1
 
 class ProductionConfig(Config):
     """Production configuration"""
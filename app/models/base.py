@@ -1,11 +1,79 @@
 from .. import db
-from datetime import datetime
+from datetime import datetime, timedelta
+from flask import g, has_app_context
+from sqlalchemy import event
+from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy.orm import Session, with_loader_criteria
+
+# Owner of data created outside any user's request (CLI, single-user installs)
+DEFAULT_USER_ID = 1
+
+class User(db.Model):
+    """Person whose health data is stored; every data type and data point has an owner
+    
+    The default user needs no password: it is whom every visitor sees
+    without signing in. Other users sign in with their password, and users
+    without one (created by the import command) cannot be signed in to
+    until it is set with the set-password command.
+    """
+    __tablename__ = 'users'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), nullable=False, unique=True)
+    password_hash = db.Column(db.String(255), nullable=True)
+    # Stored in plaintext, as the Oura API needs it back for scheduled syncs:
+    # protect the database file as you would the token itself
+    oura_token = db.Column(db.String(255), nullable=True)
+    # Incremented by every write to the user's data types, data points or coverage (see _bump_data_versions)
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<User {self.id}:{self.username}>"
+    
+    @classmethod
+    def get_or_create(cls, username):
+        """Get the user with this username, creating it if needed (committed)"""
+        user = cls.query.filter_by(username=username).first()
+        if not user:
+            user = cls(username=username)
+            db.session.add(user)
+            db.session.commit()
+        return user
+    
+    def set_password(self, password):
+        """Store a salted hash of password (not committed)"""
+        self.password_hash = generate_password_hash(password)
+    
+    def check_password(self, password):
+        """Whether password matches; always False for users without a password"""
+        return bool(self.password_hash) and check_password_hash(self.password_hash, password)
+
+@event.listens_for(User.__table__, 'after_create')
+def _create_default_user(target, connection, **kw):
+    connection.execute(target.insert().values(id=DEFAULT_USER_ID, username='default',
+                                              created_at=datetime.utcnow()))
+
+def current_user_id():
+    """Id of the user whose data is being read and written
+    
+    This is g.user_id when set (per request, from the session, or by the
+    import command), otherwise the default user.
+    """
+    if has_app_context():
+        return g.get('user_id') or DEFAULT_USER_ID
+    return DEFAULT_USER_ID
+
+def data_version(user_id):
+    """The user's data_version: a single primary key lookup, for caches to tell whether the user's data changed"""
+    return db.session.execute(db.select(User.data_version).where(User.id == user_id)).scalar() or 0
 
 class DataType(db.Model):
     """Model for storing metadata about health data types and sources"""
     __tablename__ = 'data_types'
     
     id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, default=current_user_id)
     source = db.Column(db.String(50), nullable=False)  # 'oura', 'chronometer', 'custom', etc.
     metric_name = db.Column(db.String(100), nullable=False)
     metric_units = db.Column(db.String(50))
@@ -15,9 +83,9 @@ class DataType(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Ensure unique combinations of source and metric_name
+    # Ensure unique combinations of source and metric_name for each user
     __table_args__ = (
-        db.UniqueConstraint('source', 'metric_name', name='unique_metric_type'),
+        db.UniqueConstraint('user_id', 'source', 'metric_name', name='unique_metric_type'),
     )
     
     # Relationship to HealthData
@@ -94,6 +162,8 @@ class HealthData(db.Model):
     __tablename__ = 'health_data'
     
     id = db.Column(db.Integer, primary_key=True)
+    # Denormalized from data_type so per-user scans use an index leading with the owner
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, default=current_user_id)
     date = db.Column(db.Date, nullable=False, index=True)
     data_type_id = db.Column(db.Integer, db.ForeignKey('data_types.id'), nullable=False)
     metric_value = db.Column(db.Float, nullable=False)
@@ -103,6 +173,8 @@ class HealthData(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('date', 'data_type_id', name='unique_metric_per_day'),
+        db.Index('ix_health_data_user_date', 'user_id', 'date'),
+        db.Index('ix_health_data_user_type_date', 'user_id', 'data_type_id', 'date'),
     )
     
     def __repr__(self):
@@ -130,3 +202,220 @@ class HealthData(db.Model):
         )
         
         return health_data
+
+class DataCoverage(db.Model):
+    """Date range over which a data type's missing days have an implicit value
+    
+    Sparse metrics such as Oura tags store only the days with a non-zero value.
+    A coverage row records that every other day from start_date to end_date is
+    fill_value (normally 0), and the analyzer fills those days in when reading.
+    """
+    __tablename__ = 'data_coverage'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    data_type_id = db.Column(db.Integer, db.ForeignKey('data_types.id'), nullable=False, index=True)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    fill_value = db.Column(db.Float, nullable=False, default=0.0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    data_type = db.relationship('DataType', backref=db.backref('coverage', lazy='dynamic', cascade='all, delete-orphan'))
+    
+    def __repr__(self):
+        return f"<DataCoverage {self.data_type_id} {self.start_date}..{self.end_date}={self.fill_value}>"
+    
+    @classmethod
+    def extend(cls, data_type_id, start_date, end_date, fill_value=0.0):
+        """Record coverage for a date range, merging it with overlapping or adjacent ranges
+        
+        Returns:
+            The merged DataCoverage record (added to the session, not committed)
+        """
+        overlapping = cls.query.filter(
+            cls.data_type_id == data_type_id,
+            cls.fill_value == fill_value,
+            cls.start_date <= end_date + timedelta(days=1),
+            cls.end_date >= start_date - timedelta(days=1)
+        ).order_by(cls.start_date).all()
+        
+        if not overlapping:
+            coverage = cls(data_type_id=data_type_id, start_date=start_date,
+                           end_date=end_date, fill_value=fill_value)
+            db.session.add(coverage)
+            return coverage
+        
+        coverage = overlapping[0]
+        coverage.start_date = min([start_date] + [c.start_date for c in overlapping])
+        coverage.end_date = max([end_date] + [c.end_date for c in overlapping])
+        for extra in overlapping[1:]:
+            db.session.delete(extra)
+        return coverage
+
+class ImportFingerprint(db.Model):
+    """Content hash of an imported file or of one day's imported values
+    
+    Importers compare fresh hashes against these to skip files and days whose
+    content has not changed since the last import. kind is 'file' (key is the
+    file's content hash) or 'day' (key is the ISO date). record_count is the
+    number of HealthData rows the import wrote, used to notice rows deleted
+    since then.
+    """
+    __tablename__ = 'import_fingerprints'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, default=current_user_id)
+    source = db.Column(db.String(50), nullable=False)
+    kind = db.Column(db.String(10), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    digest = db.Column(db.String(64), nullable=False)
+    record_count = db.Column(db.Integer, nullable=False, default=0)
+    start_date = db.Column(db.Date, nullable=True)
+    end_date = db.Column(db.Date, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'source', 'kind', 'key', name='unique_import_fingerprint'),
+    )
+    
+    def __repr__(self):
+        return f"<ImportFingerprint {self.source}:{self.kind}:{self.key}={self.digest[:12]}>"
+    
+    @classmethod
+    def record(cls, source, kind, fingerprints):
+        """Insert or update fingerprints (not committed)
+        
+        Args:
+            source: Data source name
+            kind: 'file' or 'day'
+            fingerprints: Dict of key -> dict with 'digest', 'record_count' and
+                optionally 'start_date' / 'end_date'
+        """
+        if not fingerprints:
+            return
+        existing = {
+            fingerprint.key: fingerprint
+            for fingerprint in cls.query.filter(cls.source == source, cls.kind == kind,
+                                                cls.key.in_(list(fingerprints)))
+        }
+        for key, values in fingerprints.items():
+            fingerprint = existing.get(key)
+            if fingerprint is None:
+                fingerprint = cls(source=source, kind=kind, key=key)
+                db.session.add(fingerprint)
+            for name, value in values.items():
+                setattr(fingerprint, name, value)
+    
+    @classmethod
+    def forget(cls, source, date):
+        """Drop the fingerprints covering a day whose data was changed outside an import"""
+        cls.query.filter(
+            cls.source == source,
+            db.or_(
+                db.and_(cls.kind == 'day', cls.key == date.isoformat()),
+                db.and_(cls.kind == 'file', cls.start_date <= date, cls.end_date >= date)
+            )
+        ).delete(synchronize_session=False)
+
+class SyncRun(db.Model):
+    """One scheduled sync of a user's account with an external API
+    
+    status is 'running', then 'ok', 'error' or 'rate_limited'. start_date
+    and end_date are the range of days requested.
+    """
+    __tablename__ = 'sync_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, default=current_user_id)
+    source = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='running')
+    start_date = db.Column(db.Date, nullable=True)
+    end_date = db.Column(db.Date, nullable=True)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    duration = db.Column(db.Float, nullable=True)  # seconds
+    request_count = db.Column(db.Integer, nullable=False, default=0)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_sync_runs_user_source_started', 'user_id', 'source', 'started_at'),
+    )
+    
+    def __repr__(self):
+        return f"<SyncRun {self.source} user={self.user_id} {self.status} {self.start_date}..{self.end_date}>"
+
+# Models partitioned by owner; ORM queries only ever see the current user's rows
+OWNED_MODELS = (DataType, HealthData, ImportFingerprint, SyncRun)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _scope_to_user(execute_state):
+    """Restrict ORM selects, updates and deletes of owned models to one user
+    
+    The user is the query's user_id execution option if given, otherwise
+    current_user_id(). Queries run with the all_users execution option are
+    left unscoped.
+    """
+    if execute_state.is_column_load or execute_state.execution_options.get('all_users'):
+        return
+    if not (execute_state.is_select or execute_state.is_update or execute_state.is_delete):
+        return
+    user_id = execute_state.execution_options.get('user_id') or current_user_id()
+    execute_state.statement = execute_state.statement.options(*(
+        with_loader_criteria(model, lambda cls: cls.user_id == user_id, include_aliases=True)
+        for model in OWNED_MODELS
+    ))
+
+@event.listens_for(Session, 'before_flush')
+def _assign_owner(session, flush_context, instances):
+    """Give new data points added with a data type object that data type's owner
+    
+    Other new rows get the current user from the user_id column default.
+    """
+    for obj in session.new:
+        if isinstance(obj, HealthData) and obj.user_id is None and obj.data_type is not None:
+            if obj.data_type.user_id is None:
+                obj.data_type.user_id = current_user_id()
+            obj.user_id = obj.data_type.user_id
+
+# Models whose rows make up the data analysis caches are built from
+VERSIONED_MODELS = (DataType, HealthData, DataCoverage)
+
+def _bump_data_versions(connection, user_ids=None):
+    """Increment data_version for these users (all users when None) in the current transaction"""
+    users = User.__table__
+    statement = users.update().values(data_version=users.c.data_version + 1)
+    if user_ids is not None:
+        statement = statement.where(users.c.id.in_(user_ids))
+    connection.execute(statement)
+
+def _owner_id(obj):
+    """Id of the user owning a versioned model instance"""
+    if isinstance(obj, DataCoverage):
+        obj = obj.data_type
+    return getattr(obj, 'user_id', None) or current_user_id()
+
+@event.listens_for(Session, 'before_flush')
+def _version_flushed_writes(session, flush_context, instances):
+    """Bump data_version for every user whose data this flush inserts, changes or deletes"""
+    changed = [obj for obj in session.new | session.deleted if isinstance(obj, VERSIONED_MODELS)]
+    changed += [obj for obj in session.dirty
+                if isinstance(obj, VERSIONED_MODELS) and session.is_modified(obj, include_collections=False)]
+    if changed:
+        _bump_data_versions(session.connection(), {_owner_id(obj) for obj in changed})
+
+@event.listens_for(Session, 'do_orm_execute')
+def _version_bulk_writes(execute_state):
+    """Bump data_version for bulk updates and deletes, which bypass the flush"""
+    if not (execute_state.is_update or execute_state.is_delete):
+        return
+    mapper = execute_state.bind_mapper
+    if mapper is None or not issubclass(mapper.class_, VERSIONED_MODELS):
+        return
+    if execute_state.execution_options.get('all_users'):
+        user_ids = None
+    else:
+        user_ids = [execute_state.execution_options.get('user_id') or current_user_id()]
+    _bump_data_versions(execute_state.session.connection(), user_ids)
+
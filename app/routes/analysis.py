@@ -1,9 +1,15 @@
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, render_template, request, jsonify, current_app, flash
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 import traceback
-from ..utils.analyzer import HealthAnalyzer
+from ..utils.analyzer import HealthAnalyzer, OURA_SLEEP_METRICS
+from ..utils.compute_pool import request_analyzer
+from ..utils.downsampling import RESOLUTIONS, DOWNSAMPLE_METHODS
+from ..utils.json_provider import date_strings, nullable_floats
+from ..utils.series_format import series_response
+from ..utils.correlation import permutation_test_matrix, benjamini_hochberg, bootstrap_ci_matrix, pairwise_correlations
 from scipy import stats
+import numpy as np
 import pandas as pd
 
 analysis_bp = Blueprint('analysis', __name__)
@@ -11,7 +17,7 @@ analysis_bp = Blueprint('analysis', __name__)
 @analysis_bp.route('/correlation', methods=['GET', 'POST'])
 def correlation():
     """Correlation analysis page"""
-    analyzer = HealthAnalyzer()
+    analyzer = request_analyzer()
     metrics = analyzer.get_available_metrics()
     
     if request.method == 'POST':
@@ -27,6 +33,12 @@ def correlation():
         time_shift_oura = request.form.get('time_shift_oura', 'no') == 'yes'
         use_density = request.form.get('use_density', 'no') == 'yes'
         interpolate = request.form.get('interpolate', 'no') == 'yes'
+        try:
+            n_resamples = _form_resamples(0)
+        except ValueError as e:
+            flash(str(e), 'error')
+            return render_template('analysis/correlation.html', sources=_metrics_by_source(metrics)), 400
+        seed = request.form.get('seed', type=int)
         
         # Calculate date range
         end_date = datetime.now().date()
@@ -58,7 +70,10 @@ def correlation():
             metric2_name, metric2_source,
             start_date, end_date, method, min_pairs, interpolate, handle_missing,
             {'oura': -1} if time_shift_oura else None,
-            use_density
+            use_density,
+            n_resamples=n_resamples,
+            seed=seed,
+            time_budget=current_app.config.get('RESAMPLING_TIME_BUDGET')
         )
         
         return render_template('analysis/correlation_result.html', 
@@ -78,14 +93,30 @@ def correlation():
                                   'end_date': end_date.strftime('%Y-%m-%d') if end_date else None
                               })
     
-    # Group metrics by source for the form
+    return render_template('analysis/correlation.html', sources=_metrics_by_source(metrics))
+
+def _metrics_by_source(metrics):
+    """Group metrics by source for the correlation form"""
     sources = {}
     for metric in metrics:
         if metric['source'] not in sources:
             sources[metric['source']] = []
         sources[metric['source']].append(metric)
+    return sources
+
+def _form_resamples(default):
+    """The form's n_resamples, capped at RESAMPLING_MAX_RESAMPLES
     
-    return render_template('analysis/correlation.html', sources=sources)
+    Raises:
+        ValueError: With a message for the user if it is not a whole number of at least 0
+    """
+    try:
+        n_resamples = int(request.form.get('n_resamples') or default)
+    except ValueError:
+        raise ValueError('The number of resamples must be a whole number')
+    if n_resamples < 0:
+        raise ValueError('The number of resamples cannot be negative')
+    return min(n_resamples, current_app.config.get('RESAMPLING_MAX_RESAMPLES', 100000))
 
 @analysis_bp.route('/dashboard')
 def dashboard():
@@ -110,54 +141,62 @@ def dashboard():
     except ValueError:
         days = 30
     
-    # Get sample metrics for initial load (one from each source)
-    sample_metrics = []
-    visited_sources = set()
-    
+    # Only the catalog of metrics with enough data is rendered; each card
+    # fetches its series from /api/metric_series once it scrolls into view
+    dashboard_data = {}
     for metric in available_metrics:
-        if metric['source'] not in visited_sources and metric['count'] > 5:
-            sample_metrics.append({
+        if metric['count'] > 5:
+            dashboard_data[f"{metric['source']}:{metric['metric_name']}"] = {
                 'name': metric['metric_name'],
                 'source': metric['source'],
                 'color': f'#{hash(metric["metric_name"]) % 0xffffff:06x}'  # Generate a color based on name
-            })
-            # visited_sources.add(metric['source'])
-            # if len(sample_metrics) >= 3:  # Limit to 3 initial metrics
-            #     break
-    
-    # Load data for sample metrics
-    dashboard_data = {}
-    for metric in sample_metrics:
-        data = analyzer.get_metric_data(
-            metric['name'], metric['source'], limit=days
-        )
-        
-        if data:
-            metric_key = f"{metric['source']}:{metric['name']}"
-            dashboard_data[metric_key] = {
-                'name': metric['name'],
-                'source': metric['source'],
-                'color': metric['color'],
-                'data': [
-                    {'date': d[0].strftime('%Y-%m-%d'), 'value': float(d[1])}
-                    for d in data
-                ],
-                'units': data[0][2] if data else ''
             }
     
     return render_template('analysis/dashboard.html',
                           available_metrics=available_metrics,
                           metrics_by_source=metrics_by_source,
                           dashboard_data=dashboard_data,
-                          date_range=date_range)
+                          date_range=date_range,
+                          days=days)
+
+def _series_points(series, units=None):
+    """JSON points of a get_metric_series result, with the days behind each aggregated point"""
+    dates = np.datetime_as_string(series['dates'], unit='D').tolist()
+    values = series['values'].tolist()
+    if series['counts'] is None:
+        points = [{'date': d, 'value': v} for d, v in zip(dates, values)]
+    else:
+        points = [{'date': d, 'value': v, 'count': c}
+                  for d, v, c in zip(dates, values, series['counts'].tolist())]
+    if units is not None:
+        for point in points:
+            point['units'] = units
+    return points
+
+def _series_columns(series):
+    """A get_metric_series result's arrays, for the columnar and binary formats"""
+    columns = {'dates': series['dates'], 'values': series['values']}
+    if series['counts'] is not None:
+        columns['counts'] = series['counts']
+    return columns
 
 @analysis_bp.route('/api/metric_data')
 def metric_data():
-    """API endpoint for getting data for specific metrics"""
+    """API endpoint for getting data for specific metrics
+    
+    Query parameters resolution ('day', 'week' or 'month'), points (largest
+    number of points returned, 0 for all; defaults to SERIES_MAX_POINTS) and
+    downsample ('lttb' or 'minmax') control the size of the series returned.
+    Like the other series endpoints, it answers in the columnar or binary
+    format of series_format when the Accept header asks for one.
+    """
     metric_name = request.args.get('metric_name')
     source = request.args.get('source')
     start_date_str = request.args.get('start_date')
     end_date_str = request.args.get('end_date')
+    resolution = request.args.get('resolution', 'day')
+    points = request.args.get('points', current_app.config.get('SERIES_MAX_POINTS'), type=int)
+    downsample = request.args.get('downsample', 'lttb')
     
     if not metric_name or not source:
         return jsonify({
@@ -176,28 +215,143 @@ def metric_data():
             'data': []
         })
     
+    if resolution not in RESOLUTIONS or downsample not in DOWNSAMPLE_METHODS or points is None or points < 0:
+        return jsonify({
+            'success': False,
+            'message': f"resolution must be one of {', '.join(RESOLUTIONS)}, downsample one of "
+                       f"{', '.join(DOWNSAMPLE_METHODS)} and points a whole number",
+            'data': []
+        })
+    
     analyzer = HealthAnalyzer()
-    data = analyzer.get_metric_data(metric_name, source, start_date, end_date)
+    series = analyzer.get_metric_series(metric_name, source, start_date, end_date,
+                                        resolution=resolution, points=points, method=downsample)
     
-    if not data:
+    if not series:
         return jsonify({
             'success': False,
             'message': 'No data found for the specified metric and date range',
             'data': []
         })
     
-    processed_data = [{
-        'date': d[0].strftime('%Y-%m-%d'),
-        'value': float(d[1]),
-        'units': d[2]
-    } for d in data]
-    
-    return jsonify({
+    payload = {
         'success': True,
         'message': 'Data retrieved successfully',
-        'data': processed_data,
-        'units': data[0][2] if data else ''
-    })
+        'units': series['units'],
+        'resolution': resolution,
+        'total_points': series['total']
+    }
+    return series_response(
+        dict(payload, data=_series_columns(series)),
+        lambda: dict(payload, data=_series_points(series, series['units']))
+    )
+
+@analysis_bp.route('/api/metric_series', methods=['POST'])
+def api_metric_series():
+    """API endpoint returning the series of several metrics, read with one query
+    
+    Takes 'metrics' (a list of {'name', 'source'}), optional 'start_date',
+    'end_date' and 'limit' (each metric's most recent days with data), and
+    'resolution', 'points' and 'downsample' as for /api/metric_data.
+    """
+    data = request.json or {}
+    try:
+        metrics, start_date, end_date, limit = _parse_metrics_request(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    resolution = data.get('resolution', 'day')
+    downsample = data.get('downsample', 'lttb')
+    try:
+        points = int(data.get('points', current_app.config.get('SERIES_MAX_POINTS')) or 0)
+    except (TypeError, ValueError):
+        points = None
+    if points is None or points < 0:
+        return jsonify({'error': 'points must be a whole number'}), 400
+    if resolution not in RESOLUTIONS or downsample not in DOWNSAMPLE_METHODS:
+        return jsonify({'error': f"resolution must be one of {', '.join(RESOLUTIONS)} and downsample one of "
+                                 f"{', '.join(DOWNSAMPLE_METHODS)}"}), 400
+    
+    analyzer = HealthAnalyzer()
+    results = analyzer.get_metrics_series(metrics, start_date, end_date, limit, resolution, points, downsample)
+    
+    series = {}
+    missing = []
+    for (name, source), result in results.items():
+        key = f"{source}:{name}"
+        if result is None:
+            missing.append(key)
+            continue
+        series[key] = {
+            'name': name,
+            'source': source,
+            'units': result['units'],
+            'total_points': result['total']
+        }
+    
+    def payload(encode):
+        return {
+            'resolution': resolution,
+            'series': {key: dict(meta, data=encode(results[meta['name'], meta['source']]))
+                       for key, meta in series.items()},
+            'missing': missing
+        }
+    return series_response(payload(_series_columns), lambda: payload(_series_points))
+
+@analysis_bp.route('/api/metrics_data', methods=['POST'])
+def api_metrics_data():
+    """API endpoint returning several metrics' daily values aligned on their dates
+    
+    Takes 'metrics' (a list of {'name', 'source'}) and optional 'start_date',
+    'end_date' and 'limit' (each metric's most recent days with data). The
+    response lists the days with any value once, and each metric's values for
+    those days, with null where a metric has no value.
+    """
+    try:
+        metrics, start_date, end_date, limit = _parse_metrics_request(request.json or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    result = HealthAnalyzer().get_metrics_data(metrics, start_date, end_date, limit)
+    
+    def payload(dates, column):
+        return {
+            'dates': dates,
+            'metrics': [
+                {'name': name, 'source': source, 'units': units, 'values': column(result['values'][:, i])}
+                for i, ((name, source), units) in enumerate(zip(result['metrics'], result['units']))
+            ]
+        }
+    return series_response(
+        payload(result['dates'], lambda values: values),
+        lambda: payload(date_strings(result['dates']), nullable_floats)
+    )
+
+def _parse_metrics_request(data):
+    """Read the metrics, date range and per-metric limit of a batched metrics request
+    
+    Returns:
+        Tuple (metrics, start_date, end_date, limit), metrics as (name, source) tuples
+    
+    Raises:
+        ValueError: With a message for the client if any of them is invalid
+    """
+    metrics = data.get('metrics')
+    if not metrics or not all(isinstance(m, dict) and m.get('name') and m.get('source') for m in metrics):
+        raise ValueError("Provide 'metrics' as a list of {'name', 'source'}")
+    
+    try:
+        start_date = _parse_json_date(data, 'start_date')
+        end_date = _parse_json_date(data, 'end_date')
+    except (TypeError, ValueError):
+        raise ValueError('Invalid date format, use YYYY-MM-DD')
+    
+    try:
+        limit = int(data['limit']) if data.get('limit') else None
+    except (TypeError, ValueError):
+        raise ValueError('limit must be a whole number')
+    
+    return [(m['name'], m['source']) for m in metrics], start_date, end_date, limit
 
 @analysis_bp.route('/data')
 def data():
@@ -273,8 +427,8 @@ def api_dashboard_correlation():
                 
             # Prepare data points for time series chart
             data_points = [
-                {'date': d[0].strftime('%Y-%m-%d'), 'value': float(d[1])}
-                for d in metric_data
+                {'date': day, 'value': value}
+                for day, value in zip(date_strings([d[0] for d in metric_data]), values)
             ]
                 
             return jsonify({
@@ -373,14 +527,13 @@ def api_dashboard_correlation():
                 return jsonify({'error': f'Unknown correlation method: {method}'}), 400
             
             # Prepare paired data points for scatter plot
-            paired_data = []
-            for idx, row in corr_df.iterrows():
-                if not pd.isna(row['metric1']) and not pd.isna(row['metric2']):
-                    paired_data.append({
-                        'date': idx.strftime('%Y-%m-%d'),
-                        'x': float(row['metric1']),
-                        'y': float(row['metric2'])
-                    })
+            paired_df = corr_df.dropna()
+            paired_data = [
+                {'date': day, 'x': x, 'y': y}
+                for day, x, y in zip(date_strings(paired_df.index),
+                                     paired_df['metric1'].to_numpy(dtype=float).tolist(),
+                                     paired_df['metric2'].to_numpy(dtype=float).tolist())
+            ]
             
             return jsonify({
                 'metric1': {
@@ -417,10 +570,283 @@ def api_dashboard_correlation():
             'traceback': traceback.format_exc()
         }), 500 
 
+def _parse_json_date(data, key):
+    """Parse an optional YYYY-MM-DD date from a JSON request body
+    
+    Raises:
+        ValueError: If the value is present but not a valid date
+    """
+    if not data.get(key):
+        return None
+    return datetime.strptime(data[key], '%Y-%m-%d').date()
+
+@analysis_bp.route('/api/rolling-correlation', methods=['POST'])
+def api_rolling_correlation():
+    """API endpoint returning N-day rolling correlations as time series
+    
+    Accepts either a 'metrics' list with two metrics or a 'pairs' list of
+    {'metric1': {...}, 'metric2': {...}} objects, each metric given as
+    {'name': ..., 'source': ...}.
+    """
+    try:
+        data = request.json or {}
+        
+        try:
+            start_date = _parse_json_date(data, 'start_date')
+            end_date = _parse_json_date(data, 'end_date')
+        except ValueError:
+            return jsonify({'error': 'Invalid date format, use YYYY-MM-DD'}), 400
+        
+        pairs = data.get('pairs')
+        if pairs is None:
+            metrics = data.get('metrics', [])
+            if len(metrics) < 2:
+                return jsonify({'error': 'Two metrics are required'}), 400
+            pairs = [{'metric1': metrics[0], 'metric2': metrics[1]}]
+        
+        try:
+            pair_tuples = [
+                (p['metric1']['name'], p['metric1']['source'], p['metric2']['name'], p['metric2']['source'])
+                for p in pairs
+            ]
+        except (KeyError, TypeError):
+            return jsonify({'error': 'Each metric needs a name and source'}), 400
+        
+        try:
+            window = int(data.get('window', 30))
+            min_periods = data.get('min_periods')
+            min_periods = int(min_periods) if min_periods is not None else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'window and min_periods must be whole numbers'}), 400
+        time_shift = {'oura': -1} if data.get('time_shift_oura') else None
+        
+        analyzer = request_analyzer()
+        result = analyzer.calculate_rolling_correlations(
+            pair_tuples, window, start_date, end_date, min_periods,
+            time_shift, bool(data.get('use_density', False))
+        )
+        
+        if 'error' in result:
+            return jsonify(result), 400
+        
+        return jsonify(result)
+    
+    except Exception as e:
+        return jsonify({
+            'error': f'Error calculating rolling correlation: {str(e)}',
+            'traceback': traceback.format_exc()
+        }), 500
+
+@analysis_bp.route('/api/lag-correlation', methods=['POST'])
+def api_lag_correlation():
+    """API endpoint for lag-scan cross-correlation
+    
+    Handles two scenarios:
+    1. 'metrics' with two metrics: returns the full lag curve and best lag for the pair
+    2. 'target' with one metric: scans every other metric at every lag (target-vs-all)
+    """
+    try:
+        data = request.json or {}
+        
+        try:
+            start_date = _parse_json_date(data, 'start_date')
+            end_date = _parse_json_date(data, 'end_date')
+        except ValueError:
+            return jsonify({'error': 'Invalid date format, use YYYY-MM-DD'}), 400
+        
+        try:
+            max_lag = int(data.get('max_lag', 7))
+            min_pairs = int(data.get('min_pairs', 10))
+            top_n = int(data.get('top_n', 10))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'max_lag, min_pairs and top_n must be whole numbers'}), 400
+        if max_lag < 0 or max_lag > 365:
+            return jsonify({'error': 'max_lag must be between 0 and 365 days'}), 400
+        
+        method = data.get('method', 'pearson')
+        use_density = bool(data.get('use_density', False))
+        analyzer = request_analyzer()
+        
+        target = data.get('target')
+        if target:
+            if method not in ('pearson', 'spearman'):
+                return jsonify({'error': f'Unknown correlation method for lag scan: {method}'}), 400
+            
+            results = analyzer.calculate_lag_scan(
+                target['name'], target['source'], max_lag,
+                start_date, end_date, method, min_pairs,
+                top_n, use_density,
+                bool(data.get('include_curves', False))
+            )
+            return jsonify({
+                'target': {
+                    'name': target['name'],
+                    'source': target['source'],
+                    'display': f"{target['name']} ({target['source']})"
+                },
+                'max_lag': max_lag,
+                'method': method,
+                'results': results
+            })
+        
+        metrics = data.get('metrics', [])
+        if len(metrics) < 2:
+            return jsonify({'error': 'Provide a target metric or two metrics'}), 400
+        
+        result = analyzer.calculate_lag_correlation(
+            metrics[0]['name'], metrics[0]['source'],
+            metrics[1]['name'], metrics[1]['source'],
+            max_lag, start_date, end_date, method, min_pairs, use_density
+        )
+        
+        if 'error' in result:
+            return jsonify(result), 400
+        
+        return jsonify(result)
+    
+    except Exception as e:
+        return jsonify({
+            'error': f'Error calculating lag correlation: {str(e)}',
+            'traceback': traceback.format_exc()
+        }), 500
+
+def _metric_tuples(metrics):
+    """Convert a JSON list of {'name': ..., 'source': ...} objects to (name, source) tuples
+    
+    Raises:
+        KeyError, TypeError: If an entry is missing its name or source
+    """
+    return [(metric['name'], metric['source']) for metric in metrics or []]
+
+@analysis_bp.route('/api/partial-correlation', methods=['POST'])
+def api_partial_correlation():
+    """API endpoint for partial correlation controlling for covariates
+    
+    Handles two scenarios:
+    1. 'metrics' with two metrics: partial correlation of the pair
+    2. 'target' with one metric: partial correlation of the target against every other metric
+    
+    'covariates' lists the metrics to control for, e.g. [{'name': 'Energy', 'source': 'chronometer'}].
+    """
+    try:
+        data = request.json or {}
+        
+        try:
+            start_date = _parse_json_date(data, 'start_date')
+            end_date = _parse_json_date(data, 'end_date')
+        except ValueError:
+            return jsonify({'error': 'Invalid date format, use YYYY-MM-DD'}), 400
+        
+        try:
+            covariates = _metric_tuples(data.get('covariates'))
+        except (KeyError, TypeError):
+            return jsonify({'error': 'Each covariate needs a name and source'}), 400
+        
+        method = data.get('method', 'pearson')
+        if method not in ('pearson', 'spearman'):
+            return jsonify({'error': f'Unknown correlation method for partial correlation: {method}'}), 400
+        
+        try:
+            min_pairs = int(data.get('min_pairs', 10))
+            top_n = int(data.get('top_n', 10))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'min_pairs and top_n must be whole numbers'}), 400
+        time_shift = {'oura': -1} if data.get('time_shift_oura') else None
+        use_density = bool(data.get('use_density', False))
+        analyzer = request_analyzer()
+        
+        target = data.get('target')
+        if target:
+            results = analyzer.calculate_partial_correlation_scan(
+                target['name'], target['source'], covariates,
+                start_date, end_date, method, min_pairs,
+                top_n, time_shift, use_density
+            )
+            return jsonify({
+                'target': {
+                    'name': target['name'],
+                    'source': target['source'],
+                    'display': f"{target['name']} ({target['source']})"
+                },
+                'covariates': [{'name': name, 'source': source} for name, source in covariates],
+                'method': method,
+                'results': results
+            })
+        
+        metrics = data.get('metrics', [])
+        if len(metrics) < 2:
+            return jsonify({'error': 'Provide a target metric or two metrics'}), 400
+        
+        result = analyzer.calculate_partial_correlation(
+            metrics[0]['name'], metrics[0]['source'],
+            metrics[1]['name'], metrics[1]['source'],
+            covariates, start_date, end_date, method, min_pairs,
+            time_shift, use_density
+        )
+        
+        if 'error' in result:
+            return jsonify(result), 400
+        
+        return jsonify(result)
+    
+    except Exception as e:
+        return jsonify({
+            'error': f'Error calculating partial correlation: {str(e)}',
+            'traceback': traceback.format_exc()
+        }), 500
+
+@analysis_bp.route('/api/regression', methods=['POST'])
+def api_regression():
+    """API endpoint for multiple linear regression
+    
+    Expects 'predictors' and either 'target' or 'targets', each metric given as
+    {'name': ..., 'source': ...}. All targets are fitted in one batched solve.
+    """
+    try:
+        data = request.json or {}
+        
+        try:
+            start_date = _parse_json_date(data, 'start_date')
+            end_date = _parse_json_date(data, 'end_date')
+        except ValueError:
+            return jsonify({'error': 'Invalid date format, use YYYY-MM-DD'}), 400
+        
+        try:
+            targets = _metric_tuples(data.get('targets') or ([data['target']] if data.get('target') else []))
+            predictors = _metric_tuples(data.get('predictors'))
+        except (KeyError, TypeError):
+            return jsonify({'error': 'Each metric needs a name and source'}), 400
+        
+        if not targets or not predictors:
+            return jsonify({'error': 'At least one target and one predictor are required'}), 400
+        
+        try:
+            min_pairs = int(data.get('min_pairs', 10))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'min_pairs must be a whole number'}), 400
+        
+        analyzer = request_analyzer()
+        result = analyzer.calculate_regression(
+            targets, predictors, start_date, end_date, min_pairs,
+            {'oura': -1} if data.get('time_shift_oura') else None,
+            bool(data.get('use_density', False))
+        )
+        
+        if 'error' in result:
+            return jsonify(result), 400
+        
+        return jsonify(result)
+    
+    except Exception as e:
+        return jsonify({
+            'error': f'Error calculating regression: {str(e)}',
+            'traceback': traceback.format_exc()
+        }), 500
+
 @analysis_bp.route('/correlation_table', methods=['GET', 'POST'])
 def correlation_table():
     """Correlation table analysis page"""
-    analyzer = HealthAnalyzer()
+    analyzer = request_analyzer()
     metrics = analyzer.get_available_metrics()
     
     # Group metrics by source
@@ -432,6 +858,12 @@ def correlation_table():
         sources[source].append(metric)
     
     if request.method == 'POST':
+        try:
+            n_resamples = _form_resamples(1000)
+        except ValueError as e:
+            return render_template('analysis/correlation_table.html', sources=sources, metrics=metrics,
+                                   error_message=str(e)), 400
+        
         try:
             # Get form data
             x_metrics = request.form.getlist('x_metrics')
@@ -443,6 +875,10 @@ def correlation_table():
             pvalue_threshold = float(request.form.get('pvalue_threshold', 0.05))
             time_shift_oura = request.form.get('time_shift_oura', 'no') == 'yes'
             use_density = request.form.get('use_density', 'no') == 'yes'
+            significance_test = request.form.get('significance_test', 'parametric')
+            seed = request.form.get('seed', type=int)
+            fdr_correction = request.form.get('fdr_correction', 'no') == 'yes'
+            bootstrap_ci = request.form.get('bootstrap_ci', 'no') == 'yes'
             
             # Calculate date range
             end_date = datetime.now().date()
@@ -472,16 +908,6 @@ def correlation_table():
                     'full_name': metric_str
                 })
             
-            # Define Oura sleep metrics locally for time shifting logic
-            OURA_SLEEP_METRICS = [
-                'sleep_score', 'rem_sleep', 'deep_sleep', 'light_sleep', 
-                'total_sleep', 'sleep_latency', 'awake_time', 'rem_sleep_score',
-                'deep_sleep_score', 'sleep_efficiency', 'avg_hr', 'avg_hrv',
-                'avg_resp', 'long_hr', 'long_hrv', 'long_resp', 'long_efficiency',
-                'total_sleep_score', 'sleep_latency_score', 'sleep_efficiency_score',
-                'sleep_restfulness_score', 'sleep_timing_score'
-            ]
-
             # --- Optimization Start ---
             # 1. Fetch all potentially relevant data once
             df = analyzer.get_metric_dataframe(start_date, end_date, include_derived=use_density)
@@ -522,17 +948,31 @@ def correlation_table():
                     'col_name': col_name
                 })
 
-            # 3. Calculate correlations by iterating through pairs
+            # 3. Calculate all pairs at once, on the worker pool for large tables
+            filled = handle_missing in ('interpolate', 'ffill')
+            table = pairwise_correlations(
+                _table_matrix(df, x_metric_details, time_shift_oura, 'drop'),
+                _table_matrix(df, y_metric_details, time_shift_oura, 'drop'),
+                method, min_pairs,
+                _table_matrix(df, x_metric_details, time_shift_oura, handle_missing) if filled else None,
+                _table_matrix(df, y_metric_details, time_shift_oura, handle_missing) if filled else None,
+                n_jobs=current_app.config.get('CORRELATION_WORKERS', 1),
+                min_parallel_pairs=current_app.config.get('CORRELATION_POOL_MIN_PAIRS')
+            )
+            
             correlation_matrix = []
-            for y_metric in y_metric_details:
+            for j, y_metric in enumerate(y_metric_details):
                 row = {
                     'metric': y_metric, # Use the detailed dict
                     'correlations': []
                 }
                 
-                for x_metric in x_metric_details:
-                    corr_result = {} # Initialize result for this pair
-
+                for i, x_metric in enumerate(x_metric_details):
+                    valid_pairs = int(table['valid_pairs'][i, j])
+                    calc_pairs = int(table['calc_pairs'][i, j])
+                    corr = table['coefficients'][i, j]
+                    p_value = table['p_values'][i, j]
+                    
                     # Skip self-correlation
                     if y_metric['full_name'] == x_metric['full_name']:
                         corr_result = {
@@ -542,106 +982,65 @@ def correlation_table():
                             'self': True,
                             'valid_pairs': df[y_metric['col_name']].count() if y_metric['col_name'] in df.columns else 0
                         }
-                    else:
+                    elif x_metric['col_name'] not in df.columns or y_metric['col_name'] not in df.columns:
                         x_col = x_metric['col_name']
-                        y_col = y_metric['col_name']
-
-                        # Check if columns exist in the DataFrame
-                        if x_col not in df.columns or y_col not in df.columns:
-                            corr_result = {
-                                'error': f"Metric data not found ({x_col if x_col not in df.columns else y_col})",
-                                'valid_pairs': 0,
-                                'significant': False
-                            }
-                        else:
-                            # Extract series
-                            series_x = df[x_col].copy()
-                            series_y = df[y_col].copy()
-
-                            # Apply time shift if needed
-                            shifted = False
-                            if time_shift_oura:
-                                if x_metric['source'] == 'oura' and x_metric['name'] in OURA_SLEEP_METRICS:
-                                    series_x = series_x.shift(-1)
-                                    shifted = True
-                                if y_metric['source'] == 'oura' and y_metric['name'] in OURA_SLEEP_METRICS:
-                                    series_y = series_y.shift(-1)
-                                    shifted = True
-                            
-                            # Combine into a temporary DataFrame for pairwise analysis
-                            pair_df = pd.DataFrame({'x': series_x, 'y': series_y})
-
-                            # Count valid pairs *before* interpolation/ffill
-                            valid_pair_df = pair_df.dropna()
-                            valid_pairs = len(valid_pair_df)
-
-                            if valid_pairs < min_pairs:
-                                corr_result = {
-                                    'error': f'Insufficient pairs ({valid_pairs} < {min_pairs})',
-                                    'valid_pairs': valid_pairs,
-                                    'significant': False
-                                }
-                            else:
-                                # Select data based on handle_missing strategy for calculation
-                                calc_df = None
-                                if handle_missing == 'drop':
-                                    calc_df = valid_pair_df
-                                elif handle_missing == 'interpolate':
-                                    # Interpolate original pair_df then drop NaNs that might remain at ends
-                                    calc_df = pair_df.interpolate(method='linear').dropna()
-                                elif handle_missing == 'ffill':
-                                    # Forward fill original pair_df then drop NaNs
-                                    calc_df = pair_df.ffill().dropna()
-                                else: # Default to drop
-                                    calc_df = valid_pair_df
-
-                                # Recalculate valid pairs if interpolation/ffill changed the count
-                                final_calc_pairs = len(calc_df)
-                                if final_calc_pairs < min_pairs:
-                                     corr_result = {
-                                        'error': f'Insufficient pairs after {handle_missing} ({final_calc_pairs} < {min_pairs})',
-                                        'valid_pairs': final_calc_pairs,
-                                        'significant': False
-                                    }
-                                else:
-                                    # Calculate correlation
-                                    try:
-                                        if method == 'pearson':
-                                            corr, p_value = stats.pearsonr(calc_df['x'], calc_df['y'])
-                                        elif method == 'spearman':
-                                            corr, p_value = stats.spearmanr(calc_df['x'], calc_df['y'])
-                                        elif method == 'kendall':
-                                            corr, p_value = stats.kendalltau(calc_df['x'], calc_df['y'])
-                                        else:
-                                            raise ValueError(f"Unknown correlation method: {method}")
-                                        
-                                        # Check for NaN results (can happen with constant data)
-                                        if pd.isna(corr) or pd.isna(p_value):
-                                             corr_result = {
-                                                'error': 'Calculation resulted in NaN (constant data?)',
-                                                'valid_pairs': final_calc_pairs,
-                                                'significant': False
-                                            }
-                                        else:
-                                            corr_result = {
-                                                'correlation': float(corr),
-                                                'p_value': float(p_value),
-                                                'significant': float(p_value) < pvalue_threshold,
-                                                'valid_pairs': final_calc_pairs,
-                                                'shifted': shifted,
-                                                'interpretation': analyzer._interpret_correlation(corr, p_value) # Use existing interpretation method
-                                            }
-                                    except Exception as calc_e:
-                                        corr_result = {
-                                            'error': f'Calculation error: {str(calc_e)}',
-                                            'valid_pairs': final_calc_pairs,
-                                            'significant': False
-                                        }
+                        corr_result = {
+                            'error': f"Metric data not found ({x_col if x_col not in df.columns else y_metric['col_name']})",
+                            'valid_pairs': 0,
+                            'significant': False
+                        }
+                    elif valid_pairs < min_pairs:
+                        corr_result = {
+                            'error': f'Insufficient pairs ({valid_pairs} < {min_pairs})',
+                            'valid_pairs': valid_pairs,
+                            'significant': False
+                        }
+                    elif calc_pairs < min_pairs:
+                        # Interpolating or forward filling can leave fewer complete rows
+                        corr_result = {
+                            'error': f'Insufficient pairs after {handle_missing} ({calc_pairs} < {min_pairs})',
+                            'valid_pairs': calc_pairs,
+                            'significant': False
+                        }
+                    elif (i, j) in table['errors']:
+                        corr_result = {
+                            'error': f"Calculation error: {table['errors'][(i, j)]}",
+                            'valid_pairs': calc_pairs,
+                            'significant': False
+                        }
+                    elif np.isnan(corr) or np.isnan(p_value):
+                        # Constant data has no defined correlation
+                        corr_result = {
+                            'error': 'Calculation resulted in NaN (constant data?)',
+                            'valid_pairs': calc_pairs,
+                            'significant': False
+                        }
+                    else:
+                        shifted = time_shift_oura and any(
+                            metric['source'] == 'oura' and metric['name'] in OURA_SLEEP_METRICS
+                            for metric in (x_metric, y_metric))
+                        corr_result = {
+                            'correlation': float(corr),
+                            'p_value': float(p_value),
+                            'significant': float(p_value) < pvalue_threshold,
+                            'valid_pairs': calc_pairs,
+                            'shifted': shifted,
+                            'interpretation': analyzer._interpret_correlation(corr, p_value) # Use existing interpretation method
+                        }
                     
                     row['correlations'].append(corr_result)
                 
                 correlation_matrix.append(row)
             # --- Optimization End ---
+            
+            significance_note = None
+            if significance_test == 'permutation' or fdr_correction or bootstrap_ci:
+                significance_note = _add_table_significance(
+                    correlation_matrix, df, x_metric_details, y_metric_details,
+                    method, min_pairs, handle_missing, time_shift_oura,
+                    significance_test == 'permutation', n_resamples, seed,
+                    fdr_correction, pvalue_threshold, bootstrap_ci
+                )
 
             # Get available metrics for display (using original metric list)
             all_metrics = {f"{metric['source']}:{metric['metric_name']}": metric['display_name'] for metric in metrics}
@@ -659,7 +1058,13 @@ def correlation_table():
                                   handle_missing=handle_missing,
                                   pvalue_threshold=pvalue_threshold,
                                   time_shift_oura=time_shift_oura,
-                                  use_density=use_density)
+                                  use_density=use_density,
+                                  significance_test=significance_test,
+                                  n_resamples=n_resamples,
+                                  seed=seed,
+                                  fdr_correction=fdr_correction,
+                                  bootstrap_ci=bootstrap_ci,
+                                  significance_note=significance_note)
         
         except Exception as e:
             error_message = f"Error: {str(e)}"
@@ -672,3 +1077,102 @@ def correlation_table():
     return render_template('analysis/correlation_table.html', 
                           sources=sources, 
                           metrics=metrics)
+
+
+def _table_matrix(df, metric_details, time_shift_oura, handle_missing):
+    """Build a (days x metrics) array for the correlation table, shifted and filled like each pair"""
+    columns = []
+    for metric in metric_details:
+        if metric['col_name'] not in df.columns:
+            columns.append(pd.Series(np.nan, index=df.index))
+            continue
+        series = df[metric['col_name']]
+        if time_shift_oura and metric['source'] == 'oura' and metric['name'] in OURA_SLEEP_METRICS:
+            series = series.shift(-1)
+        if handle_missing == 'interpolate':
+            series = series.interpolate(method='linear')
+        elif handle_missing == 'ffill':
+            series = series.ffill()
+        columns.append(series)
+    if not columns:
+        return np.empty((len(df), 0))
+    return pd.concat(columns, axis=1).to_numpy(dtype=float)
+
+def _add_table_significance(correlation_matrix, df, x_metric_details, y_metric_details,
+                            method, min_pairs, handle_missing, time_shift_oura,
+                            use_permutation, n_resamples, seed, fdr_correction, pvalue_threshold,
+                            bootstrap_ci=False):
+    """Add permutation p-values, bootstrap intervals and/or Benjamini-Hochberg q-values to correlation table cells
+    
+    Permutation p-values come from one table-wide test that permutes the days of
+    all y metrics together; pairs involving a metric with missing days are
+    permuted within their own complete rows instead. Bootstrap intervals
+    (95%, ci_low / ci_high) resample each pair's complete rows. The q-values
+    correct for every cell in the table.
+    
+    Returns:
+        A note to show with the table, or None
+    """
+    note = None
+    
+    if use_permutation:
+        if method == 'kendall':
+            note = 'Permutation tests are not available for Kendall correlation; parametric p-values are shown.'
+        else:
+            x = _table_matrix(df, x_metric_details, time_shift_oura, handle_missing)
+            y = _table_matrix(df, y_metric_details, time_shift_oura, handle_missing)
+            
+            p_values, used, truncated = permutation_test_matrix(
+                x, y, n_resamples, seed, min_periods=min_pairs,
+                time_budget=current_app.config.get('RESAMPLING_TIME_BUDGET'),
+                n_jobs=current_app.config.get('RESAMPLING_WORKERS', 1),
+                method=method
+            )
+            
+            for i, row in enumerate(correlation_matrix):
+                for j, cell in enumerate(row['correlations']):
+                    if 'error' in cell or cell.get('self') or np.isnan(p_values[j, i]):
+                        continue
+                    cell['parametric_p_value'] = cell['p_value']
+                    cell['p_value'] = float(p_values[j, i])
+                    cell['significant'] = cell['p_value'] < pvalue_threshold
+            
+            note = f'Permutation p-values from {used} resamples'
+            if truncated:
+                note += ' (stopped early at the time budget)'
+    
+    if bootstrap_ci:
+        if method == 'kendall':
+            ci_note = 'Bootstrap intervals are not available for Kendall correlation'
+        else:
+            low, high, truncated = bootstrap_ci_matrix(
+                _table_matrix(df, x_metric_details, time_shift_oura, handle_missing),
+                _table_matrix(df, y_metric_details, time_shift_oura, handle_missing),
+                n_resamples, 0.95, method, seed, min_periods=min_pairs,
+                time_budget=current_app.config.get('RESAMPLING_TIME_BUDGET'),
+                n_jobs=current_app.config.get('RESAMPLING_WORKERS', 1)
+            )
+            
+            for i, row in enumerate(correlation_matrix):
+                for j, cell in enumerate(row['correlations']):
+                    if 'error' in cell or cell.get('self') or np.isnan(low[j, i]):
+                        continue
+                    cell['ci_low'] = float(low[j, i])
+                    cell['ci_high'] = float(high[j, i])
+            
+            ci_note = f'95% bootstrap intervals from {n_resamples} resamples per cell'
+            if truncated:
+                ci_note += ' (cells past the time budget have none)'
+        note = f'{note}. {ci_note}' if note else ci_note
+    
+    if fdr_correction:
+        cells = [cell for row in correlation_matrix for cell in row['correlations']
+                 if 'error' not in cell and not cell.get('self')]
+        q_values = benjamini_hochberg([cell['p_value'] for cell in cells])
+        for cell, q_value in zip(cells, q_values):
+            cell['q_value'] = float(q_value)
+            cell['significant'] = cell['q_value'] < pvalue_threshold
+        fdr_note = 'Significance uses Benjamini-Hochberg q-values across the table'
+        note = f'{note}. {fdr_note}' if note else fdr_note
+    
+    return note
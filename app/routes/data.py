@@ -1,18 +1,32 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify, session
 from werkzeug.utils import secure_filename
-import os
 from datetime import datetime, date, timedelta
 import pandas as pd
 import traceback
 from sqlalchemy import func
 
 from .. import db
-from ..models.base import HealthData, DataType
+from ..models.base import HealthData, DataType, ImportFingerprint, SyncRun, User, current_user_id, DEFAULT_USER_ID
 from ..utils.oura_importer import OuraImporter
 from ..utils.chronometer_importer import ChronometerImporter
+from ..utils.uploads import open_upload
 
 data_bp = Blueprint('data', __name__)
 
+# Accepted names for CSV uploads; compression is detected from the content
+CSV_UPLOAD_EXTENSIONS = ('.csv', '.csv.gz', '.gz', '.zip')
+
+def _signed_in():
+    """Whether the session signed in with a password (see main.switch_user), rather than as the shared default user"""
+    return session.get('user_id') not in (None, DEFAULT_USER_ID)
+
+def _oura_token():
+    """Return the current user's Oura token, from the session or, once signed in, their user record"""
+    if session.get('oura_personal_token') or not _signed_in():
+        return session.get('oura_personal_token')
+    user = db.session.get(User, current_user_id())
+    return user.oura_token if user else None
+
 @data_bp.route('/', strict_slashes=False)
 def index():
     """Data home page"""
@@ -39,7 +53,7 @@ def index():
     ).scalar()
     
     # Check if Oura is connected through the session
-    oura_connected = session.get('oura_connected', False)
+    oura_connected = session.get('oura_connected', False) or _oura_token() is not None
     
     # Format last import date for Oura
     oura_last_import_date = None
@@ -89,7 +103,7 @@ def import_data():
     ).order_by(DataType.last_import.desc()).first()
     
     # Check if Oura is connected through the session
-    oura_connected = session.get('oura_connected', False)
+    oura_connected = session.get('oura_connected', False) or _oura_token() is not None
     
     # Format last import date for Oura
     oura_last_import_date = None
@@ -164,35 +178,10 @@ def _import_oura_api():
     return redirect(url_for('data.import_data'))
 
 def _import_oura_csv():
-    """Import data from Oura CSV file"""
-    try:
-        if 'file' not in request.files:
-            flash('No file part', 'error')
-            return redirect(url_for('data.import_data'))
-            
-        file = request.files['file']
-        
-        if file.filename == '':
-            flash('No selected file', 'error')
-            return redirect(url_for('data.import_data'))
-            
-        if file:
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            importer = OuraImporter()
-            data = importer.import_from_csv(file_path)
-            
-            # Clean up the temp file
-            os.remove(file_path)
-            
-            flash(f'Successfully imported {len(data)} Oura data points from CSV', 'success')
-    except Exception as e:
-        current_app.logger.error(f"Error importing Oura CSV data: {e}")
-        flash(f'Error importing data: {str(e)}', 'error')
-    
-    return redirect(url_for('data.index'))
+    """Reject Oura CSV uploads; Oura data is imported through its API"""
+    # OuraImporter has no CSV parser, so there is nothing to hand the upload to
+    flash('Oura CSV files cannot be imported. Connect Oura with a personal token to import its data.', 'error')
+    return redirect(url_for('data.import_data'))
 
 def _import_chronometer_csv():
     """Import data from Chronometer CSV file"""
@@ -207,27 +196,18 @@ def _import_chronometer_csv():
             flash('No selected file', 'error')
             return redirect(url_for('data.import_data'))
             
-        if file and file.filename.endswith('.csv'):
-            # Create upload folder if it doesn't exist
-            upload_folder = os.path.join(current_app.instance_path, 'uploads')
-            os.makedirs(upload_folder, exist_ok=True)
-            
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(upload_folder, filename)
-            file.save(file_path)
-            
-            # Import the data
+        if file and file.filename.lower().endswith(CSV_UPLOAD_EXTENSIONS):
+            # Import the data straight from the upload stream (plain, gzip or zip)
             store_categories = request.form.get('process_categories') == 'yes'
             importer = ChronometerImporter()
-            nutrition_data, category_data = importer.import_from_csv(file_path, store_categories)
-            
-            # Clean up the temp file
-            os.remove(file_path)
+            with open_upload(file.stream, file.filename) as csv_stream:
+                nutrition_data, category_data = importer.import_from_csv(
+                    csv_stream, store_categories, name=secure_filename(file.filename))
             
             total_data_points = len(nutrition_data) if store_categories else len(nutrition_data) + len(category_data)
             flash(f'Successfully imported {total_data_points} Chronometer data points from Chronometer CSV with store_categories == {store_categories}.', 'success')
         else:
-            flash('Invalid file format. Please upload a CSV file.', 'error')
+            flash('Invalid file format. Please upload a CSV file (optionally .gz or .zip compressed).', 'error')
             return redirect(url_for('data.import_data'))
     except Exception as e:
         current_app.logger.error(f"Error importing Chronometer CSV data: {e}")
@@ -468,6 +448,46 @@ def api_metrics():
     
     return jsonify(metrics)
 
+@data_bp.route('/api/sync-runs')
+def api_sync_runs():
+    """API to get the current user's most recent scheduled sync runs"""
+    limit = request.args.get('limit', 20, type=int)
+    runs = SyncRun.query.order_by(SyncRun.started_at.desc()).limit(max(1, min(limit, 500))).all()
+    
+    return jsonify([{
+        'source': run.source,
+        'status': run.status,
+        'start_date': run.start_date.isoformat() if run.start_date else None,
+        'end_date': run.end_date.isoformat() if run.end_date else None,
+        'started_at': run.started_at.isoformat(),
+        'duration': run.duration,
+        'request_count': run.request_count,
+        'row_count': run.row_count,
+        'error': run.error
+    } for run in runs])
+
+@data_bp.route('/api/import/chronometer', methods=['POST'])
+def api_import_chronometer():
+    """API to import a Chronometer CSV sent as the raw request body
+    
+    The body may be plain, gzip or zip compressed. Plain and gzip bodies are
+    parsed while they arrive, and MAX_CONTENT_LENGTH bounds their size. Pass
+    categories=yes to also store food category totals.
+    """
+    store_categories = request.args.get('categories') == 'yes'
+    try:
+        with open_upload(request.stream) as csv_stream:
+            nutrition_data, category_data = ChronometerImporter().import_from_csv(
+                csv_stream, store_categories, name='request body')
+    except (ValueError, pd.errors.ParserError, OSError) as e:
+        current_app.logger.error(f"Error importing Chronometer CSV body: {e}")
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'nutrition_points': len(nutrition_data),
+        'category_points': len(category_data) if store_categories else 0
+    })
+
 @data_bp.route('/connect/oura')
 def connect_oura():
     """Connect to Oura Ring using personal token"""
@@ -483,23 +503,31 @@ def submit_oura_token():
         flash('Please provide a personal access token', 'error')
         return redirect(url_for('data.connect_oura'))
 
-    # In a real application, store this securely in a database
-    # Here we just store it in the session for simplicity
+    # Keep the token with a signed-in user, so scheduled and CLI imports can use it too. Every
+    # visitor shares the default user, so its token stays in this browser's session only
+    user = db.session.get(User, current_user_id()) if _signed_in() else None
+    if user:
+        user.oura_token = personal_token
+        db.session.commit()
     session['oura_personal_token'] = personal_token
     session['oura_connected'] = True
 
-    flash('Successfully saved Oura personal token!', 'success')
+    if user:
+        flash('Successfully saved Oura personal token!', 'success')
+    else:
+        flash('Oura personal token kept for this browser session only; sign in to save it for scheduled syncs.',
+              'success')
     return redirect(url_for('data.import_data'))
 
 @data_bp.route('/import/oura', methods=['POST'])
 def import_oura():
     """Import data from Oura API using personal token"""
-    if not session.get('oura_connected'):
+    personal_token = _oura_token()
+    if not personal_token:
         flash('You need to connect your Oura Ring first', 'error')
         return redirect(url_for('data.import_data'))
     
     try:
-        personal_token = session.get('oura_personal_token')
         start_date = request.form.get('start_date')
         end_date = request.form.get('end_date')
         data_type = request.form.get('data_type', 'all')  # Default to all data
@@ -682,6 +710,8 @@ def edit_data_point():
             flash('Data point not found.', 'error')
             return redirect(request.referrer or url_for('data.index'))
         data_point.metric_value = float(new_value)
+        # A manual edit must not be skipped as unchanged by the next re-import
+        ImportFingerprint.forget(data_point.data_type.source, data_point.date)
         db.session.commit()
         # Fetch the data point again to ensure date is available
         refreshed = HealthData.query.get(int(data_id))
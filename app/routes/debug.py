@@ -0,0 +1,8 @@
+from flask import Blueprint, current_app, jsonify
+
+debug_bp = Blueprint('debug', __name__)
+
+@debug_bp.route('/perf')
+def perf():
+    """Request profiling summary: per-endpoint totals and the slow request log"""
+    return jsonify(current_app.extensions['profiler'].summary())
@@ -1,5 +1,6 @@
-from flask import Blueprint, render_template
-from ..models.base import DataType
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from .. import db
+from ..models.base import DataType, User, DEFAULT_USER_ID
 from sqlalchemy import func
 
 main_bp = Blueprint('main', __name__)
@@ -19,3 +20,41 @@ def index():
 def about():
     """About page"""
     return render_template('about.html')
+
+@main_bp.route('/user', methods=['POST'])
+def switch_user():
+    """Sign the session in as another user
+    
+    Existing users must give their password; a new user name is registered
+    with the password given. The default user, whose data every visitor
+    sees, needs none.
+    """
+    username = (request.form.get('username') or '').strip()
+    password = request.form.get('password') or ''
+    if not username:
+        flash('Please provide a user name', 'error')
+        return redirect(request.referrer or url_for('main.index'))
+    
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        if not password:
+            flash('Please choose a password for the new user', 'error')
+            return redirect(request.referrer or url_for('main.index'))
+        user = User(username=username)
+        user.set_password(password)
+        db.session.add(user)
+        db.session.commit()
+    elif user.id != DEFAULT_USER_ID and not user.check_password(password):
+        if user.password_hash:
+            flash('Wrong user name or password', 'error')
+        else:
+            flash(f'{username} has no password yet; set one with "health-tracker set-password {username}"', 'error')
+        return redirect(request.referrer or url_for('main.index'))
+    
+    session['user_id'] = user.id
+    # The Oura connection belonged to the previous user
+    session.pop('oura_personal_token', None)
+    session.pop('oura_connected', None)
+    
+    flash(f'Now viewing data for {user.username}', 'success')
+    return redirect(request.referrer or url_for('main.index'))
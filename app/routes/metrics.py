@@ -0,0 +1,10 @@
+from flask import Blueprint, Response, current_app
+
+from ..utils.metrics import CONTENT_TYPE
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """Counters and histograms in the Prometheus text exposition format"""
+    return Response(current_app.extensions['metrics'].render(), content_type=CONTENT_TYPE)
@@ -1,30 +1,161 @@
+import hashlib
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
 import pandas as pd
+from flask import current_app, has_app_context
 from scipy import stats
-from sqlalchemy import func
+from sqlalchemy import exists, func, tuple_
 from .. import db
-from ..models.base import HealthData, DataType
+from ..models.base import HealthData, DataType, DataCoverage, current_user_id, data_version
+from .downsampling import reduce_series
+from .json_provider import date_strings, nullable_floats
+from .metrics import count_cache_lookup
+from .profiling import phase, profiled
+from .correlation import (rolling_pearson, lag_scan, pearson_pvalues, rank_columns,
+                          bootstrap_confidence_interval, permutation_pvalue, benjamini_hochberg,
+                          partial_pearson, ols_fit, pairwise_correlations)
+
+# Oura sleep metrics are recorded on the morning after the night they describe,
+# so these are the metrics that get shifted when aligning with same-day data
+OURA_SLEEP_METRICS = [
+    'sleep_score', 'rem_sleep', 'deep_sleep', 'light_sleep', 
+    'total_sleep', 'sleep_latency', 'awake_time', 'rem_sleep_score',
+    'deep_sleep_score', 'sleep_efficiency', 'avg_hr', 'avg_hrv',
+    'avg_resp', 'long_hr', 'long_hrv', 'long_resp', 'long_efficiency',
+    'total_sleep_score', 'sleep_latency_score', 'sleep_efficiency_score',
+    'sleep_restfulness_score', 'sleep_timing_score'
+]
+
+# Row shape returned by get_metric_data, matching its query rows
+MetricPoint = namedtuple('MetricPoint', ['date', 'metric_value', 'metric_units'])
+
+# Maximum number of (start_date, end_date) frames kept per user, and of users
+# with cached frames per app
+FRAME_CACHE_SIZE = 8
+FRAME_CACHE_USERS = 32
+
+# Maximum number of reduced series (see get_metric_series) kept per user
+SERIES_CACHE_SIZE = 64
+
+# Guards the per-user caches in app.extensions, which a threaded server's requests share
+_CACHE_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=64)
+def _density_index(columns):
+    """Group the "source:metric" columns of a metric frame for nutrient density
+    
+    Energy and calorie columns are found once per distinct column set rather
+    than on every call.
+    
+    Args:
+        columns: Tuple of column names
+        
+    Returns:
+        Tuple of (source, energy_col, nutrient_cols, density_cols) entries, one
+        per energy column, in column order
+    """
+    by_source = {}
+    energy_cols = []
+    for col in columns:
+        source, name = col.split(':', 1)
+        is_energy = 'energy' in name.lower() or 'calories' in name.lower()
+        by_source.setdefault(source, []).append((col, name, is_energy))
+        if is_energy:
+            energy_cols.append((source, col))
+    
+    index = []
+    for source, energy_col in energy_cols:
+        nutrients = [(col, name) for col, name, is_energy in by_source[source] if not is_energy]
+        index.append((
+            source,
+            energy_col,
+            [col for col, _ in nutrients],
+            [f"{source}:density_{name}" for _, name in nutrients]
+        ))
+    return tuple(index)
+
 
 class HealthAnalyzer:
-    """Utility class for analyzing health data correlations"""
+    """Utility class for analyzing health data correlations
     
-    def __init__(self):
-        pass
+    Each analyzer reads one user's data: user_id if given, otherwise the
+    current user when it is created.
+    """
+    
+    def __init__(self, user_id=None):
+        self.user_id = user_id if user_id is not None else current_user_id()
+    
+    def _query(self, *entities):
+        """Start a query scoped to this analyzer's user"""
+        return db.session.query(*entities).execution_options(user_id=self.user_id)
     
     def get_available_metrics(self):
-        """Get a list of all available metrics in the database"""
-        metrics = db.session.query(
-            DataType.metric_name, 
+        """Get a list of all available metrics in the database
+        
+        Each metric's count is its number of days with a value, including the
+        implicit days of its DataCoverage ranges, so sparse metrics such as
+        Oura tags are counted as densely as get_metric_data reads them, and a
+        metric with coverage but no stored rows is listed too.
+        """
+        counts = {
+            (metric_name, source): count
+            for metric_name, source, count in self._query(
+                DataType.metric_name, 
+                DataType.source,
+                func.count(HealthData.id).label('count')
+            ).join(
+                HealthData, HealthData.data_type_id == DataType.id
+            ).group_by(
+                DataType.metric_name, 
+                DataType.source
+            )
+        }
+        
+        # Each metric's coverage ranges may overlap, so merge them before counting their days
+        ranges = {}
+        for metric_name, source, start_date, end_date in self._query(
+            DataType.metric_name,
+            DataType.source,
+            DataCoverage.start_date,
+            DataCoverage.end_date
+        ).join(
+            DataType, DataCoverage.data_type_id == DataType.id
+        ).order_by(
+            DataCoverage.start_date
+        ):
+            merged = ranges.setdefault((metric_name, source), [])
+            if merged and start_date <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end_date)
+            else:
+                merged.append([start_date, end_date])
+        for key, merged in ranges.items():
+            counts[key] = counts.get(key, 0) + sum((end_date - start_date).days + 1 for start_date, end_date in merged)
+        
+        # Less the stored rows inside any range, which are already counted
+        in_coverage = exists().where(
+            DataCoverage.data_type_id == DataType.id,
+            HealthData.date.between(DataCoverage.start_date, DataCoverage.end_date)
+        )
+        for metric_name, source, stored in self._query(
+            DataType.metric_name,
             DataType.source,
-            func.count(HealthData.id).label('count')
+            func.count(HealthData.id)
         ).join(
             HealthData, HealthData.data_type_id == DataType.id
+        ).filter(
+            in_coverage
         ).group_by(
-            DataType.metric_name, 
+            DataType.metric_name,
             DataType.source
-        ).all()
+        ):
+            counts[(metric_name, source)] -= stored
         
         result = []
-        for metric_name, source, count in metrics:
+        for (metric_name, source), count in sorted(counts.items()):
             result.append({
                 'metric_name': metric_name,
                 'source': source,
@@ -34,8 +165,14 @@ class HealthAnalyzer:
         
         return result
     
+    @profiled('analyzer.metric_data')
     def get_metric_data(self, metric_name, source, start_date=None, end_date=None, limit=None):
-        query = db.session.query(
+        """Get (date, metric_value, metric_units) rows for one metric in chronological order
+        
+        Days covered by an implicit value (see DataCoverage) are filled in, so
+        sparse metrics read the same as if every day were stored.
+        """
+        query = self._query(
             HealthData.date,
             HealthData.metric_value,
             DataType.metric_units
@@ -57,14 +194,243 @@ class HealthAnalyzer:
             query = query.order_by(HealthData.date.desc())
             results = query.limit(limit).all()
             results = results[::-1]  # reverse to chronological order
-            return results
         else:
             query = query.order_by(HealthData.date)
-            return query.all()
+            results = query.all()
+        
+        ranges = self._coverage_ranges(start_date, end_date, metric_name, source)
+        return self._with_coverage(results, ranges, limit, metric_name, source)
+    
+    def _with_coverage(self, rows, ranges, limit, metric_name, source):
+        """Add the implicit values of one metric's covered days to its most recent limit rows"""
+        if not ranges:
+            return rows
+        
+        # With a limit, only the days from the earliest returned row onward can be in the last N
+        if limit is not None and len(rows) == limit and rows:
+            ranges = [(col, max(first, rows[0].date), last, fill)
+                      for col, first, last, fill in ranges if last >= rows[0].date]
+        
+        dense = self._densify_points(rows, ranges, metric_name, source)
+        return dense[-limit:] if limit is not None else dense
+    
+    def get_metrics_data(self, metrics, start_date=None, end_date=None, limit=None, as_frame=False):
+        """Get several metrics' values aligned on their dates, reading the data with one query
+        
+        With a limit, each metric keeps its own most recent limit days, so the
+        metrics may cover different spans; days a metric has no value for are NaN.
+        
+        Args:
+            metrics: List of (metric_name, source) tuples
+            start_date: Start date for filtering data
+            end_date: End date for filtering data
+            limit: Only keep each metric's most recent limit days with data
+            as_frame: Return a wide DataFrame instead of arrays
+            
+        Returns:
+            Dict with 'metrics' (the (metric_name, source) tuples), 'units' (one
+            per metric, None without data), 'dates' (sorted datetime64[D] array
+            of every day with a value) and 'values' (float array of shape
+            (len(dates), len(metrics))). With as_frame, a DataFrame with dates as
+            index and "source:metric_name" columns, as get_metric_dataframe returns.
+        """
+        points = self._metrics_points(metrics, start_date, end_date, limit)
+        metrics = list(points)
+        columns = [
+            (np.array([row[0] for row in rows], dtype='datetime64[D]'),
+             np.fromiter((row[1] for row in rows), dtype=float, count=len(rows)))
+            for rows in points.values()
+        ]
+        
+        all_days = [days for days, _ in columns]
+        dates = np.unique(np.concatenate(all_days)) if all_days else np.array([], dtype='datetime64[D]')
+        values = np.full((len(dates), len(metrics)), np.nan)
+        for i, (days, column) in enumerate(columns):
+            values[np.searchsorted(dates, days), i] = column
+        
+        if as_frame:
+            return pd.DataFrame(
+                values,
+                index=pd.Index(dates.astype(object), name='date'),
+                columns=[f"{source}:{name}" for name, source in metrics]
+            )
+        return {
+            'metrics': metrics,
+            'units': [rows[0][2] if rows else None for rows in points.values()],
+            'dates': dates,
+            'values': values
+        }
+    
+    @profiled('analyzer.metrics_data')
+    def _metrics_points(self, metrics, start_date=None, end_date=None, limit=None):
+        """Get get_metric_data's rows for several metrics with one data query
+        
+        Args:
+            metrics: List of (metric_name, source) tuples
+            start_date: Start date for filtering data
+            end_date: End date for filtering data
+            limit: Only keep each metric's most recent limit rows
+            
+        Returns:
+            Dict mapping each (metric_name, source) to its list of MetricPoint rows
+        """
+        metrics = list(dict.fromkeys(metrics))
+        points = {metric: [] for metric in metrics}
+        if not metrics:
+            return points
+        
+        # Look the data types up first, so the data query filters on the indexed type id
+        types = {
+            data_type_id: (name, source, units)
+            for data_type_id, name, source, units in self._query(
+                DataType.id, DataType.metric_name, DataType.source, DataType.metric_units
+            ).filter(tuple_(DataType.metric_name, DataType.source).in_(metrics))
+        }
+        if not types:
+            return points
+        
+        query = self._query(
+            HealthData.data_type_id,
+            HealthData.date,
+            HealthData.metric_value
+        ).filter(HealthData.data_type_id.in_(types))
+        
+        if start_date:
+            query = query.filter(HealthData.date >= start_date)
+        
+        if end_date:
+            query = query.filter(HealthData.date <= end_date)
+        
+        if limit is not None:
+            # Number each metric's rows from its latest day and keep the first limit of them
+            recency = func.row_number().over(
+                partition_by=HealthData.data_type_id, order_by=HealthData.date.desc()
+            ).label('recency')
+            ranked = query.add_columns(recency).subquery()
+            query = self._query(
+                ranked.c.data_type_id, ranked.c.date, ranked.c.metric_value
+            ).filter(ranked.c.recency <= limit).order_by(ranked.c.date)
+        else:
+            query = query.order_by(HealthData.date)
+        
+        for data_type_id, day, value in query:
+            name, source, units = types[data_type_id]
+            points[(name, source)].append(MetricPoint(day, value, units))
+        
+        ranges = {}
+        for range_ in self._coverage_ranges(start_date, end_date):
+            ranges.setdefault(range_[0], []).append(range_)
+        for (name, source), rows in points.items():
+            points[(name, source)] = self._with_coverage(
+                rows, ranges.get(f"{source}:{name}"), limit, name, source)
+        return points
+    
+    def _densify_points(self, rows, ranges, metric_name, source):
+        """Merge stored rows with the implicit values of their covered days
+        
+        Returns:
+            List of MetricPoint tuples in chronological order
+        """
+        units = rows[0].metric_units if rows else self._query(DataType.metric_units).filter_by(
+            metric_name=metric_name, source=source).scalar()
+        
+        series = pd.Series({row.date: row.metric_value for row in rows}, dtype=float)
+        for _, first, last, fill_value in ranges:
+            covered = pd.Series(fill_value, index=pd.date_range(first, last, freq='D').date)
+            # Stored values win over the implicit fill
+            series = series.combine_first(covered)
+        series = series.sort_index()
+        
+        return [MetricPoint(day, value, units) for day, value in zip(series.index, series.to_numpy())]
+    
+    def get_metric_series(self, metric_name, source, start_date=None, end_date=None, limit=None,
+                          resolution='day', points=None, method='lttb'):
+        """Get one metric's points for display, at a resolution and within a point budget
+        
+        Weekly and monthly resolutions average the daily values. Series with
+        more than points points are downsampled (see reduce_series), so the
+        result has a fixed size however much history there is. Reduced series
+        are cached per user, metric and resolution, and reused while the
+        metric's daily values are unchanged.
+        
+        Args:
+            metric_name: Name of the metric
+            source: Source of the metric
+            start_date: Start date for filtering data
+            end_date: End date for filtering data
+            limit: Only use the most recent limit days with data
+            resolution: 'day', 'week' or 'month'
+            points: Largest number of points returned (None or 0 for no limit)
+            method: 'lttb' or 'minmax' downsampling
+            
+        Returns:
+            Dict with 'dates' (datetime64[D] array), 'values', 'counts' (days
+            averaged into each point, None at daily resolution), 'units' and
+            'total' (daily points before reduction), or None if there is no data
+        """
+        rows = self.get_metric_data(metric_name, source, start_date, end_date, limit)
+        key = (metric_name, source, start_date, end_date, limit, resolution, points, method)
+        return self._reduce_points(rows, key, resolution, points, method)
+    
+    def get_metrics_series(self, metrics, start_date=None, end_date=None, limit=None,
+                           resolution='day', points=None, method='lttb'):
+        """get_metric_series for several metrics, reading their data with one query
+        
+        Args:
+            metrics: List of (metric_name, source) tuples
+            
+        Returns:
+            Dict mapping each (metric_name, source) to its get_metric_series result (None without data)
+        """
+        rows = self._metrics_points(metrics, start_date, end_date, limit)
+        return {
+            (name, source): self._reduce_points(
+                metric_rows, (name, source, start_date, end_date, limit, resolution, points, method),
+                resolution, points, method)
+            for (name, source), metric_rows in rows.items()
+        }
+    
+    def _reduce_points(self, rows, key, resolution, points, method):
+        """Reduce one metric's rows with reduce_series, through the per-user series cache"""
+        if not rows:
+            return None
+        
+        dates = np.array([row[0] for row in rows], dtype='datetime64[D]')
+        values = np.fromiter((row[1] for row in rows), dtype=float, count=len(rows))
+        
+        cache = self._user_cache('health_analyzer_series')
+        # The rows were read anyway, so the series is checked by content: any change to a date or value misses
+        digest = hashlib.blake2b(dates.tobytes() + values.tobytes(), digest_size=16).digest()
+        with _CACHE_LOCK:
+            entry = cache.pop(key, None) if cache is not None else None
+        hit = entry is not None and entry['digest'] == digest
+        count_cache_lookup('analyzer_series', hit)
+        if not hit:
+            with phase('analyzer.downsample'):
+                reduced = reduce_series(dates, values, resolution, points, method)
+            entry = {'digest': digest, 'series': reduced}
+        if cache is not None:
+            with _CACHE_LOCK:
+                cache[key] = entry
+                while len(cache) > SERIES_CACHE_SIZE:
+                    cache.pop(next(iter(cache)))
+        
+        series_dates, series_values, counts = entry['series']
+        return {
+            'dates': series_dates,
+            'values': series_values,
+            'counts': counts,
+            'units': rows[0][2],
+            'total': len(rows)
+        }
     
     def get_metric_dataframe(self, start_date=None, end_date=None, include_derived=False):
         """Get a dataframe of all metrics by date
         
+        Frames are cached per user and date range, and rebuilt only when the
+        user's data_version changes, which costs one primary key lookup per
+        call. Callers receive a copy they are free to modify.
+        
         Args:
             start_date: Start date for filtering data
             end_date: End date for filtering data
@@ -73,8 +439,106 @@ class HealthAnalyzer:
         Returns:
             DataFrame with dates as index and metrics as columns
         """
+        cache = self._frame_cache()
+        if cache is None:
+            pivot_df = self._query_metric_frame(start_date, end_date)
+            return self._add_nutrient_density_metrics(pivot_df) if include_derived else pivot_df
+        
+        # Reuse the frame for this date range until any of the user's data changes
+        version = data_version(self.user_id)
+        key = (start_date, end_date)
+        with _CACHE_LOCK:
+            entry = cache.get(key)
+        hit = entry is not None and entry['version'] == version
+        count_cache_lookup('analyzer_frame', hit)
+        if not hit:
+            entry = {
+                'version': version,
+                # Density blocks carry their own source fingerprint and survive a rebuild
+                'fingerprints': self._source_fingerprints(),
+                'frame': self._query_metric_frame(start_date, end_date),
+                'density': entry['density'] if entry else {}
+            }
+        with _CACHE_LOCK:
+            cache.pop(key, None)
+            cache[key] = entry
+            while len(cache) > FRAME_CACHE_SIZE:
+                cache.pop(next(iter(cache)))
+        
+        pivot_df = entry['frame'].copy()
+        
+        # Calculate derived metrics if requested
+        if include_derived:
+            pivot_df = self._add_nutrient_density_metrics(pivot_df, entry['density'], entry['fingerprints'])
+        
+        return pivot_df
+    
+    def _frame_cache(self):
+        """This user's cache of metric frames keyed by date range, or None outside an app context"""
+        return self._user_cache('health_analyzer_frames')
+    
+    def _user_cache(self, extension):
+        """This user's dict in the per-user cache app.extensions[extension], or None outside an app context
+        
+        Users' caches are kept in least recently used order, at most
+        FRAME_CACHE_USERS of them per app.
+        """
+        if not has_app_context():
+            return None
+        with _CACHE_LOCK:
+            caches = current_app.extensions.setdefault(extension, {})
+            cache = caches.pop(self.user_id, None)
+            caches[self.user_id] = cache = {} if cache is None else cache
+            while len(caches) > FRAME_CACHE_USERS:
+                caches.pop(next(iter(caches)))
+        return cache
+    
+    @profiled('analyzer.fingerprints')
+    def _source_fingerprints(self):
+        """Summarize each source's stored data with grouped aggregate queries
+        
+        Any insert, delete or edit changes the row count, highest id, latest
+        update time or value total of that source; coverage ranges are
+        summarized the same way. These full scans only run when a frame is
+        rebuilt, to tell which sources' density blocks are still valid.
+        
+        Returns:
+            Dict mapping source to a tuple of aggregates
+        """
+        rows = self._query(
+            DataType.source,
+            func.count(HealthData.id),
+            func.max(HealthData.id),
+            func.max(HealthData.updated_at),
+            func.sum(HealthData.metric_value)
+        ).join(
+            HealthData, HealthData.data_type_id == DataType.id
+        ).group_by(
+            DataType.source
+        ).all()
+        
+        fingerprints = {source: tuple(values) for source, *values in rows}
+        
+        # Coverage changes alter densified values without touching health_data
+        coverage_rows = self._query(
+            DataType.source,
+            func.count(DataCoverage.id),
+            func.max(DataCoverage.updated_at)
+        ).join(
+            DataType, DataCoverage.data_type_id == DataType.id
+        ).group_by(
+            DataType.source
+        ).all()
+        for source, *values in coverage_rows:
+            fingerprints[source] = fingerprints.get(source, ()) + tuple(values)
+        
+        return fingerprints
+    
+    @profiled('analyzer.frame')
+    def _query_metric_frame(self, start_date=None, end_date=None):
+        """Query all metrics in the date range into a wide dataframe"""
         # First, query all data within date range
-        query = db.session.query(
+        query = self._query(
             HealthData.date,
             DataType.source,
             DataType.metric_name,
@@ -100,72 +564,127 @@ class HealthAnalyzer:
         ) for r in results], columns=['date', 'source', 'metric_name', 'value'])
         
         # Pivot to wide format with dates as index and metrics as columns
-        pivot_df = df.pivot_table(
-            index='date', 
-            columns=['source', 'metric_name'], 
-            values='value',
-            aggfunc='first'
-        )
+        with phase('analyzer.pivot'):
+            pivot_df = df.pivot_table(
+                index='date', 
+                columns=['source', 'metric_name'], 
+                values='value',
+                aggfunc='first'
+            )
         
         # Flatten column multi-index
         pivot_df.columns = [f"{source}:{metric}" for source, metric in pivot_df.columns]
+        return self._fill_covered_days(pivot_df, start_date, end_date)
+    
+    def _coverage_ranges(self, start_date=None, end_date=None, metric_name=None, source=None):
+        """Query implicit-value coverage ranges, clipped to the requested dates
         
-        # Calculate derived metrics if requested
-        if include_derived:
-            pivot_df = self._add_nutrient_density_metrics(pivot_df)
+        Returns:
+            List of (column_name, start_date, end_date, fill_value) tuples
+        """
+        query = self._query(
+            DataType.source,
+            DataType.metric_name,
+            DataCoverage.start_date,
+            DataCoverage.end_date,
+            DataCoverage.fill_value
+        ).join(
+            DataType, DataCoverage.data_type_id == DataType.id
+        )
         
-        return pivot_df
+        if metric_name is not None:
+            query = query.filter(DataType.metric_name == metric_name, DataType.source == source)
+        
+        if start_date:
+            query = query.filter(DataCoverage.end_date >= start_date)
+        
+        if end_date:
+            query = query.filter(DataCoverage.start_date <= end_date)
+        
+        return [(
+            f"{r.source}:{r.metric_name}",
+            max(r.start_date, start_date) if start_date else r.start_date,
+            min(r.end_date, end_date) if end_date else r.end_date,
+            r.fill_value
+        ) for r in query.all()]
     
-    def _add_nutrient_density_metrics(self, df):
+    def _fill_covered_days(self, pivot_df, start_date=None, end_date=None):
+        """Densify sparse metrics by filling their covered days that have no stored value
+        
+        Covered days missing from the frame are added as rows, so the result
+        matches storing the implicit value on every day.
+        """
+        ranges = self._coverage_ranges(start_date, end_date)
+        if not ranges:
+            return pivot_df
+        
+        covered_days = pd.DatetimeIndex(np.concatenate([
+            pd.date_range(first, last, freq='D').values for _, first, last, _ in ranges
+        ]))
+        index = pd.DatetimeIndex(pd.to_datetime(pivot_df.index)).union(covered_days)
+        
+        dense = pivot_df.copy()
+        dense.index = pd.to_datetime(dense.index)
+        dense = dense.reindex(index)
+        days = index.values
+        
+        for column, first, last, fill_value in ranges:
+            if column not in dense.columns:
+                dense[column] = np.nan
+            in_range = (days >= np.datetime64(first)) & (days <= np.datetime64(last))
+            values = dense[column].to_numpy(dtype=float, copy=True)
+            values[in_range & np.isnan(values)] = fill_value
+            dense[column] = values
+        
+        dense.index = dense.index.date
+        dense.index.name = pivot_df.index.name
+        return dense
+    
+    @profiled('analyzer.density')
+    def _add_nutrient_density_metrics(self, df, cache=None, fingerprints=None):
         """Add nutrient density metrics (nutrient per calorie) to the dataframe
         
+        Each source's nutrients are divided by its energy column as one block.
+        When a cache is given, a block is reused until its source's fingerprint
+        changes, so edits to other sources do not trigger a recompute.
+        
         Args:
             df: DataFrame with metrics as columns
+            cache: Optional dict of density blocks keyed by energy column
+            fingerprints: Source fingerprints from _source_fingerprints, required with cache
             
         Returns:
             DataFrame with additional derived metrics
         """
-        # Find all calorie/energy columns
-        energy_cols = [col for col in df.columns if 'energy' in col.lower() or 'calories' in col.lower()]
-        
-        # If no energy metrics are found, we can't calculate density
-        if not energy_cols:
-            return df
-            
-        # For each source that has energy data, create nutrient density metrics
-        for energy_col in energy_cols:
-            source = energy_col.split(':')[0]  # Extract the source (e.g., 'chronometer')
-            
-            # Find all columns for this source that aren't energy/calories
-            nutrient_cols = [col for col in df.columns 
-                           if col.startswith(f"{source}:") 
-                           and col != energy_col
-                           and 'calories' not in col.lower()
-                           and 'energy' not in col.lower()]
-            
-            # Dictionary to store the new density columns before adding them
-            new_density_cols = {}
+        blocks = []
+        for source, energy_col, nutrient_cols, density_cols in _density_index(tuple(df.columns)):
+            if not nutrient_cols:
+                continue
             
-            # For each nutrient, calculate its density metric (per 100 calories)
-            for nutrient_col in nutrient_cols:
-                nutrient_name = nutrient_col.split(':')[1]  # Extract the metric name
-                density_col = f"{source}:density_{nutrient_name}"
-                
-                # Calculate: nutrient value per 100 calories
-                # Use .div for division to handle NaN values better than the / operator
-                calculated_density = df[nutrient_col].div(df[energy_col]).multiply(100)
-                new_density_cols[density_col] = calculated_density
-        
-            # If any density columns were calculated, add them all at once
-            if new_density_cols:
-                density_df = pd.DataFrame(new_density_cols, index=df.index)
-                df = pd.concat([df, density_df], axis=1)
+            cached = cache.get(energy_col) if cache is not None else None
+            if cached is not None and cached[0] == fingerprints.get(source) and cached[1].columns.equals(pd.Index(density_cols)):
+                block = cached[1].reindex(df.index)
+            else:
+                # Nutrient value per 100 calories for every nutrient at once
+                energy = df[energy_col].to_numpy(dtype=float)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    values = df[nutrient_cols].to_numpy(dtype=float) / energy[:, None] * 100
+                block = pd.DataFrame(values, index=df.index, columns=density_cols)
+                if cache is not None:
+                    with _CACHE_LOCK:
+                        cache[energy_col] = (fingerprints.get(source), block)
+            blocks.append(block)
+        
+        if blocks:
+            df = pd.concat([df] + blocks, axis=1)
         return df
     
+    @profiled('analyzer.correlation')
     def calculate_correlation(self, metric1_name, metric1_source, metric2_name, metric2_source, 
                              start_date=None, end_date=None, method='pearson', 
                              min_pairs=10, interpolate=False, handle_missing='drop',
-                             time_shift=None, use_density=False):
+                             time_shift=None, use_density=False, n_resamples=0,
+                             confidence=0.95, seed=None, time_budget=None, n_jobs=None):
         """Calculate correlation between two metrics
         
         Args:
@@ -185,20 +704,16 @@ class HealthAnalyzer:
             time_shift: Dictionary specifying time shifts for metrics by source
                         e.g., {'oura': -1} shifts oura data back by 1 day
             use_density: Whether to use nutrient density instead of raw values
+            n_resamples: Number of bootstrap and permutation resamples (0 disables resampling)
+            confidence: Confidence level for the bootstrap interval
+            seed: Seed for reproducible resampling
+            time_budget: Seconds allowed for resampling, split between the two tests
+            n_jobs: Number of worker processes used for resampling; None reads
+                    RESAMPLING_WORKERS from the app config (1 outside an app)
             
         Returns:
             Dict with correlation results
         """
-        # Define a list of Oura sleep metrics that should be time-shifted
-        OURA_SLEEP_METRICS = [
-            'sleep_score', 'rem_sleep', 'deep_sleep', 'light_sleep', 
-            'total_sleep', 'sleep_latency', 'awake_time', 'rem_sleep_score',
-            'deep_sleep_score', 'sleep_efficiency', 'avg_hr', 'avg_hrv',
-            'avg_resp', 'long_hr', 'long_hrv', 'long_resp', 'long_efficiency',
-            'total_sleep_score', 'sleep_latency_score', 'sleep_efficiency_score',
-            'sleep_restfulness_score', 'sleep_timing_score'
-        ]
-        
         # Get data for both metrics, including derived metrics if needed
         df = self.get_metric_dataframe(start_date, end_date, include_derived=use_density)
         
@@ -297,6 +812,16 @@ class HealthAnalyzer:
                 'error': f'Unknown correlation method: {method}'
             }
         
+        # Optional distribution-free significance from resampling the same pairs
+        resampling = None
+        if n_resamples:
+            resampling = self._resample_correlation(
+                corr_df.dropna(), method, n_resamples, confidence, seed, time_budget, n_jobs
+            )
+        interpretation_p = p_value
+        if resampling and resampling.get('permutation_p_value') is not None:
+            interpretation_p = resampling['permutation_p_value']
+        
         # Prepare result
         result = {
             'metric1': {
@@ -313,7 +838,7 @@ class HealthAnalyzer:
                 'coefficient': float(corr),
                 'p_value': float(p_value),
                 'method': method,
-                'interpretation': self._interpret_correlation(corr, p_value),
+                'interpretation': self._interpret_correlation(corr, interpretation_p),
                 'valid_pairs': valid_pairs,
                 'data_info': {
                     'total_dates': total_rows,
@@ -332,15 +857,57 @@ class HealthAnalyzer:
                 )
             },
             'data_points': [
-                {'date': row[0].strftime('%Y-%m-%d'), 
-                 'metric1': None if pd.isna(row[1]) else float(row[1]), 
-                 'metric2': None if pd.isna(row[2]) else float(row[2])}
-                for row in corr_df.reset_index().values
+                {'date': day, 'metric1': value1, 'metric2': value2}
+                for day, value1, value2 in zip(date_strings(corr_df.index),
+                                               nullable_floats(corr_df['metric1']),
+                                               nullable_floats(corr_df['metric2']))
             ]
         }
         
+        if resampling is not None:
+            result['correlation']['resampling'] = resampling
+        
         return result
     
+    @profiled('analyzer.resampling')
+    def _resample_correlation(self, pairs_df, method, n_resamples, confidence, seed, time_budget, n_jobs):
+        """Bootstrap confidence interval and permutation p-value for paired data
+        
+        Args:
+            pairs_df: DataFrame with complete 'metric1' and 'metric2' columns
+            
+        Returns:
+            Dict describing the resampling results
+        """
+        if method not in ('pearson', 'spearman'):
+            return {'error': f'Resampling is not available for {method} correlation'}
+        
+        x = pairs_df['metric1'].to_numpy(dtype=float)
+        y = pairs_df['metric2'].to_numpy(dtype=float)
+        
+        # Split the budget between the two tests
+        per_test_budget = time_budget / 2 if time_budget is not None else None
+        if n_jobs is None:
+            n_jobs = self._resampling_workers()
+        bootstrap = bootstrap_confidence_interval(
+            x, y, n_resamples, confidence, method, seed,
+            time_budget=per_test_budget, n_jobs=n_jobs
+        )
+        permutation = permutation_pvalue(
+            x, y, n_resamples, method, seed,
+            time_budget=per_test_budget, n_jobs=n_jobs
+        )
+        
+        return {
+            'bootstrap_ci': [bootstrap['low'], bootstrap['high']],
+            'confidence': confidence,
+            'permutation_p_value': permutation['p_value'],
+            'n_bootstrap': bootstrap['n_resamples'],
+            'n_permutations': permutation['n_resamples'],
+            'truncated': bootstrap['truncated'] or permutation['truncated'],
+            'seed': seed
+        }
+    
     def _interpret_correlation(self, corr, p_value):
         """Interpret the correlation coefficient and p-value"""
         strength = ""
@@ -379,48 +946,698 @@ class HealthAnalyzer:
         
         return f"A {strength} {direction} correlation, {significance}"
     
+    @profiled('analyzer.multiple_correlations')
     def calculate_multiple_correlations(self, target_metric_name, target_metric_source, 
                                        start_date=None, end_date=None, method='pearson',
                                        min_pairs=10, top_n=10, handle_missing='drop',
                                        time_shift=None, use_density=False):
-        """Calculate correlations between target metric and all other metrics"""
+        """Calculate correlations between target metric and all other metrics
+        
+        Each metric is paired with the target as calculate_correlation pairs
+        them, and all pairs are calculated in one pairwise_correlations call, which
+        runs on the worker pool once there are CORRELATION_POOL_MIN_PAIRS of them.
+        """
         # Get all available metrics
         all_metrics = self.get_available_metrics()
+        df = self.get_metric_dataframe(start_date, end_date, include_derived=use_density)
         
-        results = []
+        def column(metric_name, source):
+            """(raw, filled) values of a metric, or None if it has no data"""
+            col, effective_name = self._resolve_metric_column(df, metric_name, source, use_density)
+            if col not in df.columns:
+                return None
+            series = df[col]
+            if self._is_time_shifted(effective_name, source, time_shift):
+                series = series.shift(time_shift[source])
+            filled = series
+            if handle_missing == 'interpolate':
+                filled = series.interpolate(method='linear')
+            elif handle_missing == 'ffill':
+                filled = series.ffill()
+            return series.to_numpy(dtype=float), filled.to_numpy(dtype=float)
+        
+        target = column(target_metric_name, target_metric_source)
+        if target is None:
+            return []
         
+        others, columns = [], []
         for metric in all_metrics:
             # Skip the target metric itself
             if (metric['metric_name'] == target_metric_name and 
                 metric['source'] == target_metric_source):
                 continue
-            
-            # Calculate correlation with this metric
-            corr_result = self.calculate_correlation(
-                target_metric_name, target_metric_source,
-                metric['metric_name'], metric['source'],
-                start_date, end_date, method, min_pairs, False, handle_missing,
-                time_shift, use_density
-            )
-            
-            # If there was an error, skip this metric
-            if 'error' in corr_result:
+            values = column(metric['metric_name'], metric['source'])
+            if values is not None:
+                others.append(metric)
+                columns.append(values)
+        if not others:
+            return []
+        
+        n_jobs, min_parallel_pairs = self._correlation_workers()
+        table = pairwise_correlations(
+            target[0], np.column_stack([raw for raw, _ in columns]), method, min_pairs,
+            target[1], np.column_stack([filled for _, filled in columns]),
+            n_jobs=n_jobs, min_parallel_pairs=min_parallel_pairs
+        )
+        
+        results = []
+        for j, metric in enumerate(others):
+            # Skip metrics with too little overlapping data or a failed test
+            if (table['valid_pairs'][0, j] < min_pairs or table['calc_pairs'][0, j] < min_pairs
+                    or (0, j) in table['errors']):
                 continue
             
-            # Add this to the results
             results.append({
                 'metric': {
                     'name': metric['metric_name'],
                     'source': metric['source'],
                     'display': metric['display_name']
                 },
-                'correlation': corr_result['correlation']['coefficient'],
-                'p_value': corr_result['correlation']['p_value'],
-                'valid_pairs': corr_result['correlation']['valid_pairs']
+                'correlation': float(table['coefficients'][0, j]),
+                'p_value': float(table['p_values'][0, j]),
+                'valid_pairs': int(table['valid_pairs'][0, j])
             })
         
+        # Correct for testing every metric against the target
+        q_values = benjamini_hochberg([r['p_value'] for r in results])
+        for result, q_value in zip(results, q_values):
+            result['q_value'] = None if np.isnan(q_value) else float(q_value)
+        
         # Sort by absolute correlation value
         results.sort(key=lambda x: abs(x['correlation']), reverse=True)
         
         # Return top N results
-        return results[:top_n] 
\ No newline at end of file
+        return results[:top_n] 
+    
+    def _resolve_metric_column(self, df, metric_name, source, use_density=False):
+        """Get the dataframe column for a metric, switching to its density column when requested
+        
+        Returns:
+            Tuple (column_name, effective_metric_name)
+        """
+        if use_density and source == 'chronometer' and 'energy' not in metric_name and 'calories' not in metric_name:
+            density_col = f"{source}:density_{metric_name}"
+            if density_col in df.columns:
+                return density_col, f"density_{metric_name}"
+        return f"{source}:{metric_name}", metric_name
+    
+    def _is_time_shifted(self, metric_name, source, time_shift):
+        """Check whether a metric should be shifted under the given time_shift mapping"""
+        return (time_shift is not None and source == 'oura' and source in time_shift
+                and metric_name in OURA_SLEEP_METRICS)
+    
+    def _correlation_workers(self):
+        """(n_jobs, min_parallel_pairs) for pairwise_correlations from the app config; inline outside an app"""
+        if not has_app_context():
+            return 1, None
+        return (current_app.config.get('CORRELATION_WORKERS', 1),
+                current_app.config.get('CORRELATION_POOL_MIN_PAIRS'))
+    
+    def _resampling_workers(self):
+        """n_jobs for bootstrap and permutation tests from the app config; inline outside an app"""
+        if not has_app_context():
+            return 1
+        return current_app.config.get('RESAMPLING_WORKERS', 1)
+    
+    def _to_daily_frame(self, df, columns):
+        """Reindex the selected columns onto a complete calendar-day index
+        
+        Days without any data become rows of NaN, so positional operations
+        (windows, shifts) always move in whole calendar days.
+        """
+        daily = df[columns].copy()
+        daily.index = pd.to_datetime(daily.index)
+        daily = daily[~daily.index.duplicated()].sort_index()
+        if daily.empty:
+            return daily
+        return daily.asfreq('D')
+    
+    @profiled('analyzer.rolling')
+    def calculate_rolling_correlations(self, pairs, window=30, start_date=None, end_date=None,
+                                       min_periods=None, time_shift=None, use_density=False):
+        """Calculate N-day rolling correlations for several metric pairs at once
+        
+        All pairs are evaluated in one vectorized pass using running sums, so the
+        cost is linear in the number of days regardless of the window length.
+        Missing days are treated as gaps: a window only uses days where both
+        metrics have data.
+        
+        Args:
+            pairs: List of (metric1_name, metric1_source, metric2_name, metric2_source) tuples
+            window: Window length in calendar days
+            start_date: Start date for analysis
+            end_date: End date for analysis
+            min_periods: Minimum number of valid pairs per window (defaults to half the window)
+            time_shift: Dictionary specifying time shifts for metrics by source,
+                        applied in calendar days (e.g., {'oura': -1})
+            use_density: Whether to use nutrient density instead of raw values
+            
+        Returns:
+            Dict with the window settings, the list of dates and one result per pair
+        """
+        window = int(window)
+        if window < 2:
+            return {'error': 'Window size must be at least 2 days'}
+        if min_periods is None:
+            min_periods = max(2, window // 2)
+        min_periods = int(min_periods)
+        
+        df = self.get_metric_dataframe(start_date, end_date, include_derived=use_density)
+        
+        results = []
+        resolved = []
+        for metric1_name, metric1_source, metric2_name, metric2_source in pairs:
+            col1, name1 = self._resolve_metric_column(df, metric1_name, metric1_source, use_density)
+            col2, name2 = self._resolve_metric_column(df, metric2_name, metric2_source, use_density)
+            result = {
+                'metric1': {
+                    'name': name1,
+                    'source': metric1_source,
+                    'display': f"{name1} ({metric1_source})"
+                },
+                'metric2': {
+                    'name': name2,
+                    'source': metric2_source,
+                    'display': f"{name2} ({metric2_source})"
+                }
+            }
+            if col1 not in df.columns or col2 not in df.columns:
+                result['error'] = 'One or both metrics not found in data'
+            else:
+                resolved.append((len(results), col1, col2,
+                                 self._is_time_shifted(metric1_name, metric1_source, time_shift),
+                                 self._is_time_shifted(metric2_name, metric2_source, time_shift)))
+            results.append(result)
+        
+        if not resolved:
+            return {'window': window, 'min_periods': min_periods, 'dates': [], 'results': results}
+        
+        columns = sorted({col for _, col1, col2, _, _ in resolved for col in (col1, col2)})
+        daily = self._to_daily_frame(df, columns)
+        shift = time_shift.get('oura', 0) if time_shift else 0
+        shifted = daily.shift(shift) if shift else daily
+        
+        # Stack every pair into two aligned (days x pairs) matrices
+        x = np.column_stack([
+            (shifted if shift1 else daily)[col1].to_numpy(dtype=float)
+            for _, col1, _, shift1, _ in resolved
+        ])
+        y = np.column_stack([
+            (shifted if shift2 else daily)[col2].to_numpy(dtype=float)
+            for _, _, col2, _, shift2 in resolved
+        ])
+        coefficients, counts = rolling_pearson(x, y, window, min_periods)
+        
+        dates = date_strings(daily.index)
+        for j, (position, _, _, shift1, shift2) in enumerate(resolved):
+            column = coefficients[:, j]
+            valid = ~np.isnan(column)
+            result = results[position]
+            result['time_shifted'] = shift1 or shift2
+            result['series'] = [
+                {'date': date_str, 'coefficient': coef, 'pairs': count}
+                for date_str, coef, count in zip(dates, nullable_floats(column), counts[:, j].tolist())
+            ]
+            if valid.any():
+                result['summary'] = {
+                    'windows': int(valid.sum()),
+                    'mean': float(column[valid].mean()),
+                    'min': float(column[valid].min()),
+                    'max': float(column[valid].max())
+                }
+            else:
+                result['summary'] = {'windows': 0, 'mean': None, 'min': None, 'max': None}
+        
+        return {'window': window, 'min_periods': min_periods, 'dates': dates, 'results': results}
+    
+    def calculate_rolling_correlation(self, metric1_name, metric1_source, metric2_name, metric2_source,
+                                      window=30, start_date=None, end_date=None, min_periods=None,
+                                      time_shift=None, use_density=False):
+        """Calculate an N-day rolling correlation between two metrics as a time series
+        
+        See calculate_rolling_correlations for argument details.
+        
+        Returns:
+            Dict with the pair's series and summary, or an 'error' key
+        """
+        batch = self.calculate_rolling_correlations(
+            [(metric1_name, metric1_source, metric2_name, metric2_source)],
+            window, start_date, end_date, min_periods, time_shift, use_density
+        )
+        if 'error' in batch:
+            return batch
+        
+        result = batch['results'][0]
+        result['window'] = batch['window']
+        result['min_periods'] = batch['min_periods']
+        return result
+    
+    @profiled('analyzer.lag_scan')
+    def _lag_scan_frame(self, df, target_col, candidate_cols, max_lag, method, min_pairs):
+        """Run a lag scan of one target column against many candidate columns
+        
+        Returns:
+            Tuple (lags, coefficients, p_values, pair_counts) with arrays shaped (lags, candidates)
+        """
+        if method not in ('pearson', 'spearman'):
+            raise ValueError(f"Lag scan supports 'pearson' and 'spearman', not '{method}'")
+        
+        daily = self._to_daily_frame(df, [target_col] + list(candidate_cols))
+        x = daily[target_col].to_numpy(dtype=float)
+        y = daily[list(candidate_cols)].to_numpy(dtype=float)
+        
+        # Spearman is approximated by ranking each series over all of its own days
+        if method == 'spearman':
+            x = rank_columns(x)
+            y = rank_columns(y)
+        
+        lags, coefficients, counts = lag_scan(x, y, max_lag, min_pairs)
+        return lags, coefficients, pearson_pvalues(coefficients, counts), counts
+    
+    def _lag_curve(self, lags, coefficients, p_values, counts):
+        """Build the per-lag result list and pick the lag with the strongest correlation"""
+        curve = []
+        best = None
+        for lag, corr, p_value, count in zip(lags, coefficients, p_values, counts):
+            point = {
+                'lag': int(lag),
+                'coefficient': None if np.isnan(corr) else float(corr),
+                'p_value': None if np.isnan(p_value) else float(p_value),
+                'valid_pairs': int(count)
+            }
+            curve.append(point)
+            if point['coefficient'] is not None and (
+                    best is None or abs(point['coefficient']) > abs(best['coefficient'])):
+                best = point
+        return curve, best
+    
+    def calculate_lag_correlation(self, metric1_name, metric1_source, metric2_name, metric2_source,
+                                  max_lag=7, start_date=None, end_date=None, method='pearson',
+                                  min_pairs=10, use_density=False):
+        """Correlate metric1 against metric2 shifted by every lag from -max_lag to +max_lag days
+        
+        A positive lag k pairs metric1 on day t with metric2 on day t - k, so a
+        peak at lag 2 means metric2 two days earlier tracks metric1 best.
+        
+        Args:
+            metric1_name: Name of first metric
+            metric1_source: Source of first metric
+            metric2_name: Name of second metric
+            metric2_source: Source of second metric
+            max_lag: Largest lag in days to evaluate in each direction
+            start_date: Start date for analysis
+            end_date: End date for analysis
+            method: Correlation method ('pearson' or 'spearman')
+            min_pairs: Minimum number of overlapping days required at a lag
+            use_density: Whether to use nutrient density instead of raw values
+            
+        Returns:
+            Dict with the full lag curve and the best lag
+        """
+        df = self.get_metric_dataframe(start_date, end_date, include_derived=use_density)
+        col1, name1 = self._resolve_metric_column(df, metric1_name, metric1_source, use_density)
+        col2, name2 = self._resolve_metric_column(df, metric2_name, metric2_source, use_density)
+        
+        if col1 not in df.columns or col2 not in df.columns:
+            return {
+                'error': 'One or both metrics not found in data'
+            }
+        
+        try:
+            lags, coefficients, p_values, counts = self._lag_scan_frame(
+                df, col1, [col2], max_lag, method, min_pairs
+            )
+        except ValueError as e:
+            return {'error': str(e)}
+        
+        curve, best = self._lag_curve(lags, coefficients[:, 0], p_values[:, 0], counts[:, 0])
+        
+        result = {
+            'metric1': {
+                'name': name1,
+                'source': metric1_source,
+                'display': f"{name1} ({metric1_source})"
+            },
+            'metric2': {
+                'name': name2,
+                'source': metric2_source,
+                'display': f"{name2} ({metric2_source})"
+            },
+            'method': method,
+            'max_lag': int(max_lag),
+            'lags': curve,
+            'best_lag': best
+        }
+        
+        if best is not None:
+            result['best_lag']['interpretation'] = self._interpret_correlation(
+                best['coefficient'], best['p_value']
+            )
+        else:
+            result['error'] = f'Insufficient data points at every lag. Need at least {min_pairs}.'
+        
+        return result
+    
+    def calculate_lag_scan(self, target_metric_name, target_metric_source, max_lag=7,
+                           start_date=None, end_date=None, method='pearson', min_pairs=10,
+                           top_n=10, use_density=False, include_curves=False):
+        """Find which metrics, at which lag, best predict a target metric
+        
+        Every other metric is scanned at every lag from -max_lag to +max_lag in a
+        single vectorized pass. Lags follow calculate_lag_correlation: a positive
+        lag means the other metric precedes the target.
+        
+        Args:
+            target_metric_name: Name of the target metric
+            target_metric_source: Source of the target metric
+            max_lag: Largest lag in days to evaluate in each direction
+            start_date: Start date for analysis
+            end_date: End date for analysis
+            method: Correlation method ('pearson' or 'spearman')
+            min_pairs: Minimum number of overlapping days required at a lag
+            top_n: Number of metrics to return, ranked by their best |coefficient|
+            use_density: Whether to use nutrient density instead of raw values
+            include_curves: Whether to include the full lag curve for each metric
+            
+        Returns:
+            List of result dicts, strongest first
+        """
+        df = self.get_metric_dataframe(start_date, end_date, include_derived=use_density)
+        target_col, _ = self._resolve_metric_column(df, target_metric_name, target_metric_source, use_density)
+        if target_col not in df.columns:
+            return []
+        
+        candidates = []
+        for metric in self.get_available_metrics():
+            if (metric['metric_name'] == target_metric_name and
+                    metric['source'] == target_metric_source):
+                continue
+            col, name = self._resolve_metric_column(df, metric['metric_name'], metric['source'], use_density)
+            if col in df.columns and col != target_col:
+                candidates.append((col, name, metric))
+        
+        if not candidates:
+            return []
+        
+        lags, coefficients, p_values, counts = self._lag_scan_frame(
+            df, target_col, [col for col, _, _ in candidates], max_lag, method, min_pairs
+        )
+        
+        results = []
+        for j, (_, name, metric) in enumerate(candidates):
+            curve, best = self._lag_curve(lags, coefficients[:, j], p_values[:, j], counts[:, j])
+            if best is None:
+                continue
+            
+            result = {
+                'metric': {
+                    'name': name,
+                    'source': metric['source'],
+                    'display': f"{name} ({metric['source']})"
+                },
+                'best_lag': best['lag'],
+                'correlation': best['coefficient'],
+                'p_value': best['p_value'],
+                'valid_pairs': best['valid_pairs']
+            }
+            if include_curves:
+                result['lags'] = curve
+            results.append(result)
+        
+        results.sort(key=lambda x: abs(x['correlation']), reverse=True)
+        return results[:top_n]
+    
+    def _metric_matrix(self, df, metrics, time_shift=None, use_density=False):
+        """Stack metrics into a (days x metrics) array on a complete calendar-day index
+        
+        Args:
+            df: Dataframe from get_metric_dataframe
+            metrics: List of (metric_name, source) tuples
+            time_shift: Dictionary specifying time shifts for metrics by source (e.g., {'oura': -1})
+            use_density: Whether to use nutrient density instead of raw values
+            
+        Returns:
+            Tuple (values, described, missing) where described holds a metric dict
+            for each column and missing lists the metrics without data
+        """
+        resolved = []
+        missing = []
+        for metric_name, source in metrics:
+            col, name = self._resolve_metric_column(df, metric_name, source, use_density)
+            if col in df.columns:
+                resolved.append((col, name, source, self._is_time_shifted(metric_name, source, time_shift)))
+            else:
+                missing.append(f"{metric_name} ({source})")
+        
+        if not resolved:
+            return np.empty((0, 0)), [], missing
+        
+        daily = self._to_daily_frame(df, sorted({col for col, _, _, _ in resolved}))
+        shift = time_shift.get('oura', 0) if time_shift else 0
+        shifted = daily.shift(shift) if shift else daily
+        
+        values = np.column_stack([
+            (shifted if is_shifted else daily)[col].to_numpy(dtype=float)
+            for col, _, _, is_shifted in resolved
+        ])
+        described = [{
+            'name': name,
+            'source': source,
+            'display': f"{name} ({source})",
+            'time_shifted': is_shifted
+        } for _, name, source, is_shifted in resolved]
+        return values, described, missing
+    
+    @profiled('analyzer.partial')
+    def _partial_correlation_frame(self, values, covariate_count, method, min_pairs):
+        """Partial correlation of the first column of values with every later column
+        
+        The last covariate_count columns are the covariates.
+        
+        Returns:
+            Tuple (coefficients, p_values, pair_counts, bivariate) for the middle columns,
+            where bivariate holds plain correlations over the same days
+        """
+        if method not in ('pearson', 'spearman'):
+            raise ValueError(f"Partial correlation supports 'pearson' and 'spearman', not '{method}'")
+        
+        # Spearman partial correlation is the Pearson partial correlation of ranks
+        if method == 'spearman':
+            values = rank_columns(values)
+        
+        split = values.shape[1] - covariate_count
+        x = values[:, 0]
+        y = values[:, 1:split]
+        z = values[:, split:]
+        
+        coefficients, counts = partial_pearson(x, y, z, min_pairs)
+        p_values = pearson_pvalues(coefficients, counts, covariate_count)
+        
+        # Uncontrolled correlation over exactly the same days, for comparison
+        x_same_days = np.where(np.isnan(z).any(axis=1), np.nan, x)
+        bivariate, _ = partial_pearson(x_same_days, y, np.empty((len(x), 0)), min_pairs)
+        return coefficients, p_values, counts, bivariate
+    
+    def calculate_partial_correlation(self, metric1_name, metric1_source, metric2_name, metric2_source,
+                                      covariates, start_date=None, end_date=None, method='pearson',
+                                      min_pairs=10, time_shift=None, use_density=False):
+        """Correlate two metrics while controlling for a set of covariates
+        
+        Both metrics are regressed on the covariates and their residuals are
+        correlated, e.g. a nutrient against sleep with Energy held fixed.
+        
+        Args:
+            metric1_name: Name of first metric
+            metric1_source: Source of first metric
+            metric2_name: Name of second metric
+            metric2_source: Source of second metric
+            covariates: List of (metric_name, source) tuples to control for
+            start_date: Start date for analysis
+            end_date: End date for analysis
+            method: Correlation method ('pearson' or 'spearman')
+            min_pairs: Minimum number of days with every metric present
+            time_shift: Dictionary specifying time shifts for metrics by source (e.g., {'oura': -1})
+            use_density: Whether to use nutrient density instead of raw values
+            
+        Returns:
+            Dict with the partial and the uncontrolled correlation
+        """
+        df = self.get_metric_dataframe(start_date, end_date, include_derived=use_density)
+        metrics = [(metric1_name, metric1_source), (metric2_name, metric2_source)] + list(covariates)
+        values, described, missing = self._metric_matrix(df, metrics, time_shift, use_density)
+        
+        if missing:
+            return {
+                'error': f"Metrics not found in data: {', '.join(missing)}"
+            }
+        
+        try:
+            coefficients, p_values, counts, bivariate = self._partial_correlation_frame(
+                values, len(covariates), method, min_pairs
+            )
+        except ValueError as e:
+            return {'error': str(e)}
+        
+        corr = coefficients[0]
+        valid_pairs = int(counts[0])
+        if np.isnan(corr):
+            return {
+                'error': f'Insufficient data points. Found {valid_pairs} days with every metric, '
+                         f'need at least {max(min_pairs, len(covariates) + 3)}.'
+            }
+        
+        return {
+            'metric1': described[0],
+            'metric2': described[1],
+            'covariates': described[2:],
+            'method': method,
+            'partial': {
+                'coefficient': float(corr),
+                'p_value': float(p_values[0]),
+                'valid_pairs': valid_pairs,
+                'interpretation': self._interpret_correlation(corr, p_values[0])
+            },
+            'bivariate': {
+                'coefficient': None if np.isnan(bivariate[0]) else float(bivariate[0])
+            }
+        }
+    
+    def calculate_partial_correlation_scan(self, target_metric_name, target_metric_source, covariates,
+                                           start_date=None, end_date=None, method='pearson',
+                                           min_pairs=10, top_n=10, time_shift=None, use_density=False):
+        """Partial correlations between a target metric and every other metric
+        
+        All candidate metrics are residualized against the covariates in one
+        batched solve.
+        
+        Args:
+            target_metric_name: Name of the target metric
+            target_metric_source: Source of the target metric
+            covariates: List of (metric_name, source) tuples to control for
+            start_date: Start date for analysis
+            end_date: End date for analysis
+            method: Correlation method ('pearson' or 'spearman')
+            min_pairs: Minimum number of days with every metric present
+            top_n: Number of metrics to return, ranked by |partial coefficient|
+            time_shift: Dictionary specifying time shifts for metrics by source (e.g., {'oura': -1})
+            use_density: Whether to use nutrient density instead of raw values
+            
+        Returns:
+            List of result dicts, strongest first
+        """
+        df = self.get_metric_dataframe(start_date, end_date, include_derived=use_density)
+        excluded = {(target_metric_name, target_metric_source)} | set(covariates)
+        candidates = [(m['metric_name'], m['source']) for m in self.get_available_metrics()
+                      if (m['metric_name'], m['source']) not in excluded]
+        
+        metrics = [(target_metric_name, target_metric_source)] + candidates + list(covariates)
+        values, described, missing = self._metric_matrix(df, metrics, time_shift, use_density)
+        
+        # The target and every covariate must exist; candidates without data are skipped
+        required = [(target_metric_name, target_metric_source)] + list(covariates)
+        if any(f"{name} ({source})" in missing for name, source in required):
+            return []
+        if len(described) - len(covariates) < 2:
+            return []
+        
+        coefficients, p_values, counts, bivariate = self._partial_correlation_frame(
+            values, len(covariates), method, min_pairs
+        )
+        q_values = benjamini_hochberg(p_values)
+        
+        results = []
+        for j, metric in enumerate(described[1:len(described) - len(covariates)]):
+            if np.isnan(coefficients[j]):
+                continue
+            results.append({
+                'metric': metric,
+                'correlation': float(coefficients[j]),
+                'p_value': float(p_values[j]),
+                'q_value': float(q_values[j]),
+                'bivariate_correlation': None if np.isnan(bivariate[j]) else float(bivariate[j]),
+                'valid_pairs': int(counts[j])
+            })
+        
+        results.sort(key=lambda x: abs(x['correlation']), reverse=True)
+        return results[:top_n]
+    
+    @profiled('analyzer.regression')
+    def calculate_regression(self, targets, predictors, start_date=None, end_date=None,
+                             min_pairs=10, time_shift=None, use_density=False):
+        """Multiple linear regression of one or more target metrics on a set of predictors
+        
+        Every target is fitted against the same predictors in one batched
+        least-squares solve. Standardized coefficients (in standard deviations of
+        the target per standard deviation of the predictor) make effects
+        comparable across metrics with different units.
+        
+        Args:
+            targets: List of (metric_name, source) tuples to explain
+            predictors: List of (metric_name, source) tuples used as regressors
+            start_date: Start date for analysis
+            end_date: End date for analysis
+            min_pairs: Minimum number of days with the target and every predictor present
+            time_shift: Dictionary specifying time shifts for metrics by source (e.g., {'oura': -1})
+            use_density: Whether to use nutrient density instead of raw values
+            
+        Returns:
+            Dict with the predictors and one fitted model per target
+        """
+        if not predictors:
+            return {'error': 'At least one predictor is required'}
+        
+        df = self.get_metric_dataframe(start_date, end_date, include_derived=use_density)
+        values, described, missing = self._metric_matrix(
+            df, list(predictors) + list(targets), time_shift, use_density)
+        
+        missing_predictors = [f"{name} ({source})" for name, source in predictors
+                              if f"{name} ({source})" in missing]
+        if missing_predictors:
+            return {
+                'error': f"Predictors not found in data: {', '.join(missing_predictors)}"
+            }
+        
+        split = len(predictors)
+        predictor_info = described[:split]
+        target_info = described[split:]
+        if not target_info:
+            return {
+                'error': f"Targets not found in data: {', '.join(missing)}"
+            }
+        
+        X = values[:, :split]
+        Y = values[:, split:]
+        fit = ols_fit(X, Y, min_pairs)
+        
+        results = []
+        for i, target in enumerate(target_info):
+            n = int(fit['counts'][i])
+            if np.isnan(fit['r_squared'][i]):
+                results.append({
+                    'target': target,
+                    'error': f'Insufficient data points. Found {n} complete days, '
+                             f'need at least {max(min_pairs, len(predictors) + 2)}.'
+                })
+                continue
+            
+            results.append({
+                'target': target,
+                'valid_pairs': n,
+                'r_squared': float(fit['r_squared'][i]),
+                'adjusted_r_squared': float(fit['adjusted_r_squared'][i]),
+                'intercept': float(fit['intercept'][i]),
+                'coefficients': [{
+                    'metric': predictor,
+                    'coefficient': float(fit['coefficients'][i, j]),
+                    'standardized': None if np.isnan(fit['standardized'][i, j]) else float(fit['standardized'][i, j]),
+                    'std_error': float(fit['std_errors'][i, j]),
+                    'p_value': float(fit['p_values'][i, j])
+                } for j, predictor in enumerate(predictor_info)]
+            })
+        
+        return {
+            'predictors': predictor_info,
+            'missing_targets': missing,
+            'results': results
+        }
+
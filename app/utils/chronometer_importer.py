@@ -1,11 +1,81 @@
+import hashlib
+import io
 import pandas as pd
 from datetime import datetime
 from flask import current_app
 from sqlalchemy.exc import SQLAlchemyError
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Tuple, Union, IO, Optional
 
 from .. import db
-from ..models.base import HealthData, DataType
+from ..models.base import HealthData, DataType, ImportFingerprint
+from .metrics import count_import_rows
+from .profiling import profiled
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _categories_salt(store_categories: bool) -> bytes:
+    """Prefix for file hashes, so importing with and without categories are told apart"""
+    return b'categories\n' if store_categories else b'nutrition\n'
+
+
+def _content_hash(source: Union[str, IO[bytes]], store_categories: bool):
+    """
+    Hash a CSV file or seekable stream (rewinding the stream afterwards).
+
+    Returns:
+        A hashlib sha256 object, or None if source is a stream that cannot be rewound.
+    """
+    file_hash = hashlib.sha256(_categories_salt(store_categories))
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                file_hash.update(chunk)
+        return file_hash
+
+    try:
+        if not source.seekable():
+            return None
+        start = source.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+    for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+        file_hash.update(chunk)
+    source.seek(start)
+    return file_hash
+
+
+class _HashingReader(io.BufferedIOBase):
+    """Read-through wrapper that hashes a stream while pandas parses it"""
+
+    def __init__(self, stream: IO[bytes], file_hash):
+        self._stream = stream
+        self._hash = file_hash
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self._hash.update(data)
+        return data
+
+    read1 = read
+
+
+def _day_digests(records: List[Dict[str, Any]]) -> Dict[Any, Tuple[str, int]]:
+    """Map each date to a hash of its (metric_name, metric_value) pairs and their count"""
+    by_day: Dict[Any, List[Tuple[str, float]]] = {}
+    for item in records:
+        by_day.setdefault(item['date'], []).append((item['metric_name'], float(item['metric_value'])))
+
+    digests = {}
+    for day, values in by_day.items():
+        values.sort()
+        text = '\n'.join(f"{metric_name}\t{metric_value!r}" for metric_name, metric_value in values)
+        digests[day] = (hashlib.sha256(text.encode('utf-8')).hexdigest(), len(values))
+    return digests
+
 
 class ChronometerImporter:
     """
@@ -70,12 +140,17 @@ class ChronometerImporter:
             k: v for k, v in self.metrics_config.items() if v['type'] == 'nutrition'
         }
 
-    def import_from_csv(self, file_path: str, store_categories: bool = False) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    def import_from_csv(self, file_path: Union[str, IO[bytes]], store_categories: bool = False,
+                        name: Optional[str] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
         """
         Import Chronometer data from a CSV file, process nutrition and categories, and store it.
 
         Args:
-            file_path: Path to the Chronometer CSV file.
+            file_path: Path to the Chronometer CSV file, or a binary file-like object
+                (e.g. an upload opened with utils.uploads.open_upload), which is parsed
+                as it is read.
+            store_categories: Whether to also store food category data points.
+            name: Name used for the data in log messages; defaults to file_path.
 
         Returns:
             A tuple containing two lists:
@@ -88,8 +163,22 @@ class ChronometerImporter:
             Exception: For other potential Pandas or file reading errors.
             SQLAlchemyError: If there's an issue during database operations.
         """
+        csv_source = file_path
+        if name or not isinstance(file_path, str):
+            file_path = name or '<upload>'
+
+        # --- Skip Files Imported Before ---
+        # Unseekable streams can only be hashed while they are parsed
+        file_hash = _content_hash(csv_source, store_categories)
+        if file_hash is None:
+            file_hash = hashlib.sha256(_categories_salt(store_categories))
+            csv_source = _HashingReader(csv_source, file_hash)
+        elif self._file_unchanged(file_hash.hexdigest()):
+            current_app.logger.info(f"'{file_path}' is unchanged since it was last imported; skipping.")
+            return [], []
+
         try:
-            df = pd.read_csv(file_path)
+            df = pd.read_csv(csv_source)
             if df.empty:
                 current_app.logger.warning(f"CSV file is empty: {file_path}")
                 return [], []
@@ -105,43 +194,195 @@ class ChronometerImporter:
 
         # --- Process Nutrition Data ---
         processed_nutrition = []
+        clean = True
         try:
             processed_nutrition = self._process_nutrition_data(df.copy(), file_path) # Use copy to avoid side effects
-            if processed_nutrition:
-                 self._store_data(processed_nutrition, data_kind='nutrition')
-                 current_app.logger.info(f"Successfully processed and stored {len(processed_nutrition)} nutrition data points from '{file_path}'.")
-            else:
-                 current_app.logger.info(f"No valid nutrition data found or processed from '{file_path}'.")
         except Exception as e:
+            clean = False
             # Log error but continue to category processing if possible
             current_app.logger.error(f"Error processing nutrition data from '{file_path}': {e}", exc_info=True)
 
-
         # --- Process Food Category Data ---
         processed_categories = []
         try:
             processed_categories = self._process_food_categories(df.copy(), file_path) # Use copy
-            if processed_categories and store_categories == True:
-                self._store_data(processed_categories, data_kind='food category')
-                current_app.logger.info(f"Successfully processed and stored {len(processed_categories)} food category data points from '{file_path}'.")
-            else:
-                 current_app.logger.info(f"No valid food category data found or processed from '{file_path}'.")
         except Exception as e:
+            clean = False
             current_app.logger.error(f"Error processing food category data from '{file_path}': {e}", exc_info=True)
-            # If storing nutrition succeeded but categories failed, the source timestamp might only reflect nutrition.
-            # Consider if separate timestamp updates are needed or if partial success is acceptable.
 
-        # --- Update Data Source Timestamp ---
-        # Update timestamp only if at least one part succeeded without raising SQLAlchemyError during storage
-        if processed_nutrition or processed_categories:
-             try:
-                 self._update_data_source()
-             except Exception as e:
-                 current_app.logger.error(f"Failed to update data source timestamp for '{self.SOURCE_NAME}': {e}", exc_info=True)
+        # --- Store Days Whose Totals Changed ---
+        to_store = processed_nutrition + (processed_categories if store_categories else [])
+        if not to_store:
+            current_app.logger.info(f"No valid data found or processed from '{file_path}'.")
+            return processed_nutrition, processed_categories
 
+        data_kind = 'nutrition and food category' if store_categories else 'nutrition'
+        try:
+            # Only a clean import fingerprints the file, so a failed one is retried in full next time
+            changed, day_fingerprints = self.store_changed_days(
+                to_store, data_kind, file_digest=file_hash.hexdigest() if clean else None)
+            current_app.logger.info(
+                f"'{file_path}': stored {len(changed)} {data_kind} data points; "
+                f"{len(day_fingerprints)} of {len({item['date'] for item in to_store})} days changed since the last import.")
+        except Exception as e:
+            current_app.logger.error(f"Error storing {data_kind} data from '{file_path}': {e}", exc_info=True)
 
         return processed_nutrition, processed_categories
 
+    def store_changed_days(self, records: List[Dict[str, Any]], data_kind: str = 'nutrition',
+                           file_digest: Optional[str] = None,
+                           dry_run: bool = False) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """
+        Stores the records of days that changed since the last import, in a single transaction.
+
+        Days whose totals match the last import's fingerprints are skipped. The rest are
+        stored, their fingerprints recorded along with the file's, if given, and the
+        source's last import time updated, all in one commit.
+
+        Args:
+            records: Processed data points, e.g. from process_csv.
+            data_kind: A string descriptor of the records for logging.
+            file_digest: Content hash of the imported file, recorded so an identical file is skipped next time.
+            dry_run: Only work out which days changed, without writing anything.
+
+        Returns:
+            A tuple of (records for changed days, new day fingerprints keyed by ISO date).
+
+        Raises:
+            SQLAlchemyError: If a database error occurs; nothing is stored.
+        """
+        changed, day_fingerprints = self._changed_days(records)
+        if dry_run or not records:
+            return changed, day_fingerprints
+
+        try:
+            self._store_data(changed, data_kind, commit=False)
+            self._record_fingerprints(file_digest, records, day_fingerprints, commit=False)
+            self._update_data_source(commit=False)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            raise
+        return changed, day_fingerprints
+
+    def process_csv(self, file_path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]:
+        """
+        Read and aggregate a Chronometer CSV file without storing anything.
+
+        Used by the bulk import command, which parses files in worker processes
+        and stores the merged result itself.
+
+        Args:
+            file_path: Path to the Chronometer CSV file.
+
+        Returns:
+            A tuple of (nutrition data points, food category data points, CSV row count).
+
+        Raises:
+            FileNotFoundError, pd.errors.EmptyDataError, KeyError: As raised while
+            reading or processing the file.
+        """
+        df = pd.read_csv(file_path)
+        if df.empty:
+            current_app.logger.warning(f"CSV file is empty: {file_path}")
+            return [], [], 0
+
+        return (
+            self._process_nutrition_data(df.copy(), file_path),
+            self._process_food_categories(df.copy(), file_path),
+            len(df)
+        )
+
+    def _file_unchanged(self, file_digest: str) -> bool:
+        """
+        Checks whether a file with this content hash was imported before and its rows are still present.
+
+        The row check is a count over the file's date range, enough to notice a wipe
+        or a deleted data type; day fingerprints catch the rest on a full import.
+        """
+        fingerprint = ImportFingerprint.query.filter_by(
+            source=self.SOURCE_NAME, kind='file', key=file_digest
+        ).first()
+        if fingerprint is None:
+            return False
+        if not fingerprint.record_count:
+            return True
+
+        present = db.session.query(db.func.count(HealthData.id)).filter(
+            HealthData.data_type_id.in_(db.session.query(DataType.id).filter(DataType.source == self.SOURCE_NAME)),
+            HealthData.date >= fingerprint.start_date,
+            HealthData.date <= fingerprint.end_date
+        ).scalar()
+        return present >= fingerprint.record_count
+
+    @profiled('chronometer.fingerprints')
+    def _changed_days(self, records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """
+        Drops the records of days whose totals match the fingerprints of the last import.
+
+        A day also counts as changed if fewer of its rows are in the database than
+        were imported, e.g. after data was deleted.
+
+        Args:
+            records: Processed data points about to be stored.
+
+        Returns:
+            A tuple of (records for changed days, new day fingerprints keyed by ISO date).
+        """
+        digests = _day_digests(records)
+        if not digests:
+            return [], {}
+
+        stored_digests = {
+            fingerprint.key: fingerprint.digest
+            for fingerprint in ImportFingerprint.query.filter(
+                ImportFingerprint.source == self.SOURCE_NAME,
+                ImportFingerprint.kind == 'day',
+                ImportFingerprint.key >= min(digests).isoformat(),
+                ImportFingerprint.key <= max(digests).isoformat()
+            )
+        }
+        candidates = {day for day, (digest, _) in digests.items() if stored_digests.get(day.isoformat()) == digest}
+
+        unchanged = set()
+        if candidates:
+            data_type_ids = [
+                data_type_id for (data_type_id,) in db.session.query(DataType.id).filter(
+                    DataType.source == self.SOURCE_NAME,
+                    DataType.metric_name.in_({item['metric_name'] for item in records})
+                )
+            ]
+            counts = dict(
+                db.session.query(HealthData.date, db.func.count(HealthData.id)).filter(
+                    HealthData.data_type_id.in_(data_type_ids),
+                    HealthData.date >= min(candidates),
+                    HealthData.date <= max(candidates)
+                ).group_by(HealthData.date).all()
+            )
+            unchanged = {day for day in candidates if counts.get(day, 0) == digests[day][1]}
+
+        changed = [item for item in records if item['date'] not in unchanged]
+        fingerprints = {
+            day.isoformat(): {'digest': digest, 'record_count': count, 'start_date': day, 'end_date': day}
+            for day, (digest, count) in digests.items() if day not in unchanged
+        }
+        return changed, fingerprints
+
+    def _record_fingerprints(self, file_digest: Optional[str], records: List[Dict[str, Any]],
+                             day_fingerprints: Dict[str, Dict[str, Any]], commit: bool = True):
+        """Stores day fingerprints and, if given, the file fingerprint, then commits unless commit is False."""
+        ImportFingerprint.record(self.SOURCE_NAME, 'day', day_fingerprints)
+        if file_digest and records:
+            dates = [item['date'] for item in records]
+            ImportFingerprint.record(self.SOURCE_NAME, 'file', {file_digest: {
+                'digest': file_digest,
+                'record_count': len(records),
+                'start_date': min(dates),
+                'end_date': max(dates)
+            }})
+        if commit:
+            db.session.commit()
+
     def _validate_columns(self, df_columns: pd.Index, expected_mapping: Dict[str, str], file_path: str, data_kind: str) -> set:
         """Checks for missing expected columns and logs warnings."""
         actual_cols = set(df_columns)
@@ -159,6 +400,7 @@ class ChronometerImporter:
             )
         return actual_cols # Return the set of columns actually present
 
+    @profiled('chronometer.nutrition')
     def _process_nutrition_data(self, df: pd.DataFrame, file_path: str) -> List[Dict[str, Any]]:
         """Processes raw Chronometer nutrition CSV data using vectorized operations."""
         current_app.logger.debug(f"Starting nutrition data processing for '{file_path}'.")
@@ -200,7 +442,7 @@ class ChronometerImporter:
 
         # Group by date and sum up values. Fill NaN with 0 before summing.
         # Using fillna(0) explicitly before sum handles cases where a whole day might have NaNs for a metric
-        daily_totals = df_filtered.groupby('date')[nutrient_csv_cols].agg(lambda x: x.fillna(0).sum())
+        daily_totals = df_filtered[nutrient_csv_cols].fillna(0).groupby(df_filtered['date']).sum()
 
 
         # Rename columns from CSV names back to canonical metric names for melting
@@ -216,9 +458,9 @@ class ChronometerImporter:
         )
 
         # Add units based on the canonical metric name
-        daily_totals_long['metric_units'] = daily_totals_long['metric_name'].apply(
-            lambda name: self.nutrition_metrics.get(name, {}).get('unit', '')
-        )
+        daily_totals_long['metric_units'] = daily_totals_long['metric_name'].map(
+            {name: config.get('unit', '') for name, config in self.nutrition_metrics.items()}
+        ).fillna('')
 
         # Filter out rows where value is NaN (unlikely after fillna(0).sum() but safe)
         daily_totals_long.dropna(subset=['metric_value'], inplace=True)
@@ -229,6 +471,7 @@ class ChronometerImporter:
         return processed_data
 
 
+    @profiled('chronometer.categories')
     def _process_food_categories(self, df: pd.DataFrame, file_path: str) -> List[Dict[str, Any]]:
         """Processes food category data using vectorized operations."""
         current_app.logger.debug(f"Starting food category processing for '{file_path}'.")
@@ -300,7 +543,8 @@ class ChronometerImporter:
         return processed_data
 
 
-    def _store_data(self, processed_data: List[Dict[str, Any]], data_kind: str):
+    @profiled('chronometer.store')
+    def _store_data(self, processed_data: List[Dict[str, Any]], data_kind: str, commit: bool = True):
         """
         Stores processed data (either nutrition or category) in the database with optimizations.
 
@@ -308,6 +552,7 @@ class ChronometerImporter:
             processed_data: A list of dictionaries, each representing a data point.
                             Expected keys: 'date', 'metric_name', 'metric_value', 'metric_units'.
             data_kind: A string descriptor ('nutrition' or 'food category') for logging.
+            commit: Whether to commit; False leaves the changes in the session for the caller's transaction.
 
         Raises:
             SQLAlchemyError: If a database error occurs during the transaction.
@@ -354,6 +599,8 @@ class ChronometerImporter:
         # --- Step 2: Prepare HealthData for Upsert ---
         updates = []
         inserts = []
+        unchanged = 0
+        skipped = 0
         unique_dates = {item['date'] for item in processed_data}
         # Ensure data_type_map is up-to-date after potential additions
         data_type_ids = {dt.id for dt in data_type_map.values() if dt.id is not None} # Filter out None IDs if flush failed somehow
@@ -389,6 +636,7 @@ class ChronometerImporter:
             # Ensure data_type and its id are valid before proceeding
             if not data_type or data_type.id is None:
                  current_app.logger.warning(f"Skipping item due to missing or invalid DataType ID for metric '{metric_name}'. Item: {item}")
+                 skipped += 1
                  continue
 
             lookup_key = (data_type.id, item['date'])
@@ -399,15 +647,19 @@ class ChronometerImporter:
                 metric_value = float(item['metric_value'])
             except (ValueError, TypeError) as e:
                  current_app.logger.warning(f"Could not convert metric_value '{item['metric_value']}' to float for metric '{metric_name}' on date {item['date']}. Skipping record. Error: {e}")
+                 skipped += 1
                  continue # Skip this record
 
             if existing_record:
                 # Update existing record only if value has changed
                 if existing_record.metric_value != metric_value:
                     existing_record.metric_value = metric_value
+                    updates.append(existing_record)
                     # Ensure the fetched object is associated with the session if not already
                     if existing_record not in db.session:
                          db.session.add(existing_record)
+                else:
+                    unchanged += 1
             else:
                 # Prepare for insert
                 new_data = HealthData(
@@ -426,12 +678,16 @@ class ChronometerImporter:
             # Updates to existing_record objects are tracked by the session
 
             # Check if there are any pending changes before committing
-            if db.session.new or db.session.dirty:
+            if not commit:
+                 current_app.logger.debug(f"Leaving {data_kind} changes for the caller to commit.")
+            elif db.session.new or db.session.dirty:
                  current_app.logger.debug(f"Session has {len(db.session.new)} new and {len(db.session.dirty)} dirty objects to commit for {data_kind}.")
                  db.session.commit()
                  current_app.logger.info(f"Successfully committed database changes for {data_kind}.")
             else:
                  current_app.logger.info(f"No database changes detected for {data_kind}. Commit skipped.")
+            count_import_rows(self.SOURCE_NAME, inserted=len(inserts), updated=len(updates),
+                              unchanged=unchanged, skipped=skipped)
 
 
         except SQLAlchemyError as e:
@@ -440,12 +696,13 @@ class ChronometerImporter:
             raise # Re-raise the error after rollback
 
 
-    def _update_data_source(self):
-        """Updates the last import timestamp for all data types from this source."""
+    def _update_data_source(self, commit: bool = True):
+        """Updates the last import timestamp for all data types from this source, committing unless commit is False."""
         try:
             # Ensure the update happens in a transaction
             DataType.update_last_import(self.SOURCE_NAME)
-            db.session.commit() # Commit the timestamp update separately or as part of the main transaction
+            if commit:
+                db.session.commit()
             current_app.logger.info(f"Updated last import timestamp for source '{self.SOURCE_NAME}'.")
         except SQLAlchemyError as e:
              db.session.rollback() # Rollback if timestamp update fails
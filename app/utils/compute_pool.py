@@ -0,0 +1,188 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+
+from ..models.base import current_user_id
+from .analyzer import HealthAnalyzer
+from .profiling import phase
+
+# HealthAnalyzer methods run in the compute pool; everything else stays in the request's thread
+OFFLOADED_METHODS = frozenset({
+    'calculate_correlation', 'calculate_multiple_correlations', 'calculate_rolling_correlations',
+    'calculate_lag_correlation', 'calculate_lag_scan', 'calculate_partial_correlation',
+    'calculate_partial_correlation_scan', 'calculate_regression',
+})
+
+
+def _init_worker(config_name, overrides, niceness):
+    """Give each worker process an app of its own, with its own database connections
+
+    With a niceness, workers also run at lower CPU priority than the server,
+    so on a busy host light requests are scheduled ahead of long calculations.
+    """
+    from .. import create_app
+    if niceness and hasattr(os, 'nice'):
+        os.nice(niceness)
+    create_app(config_name, overrides).app_context().push()
+
+
+def _call_analyzer(user_id, method, args, kwargs):
+    """Run one HealthAnalyzer method for a user; runs in a worker process
+
+    Returns:
+        Tuple (result, CPU seconds the call used)
+    """
+    start = time.thread_time()
+    result = getattr(HealthAnalyzer(user_id=user_id), method)(*args, **kwargs)
+    return result, time.thread_time() - start
+
+
+class ComputePool:
+    """Worker processes running CPU-heavy analysis off the web server's threads
+
+    While a calculation runs in a worker, the request's thread only waits
+    on it, so the server's other threads (or an ASGI server's event loop)
+    keep answering light requests without contending for the GIL. Workers
+    are started with 'spawn', on first use, and each builds its own app, so
+    they keep their own metric frame caches.
+    """
+
+    # Weight of the latest call in a kind of call's running mean CPU time
+    DURATION_WEIGHT = 0.3
+
+    def __init__(self, app, workers, timeout=None, niceness=0, min_seconds=0.0):
+        """
+        Args:
+            app: Flask app whose configuration the workers copy
+            workers: Number of worker processes
+            timeout: Seconds a request waits for a result before failing
+            niceness: Increment to the workers' nice value (Unix only)
+            min_seconds: Running mean CPU time from which other calls than
+                resampling ones are offloaded
+        """
+        self.workers = workers
+        self.timeout = timeout
+        self.niceness = niceness
+        self.min_seconds = min_seconds
+        self._durations = {}
+        # Workers must not start pools of their own, or profile and count into nothing
+        self._overrides = {
+            'SQLALCHEMY_DATABASE_URI': app.config['SQLALCHEMY_DATABASE_URI'],
+            'ANALYSIS_WORKERS': 0,
+            'RESAMPLING_WORKERS': 1,
+            'CORRELATION_WORKERS': 1,
+            'PROFILING': False,
+            'METRICS': False,
+        }
+        self._config_name = app.config['CONFIG_NAME']
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Schedule fn(*args) in a worker process and return its Future"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker, initargs=(self._config_name, self._overrides, self.niceness))
+                atexit.register(self.shutdown)
+        return self._executor.submit(fn, *args)
+
+    def offloads(self, kind):
+        """Whether calls of kind, a (method, resamples) tuple, run in the workers
+
+        Resampling calls always do. Other calls run inline, where they skip
+        the hand-off to a worker, until the running mean of the CPU time
+        they use reaches min_seconds; calls this short gain nothing from a
+        worker, which competes for the same CPUs. CPU time rather than wall
+        time keeps a loaded server from counting its queueing as work.
+        """
+        if kind[1]:
+            return True
+        with self._lock:
+            return self._durations.get(kind, 0.0) >= self.min_seconds
+
+    def record(self, kind, seconds):
+        """Fold one call's CPU seconds into its kind's running mean"""
+        with self._lock:
+            mean = self._durations.get(kind)
+            self._durations[kind] = seconds if mean is None else mean + self.DURATION_WEIGHT * (seconds - mean)
+
+    def call_analyzer(self, user_id, method, *args, **kwargs):
+        """Run a HealthAnalyzer method for user_id in a worker and wait for its result
+
+        An n_jobs argument is dropped: it is sized for the server, and the
+        worker reads its own RESAMPLING_WORKERS (1) instead, so a busy pool
+        never starts a process pool in each of its workers.
+        """
+        kwargs.pop('n_jobs', None)
+        future = self.submit(_call_analyzer, user_id, method, args, kwargs)
+        with phase(f'pool.{method}'):
+            result, seconds = future.result(self.timeout)
+        self.record((method, bool(kwargs.get('n_resamples'))), seconds)
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+class OffloadedAnalyzer:
+    """A HealthAnalyzer whose OFFLOADED_METHODS run in a ComputePool
+
+    Other attributes are served by a local HealthAnalyzer for the same user,
+    and so are offloadable calls the pool does not consider heavy (see
+    ComputePool.offloads).
+    """
+
+    def __init__(self, pool, user_id=None):
+        self._pool = pool
+        self._local = HealthAnalyzer(user_id=user_id)
+        self.user_id = self._local.user_id
+
+    def __getattr__(self, name):
+        if name not in OFFLOADED_METHODS:
+            return getattr(self._local, name)
+
+        def call(*args, **kwargs):
+            kind = (name, bool(kwargs.get('n_resamples')))
+            if self._pool.offloads(kind):
+                return self._pool.call_analyzer(self.user_id, name, *args, **kwargs)
+            start = time.thread_time()
+            result = getattr(self._local, name)(*args, **kwargs)
+            self._pool.record(kind, time.thread_time() - start)
+            return result
+        return call
+
+
+def request_analyzer(user_id=None):
+    """Return an analyzer for the current user, offloaded when the app has a compute pool"""
+    pool = current_app.extensions.get('compute_pool')
+    if pool is None:
+        return HealthAnalyzer(user_id=user_id)
+    return OffloadedAnalyzer(pool, user_id if user_id is not None else current_user_id())
+
+
+def init_compute_pool(app):
+    """Run analysis API calculations in ANALYSIS_WORKERS processes, if set
+
+    Workers need a database they can open themselves, so in-memory SQLite
+    databases keep running calculations inline.
+    """
+    workers = app.config.get('ANALYSIS_WORKERS', 0)
+    if not workers:
+        return None
+    if app.config['SQLALCHEMY_DATABASE_URI'] in ('sqlite://', 'sqlite:///:memory:'):
+        app.logger.warning("ANALYSIS_WORKERS ignored: worker processes cannot share an in-memory database")
+        return None
+    pool = ComputePool(app, workers, app.config.get('ANALYSIS_TIMEOUT'), app.config.get('ANALYSIS_NICENESS', 0),
+                       app.config.get('ANALYSIS_POOL_MIN_MS', 250) / 1000)
+    app.extensions['compute_pool'] = pool
+    return pool
@@ -0,0 +1,862 @@
+import atexit
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+def _as_2d(values):
+    """Return a float copy of values as a 2-D (rows, columns) array and whether it was 1-D"""
+    arr = np.asarray(values, dtype=float)
+    if arr.ndim == 1:
+        return arr[:, None], True
+    return arr, False
+
+
+def _window_sums(values, window):
+    """Trailing window sums over axis 0 using a single cumulative sum
+
+    Each output row t holds the sum of rows max(0, t - window + 1) .. t, so every
+    step costs O(1) regardless of the window length.
+    """
+    cumulative = np.zeros((values.shape[0] + 1,) + values.shape[1:])
+    np.cumsum(values, axis=0, out=cumulative[1:])
+    upper = np.arange(1, values.shape[0] + 1)
+    lower = np.maximum(0, upper - window)
+    return cumulative[upper] - cumulative[lower]
+
+
+def rolling_pearson(x, y, window, min_periods=None):
+    """Calculate trailing-window Pearson correlations with incremental sums
+
+    x and y must be aligned on a complete daily index (one row per calendar day),
+    with NaN marking days where a metric is missing. Only rows where both values
+    are present contribute to a window. Both arrays may be 2-D, in which case each
+    column pair is treated as an independent series.
+
+    Args:
+        x: Array of shape (days,) or (days, pairs)
+        y: Array with the same shape as x
+        window: Window length in days
+        min_periods: Minimum number of valid pairs in a window (defaults to window)
+
+    Returns:
+        Tuple (coefficients, pair_counts) with the same shape as x. Coefficients are
+        NaN where a window has too few pairs or zero variance.
+    """
+    if window < 2:
+        raise ValueError("Window size must be at least 2")
+    if min_periods is None:
+        min_periods = window
+    min_periods = max(2, int(min_periods))
+
+    x_arr, squeeze = _as_2d(x)
+    y_arr, _ = _as_2d(y)
+    if x_arr.shape != y_arr.shape:
+        raise ValueError("x and y must have the same shape")
+
+    valid = ~(np.isnan(x_arr) | np.isnan(y_arr))
+    counts_total = valid.sum(axis=0)
+
+    # Center each series on its overall mean so the running sums stay small and
+    # the sum-of-squares formulas don't lose precision over long histories
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = np.where(valid, x_arr, 0.0).sum(axis=0) / np.maximum(counts_total, 1)
+        y_mean = np.where(valid, y_arr, 0.0).sum(axis=0) / np.maximum(counts_total, 1)
+    xc = np.where(valid, x_arr - x_mean, 0.0)
+    yc = np.where(valid, y_arr - y_mean, 0.0)
+
+    n = _window_sums(valid.astype(float), window)
+    sum_x = _window_sums(xc, window)
+    sum_y = _window_sums(yc, window)
+    sum_xy = _window_sums(xc * yc, window)
+    sum_xx = _window_sums(xc * xc, window)
+    sum_yy = _window_sums(yc * yc, window)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sum_xy - sum_x * sum_y / n
+        var_x = sum_xx - sum_x * sum_x / n
+        var_y = sum_yy - sum_y * sum_y / n
+        coefficients = cov / np.sqrt(var_x * var_y)
+
+    # Tiny negative variances can appear from rounding when a window is constant
+    scale_x = np.maximum(sum_xx, 1.0) * 1e-12
+    scale_y = np.maximum(sum_yy, 1.0) * 1e-12
+    usable = (n >= min_periods) & (var_x > scale_x) & (var_y > scale_y)
+    coefficients = np.where(usable, np.clip(coefficients, -1.0, 1.0), np.nan)
+    counts = n.astype(int)
+
+    if squeeze:
+        return coefficients[:, 0], counts[:, 0]
+    return coefficients, counts
+
+
+def pairwise_pearson(x, y, min_periods=2):
+    """Correlate every column of x with every column of y using pairwise-complete rows
+
+    All column pairs are computed at once with masked matrix products, so a
+    (days x a) by (days x b) problem costs a handful of matrix multiplications
+    instead of a * b separate correlation calls.
+
+    Args:
+        x: Array of shape (days, a), NaN marking missing values
+        y: Array of shape (days, b) aligned with x
+        min_periods: Minimum number of rows where both columns have data
+
+    Returns:
+        Tuple (coefficients, pair_counts), both of shape (a, b)
+    """
+    x_arr, _ = _as_2d(x)
+    y_arr, _ = _as_2d(y)
+
+    x_valid = ~np.isnan(x_arr)
+    y_valid = ~np.isnan(y_arr)
+    mx = x_valid.astype(float)
+    my = y_valid.astype(float)
+
+    # Center on each column's own mean to keep the sums well conditioned
+    x_mean = np.where(x_valid, x_arr, 0.0).sum(axis=0) / np.maximum(x_valid.sum(axis=0), 1)
+    y_mean = np.where(y_valid, y_arr, 0.0).sum(axis=0) / np.maximum(y_valid.sum(axis=0), 1)
+    x0 = np.where(x_valid, x_arr - x_mean, 0.0)
+    y0 = np.where(y_valid, y_arr - y_mean, 0.0)
+
+    n = mx.T @ my
+    sum_x = x0.T @ my
+    sum_y = mx.T @ y0
+    sum_xy = x0.T @ y0
+    sum_xx = (x0 * x0).T @ my
+    sum_yy = mx.T @ (y0 * y0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sum_xy - sum_x * sum_y / n
+        var_x = sum_xx - sum_x * sum_x / n
+        var_y = sum_yy - sum_y * sum_y / n
+        coefficients = cov / np.sqrt(var_x * var_y)
+
+    usable = (n >= max(2, min_periods)) & (var_x > sum_xx * 1e-12) & (var_y > sum_yy * 1e-12)
+    coefficients = np.where(usable, np.clip(coefficients, -1.0, 1.0), np.nan)
+    return coefficients, n.astype(int)
+
+
+def pearson_pvalues(coefficients, counts, n_covariates=0):
+    """Two-sided p-values for Pearson coefficients using the t distribution
+
+    For partial correlations pass the number of covariates controlled for; each
+    one removes a degree of freedom.
+    """
+    r = np.asarray(coefficients, dtype=float)
+    n = np.asarray(counts, dtype=float)
+    dof = n - 2 - n_covariates
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t_stat = r * np.sqrt(dof / np.maximum(1.0 - r * r, 1e-300))
+        p_values = 2 * stats.t.sf(np.abs(t_stat), dof)
+    return np.where(np.isnan(r) | (dof <= 0), np.nan, np.clip(p_values, 0.0, 1.0))
+
+
+def partial_pearson(x, y, covariates, min_periods=3):
+    """Partial Pearson correlation of x with every column of y, controlling for covariates
+
+    For each y column, x and that column are both regressed on the covariates
+    (plus an intercept) over the days where x, the column and every covariate
+    are present, and the residuals are correlated. The per-column normal
+    equations are built with einsum and inverted as one batched stack, so a
+    target-vs-all scan is a single solve rather than one fit per column.
+
+    Args:
+        x: Array of shape (days,)
+        y: Array of shape (days,) or (days, columns) aligned with x
+        covariates: Array of shape (days, k) aligned with x; k may be 0
+        min_periods: Minimum number of complete days per column
+
+    Returns:
+        Tuple (coefficients, pair_counts) with one entry per y column. Use
+        pearson_pvalues with n_covariates=k for p-values.
+    """
+    x_arr = np.asarray(x, dtype=float)
+    y_arr, squeeze = _as_2d(y)
+    z = np.asarray(covariates, dtype=float).reshape(x_arr.shape[0], -1)
+
+    base = ~np.isnan(x_arr) & ~np.isnan(z).any(axis=1)
+    mask = (base[:, None] & ~np.isnan(y_arr)).astype(float)
+    design = np.column_stack([np.ones(x_arr.shape[0]), np.where(base[:, None], z, 0.0)])
+    x0 = np.where(base, x_arr, 0.0)
+    y0 = np.where(mask > 0, y_arr, 0.0)
+
+    # Masked normal equations for every column at once: (columns, p, p)
+    gram = np.einsum('tc,tp,tq->cpq', mask, design, design, optimize=True)
+    inverse = np.linalg.pinv(gram)
+    beta_x = np.einsum('cpq,tc,tq,t->cp', inverse, mask, design, x0, optimize=True)
+    beta_y = np.einsum('cpq,tc,tq,tc->cp', inverse, mask, design, y0, optimize=True)
+
+    resid_x = (x0[:, None] - design @ beta_x.T) * mask
+    resid_y = (y0 - design @ beta_y.T) * mask
+    n = mask.sum(axis=0)
+    ss_x = (resid_x * resid_x).sum(axis=0)
+    ss_y = (resid_y * resid_y).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        coefficients = (resid_x * resid_y).sum(axis=0) / np.sqrt(ss_x * ss_y)
+
+    # Residuals that vanish mean a metric is (almost) explained by the covariates
+    scale_x = (x0[:, None] ** 2 * mask).sum(axis=0)
+    scale_y = (y0 * y0 * mask).sum(axis=0)
+    usable = ((n >= max(min_periods, design.shape[1] + 2))
+              & (ss_x > scale_x * 1e-12) & (ss_y > scale_y * 1e-12))
+    coefficients = np.where(usable, np.clip(coefficients, -1.0, 1.0), np.nan)
+    counts = n.astype(int)
+    if squeeze:
+        return coefficients[0], counts[0]
+    return coefficients, counts
+
+
+def ols_fit(X, Y, min_periods=None):
+    """Ordinary least squares of every column of Y on the columns of X, with an intercept
+
+    Days with any missing predictor are dropped. Targets that are missing on
+    the same days share one lstsq call, so fitting many targets against one set
+    of predictors usually costs a single solve.
+
+    Args:
+        X: Predictor array of shape (days, p)
+        Y: Target array of shape (days,) or (days, targets)
+        min_periods: Minimum number of complete days per target (defaults to p + 2)
+
+    Returns:
+        Dict of arrays: 'coefficients', 'standardized', 'std_errors' and 'p_values'
+        shaped (targets, p); 'intercept', 'r_squared', 'adjusted_r_squared' and
+        'counts' shaped (targets,). Targets with too few days are NaN throughout.
+    """
+    X_arr = np.asarray(X, dtype=float)
+    if X_arr.ndim == 1:
+        X_arr = X_arr[:, None]
+    Y_arr, _ = _as_2d(Y)
+    p = X_arr.shape[1]
+    targets = Y_arr.shape[1]
+    min_periods = max(p + 2, min_periods or 0)
+
+    fit = {key: np.full((targets, p), np.nan)
+           for key in ('coefficients', 'standardized', 'std_errors', 'p_values')}
+    fit.update({key: np.full(targets, np.nan)
+                for key in ('intercept', 'r_squared', 'adjusted_r_squared')})
+
+    present = ~np.isnan(X_arr).any(axis=1)[:, None] & ~np.isnan(Y_arr)
+    fit['counts'] = present.sum(axis=0)
+    patterns, group_of = np.unique(present.T, axis=0, return_inverse=True)
+
+    for g, rows in enumerate(patterns):
+        columns = np.flatnonzero(group_of.ravel() == g)
+        n = int(rows.sum())
+        if n < min_periods:
+            continue
+
+        Xg = X_arr[rows]
+        Yg = Y_arr[rows][:, columns]
+        x_mean = Xg.mean(axis=0)
+        y_mean = Yg.mean(axis=0)
+        Xc = Xg - x_mean
+        Yc = Yg - y_mean
+
+        # Centering absorbs the intercept, so one lstsq fits every target in the group
+        beta, _, _, _ = np.linalg.lstsq(Xc, Yc, rcond=None)
+        resid = Yc - Xc @ beta
+        sse = (resid * resid).sum(axis=0)
+        sst = (Yc * Yc).sum(axis=0)
+        dof = n - p - 1
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sigma2 = sse / dof
+            se = np.sqrt(sigma2[:, None] * np.diag(np.linalg.pinv(Xc.T @ Xc))[None, :])
+            t_stat = beta.T / se
+            r_squared = np.where(sst > 0, 1.0 - sse / sst, np.nan)
+            x_sd = Xc.std(axis=0)
+            y_sd = Yc.std(axis=0)
+            standardized = beta.T * x_sd[None, :] / y_sd[:, None]
+
+        fit['coefficients'][columns] = beta.T
+        fit['standardized'][columns] = np.where(y_sd[:, None] > 0, standardized, np.nan)
+        fit['std_errors'][columns] = se
+        fit['p_values'][columns] = np.clip(2 * stats.t.sf(np.abs(t_stat), dof), 0.0, 1.0)
+        fit['intercept'][columns] = y_mean - x_mean @ beta
+        fit['r_squared'][columns] = r_squared
+        fit['adjusted_r_squared'][columns] = 1.0 - (1.0 - r_squared) * (n - 1) / dof
+
+    return fit
+
+
+def rank_columns(values):
+    """Replace each column with its average ranks, leaving NaN in place"""
+    arr, squeeze = _as_2d(values)
+    ranked = pd.DataFrame(arr).rank(axis=0, method='average').to_numpy(dtype=float)
+    return ranked[:, 0] if squeeze else ranked
+
+
+def lag_scan(x, y, max_lag, min_periods=2):
+    """Correlate x against every column of y at all lags from -max_lag to +max_lag
+
+    The lagged copies of x are taken as a strided view over a NaN-padded array,
+    so all lags and all columns are evaluated in one pairwise_pearson call.
+    A positive lag k pairs x on day t with y on day t - k, i.e. y leads x by k days.
+
+    Args:
+        x: Array of shape (days,) aligned on a complete daily index
+        y: Array of shape (days,) or (days, columns) aligned with x
+        max_lag: Largest lag in days to evaluate in each direction
+        min_periods: Minimum number of overlapping days for a coefficient
+
+    Returns:
+        Tuple (lags, coefficients, pair_counts); coefficients and pair_counts have
+        shape (2 * max_lag + 1, columns)
+    """
+    max_lag = int(max_lag)
+    if max_lag < 0:
+        raise ValueError("max_lag must not be negative")
+
+    x_arr = np.asarray(x, dtype=float)
+    padding = np.full(max_lag, np.nan)
+    padded = np.concatenate([padding, x_arr, padding])
+    # Column j of the view holds x[t + j - max_lag], i.e. x shifted by lag j - max_lag
+    lagged = np.lib.stride_tricks.sliding_window_view(padded, 2 * max_lag + 1)
+
+    coefficients, counts = pairwise_pearson(lagged, y, min_periods)
+    lags = np.arange(-max_lag, max_lag + 1)
+    return lags, coefficients, counts
+
+
+def benjamini_hochberg(p_values):
+    """Benjamini-Hochberg adjusted p-values (q-values) for a set of tests
+
+    NaN entries are ignored and stay NaN; the output has the input's shape.
+    """
+    p = np.asarray(p_values, dtype=float)
+    q = np.full(p.shape, np.nan)
+    flat = p.ravel()
+    valid = np.flatnonzero(~np.isnan(flat))
+    if valid.size == 0:
+        return q
+
+    order = valid[np.argsort(flat[valid], kind='mergesort')]
+    ranked = flat[order] * valid.size / np.arange(1, valid.size + 1)
+    # Enforce monotonicity from the largest p-value down
+    adjusted = np.minimum.accumulate(ranked[::-1])[::-1]
+    q_flat = q.ravel()
+    q_flat[order] = np.clip(adjusted, 0.0, 1.0)
+    return q_flat.reshape(p.shape)
+
+
+def _rowwise_pearson(x, y):
+    """Pearson correlation of matching rows of two (batch, n) arrays"""
+    xc = x - x.mean(axis=1, keepdims=True)
+    yc = y - y.mean(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (xc * yc).sum(axis=1) / np.sqrt((xc * xc).sum(axis=1) * (yc * yc).sum(axis=1))
+
+
+def _resample_batch(arrays, task):
+    """Run one batch of resamples; module-level so it can execute in a worker process
+
+    arrays holds the paired data 'x' and 'y'; task is a tuple
+    (kind, method, seed_sequence, size, min_periods) where kind is
+    'bootstrap', 'permutation' or 'permutation_matrix'.
+    """
+    kind, method, seed_sequence, size, min_periods = task
+    x, y = arrays['x'], arrays['y']
+    rng = np.random.default_rng(seed_sequence)
+
+    if kind == 'bootstrap':
+        idx = rng.integers(0, x.shape[0], size=(size, x.shape[0]))
+        xb = x[idx]
+        yb = y[idx]
+        if method == 'spearman':
+            xb = stats.rankdata(xb, axis=1)
+            yb = stats.rankdata(yb, axis=1)
+        return _rowwise_pearson(xb, yb)
+
+    if kind == 'permutation':
+        # Ranks are invariant under permutation, so Spearman inputs arrive pre-ranked
+        idx = rng.permuted(np.tile(np.arange(x.shape[0]), (size, 1)), axis=1)
+        return _rowwise_pearson(np.broadcast_to(x, (size, x.shape[0])), y[idx])
+
+    if kind == 'permutation_matrix':
+        # x is (days, a) and y is (days, b); count permuted |r| >= observed |r|
+        observed, _ = pairwise_pearson(x, y, min_periods)
+        exceed = np.zeros(observed.shape)
+        for _ in range(size):
+            permuted, _ = pairwise_pearson(x, y[rng.permutation(y.shape[0])], min_periods)
+            exceed += np.abs(permuted) >= np.abs(observed) - 1e-12
+        return exceed
+
+    raise ValueError(f"Unknown resampling kind: {kind}")
+
+
+class SharedArrays:
+    """Numpy arrays copied once into a shared memory block for worker processes
+
+    Workers map the block by name (see _call_shared) instead of unpickling
+    their own copy of every array with every task. Use as a context manager;
+    the block is unlinked on exit.
+    """
+
+    def __init__(self, **arrays):
+        arrays = {name: np.ascontiguousarray(value) for name, value in arrays.items()}
+        layout, size = [], 0
+        for name, value in arrays.items():
+            layout.append((name, size, value.shape, value.dtype.str))
+            # Keep every array aligned to a cache line
+            size += -(-value.nbytes // 64) * 64
+        self._block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for (name, offset, shape, dtype) in layout:
+            np.ndarray(shape, dtype, buffer=self._block.buf, offset=offset)[...] = arrays[name]
+        self.spec = (self._block.name, tuple(layout))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._block is not None:
+            self._block.close()
+            self._block.unlink()
+            self._block = None
+
+
+def _call_shared(fn, spec, task, deadline=None):
+    """Call fn(arrays, task) with arrays mapped from a SharedArrays block; runs in a worker process
+
+    A task picked up after the wall-clock deadline is skipped and returns None.
+    """
+    if deadline is not None and time.time() >= deadline:
+        return None
+    name, layout = spec
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        arrays = {key: np.ndarray(shape, dtype, buffer=block.buf, offset=offset)
+                  for key, offset, shape, dtype in layout}
+        result = fn(arrays, task)
+        del arrays
+        return result
+    finally:
+        try:
+            block.close()
+        except BufferError:
+            # A view escaped into the result; the mapping goes when it is collected
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def worker_pool(n_jobs):
+    """Return the persistent pool of n_jobs worker processes, starting it on first use
+
+    Workers are started with 'spawn' and kept for the life of the process,
+    so numpy and scipy are imported once per worker rather than once per
+    calculation.
+    """
+    with _pools_lock:
+        pool = _pools.get(n_jobs)
+        if pool is None:
+            if not _pools:
+                atexit.register(shutdown_worker_pools)
+            pool = _pools[n_jobs] = ProcessPoolExecutor(
+                max_workers=n_jobs, mp_context=multiprocessing.get_context('spawn'))
+        return pool
+
+
+def shutdown_worker_pools():
+    """Stop every pool started by worker_pool"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _run_tasks(fn, tasks, arrays, n_jobs=1, time_budget=None):
+    """Run fn(arrays, task) for every task, inline or on the worker pool, within an optional time budget
+
+    On the pool, arrays are passed to the workers through shared memory and
+    the results are collected in task order. When the budget runs out, queued
+    tasks are cancelled or skipped, and the tasks already running are waited
+    for (and their results kept) before the shared memory is released.
+
+    Returns:
+        List with one result per task, None for tasks that did not finish in time
+    """
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+    results = [None] * len(tasks)
+
+    if n_jobs is None or n_jobs <= 1 or len(tasks) <= 1:
+        for i, task in enumerate(tasks):
+            if deadline is not None and i > 0 and time.monotonic() >= deadline:
+                break
+            results[i] = fn(arrays, task)
+        return results
+
+    pool = worker_pool(n_jobs)
+    # Workers compare against the wall clock; monotonic clocks are per process
+    task_deadline = time.time() + time_budget if time_budget is not None else None
+    with SharedArrays(**arrays) as shared:
+        try:
+            futures = {pool.submit(_call_shared, fn, shared.spec, task, task_deadline): i
+                       for i, task in enumerate(tasks)}
+            pending = set(futures)
+            while pending:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[futures[future]] = future.result()
+                if deadline is not None and time.monotonic() >= deadline:
+                    for future in pending:
+                        future.cancel()
+                    # Running tasks still read the shared block; let them finish before it is unlinked
+                    wait(pending)
+                    for future in pending:
+                        if not future.cancelled():
+                            results[futures[future]] = future.result()
+                    break
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool next time
+            with _pools_lock:
+                if _pools.get(n_jobs) is pool:
+                    del _pools[n_jobs]
+            raise
+    return results
+
+
+def _batch_tasks(kind, method, n_resamples, seed, batch_size, min_periods=2):
+    """Split n_resamples into seeded batches
+
+    Each batch gets its own child of one SeedSequence, so results are the same
+    for a given seed regardless of how many workers run the batches.
+    """
+    sizes = [batch_size] * (n_resamples // batch_size)
+    if n_resamples % batch_size:
+        sizes.append(n_resamples % batch_size)
+    children = np.random.SeedSequence(seed).spawn(len(sizes))
+    return [(kind, method, child, size, min_periods) for child, size in zip(children, sizes)]
+
+
+def bootstrap_confidence_interval(x, y, n_resamples=1000, confidence=0.95, method='pearson',
+                                  seed=None, batch_size=500, time_budget=None, n_jobs=1):
+    """Percentile bootstrap confidence interval for a correlation coefficient
+
+    Args:
+        x: 1-D array of paired observations without missing values
+        y: 1-D array aligned with x
+        n_resamples: Number of bootstrap resamples to draw
+        confidence: Confidence level of the interval
+        method: 'pearson' or 'spearman'
+        seed: Seed for reproducible resampling
+        batch_size: Resamples computed per vectorized batch
+        time_budget: Seconds allowed before stopping with the batches finished so far
+        n_jobs: Number of worker processes (1 runs inline)
+
+    Returns:
+        Dict with 'low', 'high', 'n_resamples' actually used and 'truncated'
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    tasks = _batch_tasks('bootstrap', method, n_resamples, seed, batch_size)
+    batches = [b for b in _run_tasks(_resample_batch, tasks, {'x': x, 'y': y}, n_jobs, time_budget)
+               if b is not None]
+    samples = np.concatenate(batches) if batches else np.array([])
+    samples = samples[~np.isnan(samples)]
+
+    if samples.size == 0:
+        return {'low': None, 'high': None, 'n_resamples': 0, 'truncated': True}
+
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(samples, [alpha, 1 - alpha])
+    return {
+        'low': float(low),
+        'high': float(high),
+        'n_resamples': int(samples.size),
+        'truncated': len(batches) < len(tasks)
+    }
+
+
+def permutation_pvalue(x, y, n_resamples=1000, method='pearson', seed=None,
+                       batch_size=500, time_budget=None, n_jobs=1):
+    """Two-sided permutation p-value for a correlation coefficient
+
+    Uses the (count + 1) / (resamples + 1) estimator so the p-value is never zero.
+
+    Returns:
+        Dict with 'p_value', 'n_resamples' actually used and 'truncated'
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if method == 'spearman':
+        x = stats.rankdata(x)
+        y = stats.rankdata(y)
+    observed = _rowwise_pearson(x[None, :], y[None, :])[0]
+
+    tasks = _batch_tasks('permutation', 'pearson', n_resamples, seed, batch_size)
+    batches = [b for b in _run_tasks(_resample_batch, tasks, {'x': x, 'y': y}, n_jobs, time_budget)
+               if b is not None]
+    samples = np.concatenate(batches) if batches else np.array([])
+
+    if samples.size == 0 or np.isnan(observed):
+        return {'p_value': None, 'n_resamples': int(samples.size), 'truncated': True}
+
+    exceed = np.count_nonzero(np.abs(samples) >= abs(observed) - 1e-12)
+    return {
+        'p_value': float((exceed + 1) / (samples.size + 1)),
+        'n_resamples': int(samples.size),
+        'truncated': len(batches) < len(tasks)
+    }
+
+
+def permutation_test_matrix(x, y, n_resamples=1000, seed=None, min_periods=2,
+                            batch_size=50, time_budget=None, n_jobs=1, method='pearson'):
+    """Permutation p-values for every column pair of x against y
+
+    Pairs of columns without missing values share one table-wide test: each
+    resample permutes the rows of y once and recomputes the whole block with
+    pairwise_pearson (on ranked columns for Spearman), so a 50x50 table costs
+    one matrix pass per resample. Permuting whole columns with gaps would
+    pair up fewer days than the observed coefficient used, so every pair
+    involving a column with missing values is instead tested on its own
+    complete rows, as permutation_pvalue does.
+
+    Args:
+        method: 'pearson' or 'spearman'
+
+    Returns:
+        Tuple (p_values, n_resamples_used, truncated); p_values has shape (a, b)
+    """
+    if method not in ('pearson', 'spearman'):
+        raise ValueError(f"Permutation tests support pearson and spearman, not {method}")
+    x_arr, _ = _as_2d(x)
+    y_arr, _ = _as_2d(y)
+    x_complete = ~np.isnan(x_arr).any(axis=0)
+    y_complete = ~np.isnan(y_arr).any(axis=0)
+    p_values = np.full((x_arr.shape[1], y_arr.shape[1]), np.nan)
+    used, truncated = n_resamples, False
+
+    if x_complete.any() and y_complete.any():
+        x_block, y_block = x_arr[:, x_complete], y_arr[:, y_complete]
+        if method == 'spearman':
+            x_block, y_block = rank_columns(x_block), rank_columns(y_block)
+        tasks = _batch_tasks('permutation_matrix', 'pearson', n_resamples, seed, batch_size, min_periods)
+        results = _run_tasks(_resample_batch, tasks, {'x': x_block, 'y': y_block}, n_jobs, time_budget)
+
+        used = sum(task[3] for task, result in zip(tasks, results) if result is not None)
+        finished = [result for result in results if result is not None]
+        truncated = len(finished) < len(tasks)
+        if finished:
+            observed, _ = pairwise_pearson(x_block, y_block, min_periods)
+            block = np.where(np.isnan(observed), np.nan, (np.sum(finished, axis=0) + 1) / (used + 1))
+            p_values[np.ix_(x_complete, y_complete)] = block
+
+    gaps = ~(x_complete[:, None] & y_complete[None, :])
+    if gaps.any():
+        pair_p_values, pairs_truncated = _pair_resampling(
+            'permutation', x_arr, y_arr, method, n_resamples, seed, min_periods,
+            time_budget=time_budget, n_jobs=n_jobs, pairs=gaps)
+        p_values[gaps] = pair_p_values[gaps]
+        truncated = truncated or pairs_truncated
+
+    return p_values, used, truncated
+
+
+def _pair_resampling_block(arrays, task):
+    """Resample a run of column pairs, each on its own complete rows; module-level so it can execute in a worker process
+
+    task is a tuple (kind, method, pairs, seeds, n_resamples, min_periods,
+    confidence) listing pair indices k as in _table_block, with one integer
+    seed per pair. kind 'bootstrap' returns a (len(pairs), 2) array of
+    interval bounds, 'permutation' a (len(pairs),) array of p-values; NaN
+    where a pair has too few rows.
+    """
+    kind, method, pairs, seeds, n_resamples, min_periods, confidence = task
+    x, y = arrays['x'], arrays['y']
+    results = np.full((len(pairs), 2) if kind == 'bootstrap' else len(pairs), np.nan)
+    for n, (k, pair_seed) in enumerate(zip(pairs, seeds)):
+        j, i = divmod(k, x.shape[1])
+        rows = ~np.isnan(x[:, i]) & ~np.isnan(y[:, j])
+        if np.count_nonzero(rows) < max(3, min_periods):
+            continue
+        if kind == 'bootstrap':
+            interval = bootstrap_confidence_interval(x[rows, i], y[rows, j], n_resamples, confidence,
+                                                     method, pair_seed)
+            if interval['low'] is not None:
+                results[n] = interval['low'], interval['high']
+        else:
+            test = permutation_pvalue(x[rows, i], y[rows, j], n_resamples, method, pair_seed)
+            if test['p_value'] is not None:
+                results[n] = test['p_value']
+    return results
+
+
+def _pair_resampling(kind, x, y, method, n_resamples, seed, min_periods, confidence=0.95,
+                     time_budget=None, n_jobs=1, pairs=None):
+    """Run _pair_resampling_block over column pairs of x against y
+
+    Pairs are split into runs, so the time budget can stop between them and
+    workers share the table; each pair's seed comes from one SeedSequence
+    over the whole table, so results depend neither on the number of workers
+    nor on which pairs are selected.
+
+    Args:
+        pairs: Optional (a, b) boolean mask of the pairs to resample (default all)
+
+    Returns:
+        Tuple (results, truncated); results has shape (a, b), or (a, b, 2)
+        for bootstrap bounds, and is NaN for unselected pairs and runs that
+        did not finish in time
+    """
+    a, b = x.shape[1], y.shape[1]
+    seeds = np.random.SeedSequence(seed).generate_state(max(a * b, 1)).tolist()
+    # Pair k is (i, j) = (k % a, k // a), so the mask's transpose flattens in pair order
+    selected = np.flatnonzero(pairs.T) if pairs is not None else np.arange(a * b)
+    runs = np.array_split(selected, max(1, min(len(selected), max(16, (n_jobs or 1) * 4))))
+    tasks = [(kind, method, run.tolist(), [seeds[k] for k in run], n_resamples, min_periods, confidence)
+             for run in runs]
+    finished = _run_tasks(_pair_resampling_block, tasks, {'x': x, 'y': y}, n_jobs, time_budget)
+
+    shape = (a * b, 2) if kind == 'bootstrap' else (a * b,)
+    results = np.full(shape, np.nan)
+    for task, values in zip(tasks, finished):
+        if values is not None:
+            results[task[2]] = values
+    # Pairs run through y columns slowest, so reshape to (b, a) and swap the pair axes
+    results = np.swapaxes(results.reshape((b, a) + shape[1:]), 0, 1)
+    return results, any(values is None for values in finished)
+
+
+def bootstrap_ci_matrix(x, y, n_resamples=1000, confidence=0.95, method='pearson', seed=None,
+                        min_periods=3, time_budget=None, n_jobs=1):
+    """Percentile bootstrap confidence intervals for every column pair of x against y
+
+    Each pair is resampled on its own complete rows, as
+    bootstrap_confidence_interval does for a single pair.
+
+    Args:
+        x: Array of shape (days, a), NaN marking missing values
+        y: Array of shape (days, b) aligned with x
+        method: 'pearson' or 'spearman'
+        time_budget: Seconds allowed before stopping with the runs of pairs finished so far
+        n_jobs: Number of worker processes (1 runs inline)
+
+    Returns:
+        Tuple (low, high, truncated); low and high have shape (a, b) and are NaN
+        where a pair has too few rows or was not reached within the time budget
+    """
+    if method not in ('pearson', 'spearman'):
+        raise ValueError(f"Bootstrap intervals support pearson and spearman, not {method}")
+    bounds, truncated = _pair_resampling('bootstrap', _as_2d(x)[0], _as_2d(y)[0], method, n_resamples, seed,
+                                         min_periods, confidence, time_budget, n_jobs)
+    return bounds[..., 0], bounds[..., 1], truncated
+
+
+CORRELATION_TESTS = {
+    'pearson': stats.pearsonr,
+    'spearman': stats.spearmanr,
+    'kendall': stats.kendalltau,
+}
+
+
+def _table_block(arrays, task):
+    """Correlate one run of column pairs with scipy; module-level so it can execute in a worker process
+
+    task is a tuple (start, stop, method, min_pairs) selecting pairs
+    start .. stop - 1, where pair k is x column k % a with y column k // a.
+    """
+    start, stop, method, min_pairs = task
+    x, y = arrays['x'], arrays['y']
+    x_calc, y_calc = arrays.get('x_filled', x), arrays.get('y_filled', y)
+    x_valid, y_valid = ~np.isnan(x), ~np.isnan(y)
+    x_calc_valid, y_calc_valid = ~np.isnan(x_calc), ~np.isnan(y_calc)
+    test = CORRELATION_TESTS[method]
+
+    size = stop - start
+    coefficients = np.full(size, np.nan)
+    p_values = np.full(size, np.nan)
+    valid_pairs = np.zeros(size, dtype=int)
+    calc_pairs = np.zeros(size, dtype=int)
+    errors = {}
+    for k in range(size):
+        j, i = divmod(start + k, x.shape[1])
+        valid_pairs[k] = np.count_nonzero(x_valid[:, i] & y_valid[:, j])
+        if valid_pairs[k] < min_pairs:
+            continue
+        rows = x_calc_valid[:, i] & y_calc_valid[:, j]
+        calc_pairs[k] = np.count_nonzero(rows)
+        if calc_pairs[k] < min_pairs:
+            continue
+        try:
+            coefficients[k], p_values[k] = test(x_calc[rows, i], y_calc[rows, j])
+        except Exception as e:
+            errors[start + k] = str(e)
+    return coefficients, p_values, valid_pairs, calc_pairs, errors
+
+
+def pairwise_correlations(x, y, method='pearson', min_pairs=2, x_filled=None, y_filled=None,
+                          n_jobs=1, min_parallel_pairs=None):
+    """Correlate every column of x with every column of y, each pair on its own complete rows
+
+    Unlike pairwise_pearson this runs the scipy test for each pair, so it
+    supports every method and gives scipy's exact p-values. Tables of at
+    least min_parallel_pairs pairs are split into runs of pairs computed on
+    the persistent worker pool, with the matrices passed through shared
+    memory, and reassembled here.
+
+    Args:
+        x: Array of shape (days, a), NaN marking missing values
+        y: Array of shape (days, b) aligned with x
+        method: 'pearson', 'spearman' or 'kendall'
+        min_pairs: Minimum number of rows where both columns have data
+        x_filled: Optional copy of x with missing values filled (e.g. interpolated);
+            pairs with enough original rows are then correlated on the filled rows
+        y_filled: Filled copy of y, required with x_filled
+        n_jobs: Number of worker processes (1 runs inline)
+        min_parallel_pairs: Smallest table (a * b pairs) sent to the workers
+
+    Returns:
+        Dict with arrays of shape (a, b): 'coefficients' and 'p_values' (NaN where
+        not calculated), 'valid_pairs' (rows where both columns have data) and
+        'calc_pairs' (rows correlated, 0 if there were too few valid pairs), and
+        'errors' mapping (i, j) to the message of any test that raised
+    """
+    if method not in CORRELATION_TESTS:
+        raise ValueError(f"Unknown correlation method: {method}")
+    arrays = {'x': _as_2d(x)[0], 'y': _as_2d(y)[0]}
+    if x_filled is not None:
+        arrays['x_filled'] = _as_2d(x_filled)[0]
+        arrays['y_filled'] = _as_2d(y_filled)[0]
+    a, b = arrays['x'].shape[1], arrays['y'].shape[1]
+    pairs = a * b
+
+    if n_jobs is not None and n_jobs > 1 and min_parallel_pairs is not None and pairs >= min_parallel_pairs:
+        # A few runs per worker even out pairs that take longer than others
+        bounds = np.linspace(0, pairs, min(pairs, n_jobs * 4) + 1).astype(int)
+    else:
+        n_jobs, bounds = 1, np.array([0, pairs])
+    tasks = [(int(start), int(stop), method, min_pairs) for start, stop in zip(bounds[:-1], bounds[1:])]
+    blocks = _run_tasks(_table_block, tasks, arrays, n_jobs)
+
+    def assemble(part):
+        # Pairs run through y columns slowest, so reshape to (b, a) and transpose
+        return np.concatenate([block[part] for block in blocks]).reshape(b, a).T
+
+    errors = {}
+    for block in blocks:
+        for k, message in block[4].items():
+            j, i = divmod(k, a)
+            errors[(i, j)] = message
+    return {
+        'coefficients': assemble(0),
+        'p_values': assemble(1),
+        'valid_pairs': assemble(2),
+        'calc_pairs': assemble(3),
+        'errors': errors,
+    }
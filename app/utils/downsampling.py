@@ -0,0 +1,139 @@
+import numpy as np
+
+# Display resolutions of a metric series: daily points, or weekly (ISO weeks,
+# dated by their Monday) and monthly (dated by their first day) means
+RESOLUTIONS = ('day', 'week', 'month')
+
+# Ways of reducing a series to a point budget: largest-triangle-three-buckets,
+# which keeps the shape of a line, or each bucket's lowest and highest points
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+
+
+def lttb_indices(x, y, threshold):
+    """Pick threshold points of a line with the largest-triangle-three-buckets algorithm
+
+    The first and last points are kept; the points between are split into
+    threshold - 2 equal buckets and each contributes the point forming the
+    largest triangle with the point picked from the previous bucket and the
+    mean of the next bucket. Bucket means come from one reduceat; each
+    bucket's triangle areas are computed as one array operation.
+
+    Args:
+        x: Increasing x coordinates, e.g. day numbers
+        y: Values at x
+        threshold: Number of points to keep
+
+    Returns:
+        Sorted array of the indices kept (all indices if there are no more than threshold points)
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.unique(np.linspace(0, n - 1, max(threshold, 1)).astype(int))
+
+    # Bucket i covers indices edges[i] .. edges[i + 1] - 1, between the fixed first and last points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x[:n - 1], edges[:-1]) / sizes
+    mean_y = np.add.reduceat(y[:n - 1], edges[:-1]) / sizes
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, threshold):
+    """Pick the lowest and highest point of equal buckets, plus the first and last points
+
+    Every bucket is found in one pass over a (buckets, size) view of the
+    values, so peaks and dips survive however long the series is.
+
+    Returns:
+        Sorted array of at most threshold indices (all indices if there are no more than threshold points)
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 4:
+        return lttb_indices(np.arange(n), y, threshold)
+
+    size = -(-n // ((threshold - 2) // 2))
+    buckets = -(-n // size)
+    padding = buckets * size - n
+    lows = np.append(y, np.full(padding, np.inf)).reshape(buckets, size).argmin(axis=1)
+    highs = np.append(y, np.full(padding, -np.inf)).reshape(buckets, size).argmax(axis=1)
+    starts = np.arange(buckets) * size
+    return np.unique(np.concatenate([[0, n - 1], starts + lows, starts + highs]))
+
+
+def aggregate_periods(dates, values, resolution):
+    """Average daily values into weekly or monthly points
+
+    Args:
+        dates: Sorted datetime64[D] array
+        values: Values on those dates
+        resolution: 'week' or 'month'
+
+    Returns:
+        Tuple (period_dates, means, counts); each period is dated by its first day
+    """
+    days = np.asarray(dates, dtype='datetime64[D]')
+    if resolution == 'week':
+        # 1970-01-01 was a Thursday, so day number + 3 counts from a Monday
+        periods = days - (days.astype(np.int64) + 3) % 7
+    elif resolution == 'month':
+        periods = days.astype('datetime64[M]').astype('datetime64[D]')
+    else:
+        raise ValueError(f"Unknown resolution: {resolution}")
+
+    period_dates, inverse = np.unique(periods, return_inverse=True)
+    counts = np.bincount(inverse)
+    means = np.bincount(inverse, weights=np.asarray(values, dtype=float)) / counts
+    return period_dates, means, counts
+
+
+def reduce_series(dates, values, resolution='day', points=None, method='lttb'):
+    """Bring a daily series to a display resolution and at most points points
+
+    Args:
+        dates: Sorted datetime64[D] array of days with a value
+        values: Values on those days
+        resolution: One of RESOLUTIONS
+        points: Largest number of points to return (None or 0 for no limit)
+        method: One of DOWNSAMPLE_METHODS, used when there are more than points points
+
+    Returns:
+        Tuple (dates, values, counts); counts holds the days averaged into each
+        point, and is None at daily resolution
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution: {resolution}")
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unknown downsampling method: {method}")
+
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    values = np.asarray(values, dtype=float)
+    counts = None
+    if resolution != 'day':
+        dates, values, counts = aggregate_periods(dates, values, resolution)
+
+    if points and len(values) > points:
+        if method == 'lttb':
+            keep = lttb_indices(dates.astype(np.int64), values, points)
+        else:
+            keep = minmax_indices(values, points)
+        dates, values = dates[keep], values[keep]
+        counts = counts[keep] if counts is not None else None
+    return dates, values, counts
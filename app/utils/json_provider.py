@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: without it responses are encoded with the standard library
+    orjson = None
+
+# JSON_BACKEND values: orjson when it is installed, or always one of them
+JSON_BACKENDS = ('auto', 'orjson', 'stdlib')
+
+
+def date_strings(dates):
+    """YYYY-MM-DD strings of an array or index of dates, datetimes or datetime64 values"""
+    # pandas parses date objects several times faster than NumPy's own conversion
+    days = pd.DatetimeIndex(dates).to_numpy().astype('datetime64[D]')
+    return np.datetime_as_string(days, unit='D').tolist()
+
+
+def nullable_floats(values):
+    """A float array as a list of Python floats, with None for NaN"""
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    return np.where(missing, None, values).tolist() if missing.any() else values.tolist()
+
+
+def _numpy_default(o):
+    """Encode NumPy values the standard library encoder cannot, then anything Flask can"""
+    if isinstance(o, np.ndarray):
+        if o.dtype.kind == 'M':
+            return np.datetime_as_string(o.astype('datetime64[D]'), unit='D').tolist()
+        return o.tolist()
+    if isinstance(o, np.datetime64):
+        return str(o.astype('datetime64[D]'))
+    if isinstance(o, np.generic):
+        return o.item()
+    return DefaultJSONProvider.default(o)
+
+
+class NumpyJSONProvider(DefaultJSONProvider):
+    """Flask's standard library JSON provider, also encoding NumPy arrays and scalars"""
+
+    default = staticmethod(_numpy_default)
+
+
+class OrjsonProvider(NumpyJSONProvider):
+    """JSON provider encoding with orjson
+
+    Output matches NumpyJSONProvider (sorted keys, dates in HTTP format,
+    datetime64 values as YYYY-MM-DD) except that it is UTF-8 rather than
+    ASCII-escaped and NaN becomes null. NumPy arrays go through the same
+    default as with the standard library rather than orjson's own NumPy
+    support, which writes datetime64 values as full timestamps; tolist()
+    keeps that a single C call per array. Decoding stays with the standard
+    library, which accepts the same input Flask always has.
+    """
+
+    # Dates are passed through to the default, so they keep Flask's HTTP date format
+    _options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+                | orjson.OPT_PASSTHROUGH_DATETIME) if orjson is not None else 0
+
+    def dumps(self, obj, **kwargs):
+        options = self._options | (orjson.OPT_INDENT_2 if kwargs.get('indent') else 0)
+        return orjson.dumps(obj, default=kwargs.get('default', self.default), option=options).decode()
+
+
+def init_json(app):
+    """Install the JSON provider chosen by JSON_BACKEND
+
+    Returns:
+        The provider class installed
+    """
+    backend = app.config.get('JSON_BACKEND', 'auto')
+    if backend not in JSON_BACKENDS:
+        raise ValueError(f"Unknown JSON_BACKEND: {backend}")
+    if backend == 'orjson' and orjson is None:
+        raise RuntimeError("JSON_BACKEND is orjson but orjson is not installed")
+
+    provider_class = OrjsonProvider if orjson is not None and backend != 'stdlib' else NumpyJSONProvider
+    app.json = provider_class(app)
+    return provider_class
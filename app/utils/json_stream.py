@@ -0,0 +1,130 @@
+import codecs
+import json
+import re
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_NUMBER_TAIL = re.compile(r'[0-9.eE+-]*')
+
+
+class _JSONReader:
+    """Incremental reader over a JSON document arriving in chunks
+
+    Values are decoded with json.JSONDecoder.raw_decode straight from the
+    buffered text; when a value is cut off at the end of the buffer the next
+    chunk is appended and the value decoded again. Consumed text is dropped on
+    each refill, so the buffer only ever holds about one chunk plus the value
+    being decoded.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self._text = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """Append the next chunk to the unconsumed text; return False at the end of the stream"""
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            tail = self._utf8.decode(b'', final=True)
+        else:
+            tail = self._utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+        self._text = self._text[self._pos:] + tail
+        self._pos = 0
+        return True
+
+    def _skip_whitespace(self):
+        while True:
+            self._pos = _WHITESPACE.match(self._text, self._pos).end()
+            if self._pos < len(self._text) or not self._fill():
+                return
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it ('' at the end)"""
+        self._skip_whitespace()
+        return self._text[self._pos:self._pos + 1]
+
+    def expect(self, *chars):
+        """Consume the next non-whitespace character, which must be one of chars"""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} in JSON stream, found {char or 'end of stream'!r}")
+        self._pos += 1
+        return char
+
+    def decode(self):
+        """Decode and consume the next complete JSON value"""
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._text, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number running up to the buffer edge (e.g. '12' or '1.') may continue in the next chunk
+            if (isinstance(value, (int, float)) and not isinstance(value, bool) and
+                    _NUMBER_TAIL.fullmatch(self._text, end) and self._fill()):
+                continue
+            self._pos = end
+            return value
+
+
+def _drop_paths(record, paths):
+    """Remove nested keys such as ('met', 'items') from a decoded record in place"""
+    for path in paths:
+        parent = record
+        for key in path[:-1]:
+            parent = parent.get(key) if isinstance(parent, dict) else None
+        if isinstance(parent, dict):
+            parent.pop(path[-1], None)
+    return record
+
+
+def iter_json_records(chunks, key='data', skip=()):
+    """Yield the elements of a top-level array in a streamed JSON object one at a time
+
+    Only one element is held in memory at a time, instead of the whole
+    document. Other top-level members (e.g. 'next_token') are decoded and
+    discarded.
+
+    Args:
+        chunks: Iterable of bytes (UTF-8) or str chunks, e.g. response.iter_content()
+        key: Name of the top-level member holding the array
+        skip: Key paths (tuples) removed from each element before it is yielded
+
+    Yields:
+        The decoded array elements, in order
+    """
+    reader = _JSONReader(chunks)
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.expect('}')
+    else:
+        while True:
+            name = reader.decode()
+            reader.expect(':')
+            if name == key and reader.peek() == '[':
+                reader.expect('[')
+                if reader.peek() == ']':
+                    reader.expect(']')
+                else:
+                    while True:
+                        record = reader.decode()
+                        yield _drop_paths(record, skip) if skip else record
+                        if reader.expect(',', ']') == ']':
+                            break
+            else:
+                reader.decode()
+
+            if reader.expect(',', '}') == '}':
+                break
+
+    # Reading to the end also lets wrapped chunk iterators (e.g. a cache writer) finish
+    if reader.peek():
+        raise ValueError("Unexpected data after the JSON document")
@@ -0,0 +1,227 @@
+import bisect
+import threading
+import time
+
+from flask import current_app, has_app_context, request
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing totals, one per combination of label values"""
+
+    TYPE = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+
+
+class Histogram:
+    """Observations counted into cumulative buckets, one histogram per combination of label values"""
+
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values = {}  # label values -> [per-bucket counts, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def count(self, **labels):
+        entry = self._values.get(tuple(labels[name] for name in self.labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labels, key, [('le', _format_value(bound))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(self.labels, key)} {cumulative}'
+
+
+class Gauge:
+    """Current values read by a callback when metrics are collected
+
+    The callback returns a list of (label values, value) pairs.
+    """
+
+    TYPE = 'gauge'
+
+    def __init__(self, name, documentation, callback, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.callback = callback
+
+    def samples(self):
+        for key, value in self.callback():
+            yield f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+
+
+class Metrics:
+    """An app's counters, histograms and gauges, rendered in the Prometheus text format"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.collectors = []
+        self.http_requests = self.add(Counter(
+            'health_tracker_http_requests_total', 'HTTP requests handled',
+            ('endpoint', 'method', 'status')))
+        self.http_duration = self.add(Histogram(
+            'health_tracker_http_request_duration_seconds', 'HTTP request latency',
+            ('endpoint', 'method'), buckets))
+        self.phase_duration = self.add(Histogram(
+            'health_tracker_phase_duration_seconds',
+            'Time spent in analyzer and importer phases, such as analyzer.correlation or oura.store',
+            ('phase',), buckets))
+        self.import_rows = self.add(Counter(
+            'health_tracker_import_rows_total',
+            'Imported records by outcome: inserted, updated (an existing row was overwritten), '
+            'unchanged or skipped', ('source', 'outcome')))
+        self.cache_requests = self.add(Counter(
+            'health_tracker_cache_requests_total', 'Cache lookups by result (hit or miss)',
+            ('cache', 'result')))
+
+    def add(self, collector):
+        self.collectors.append(collector)
+        return collector
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        lines = []
+        for collector in self.collectors:
+            lines.append(f'# HELP {collector.name} {collector.documentation}')
+            lines.append(f'# TYPE {collector.name} {collector.TYPE}')
+            lines.extend(collector.samples())
+        return '\n'.join(lines) + '\n'
+
+
+def current_metrics():
+    """Return the current app's Metrics, or None when metrics are disabled"""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('metrics')
+
+
+def count_import_rows(source, **outcomes):
+    """Count imported records, e.g. count_import_rows('oura', inserted=10, updated=2)"""
+    metrics = current_metrics()
+    if metrics is None:
+        return
+    for outcome, count in outcomes.items():
+        if count:
+            metrics.import_rows.inc(count, source=source, outcome=outcome)
+
+
+def count_cache_lookup(cache, hit):
+    """Count one lookup in a named cache"""
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.cache_requests.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def _pool_status(engine):
+    """Connection pool gauges as (label values, value) pairs
+
+    Pools without a fixed size, such as SQLite's in-memory pools, only
+    report what they can.
+    """
+    pool = engine.pool
+    status = []
+    if hasattr(pool, 'checkedout'):
+        status.append((('checked_out',), pool.checkedout()))
+    if hasattr(pool, 'size') and hasattr(pool, '_max_overflow'):
+        status.append((('size',), pool.size()))
+        # Connections the pool will open at most; checked_out near this means requests wait
+        status.append((('capacity',), pool.size() + max(pool._max_overflow, 0)))
+    return status
+
+
+def init_metrics(app):
+    """Collect request, import, cache and connection pool metrics if METRICS is enabled
+
+    The metrics are served at /metrics. With metrics disabled, the
+    instrumentation points reduce to a lookup in app.extensions.
+    """
+    if not app.config.get('METRICS'):
+        return None
+
+    from .. import db
+    metrics = Metrics(app.config.get('METRICS_BUCKETS', DEFAULT_BUCKETS))
+
+    def pool_status():
+        with app.app_context():
+            return _pool_status(db.engine)
+
+    metrics.add(Gauge('health_tracker_db_pool_connections',
+                      'Database connection pool: connections checked out, pool size and capacity',
+                      pool_status, ('state',)))
+    app.extensions['metrics'] = metrics
+
+    @app.before_request
+    def start_timer():
+        request.environ['health_tracker.started'] = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = request.environ.get('health_tracker.started')
+        if started is not None:
+            endpoint = request.endpoint or 'unmatched'
+            metrics.http_duration.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+            metrics.http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        return response
+
+    return metrics
@@ -2,28 +2,288 @@ import requests
 from datetime import datetime, timedelta
 from flask import current_app
 from .. import db
-from ..models.base import HealthData, DataType
+from ..models.base import HealthData, DataType, DataCoverage
+from .json_stream import iter_json_records
+from .metrics import count_cache_lookup, count_import_rows
+from .profiling import profiled
+from .response_cache import ResponseCache
 import json
+from functools import lru_cache
+import numpy as np
+
+# Declarative field specs: (metric_name, key path in the API record, units, divisor)
+DAILY_SLEEP_FIELDS = (
+    ('sleep_score', ('score',), 'score', None),
+    ('rem_sleep_score', ('contributors', 'rem_sleep'), 'score', None),
+    ('deep_sleep_score', ('contributors', 'deep_sleep'), 'score', None),
+    ('total_sleep_score', ('contributors', 'total_sleep'), 'score', None),
+    ('sleep_latency_score', ('contributors', 'latency'), 'score', None),
+    ('sleep_efficiency_score', ('contributors', 'efficiency'), 'score', None),
+    ('sleep_restfulness_score', ('contributors', 'restfulness'), 'score', None),
+    ('sleep_timing_score', ('contributors', 'timing'), 'score', None),
+)
+
+# Taken from the day's long_sleep session (the last one wins); None values are ignored
+LONG_SLEEP_FIELDS = (
+    ('long_hr', ('average_heart_rate',), 'bpm', None),
+    ('lowest_hr', ('lowest_heart_rate',), 'bpm', None),
+    ('long_hrv', ('average_hrv',), 'ms', None),
+    ('long_resp', ('average_breath',), 'breaths_per_min', None),
+    ('long_efficiency', ('efficiency',), 'score', None),
+    ('readiness_score', ('readiness', 'score'), 'score', None),
+    ('activity_balance_score', ('readiness', 'contributors', 'activity_balance'), 'score', None),
+    ('body_temperature_score', ('readiness', 'contributors', 'body_temperature'), 'score', None),
+    ('hrv_balance_score', ('readiness', 'contributors', 'hrv_balance'), 'score', None),
+    ('previous_day_activity_score', ('readiness', 'contributors', 'previous_day_activity'), 'score', None),
+    ('previous_night_score', ('readiness', 'contributors', 'previous_night'), 'score', None),
+    ('recovery_index_score', ('readiness', 'contributors', 'recovery_index'), 'score', None),
+    ('resting_heart_rate_score', ('readiness', 'contributors', 'resting_heart_rate'), 'score', None),
+    ('sleep_balance_score', ('readiness', 'contributors', 'sleep_balance'), 'score', None),
+)
+
+# Summed over all of a day's sessions and stored in minutes when positive
+SLEEP_STAGE_FIELDS = (
+    ('rem_sleep', 'rem_sleep_duration'),
+    ('deep_sleep', 'deep_sleep_duration'),
+    ('light_sleep', 'light_sleep_duration'),
+    ('awake_time', 'awake_duration'),
+)
+
+# Session averages combined into per-day means weighted by time in bed: (metric_name, key, units)
+SESSION_AVERAGE_FIELDS = (
+    ('avg_hr', 'average_heart_rate', 'bpm'),
+    ('avg_hrv', 'average_hrv', 'ms'),
+    ('avg_resp', 'average_breath', 'breaths_per_min'),
+)
+
+ACTIVITY_FIELDS = (
+    ('activity_score', ('score',), 'score', None),
+    ('active_calories', ('active_calories',), 'kcal', None),
+    ('total_calories', ('total_calories',), 'kcal', None),
+    ('steps', ('steps',), 'count', None),
+    ('walking_distance', ('equivalent_walking_distance',), 'meters', None),
+    ('sedentary_time', ('sedentary_time',), 'hours', 3600),  # seconds to hours
+    ('average_met', ('met', 'average'), 'met', None),
+    ('min_met', ('met', 'min'), 'met', None),
+    ('max_met', ('met', 'max'), 'met', None),
+    ('meet_daily_targets_score', ('contributors', 'meet_daily_targets'), 'score', None),
+    ('move_every_hour_score', ('contributors', 'move_every_hour'), 'score', None),
+    ('recovery_time_score', ('contributors', 'recovery_time'), 'score', None),
+    ('stay_active_score', ('contributors', 'stay_active'), 'score', None),
+    ('training_frequency_score', ('contributors', 'training_frequency'), 'score', None),
+    ('training_volume_score', ('contributors', 'training_volume'), 'score', None),
+)
+
+# High-resolution series the importer never stores, dropped from streamed records
+STREAM_SKIP_PATHS = {
+    '/v2/usercollection/sleep': (('heart_rate',), ('hrv',), ('movement_30_sec',), ('sleep_phase_5_min',)),
+    '/v2/usercollection/daily_activity': (('met', 'items'), ('class_5_min',)),
+}
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# day_summary is a string, so it is not stored
+STRESS_FIELDS = (
+    ('stress_high', ('stress_high',), 'score', None),
+    ('recovery_high', ('recovery_high',), 'score', None),
+)
+
+_MISSING = object()
+
+@lru_cache(maxsize=None)
+def _compile_fields(fields):
+    """Group a field spec into runs sharing the same parent path
+    
+    Each parent dict is then looked up once per record instead of once per field.
+    
+    Returns:
+        Tuple of (parent_path, ((key, metric_name, units, divisor), ...)) in spec order
+    """
+    groups = []
+    for metric_name, path, units, divisor in fields:
+        parent, key = path[:-1], path[-1]
+        if not groups or groups[-1][0] != parent:
+            groups.append((parent, []))
+        groups[-1][1].append((key, metric_name, units, divisor))
+    return tuple((parent, tuple(entries)) for parent, entries in groups)
+
+def _session_statistics(session_days, session_values, time_in_bed, n_days, spread=False):
+    """Combine session-level averages into per-day time-in-bed weighted means
+    
+    Each session weight is its time in bed over the day's total, and the weighted
+    values are summed per day with np.bincount. bincount adds in session order, so
+    the means are bit-for-bit the running sums of the original per-day loop.
+    
+    Args:
+        session_days: Day position of each session
+        session_values: Dict of metric name -> per-session values, keyed as in SESSION_AVERAGE_FIELDS
+        time_in_bed: Per-session time in bed in seconds
+        n_days: Number of day positions
+        spread: Also return the min, max and time-weighted standard deviation
+            across each day's sessions as 'session_min_*', 'session_max_*' and 'session_std_*'
+    
+    Returns:
+        Dict of day position -> list of (metric_name, value, units); days without
+        sessions, or whose sessions have no time in bed, are absent
+    """
+    if not session_days:
+        return {}
+    
+    day_index = np.asarray(session_days, dtype=np.intp)
+    time_in_bed = np.asarray(time_in_bed, dtype=float)
+    total_time = np.bincount(day_index, weights=time_in_bed, minlength=n_days)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = time_in_bed / total_time[day_index]
+    
+    days = np.flatnonzero(total_time > 0)
+    stats = {int(day): [] for day in days}
+    for metric, _, units in SESSION_AVERAGE_FIELDS:
+        values = np.asarray(session_values[metric], dtype=float)
+        means = np.bincount(day_index, weights=values * weights, minlength=n_days)
+        columns = [(metric, means)]
+        
+        if spread:
+            suffix = metric[len('avg_'):]
+            minima = np.full(n_days, np.inf)
+            maxima = np.full(n_days, -np.inf)
+            np.minimum.at(minima, day_index, values)
+            np.maximum.at(maxima, day_index, values)
+            deviations = np.bincount(day_index, weights=weights * (values - means[day_index]) ** 2,
+                                     minlength=n_days)
+            columns += [(f'session_min_{suffix}', minima),
+                        (f'session_max_{suffix}', maxima),
+                        (f'session_std_{suffix}', np.sqrt(deviations))]
+        
+        for name, column in columns:
+            for day, value in zip(days.tolist(), column[days].tolist()):
+                stats[day].append((name, value, units))
+    return stats
+
+class MetricAccumulator:
+    """Collects one value per (date, metric) in insertion order
+    
+    Membership checks are dictionary lookups, so deduplicating while building
+    a multi-year import stays linear in the number of values.
+    """
+    
+    def __init__(self):
+        self._values = {}
+        self._units = {}
+    
+    def __contains__(self, key):
+        return key in self._values
+    
+    def __len__(self):
+        return len(self._values)
+    
+    def set(self, date, metric_name, value, units):
+        """Store a value, replacing any earlier value for the same date and metric"""
+        self._values[(date, metric_name)] = value
+        self._units[metric_name] = units
+    
+    def setdefault(self, date, metric_name, value, units):
+        """Store a value only if the date and metric has none yet"""
+        if (date, metric_name) not in self._values:
+            self.set(date, metric_name, value, units)
+    
+    def add_fields(self, date, record, fields, skip_none=False):
+        """Store every field of a declarative spec that is present in the record"""
+        values = self._values
+        units_by_metric = self._units
+        for parent_path, entries in _compile_fields(fields):
+            parent = record
+            for key in parent_path:
+                parent = parent.get(key) if isinstance(parent, dict) else None
+            if not isinstance(parent, dict):
+                continue
+            
+            for key, metric_name, units, divisor in entries:
+                value = parent.get(key, _MISSING)
+                if value is _MISSING or (skip_none and value is None):
+                    continue
+                if divisor is not None and value is not None:
+                    value = value / divisor
+                values[(date, metric_name)] = value
+                units_by_metric[metric_name] = units
+    
+    def columns(self):
+        """Return the values as parallel 'date', 'metric_name', 'metric_value' and 'metric_units' lists"""
+        keys = list(self._values)
+        return {
+            'date': [date for date, _ in keys],
+            'metric_name': [metric_name for _, metric_name in keys],
+            'metric_value': list(self._values.values()),
+            'metric_units': [self._units[metric_name] for _, metric_name in keys]
+        }
+    
+    def records(self):
+        """Return the values as the list of dicts used by _store_data"""
+        units = self._units
+        return [
+            {'date': date, 'metric_name': metric_name, 'metric_value': value, 'metric_units': units[metric_name]}
+            for (date, metric_name), value in self._values.items()
+        ]
 
 class OuraImporter:
     """Utility class for importing Oura Ring data through API"""
     
-    def __init__(self, personal_token=None, access_token=None):
+    def __init__(self, personal_token=None, access_token=None, rate_budget=None):
         self.personal_token = personal_token if personal_token else access_token
-        self.api_base_url = "https://api.ouraring.com"
+        self.api_base_url = current_app.config.get('OURA_API_BASE_URL', "https://api.ouraring.com")
+        # Optional RateBudget charged one request per API call (cache hits are free)
+        self.rate_budget = rate_budget
         self.auth_header = {'Authorization': f'Bearer {self.personal_token}'}
         self.debug = current_app.config.get('DEBUG', False)
+        self.cache = ResponseCache.from_config(current_app)
     
-    def _get_data(self, endpoint, params=None):
-        """Helper method to fetch data from Oura API"""
+    def _get_data(self, endpoint, params=None, stream=False):
+        """Helper method to fetch data from Oura API
+        
+        Args:
+            endpoint: API path, e.g. '/v2/usercollection/sleep'
+            params: Query parameters
+            stream: Parse the body incrementally. The returned payload's 'data' is
+                then an iterator yielding one record at a time, with the endpoint's
+                STREAM_SKIP_PATHS removed, so it can only be consumed once.
+        
+        Returns:
+            The response payload as a dict
+        
+        When the response cache is enabled, fresh cached bodies are served
+        without a request, and successful responses are written to it.
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(endpoint, params, self.personal_token)
+            fresh = self.cache.is_fresh(cache_key, params)
+            count_cache_lookup('oura_response', fresh)
+            if fresh:
+                current_app.logger.debug(f"Serving {endpoint} {params} from the response cache")
+                if stream:
+                    chunks = self.cache.iter_chunks(cache_key, STREAM_CHUNK_SIZE)
+                    return {'data': iter_json_records(chunks, skip=STREAM_SKIP_PATHS.get(endpoint, ()))}
+                return json.loads(self.cache.read(cache_key))
+        
+        if self.rate_budget is not None:
+            self.rate_budget.acquire()
         url = f"{self.api_base_url}{endpoint}"
-        response = requests.get(url, headers=self.auth_header, params=params)
+        response = requests.get(url, headers=self.auth_header, params=params, stream=stream)
         
         if response.status_code != 200:
             current_app.logger.error(f"Error fetching data from Oura API: {response.text}")
             response.raise_for_status()
-            
-        return response.json()
+        
+        if stream and hasattr(response, 'iter_content'):
+            chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+            if cache_key is not None:
+                # Written as the body is consumed; kept only if it is read to the end
+                chunks = self.cache.tee(cache_key, chunks)
+            return {'data': iter_json_records(chunks, skip=STREAM_SKIP_PATHS.get(endpoint, ()))}
+        
+        payload = response.json()
+        if cache_key is not None:
+            self.cache.put(cache_key, json.dumps(payload).encode('utf-8'))
+        return payload
     
     def import_sleep_data(self, start_date, end_date):
         """Import sleep data from Oura API"""
@@ -33,10 +293,10 @@ class OuraImporter:
         }
         
         # Get daily sleep data
-        daily_sleep_data = self._get_data("/v2/usercollection/daily_sleep", params)
+        daily_sleep_data = self._get_data("/v2/usercollection/daily_sleep", params, stream=True)
         
         # Get detailed sleep data
-        sleep_data = self._get_data("/v2/usercollection/sleep", params)
+        sleep_data = self._get_data("/v2/usercollection/sleep", params, stream=True)
         
         # Process and store the data
         processed_data = self._process_sleep_data(sleep_data, daily_sleep_data)
@@ -47,395 +307,108 @@ class OuraImporter:
         
         return processed_data
     
+    def _parse_day(self, record):
+        """Return the record's 'day' as a date, or None if it is missing or invalid"""
+        day = record.get('day')
+        if not day:
+            return None
+        try:
+            return datetime.strptime(day, "%Y-%m-%d").date()
+        except ValueError:
+            current_app.logger.error(f"Invalid date format: {day}")
+            return None
+    
+    @profiled('oura.sleep')
     def _process_sleep_data(self, sleep_data, daily_sleep_data):
-        """Process raw Oura sleep data into a format for our database"""
-        processed_data = []
+        """Process raw Oura sleep data into a format for our database
         
-        # Create a mapping of dates to REM sleep data to ensure we have metrics for all days
-        day_to_rem_sleep = {}
-        day_to_deep_sleep = {}
-        day_to_light_sleep = {}
-        day_to_awake_time = {}
+        Daily summaries are read first to decide which days to keep; each sleep
+        session is then visited once, accumulating per-day stage totals,
+        time-weighted averages and long_sleep fields.
+        """
+        metrics = MetricAccumulator()
         
         # Process daily summary metrics
+        days = {}
         for day in daily_sleep_data.get('data', []):
-            date = day.get('day')
-            if not date:
+            date_obj = self._parse_day(day)
+            if date_obj is None:
                 continue
-                
-            # Convert string date to datetime
-            try:
-                date_obj = datetime.strptime(date, "%Y-%m-%d").date()
-            except ValueError:
-                current_app.logger.error(f"Invalid date format: {date}")
-                continue
-            
-            # Store daily sleep score
-            if 'score' in day:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'sleep_score',
-                    'metric_value': day['score'],
-                    'metric_units': 'score'
-                })
-                
-            # Process sleep metrics from daily summary if available
-            if 'contributors' in day and 'rem_sleep' in day['contributors']:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'rem_sleep_score',
-                    'metric_value': day['contributors']['rem_sleep'],
-                    'metric_units': 'score'
-                })
-                
-            if 'contributors' in day and 'deep_sleep' in day['contributors']:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'deep_sleep_score',
-                    'metric_value': day['contributors']['deep_sleep'],
-                    'metric_units': 'score'
-                })
-                
-            if 'contributors' in day and 'total_sleep' in day['contributors']:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'total_sleep_score',
-                    'metric_value': day['contributors']['total_sleep'],
-                    'metric_units': 'score'
-                })
-
-            if 'contributors' in day and 'latency' in day['contributors']:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'sleep_latency_score',
-                    'metric_value': day['contributors']['latency'],
-                    'metric_units': 'score'
-                })
-
-            if 'contributors' in day and 'efficiency' in day['contributors']:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'sleep_efficiency_score',
-                    'metric_value': day['contributors']['efficiency'],
-                    'metric_units': 'score'
-                })
-
-            if 'contributors' in day and 'restfulness' in day['contributors']:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'sleep_restfulness_score',
-                    'metric_value': day['contributors']['restfulness'],
-                    'metric_units': 'score'
-                })
-
-            if 'contributors' in day and 'timing' in day['contributors']:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'sleep_timing_score',
-                    'metric_value': day['contributors']['timing'],
-                    'metric_units': 'score'
-                })
-                
-            # Initialize tracking for this day
-            day_to_rem_sleep[date] = 0
-            day_to_deep_sleep[date] = 0
-            day_to_light_sleep[date] = 0
-            day_to_awake_time[date] = 0
+            metrics.add_fields(date_obj, day, DAILY_SLEEP_FIELDS)
+            days[day['day']] = date_obj
         
         # Process detailed sleep sessions
-        day_hr_data = {}
-        day_hrv_data = {}
-        day_avg_resp = {}
-        day_time_asleep = {}
-        
-        # Initialize these dictionaries for each date
-        for day in day_to_rem_sleep.keys():
-            day_hr_data[day] = []
-            day_hrv_data[day] = []
-            day_avg_resp[day] = []
-            day_time_asleep[day] = []
-        
-        # Track sleep stage totals for each day
-        long_hr = {}
-        lowest_hr = {}
-        long_hrv = {}
-        long_resp = {}
-        long_efficiency = {}
-        long_readiness = {}
-        activity_balance_score = {}
-        body_temperature_score = {}
-        hrv_balance_score = {}
-        previous_day_activity_score = {}
-        previous_night_score = {}
-        recovery_index_score = {}
-        resting_heart_rate_score = {}
-        sleep_balance_score = {}
+        sessions = {
+            day: {
+                'position': position,
+                'stages': dict.fromkeys([metric for metric, _ in SLEEP_STAGE_FIELDS], 0),
+                'long_sleep': MetricAccumulator()
+            }
+            for position, day in enumerate(days)
+        }
+        # Session-level values for the time-weighted averages, one entry per session
+        session_days = []
+        session_values = {metric: [] for metric, _, _ in SESSION_AVERAGE_FIELDS}
+        session_time_in_bed = []
         
         for sleep in sleep_data.get('data', []):
-            day = sleep.get('day')
-            if not day or day not in day_to_rem_sleep:
+            session = sessions.get(sleep.get('day'))
+            if session is None:
                 continue
             
-            if (sleep.get('average_heart_rate') is not None and 
-                sleep.get('average_hrv') is not None and 
-                sleep.get('average_breath') is not None):
-                
-                day_hr_data[day].append(sleep['average_heart_rate'])
-                day_hrv_data[day].append(sleep['average_hrv'])
-                day_avg_resp[day].append(sleep['average_breath'])
-                day_time_asleep[day].append(sleep.get('time_in_bed', 0))
-            
-            # Extract sleep stages from the individual sleep session
-            if sleep.get('rem_sleep_duration') is not None:
-                day_to_rem_sleep[day] += sleep['rem_sleep_duration']
-            
-            if sleep.get('deep_sleep_duration') is not None:
-                day_to_deep_sleep[day] += sleep['deep_sleep_duration']
+            if all(sleep.get(key) is not None for _, key, _ in SESSION_AVERAGE_FIELDS):
+                session_days.append(session['position'])
+                for metric, key, _ in SESSION_AVERAGE_FIELDS:
+                    session_values[metric].append(sleep[key])
+                session_time_in_bed.append(sleep.get('time_in_bed') or 0)
             
-            if sleep.get('light_sleep_duration') is not None:
-                day_to_light_sleep[day] += sleep['light_sleep_duration']
-            
-            if sleep.get('awake_duration') is not None:
-                day_to_awake_time[day] += sleep['awake_duration']
+            # Sleep stages are summed across every session of the day
+            for metric, key in SLEEP_STAGE_FIELDS:
+                if sleep.get(key) is not None:
+                    session['stages'][metric] += sleep[key]
             
             # Store info from the longest sleep session
             if sleep.get('type') == 'long_sleep':
-                if sleep.get('average_hrv') is not None:
-                    long_hrv[day] = sleep['average_hrv']
-                if sleep.get('average_heart_rate') is not None:
-                    long_hr[day] = sleep['average_heart_rate']
-                if sleep.get('lowest_heart_rate') is not None:
-                    lowest_hr[day] = sleep['lowest_heart_rate']
-                if sleep.get('average_breath') is not None:
-                    long_resp[day] = sleep['average_breath']
-                if sleep.get('efficiency') is not None:
-                    long_efficiency[day] = sleep['efficiency']
-                if sleep.get('readiness', {}).get('score') is not None:
-                    long_readiness[day] = sleep['readiness']['score']
-                if sleep.get('readiness', {}).get('contributors') is not None:
-                    readiness_contributors = sleep['readiness']['contributors']
-                    if 'activity_balance' in readiness_contributors:
-                        activity_balance_score[day] = sleep['readiness']['contributors']['activity_balance']
-                    if 'body_temperature' in readiness_contributors:
-                        body_temperature_score[day] = sleep['readiness']['contributors']['body_temperature']
-                    if 'hrv_balance' in readiness_contributors:
-                        hrv_balance_score[day] = sleep['readiness']['contributors']['hrv_balance']
-                    if 'previous_day_activity' in readiness_contributors:
-                        previous_day_activity_score[day] = sleep['readiness']['contributors']['previous_day_activity']
-                    if 'previous_night' in readiness_contributors:
-                        previous_night_score[day] = sleep['readiness']['contributors']['previous_night']
-                    if 'recovery_index' in readiness_contributors:
-                        recovery_index_score[day] = sleep['readiness']['contributors']['recovery_index']
-                    if 'resting_heart_rate' in readiness_contributors:
-                        resting_heart_rate_score[day] = sleep['readiness']['contributors']['resting_heart_rate']
-                    if 'sleep_balance' in readiness_contributors:
-                        sleep_balance_score[day] = sleep['readiness']['contributors']['sleep_balance']
+                session['long_sleep'].add_fields(None, sleep, LONG_SLEEP_FIELDS, skip_none=True)
+        
+        # Time-in-bed weighted averages (and optional spread) across each day's sessions
+        session_stats = _session_statistics(
+            session_days, session_values, session_time_in_bed, len(days),
+            spread=current_app.config.get('OURA_SESSION_STATS', False)
+        )
         
         # Process metrics for each day
-        for day, rem_sleep_duration in day_to_rem_sleep.items():
-            # Convert day string to datetime
-            try:
-                day_obj = datetime.strptime(day, "%Y-%m-%d").date()
-            except ValueError:
-                current_app.logger.error(f"Invalid date format: {day}")
-                continue
-            
-            avg_hr2 = 0
-            avg_hrv2 = 0
-            avg_resp = 0
-            
-            # Process heart rate and HRV data
-            if day_time_asleep[day]:  # Make sure we have data
-                total_time_asleep = sum(day_time_asleep[day])
-                for i in range(len(day_hr_data[day])):
-                    avg_hr2 += day_hr_data[day][i] * (day_time_asleep[day][i] / total_time_asleep)
-                    avg_hrv2 += day_hrv_data[day][i] * (day_time_asleep[day][i] / total_time_asleep)
-                    avg_resp += day_avg_resp[day][i] * (day_time_asleep[day][i] / total_time_asleep)
-                
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'avg_hr',
-                    'metric_value': avg_hr2,
-                    'metric_units': 'bpm'
-                })
-                
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'avg_hrv',
-                    'metric_value': avg_hrv2,
-                    'metric_units': 'ms'
-                })
-                
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'avg_resp',
-                    'metric_value': avg_resp,
-                    'metric_units': 'breaths_per_min'
-                })
+        for day, date_obj in days.items():
+            session = sessions[day]
             
-            # Store sleep stage metrics from session data if they weren't in daily summary
-            if rem_sleep_duration > 0:
-                exists = any(item.get('date') == day_obj and item.get('metric_name') == 'rem_sleep' for item in processed_data)
-                if not exists:
-                    processed_data.append({
-                        'date': day_obj,
-                        'metric_name': 'rem_sleep',
-                        'metric_value': rem_sleep_duration / 60,  # Convert seconds to minutes
-                        'metric_units': 'minutes'
-                    })
+            for metric, value, units in session_stats.get(session['position'], ()):
+                metrics.set(date_obj, metric, value, units)
             
-            if day_to_deep_sleep[day] > 0:
-                exists = any(item.get('date') == day_obj and item.get('metric_name') == 'deep_sleep' for item in processed_data)
-                if not exists:
-                    processed_data.append({
-                        'date': day_obj,
-                        'metric_name': 'deep_sleep',
-                        'metric_value': day_to_deep_sleep[day] / 60,  # Convert seconds to minutes
-                        'metric_units': 'minutes'
-                    })
+            for metric, _ in SLEEP_STAGE_FIELDS:
+                if session['stages'][metric] > 0:
+                    # Convert seconds to minutes
+                    metrics.setdefault(date_obj, metric, session['stages'][metric] / 60, 'minutes')
             
-            if day_to_light_sleep[day] > 0:
-                exists = any(item.get('date') == day_obj and item.get('metric_name') == 'light_sleep' for item in processed_data)
-                if not exists:
-                    processed_data.append({
-                        'date': day_obj,
-                        'metric_name': 'light_sleep',
-                        'metric_value': day_to_light_sleep[day] / 60,  # Convert seconds to minutes
-                        'metric_units': 'minutes'
-                    })
-            
-            if day_to_awake_time[day] > 0:
-                exists = any(item.get('date') == day_obj and item.get('metric_name') == 'awake_time' for item in processed_data)
-                if not exists:
-                    processed_data.append({
-                        'date': day_obj,
-                        'metric_name': 'awake_time',
-                        'metric_value': day_to_awake_time[day] / 60,  # Convert seconds to minutes
-                        'metric_units': 'minutes'
-                    })
-            
-            # Add long session data if available
-            if day in long_hr:
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'long_hr',
-                    'metric_value': long_hr[day],
-                    'metric_units': 'bpm'
-                })
-            
-            if day in lowest_hr:
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'lowest_hr',
-                    'metric_value': lowest_hr[day],
-                    'metric_units': 'bpm'
-                })
-            
-            if day in long_hrv:
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'long_hrv',
-                    'metric_value': long_hrv[day],
-                    'metric_units': 'ms'
-                })
-            
-            if day in long_resp:
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'long_resp',
-                    'metric_value': long_resp[day],
-                    'metric_units': 'breaths_per_min'
-                })
-            
-            if day in long_efficiency:
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'long_efficiency',
-                    'metric_value': long_efficiency[day],
-                    'metric_units': 'score'
-                })
-            
-            if day in long_readiness:
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'readiness_score',
-                    'metric_value': long_readiness[day],
-                    'metric_units': 'score'
-                })
-
-            if day in activity_balance_score:
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'activity_balance_score',
-                    'metric_value': activity_balance_score[day],
-                    'metric_units': 'score'
-                })
-
-            if day in body_temperature_score:
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'body_temperature_score',
-                    'metric_value': body_temperature_score[day],
-                    'metric_units': 'score'
-                })
-
-            if day in hrv_balance_score:
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'hrv_balance_score',
-                    'metric_value': hrv_balance_score[day],
-                    'metric_units': 'score'
-                })
-
-            if day in previous_day_activity_score:
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'previous_day_activity_score',
-                    'metric_value': previous_day_activity_score[day],
-                    'metric_units': 'score'
-                })
-
-            if day in previous_night_score:
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'previous_night_score',
-                    'metric_value': previous_night_score[day],
-                    'metric_units': 'score'
-                })
-
-            if day in recovery_index_score:
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'recovery_index_score',
-                    'metric_value': recovery_index_score[day],
-                    'metric_units': 'score'
-                })
-
-            if day in resting_heart_rate_score:
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'resting_heart_rate_score',
-                    'metric_value': resting_heart_rate_score[day],
-                    'metric_units': 'score'
-                })
-
-            if day in sleep_balance_score:
-                processed_data.append({
-                    'date': day_obj,
-                    'metric_name': 'sleep_balance_score',
-                    'metric_value': sleep_balance_score[day],
-                    'metric_units': 'score'
-                })
+            long_sleep = session['long_sleep'].columns()
+            for metric, value, units in zip(long_sleep['metric_name'], long_sleep['metric_value'],
+                                            long_sleep['metric_units']):
+                metrics.set(date_obj, metric, value, units)
         
-        return processed_data
+        return metrics.records()
     
+    @profiled('oura.store')
     def _store_data(self, processed_data, source):
-        """Store processed data in the database"""
+        """Store processed data in the database
+        
+        DataTypes and existing records are loaded with one query each, rather
+        than one lookup per record.
+        """
         records_added = 0
         records_updated = 0
         records_skipped = 0
         metrics_by_type = {}
         dates_range = set()
+        valid_items = []
         
         for item in processed_data:
             # Skip items with null metric_value
@@ -454,44 +427,61 @@ class OuraImporter:
             if 'date' in item:
                 dates_range.add(item['date'])
             
-            # Get or create the DataType
-            data_type = DataType.query.filter_by(
-                source=source,
-                metric_name=item['metric_name']
-            ).first()
-            
-            if not data_type:
-                data_type = DataType(
-                    source=source,
-                    metric_name=item['metric_name'],
-                    metric_units=item.get('metric_units'),
-                    source_type='api' if 'oura' in source else 'unknown'
+            valid_items.append(item)
+        
+        if valid_items:
+            # Get or create every DataType in the batch
+            data_types = {
+                data_type.metric_name: data_type
+                for data_type in DataType.query.filter(
+                    DataType.source == source,
+                    DataType.metric_name.in_({item['metric_name'] for item in valid_items})
                 )
-                db.session.add(data_type)
-                db.session.flush()  # Flush to get the ID
-            
-            # Check if record already exists using the data_type_id and date
-            existing = HealthData.query.filter_by(
-                date=item['date'],
-                data_type_id=data_type.id
-            ).first()
-            
-            if existing:
-                # Update existing record
-                existing.metric_value = item['metric_value']
-                records_updated += 1
-            else:
-                # Create new record
-                new_data = HealthData(
-                    date=item['date'],
-                    data_type=data_type,
-                    metric_value=item['metric_value']
+            }
+            for item in valid_items:
+                if item['metric_name'] not in data_types:
+                    data_type = DataType(
+                        source=source,
+                        metric_name=item['metric_name'],
+                        metric_units=item.get('metric_units'),
+                        source_type='api' if 'oura' in source else 'unknown'
+                    )
+                    db.session.add(data_type)
+                    data_types[item['metric_name']] = data_type
+            db.session.flush()  # Flush to get the IDs
+            
+            # Fetch existing records for these types over the batch's date range
+            existing_records = {
+                (record.data_type_id, record.date): record
+                for record in HealthData.query.filter(
+                    HealthData.data_type_id.in_([dt.id for dt in data_types.values()]),
+                    HealthData.date >= min(dates_range),
+                    HealthData.date <= max(dates_range)
                 )
-                db.session.add(new_data)
-                records_added += 1
+            }
+            
+            for item in valid_items:
+                data_type_id = data_types[item['metric_name']].id
+                existing = existing_records.get((data_type_id, item['date']))
+                
+                if existing:
+                    # Update existing record
+                    existing.metric_value = item['metric_value']
+                    records_updated += 1
+                else:
+                    # Create new record
+                    new_data = HealthData(
+                        date=item['date'],
+                        data_type_id=data_type_id,
+                        metric_value=item['metric_value']
+                    )
+                    db.session.add(new_data)
+                    existing_records[(data_type_id, item['date'])] = new_data
+                    records_added += 1
         
         # Commit changes to database
         db.session.commit()
+        count_import_rows(source, inserted=records_added, updated=records_updated, skipped=records_skipped)
         
         # Log detailed stats about the import
         date_range_str = ""
@@ -529,7 +519,7 @@ class OuraImporter:
         }
         
         # Get daily activity data
-        activity_data = self._get_data("/v2/usercollection/daily_activity", params)
+        activity_data = self._get_data("/v2/usercollection/daily_activity", params, stream=True)
         
         # Process and store the data
         processed_data = self._process_activity_data(activity_data)
@@ -540,154 +530,18 @@ class OuraImporter:
         
         return processed_data
         
+    @profiled('oura.activity')
     def _process_activity_data(self, activity_data):
         """Process raw Oura activity data into a format for our database"""
-        processed_data = []
+        metrics = MetricAccumulator()
         
         # Process daily activity metrics
         for day in activity_data.get('data', []):
-            date = day.get('day')
-            if not date:
-                continue
-                
-            # Convert string date to datetime
-            try:
-                date_obj = datetime.strptime(date, "%Y-%m-%d").date()
-            except ValueError:
-                current_app.logger.error(f"Invalid date format: {date}")
-                continue
-            
-            # Store activity score
-            if 'score' in day:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'activity_score',
-                    'metric_value': day['score'],
-                    'metric_units': 'score'
-                })
-            
-            # Store active calories
-            if 'active_calories' in day:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'active_calories',
-                    'metric_value': day['active_calories'],
-                    'metric_units': 'kcal'
-                })
-            
-            # Store total calories
-            if 'total_calories' in day:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'total_calories',
-                    'metric_value': day['total_calories'],
-                    'metric_units': 'kcal'
-                })
-            
-            # Store steps
-            if 'steps' in day:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'steps',
-                    'metric_value': day['steps'],
-                    'metric_units': 'count'
-                })
-            
-            # Store equivalent walking distance
-            if 'equivalent_walking_distance' in day:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'walking_distance',
-                    'metric_value': day['equivalent_walking_distance'],
-                    'metric_units': 'meters'
-                })
-            
-            # Store inactive time
-            if 'sedentary_time' in day:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'sedentary_time',
-                    'metric_value': day['sedentary_time'] / 3600, # seconds to hours
-                    'metric_units': 'hours'
-                })
-            
-            # Store met levels if available
-            if 'met' in day:
-                met_data = day['met']
-                
-                if 'average' in met_data:
-                    processed_data.append({
-                        'date': date_obj,
-                        'metric_name': 'average_met',
-                        'metric_value': met_data['average'],
-                        'metric_units': 'met'
-                    })
-                
-                if 'min' in met_data:
-                    processed_data.append({
-                        'date': date_obj,
-                        'metric_name': 'min_met',
-                        'metric_value': met_data['min'],
-                        'metric_units': 'met'
-                    })
-                
-                if 'max' in met_data:
-                    processed_data.append({
-                        'date': date_obj,
-                        'metric_name': 'max_met',
-                        'metric_value': met_data['max'],
-                        'metric_units': 'met'
-                    })
-
-            if 'contributors' in day and 'meet_daily_targets' in day['contributors']:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'meet_daily_targets_score',
-                    'metric_value': day['contributors']['meet_daily_targets'],
-                    'metric_units': 'score'
-                })
-
-            if 'contributors' in day and 'move_every_hour' in day['contributors']:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'move_every_hour_score',
-                    'metric_value': day['contributors']['move_every_hour'],
-                    'metric_units': 'score'
-                })
-
-            if 'contributors' in day and 'recovery_time' in day['contributors']:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'recovery_time_score',
-                    'metric_value': day['contributors']['recovery_time'],
-                    'metric_units': 'score'
-                })
-
-            if 'contributors' in day and 'stay_active' in day['contributors']:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'stay_active_score',
-                    'metric_value': day['contributors']['stay_active'],
-                    'metric_units': 'score'
-                })
-
-            if 'contributors' in day and 'training_frequency' in day['contributors']:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'training_frequency_score',
-                    'metric_value': day['contributors']['training_frequency'],
-                    'metric_units': 'score'
-                })
-
-            if 'contributors' in day and 'training_volume' in day['contributors']:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'training_volume_score',
-                    'metric_value': day['contributors']['training_volume'],
-                    'metric_units': 'score'
-                })
-
-        return processed_data
+            date_obj = self._parse_day(day)
+            if date_obj is not None:
+                metrics.add_fields(date_obj, day, ACTIVITY_FIELDS)
+        
+        return metrics.records()
 
     def import_tags_data(self, start_date, end_date):
         """Import tags data from Oura API"""
@@ -710,7 +564,10 @@ class OuraImporter:
         
         # Process and store the data
         processed_data = self._process_tags_data(tags_data, start_date_obj, end_date_obj)
-        if processed_data:
+        coverage = self._tag_coverage(tags_data, processed_data, start_date_obj, end_date_obj)
+        if coverage:
+            self._store_tag_coverage(*coverage)
+        if processed_data or coverage:
             self._store_data(processed_data, 'oura')  # Always use 'oura' as the source
             
             # Update data source record
@@ -718,16 +575,20 @@ class OuraImporter:
         
         return processed_data
     
+    @profiled('oura.tags')
     def _process_tags_data(self, tags_data, start_date=None, end_date=None):
-        """Process raw Oura tags data into a format for our database"""
+        """Process raw Oura tags data into a format for our database
+        
+        Only days on which a tag occurred are returned. Days without the tag are
+        implicitly 0 over the range recorded by _tag_coverage.
+        """
         processed_data = []
         
         # Check if we have valid data
         if not tags_data or 'data' not in tags_data or not tags_data['data']:
             return processed_data
         
-        # Track unique tag types and their occurrence dates
-        unique_tags = set()
+        # Count occurrences per (tag type, date)
         tag_dates = {}
         
         # Process tag metrics from the API response
@@ -747,82 +608,91 @@ class OuraImporter:
                 current_app.logger.error(f"Invalid start_time format: {start_time}")
                 continue
             
-            # Track this tag type
-            unique_tags.add(tag_name)
-            
-            # Track dates for each tag type
-            if tag_name not in tag_dates:
-                tag_dates[tag_name] = {}
-            
-            if date_obj not in tag_dates[tag_name]:
-                tag_dates[tag_name][date_obj] = 0
-            
-            # Increment the count for this tag on this date
-            tag_dates[tag_name][date_obj] += 1
+            key = (tag_name, date_obj)
+            tag_dates[key] = tag_dates.get(key, 0) + 1
+        
+        for (tag_name, date_obj), count in sorted(tag_dates.items()):
+            processed_data.append({
+                'date': date_obj,
+                'metric_name': f"tag_{tag_name}",
+                'metric_value': count,
+                'metric_units': 'count'
+            })
+        
+        return processed_data
+    
+    def _tag_coverage(self, tags_data, processed_data, start_date=None, end_date=None):
+        """Work out which tag types are implicitly 0 on the days they did not occur
+        
+        Tag types seen in this import are covered over the requested range (or
+        the span of their dates when no range was given). If the response had
+        entries but none were usable, existing tag types are covered instead.
+        
+        Returns:
+            Tuple (metric_names, start_date, end_date), or None when nothing is covered
+        """
+        if not tags_data or not tags_data.get('data'):
+            return None
+        
+        metric_names = {item['metric_name'] for item in processed_data}
         
         # If no tags found in the current import, check for existing tag types from the database
-        if not unique_tags and start_date and end_date:
+        if not metric_names and start_date and end_date:
             try:
-                # Query existing tag types from the database
                 existing_tags = db.session.query(
                     DataType.metric_name
                 ).filter(
                     DataType.metric_name.like('tag_%'),
                     DataType.source == 'oura'
                 ).distinct().all()
-                
-                # Add existing tag types to our set
-                for tag in existing_tags:
-                    unique_tags.add(tag.metric_name.replace('tag_', ''))
+                metric_names = {tag.metric_name for tag in existing_tags}
             except Exception as e:
                 current_app.logger.error(f"Error querying existing tag types: {str(e)}")
         
-        # Create a complete date range, using provided start_date and end_date if available
-        if unique_tags:
-            if start_date and end_date:
-                # Use provided date range
-                min_date = start_date
-                max_date = end_date
-            else:
-                # Get date range from the data
-                all_dates = set()
-                for tag_date_dict in tag_dates.values():
-                    all_dates.update(tag_date_dict.keys())
-                
-                if all_dates:
-                    min_date = min(all_dates)
-                    max_date = max(all_dates)
-                else:
-                    # No dates in current import, but we might have tag types
-                    # If we have start_date and end_date, use those
-                    if start_date and end_date:
-                        min_date = start_date
-                        max_date = end_date
-                    else:
-                        # No data, return empty
-                        return processed_data
-            
-            # Create a complete date range
-            complete_range = []
-            current_date = min_date
-            while current_date <= max_date:
-                complete_range.append(current_date)
-                current_date += timedelta(days=1)
-            
-            # Ensure every tag type has an entry for every date in the range
-            for tag_name in unique_tags:
-                for date_obj in complete_range:
-                    # Get the count for this tag on this date (0 if not present)
-                    count = tag_dates.get(tag_name, {}).get(date_obj, 0)
-                    
-                    processed_data.append({
-                        'date': date_obj,
-                        'metric_name': f"tag_{tag_name}",
-                        'metric_value': count,
-                        'metric_units': 'count'
-                    })
+        if not metric_names:
+            return None
         
-        return processed_data
+        if start_date and end_date:
+            return metric_names, start_date, end_date
+        
+        dates = [item['date'] for item in processed_data]
+        return metric_names, min(dates), max(dates)
+    
+    def _store_tag_coverage(self, metric_names, start_date, end_date):
+        """Mark tag types as 0-filled over a date range and clear their stale rows in it
+        
+        Rows in the range are removed first (including 0 rows written by older
+        dense imports), so the following _store_data call leaves exactly this
+        import's occurrences.
+        """
+        data_types = {
+            data_type.metric_name: data_type
+            for data_type in DataType.query.filter(
+                DataType.source == 'oura',
+                DataType.metric_name.in_(metric_names)
+            )
+        }
+        for metric_name in metric_names - set(data_types):
+            data_type = DataType(
+                source='oura',
+                metric_name=metric_name,
+                metric_units='count',
+                source_type='api'
+            )
+            db.session.add(data_type)
+            data_types[metric_name] = data_type
+        db.session.flush()
+        
+        type_ids = [data_type.id for data_type in data_types.values()]
+        HealthData.query.filter(
+            HealthData.data_type_id.in_(type_ids),
+            HealthData.date >= start_date,
+            HealthData.date <= end_date
+        ).delete(synchronize_session=False)
+        
+        for data_type_id in type_ids:
+            DataCoverage.extend(data_type_id, start_date, end_date)
+        db.session.flush()
     
     def import_stress_data(self, start_date, end_date):
         """Import daily stress data from Oura API"""
@@ -832,7 +702,7 @@ class OuraImporter:
         }
         
         # Get daily stress data
-        stress_data = self._get_data("/v2/usercollection/daily_stress", params)
+        stress_data = self._get_data("/v2/usercollection/daily_stress", params, stream=True)
         
         # Process and store the data
         processed_data = self._process_stress_data(stress_data)
@@ -843,46 +713,18 @@ class OuraImporter:
         
         return processed_data
     
+    @profiled('oura.stress')
     def _process_stress_data(self, stress_data):
         """Process raw Oura stress data into a format for our database"""
-        processed_data = []
+        metrics = MetricAccumulator()
         
         # Process daily stress metrics
         for day in stress_data.get('data', []):
-            date = day.get('day')
-            if not date:
-                continue
-                
-            # Convert string date to datetime
-            try:
-                date_obj = datetime.strptime(date, "%Y-%m-%d").date()
-            except ValueError:
-                current_app.logger.error(f"Invalid date format: {date}")
-                continue
-            
-            # Store stress_high metric
-            if 'stress_high' in day:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'stress_high',
-                    'metric_value': day['stress_high'],
-                    'metric_units': 'score'
-                })
-            
-            # Store recovery_high metric
-            if 'recovery_high' in day:
-                processed_data.append({
-                    'date': date_obj,
-                    'metric_name': 'recovery_high',
-                    'metric_value': day['recovery_high'],
-                    'metric_units': 'score'
-                })
-            
-            # Store day_summary if available
-            # We skip this because it's a string value and our database needs numeric values
-            # If needed in the future, we could convert it to a numeric code or create a separate table
+            date_obj = self._parse_day(day)
+            if date_obj is not None:
+                metrics.add_fields(date_obj, day, STRESS_FIELDS)
         
-        return processed_data
+        return metrics.records()
     
     def diagnostic_check(self, start_date, end_date):
         """Run diagnostic checks to identify potential issues with data import"""
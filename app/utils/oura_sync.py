@@ -0,0 +1,271 @@
+import hashlib
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+import requests
+from flask import current_app, g
+from sqlalchemy import func
+
+from .. import db
+from ..models.base import SyncRun, User
+from .oura_importer import OuraImporter
+
+# Summary of one account's sync, returned by OuraSyncScheduler.sync_account
+SyncResult = namedtuple('SyncResult', ['user_id', 'status', 'row_count', 'request_count', 'duration'])
+
+
+class RateLimited(Exception):
+    """Raised when an account's requests have to wait longer than allowed for its rate budget"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateBudget:
+    """Sliding-window limit on one account's API requests
+
+    At most limit requests are started in any period seconds; a request that
+    would exceed that sleeps until the oldest of the last limit requests is
+    period seconds old. Safe to share between threads.
+    """
+
+    def __init__(self, limit, period, max_wait=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        Args:
+            limit: Requests allowed in any period
+            period: Length of the window in seconds
+            max_wait: Longest acquire() may sleep; it raises RateLimited rather than wait longer
+            clock: Monotonic clock, in seconds
+            sleep: Function used to wait
+        """
+        self.limit = limit
+        self.period = period
+        self.max_wait = max_wait
+        self.requests = 0
+        self._clock = clock
+        self._sleep = sleep
+        # Start times of the last limit requests, including ones still waiting to start
+        self._starts = deque(maxlen=limit)
+        self._paused_until = float('-inf')
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one request from the budget, sleeping until it may start
+
+        Returns:
+            Seconds slept
+
+        Raises:
+            RateLimited: If the wait would be longer than max_wait
+        """
+        with self._lock:
+            now = self._clock()
+            start = max(now, self._paused_until)
+            if self._starts:
+                start = max(start, self._starts[-1])
+            if len(self._starts) == self.limit:
+                start = max(start, self._starts[0] + self.period)
+            wait = start - now
+            if self.max_wait is not None and wait > self.max_wait:
+                raise RateLimited(f"Rate budget exhausted for another {wait:.0f} s", retry_after=wait)
+            # Reserve the start time now, so concurrent callers queue up behind it
+            self._starts.append(start)
+            self.requests += 1
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        """Allow no requests for the next seconds, e.g. after a 429 Too Many Requests"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+
+def _retry_after(response, default):
+    """Seconds to wait according to a response's Retry-After header"""
+    try:
+        return max(0.0, float(response.headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return default
+
+
+def _utc(timestamp):
+    """Naive UTC datetime, as stored in the database, for a time.time() timestamp"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+class OuraSyncScheduler:
+    """Periodically syncs the Oura data of every user with a stored token
+
+    Each account is synced about every interval seconds. Run times are
+    spread by up to jitter seconds, differently for each account and run, so
+    hundreds of accounts do not all call the API at once; first syncs are
+    spread over the jitter window after the scheduler starts. Syncs are
+    incremental: after the first (lookback_days long) they start settle_days
+    before the end of the account's last successful sync, to pick up nights
+    Oura has revised. Due accounts run on a bounded pool of worker threads,
+    and every request is charged to the account's RateBudget. Each sync is
+    recorded as a SyncRun.
+    """
+
+    SOURCE = 'oura'
+    IMPORTS = ('import_sleep_data', 'import_activity_data', 'import_tags_data', 'import_stress_data')
+
+    def __init__(self, app, workers=None, interval=None, jitter=None, clock=time.time, sleep=time.sleep):
+        """
+        Args:
+            app: Flask app whose configuration and database are used
+            workers: Accounts synced at once (default OURA_SYNC_WORKERS)
+            interval: Seconds between an account's syncs (default OURA_SYNC_INTERVAL)
+            jitter: Seconds of spread around each run time (default OURA_SYNC_JITTER)
+            clock: Wall clock, in seconds since the epoch
+            sleep: Function used to wait, passed on to the rate budgets
+        """
+        config = app.config
+        self.app = app
+        self.workers = max(1, workers or config.get('OURA_SYNC_WORKERS', 4))
+        self.interval = interval if interval is not None else config.get('OURA_SYNC_INTERVAL', 3600)
+        self.jitter = jitter if jitter is not None else config.get('OURA_SYNC_JITTER', 600)
+        self.lookback_days = config.get('OURA_SYNC_LOOKBACK_DAYS', 30)
+        self.settle_days = config.get('OURA_CACHE_SETTLE_DAYS', 2)
+        self.rate_limit = config.get('OURA_SYNC_RATE_LIMIT', 5000)
+        self.rate_period = config.get('OURA_SYNC_RATE_PERIOD', 300)
+        self.max_wait = config.get('OURA_SYNC_MAX_WAIT', 30)
+        self.started = clock()
+        self._clock = clock
+        self._sleep = sleep
+        self._budgets = {}
+        self._budgets_lock = threading.Lock()
+
+    def budget(self, user_id):
+        """Return the rate budget shared by all of an account's syncs"""
+        with self._budgets_lock:
+            budget = self._budgets.get(user_id)
+            if budget is None:
+                budget = self._budgets[user_id] = RateBudget(
+                    self.rate_limit, self.rate_period, max_wait=self.max_wait, sleep=self._sleep)
+            return budget
+
+    def _jitter(self, user_id, salt):
+        """Stable pseudo-random fraction in [0, 1) for one account's run"""
+        digest = hashlib.sha256(f'{user_id}:{salt}'.encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+    def schedule(self):
+        """Return every account's next sync, soonest first (needs an app context)
+
+        Returns:
+            List of (due_time, user_id, token, start_date) tuples, due_time in
+            seconds since the epoch
+        """
+        accounts = db.session.query(User.id, User.oura_token).filter(
+            User.oura_token.isnot(None), User.oura_token != '').all()
+        runs = db.session.query(SyncRun).filter(SyncRun.source == self.SOURCE).execution_options(all_users=True)
+        last_started = dict(runs.with_entities(
+            SyncRun.user_id, func.max(SyncRun.started_at)).group_by(SyncRun.user_id).all())
+        last_synced = dict(runs.filter(SyncRun.status == 'ok').with_entities(
+            SyncRun.user_id, func.max(SyncRun.end_date)).group_by(SyncRun.user_id).all())
+        today = date.fromtimestamp(self._clock())
+
+        schedule = []
+        for user_id, token in accounts:
+            started_at = last_started.get(user_id)
+            if started_at is None:
+                due = self.started + self._jitter(user_id, 'first') * self.jitter
+            else:
+                started = started_at.replace(tzinfo=timezone.utc).timestamp()
+                due = started + self.interval + (self._jitter(user_id, started_at.isoformat()) - 0.5) * self.jitter
+
+            synced = last_synced.get(user_id)
+            if synced is None:
+                start_date = today - timedelta(days=self.lookback_days)
+            else:
+                start_date = min(synced, today) - timedelta(days=self.settle_days)
+            schedule.append((due, user_id, token, start_date))
+
+        schedule.sort(key=lambda entry: entry[0])
+        return schedule
+
+    def sync_account(self, user_id, token, start_date):
+        """Import one account's Oura data from start_date to today and record the run
+
+        Returns:
+            SyncResult for the run
+        """
+        with self.app.app_context():
+            g.user_id = user_id
+            now = self._clock()
+            end_date = date.fromtimestamp(now)
+            run = SyncRun(user_id=user_id, source=self.SOURCE, start_date=start_date,
+                          end_date=end_date, started_at=_utc(now))
+            db.session.add(run)
+            db.session.commit()
+
+            budget = self.budget(user_id)
+            requests_before = budget.requests
+            started = time.perf_counter()
+            rows = 0
+            try:
+                importer = OuraImporter(personal_token=token, rate_budget=budget)
+                for name in self.IMPORTS:
+                    records = getattr(importer, name)(start_date.isoformat(), end_date.isoformat())
+                    rows += len(records or ())
+                run.status = 'ok'
+            except RateLimited as e:
+                db.session.rollback()
+                run.status, run.error = 'rate_limited', str(e)
+            except requests.HTTPError as e:
+                db.session.rollback()
+                if e.response is not None and e.response.status_code == 429:
+                    budget.pause(_retry_after(e.response, self.rate_period))
+                    run.status = 'rate_limited'
+                else:
+                    run.status = 'error'
+                run.error = str(e)
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"Oura sync failed for user {user_id}: {e}")
+                run.status, run.error = 'error', str(e)
+
+            run.duration = time.perf_counter() - started
+            run.finished_at = _utc(self._clock())
+            run.request_count = budget.requests - requests_before
+            run.row_count = rows
+            db.session.commit()
+            return SyncResult(user_id, run.status, run.row_count, run.request_count, run.duration)
+
+    def run_once(self, now=None):
+        """Sync every account that is due, on at most workers threads at a time
+
+        Returns:
+            List of SyncResult, in the order the accounts were due
+        """
+        now = self._clock() if now is None else now
+        with self.app.app_context():
+            due = [entry[1:] for entry in self.schedule() if entry[0] <= now]
+        if not due:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(due))) as executor:
+            return list(executor.map(lambda account: self.sync_account(*account), due))
+
+    def run_forever(self, stop=None, poll=60, report=None):
+        """Run due syncs until stop is set, sleeping until the next account is due
+
+        Args:
+            stop: threading.Event ending the loop; runs forever if None
+            poll: Longest sleep in seconds, so new accounts are picked up
+            report: Optional callable receiving each SyncResult
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            for result in self.run_once():
+                if report:
+                    report(result)
+            with self.app.app_context():
+                schedule = self.schedule()
+            wait = schedule[0][0] - self._clock() if schedule else poll
+            stop.wait(min(max(wait, 1), poll))
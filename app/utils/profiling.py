@@ -0,0 +1,240 @@
+import functools
+import random
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .metrics import current_metrics
+
+
+class RequestProfile:
+    """Where one request's time went: SQL statements, named phases and peak memory"""
+
+    def __init__(self, method, path, trace_memory=False):
+        self.method = method
+        self.path = path
+        self.endpoint = None
+        self.status = None
+        self.started = time.perf_counter()
+        self.duration = None
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.phases = {}  # name -> [calls, seconds]
+        self.peak_memory = None
+        self.trace_memory = trace_memory
+
+    def add_phase(self, name, seconds):
+        entry = self.phases.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def server_timing(self):
+        """Return the Server-Timing header value for this profile"""
+        metrics = [f'total;dur={self.duration * 1000:.1f}',
+                   f'sql;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} queries"']
+        for name, (calls, seconds) in self.phases.items():
+            metrics.append(f'{name};dur={seconds * 1000:.1f}' + (f';desc="{calls} calls"' if calls > 1 else ''))
+        if self.peak_memory is not None:
+            metrics.append(f'mem;desc="peak {self.peak_memory / 2 ** 20:.1f} MiB"')
+        return ', '.join(metrics)
+
+    def to_dict(self):
+        return {
+            'method': self.method,
+            'path': self.path,
+            'endpoint': self.endpoint,
+            'status': self.status,
+            'duration_ms': round(self.duration * 1000, 2),
+            'sql_count': self.sql_count,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'phases': {name: {'calls': calls, 'ms': round(seconds * 1000, 2)}
+                       for name, (calls, seconds) in self.phases.items()},
+            'peak_memory_bytes': self.peak_memory,
+        }
+
+
+class Profiler:
+    """Per-app profiling state: sampling settings, endpoint totals and the slow request log
+
+    Requests are profiled with probability sample_rate. Profiled requests
+    slower than slow_ms are kept in a rolling log of the last slow_log_size.
+    Memory tracing uses tracemalloc, which is process-wide: while profiled
+    requests overlap, each one's peak includes the others' allocations.
+    """
+
+    def __init__(self, sample_rate=1.0, slow_ms=500.0, slow_log_size=100, trace_memory=False):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.trace_memory = trace_memory
+        self.slow_requests = deque(maxlen=slow_log_size)
+        self.endpoints = {}
+        self.profiled = 0
+        self._tracing = 0
+        self._lock = threading.Lock()
+
+    def start(self, method, path):
+        """Return a profile for a new request, or None if it is not sampled"""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return None
+        profile = RequestProfile(method, path, self.trace_memory)
+        if profile.trace_memory:
+            with self._lock:
+                if self._tracing == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                self._tracing += 1
+                tracemalloc.reset_peak()
+        return profile
+
+    def finish(self, profile, endpoint, status):
+        """Complete a profile and add it to the endpoint totals and slow log"""
+        profile.duration = time.perf_counter() - profile.started
+        profile.endpoint = endpoint
+        profile.status = status
+        with self._lock:
+            if profile.trace_memory:
+                profile.peak_memory = tracemalloc.get_traced_memory()[1]
+                self._tracing -= 1
+                if self._tracing == 0:
+                    tracemalloc.stop()
+                profile.trace_memory = False
+
+            self.profiled += 1
+            totals = self.endpoints.setdefault(endpoint or profile.path, {
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'sql_count': 0, 'sql_ms': 0.0})
+            duration_ms = profile.duration * 1000
+            totals['count'] += 1
+            totals['total_ms'] += duration_ms
+            totals['max_ms'] = max(totals['max_ms'], duration_ms)
+            totals['sql_count'] += profile.sql_count
+            totals['sql_ms'] += profile.sql_time * 1000
+            if duration_ms >= self.slow_ms:
+                self.slow_requests.append(profile.to_dict())
+        return profile
+
+    def summary(self):
+        """Return settings, per-endpoint totals and the slow request log, newest first"""
+        with self._lock:
+            endpoints = {
+                name: dict(totals, avg_ms=round(totals['total_ms'] / totals['count'], 2),
+                           total_ms=round(totals['total_ms'], 2), max_ms=round(totals['max_ms'], 2),
+                           sql_ms=round(totals['sql_ms'], 2))
+                for name, totals in self.endpoints.items()
+            }
+            return {
+                'sample_rate': self.sample_rate,
+                'slow_ms': self.slow_ms,
+                'trace_memory': self.trace_memory,
+                'profiled_requests': self.profiled,
+                'endpoints': endpoints,
+                'slow_requests': list(reversed(self.slow_requests)),
+            }
+
+
+def current_profile():
+    """Return the profile of the request being handled, or None"""
+    if not has_app_context():
+        return None
+    return g.get('_profile')
+
+
+@contextmanager
+def phase(name):
+    """Time a block as a named phase of the current request's profile
+
+    The time is also observed in the app's phase duration metric. Does
+    nothing when the request is not being profiled and metrics are disabled.
+    """
+    profile = current_profile()
+    metrics = current_metrics()
+    if profile is None and metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if profile is not None:
+            profile.add_phase(name, elapsed)
+        if metrics is not None:
+            metrics.phase_duration.observe(elapsed, phase=name)
+
+
+def profiled(name):
+    """Decorator timing every call of a function as a named phase (see phase)"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile() is not None:
+        conn.info.setdefault('_profile_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile()
+    started = conn.info.get('_profile_started')
+    if profile is not None and started:
+        profile.sql_count += 1
+        profile.sql_time += time.perf_counter() - started.pop()
+
+
+def init_profiling(app):
+    """Profile requests to app if PROFILING is enabled
+
+    Sampled requests record their SQL statement count and time, named
+    phases and, with PROFILING_TRACE_MEMORY, peak memory. Each response
+    gets a Server-Timing header, and /debug/perf reports endpoint totals
+    and the slow request log.
+    """
+    if not app.config.get('PROFILING'):
+        return None
+
+    profiler = Profiler(
+        sample_rate=app.config.get('PROFILING_SAMPLE_RATE', 1.0),
+        slow_ms=app.config.get('PROFILING_SLOW_MS', 500.0),
+        slow_log_size=app.config.get('PROFILING_SLOW_LOG_SIZE', 100),
+        trace_memory=app.config.get('PROFILING_TRACE_MEMORY', False),
+    )
+    app.extensions['profiler'] = profiler
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_profile():
+        g._profile = profiler.start(request.method, request.path)
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('_profile', None)
+        if profile is None:
+            return response
+        profiler.finish(profile, request.endpoint, response.status_code)
+        response.headers['Server-Timing'] = profile.server_timing()
+        if profile.duration * 1000 >= profiler.slow_ms:
+            current_app.logger.warning(
+                f"Slow request {profile.method} {profile.path}: {profile.duration * 1000:.0f} ms, "
+                f"{profile.sql_count} queries ({profile.sql_time * 1000:.0f} ms)")
+        return response
+
+    @app.teardown_request
+    def discard_profile(exc):
+        # Requests that fail before after_request still stop memory tracing
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            profiler.finish(profile, request.endpoint, 500)
+
+    return profiler
@@ -0,0 +1,110 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import date, datetime
+
+
+class ResponseCache:
+    """Content-addressed, gzip-compressed cache of API response bodies on disk
+
+    Entries are keyed by endpoint, query parameters and a hash of the access
+    token, so different accounts never share entries and the token itself is
+    never written to disk. A response whose end_date was already settled when
+    it was fetched (at least settle_days before the fetch) is treated as
+    immutable; anything covering more recent days expires after ttl seconds,
+    since Oura keeps revising the last night or two.
+    """
+
+    def __init__(self, directory, ttl=6 * 3600, settle_days=2):
+        self.directory = directory
+        self.ttl = ttl
+        self.settle_days = settle_days
+
+    @classmethod
+    def from_config(cls, app):
+        """Return the cache configured for app, or None if OURA_RESPONSE_CACHE is off"""
+        if not app.config.get('OURA_RESPONSE_CACHE'):
+            return None
+        directory = app.config.get('OURA_CACHE_DIR') or os.path.join(app.instance_path, 'oura_cache')
+        return cls(directory,
+                   ttl=app.config.get('OURA_CACHE_TTL', 6 * 3600),
+                   settle_days=app.config.get('OURA_CACHE_SETTLE_DAYS', 2))
+
+    def key(self, endpoint, params, token):
+        """Return the cache key for a request"""
+        token_hash = hashlib.sha256((token or '').encode('utf-8')).hexdigest()
+        request = json.dumps([endpoint, sorted((params or {}).items()), token_hash], default=str)
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.json.gz')
+
+    def is_fresh(self, key, params=None):
+        """Check whether an entry exists and can be served without a request
+
+        Args:
+            key: Cache key from key()
+            params: The request's query parameters; their 'end_date' decides
+                whether the entry was settled when it was fetched
+
+        Returns:
+            True if the entry is immutable or younger than ttl
+        """
+        try:
+            fetched_at = os.path.getmtime(self._path(key))
+        except OSError:
+            return False
+
+        end_date = (params or {}).get('end_date')
+        if end_date:
+            try:
+                end_date = datetime.strptime(str(end_date), '%Y-%m-%d').date()
+            except ValueError:
+                end_date = None
+        if end_date and (date.fromtimestamp(fetched_at) - end_date).days >= self.settle_days:
+            return True
+        return time.time() - fetched_at < self.ttl
+
+    def iter_chunks(self, key, chunk_size=64 * 1024):
+        """Yield the decompressed body of an entry in chunks"""
+        with gzip.open(self._path(key), 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def read(self, key):
+        """Return the decompressed body of an entry"""
+        with gzip.open(self._path(key), 'rb') as f:
+            return f.read()
+
+    def put(self, key, body):
+        """Store a complete response body"""
+        for _ in self.tee(key, [body]):
+            pass
+
+    def tee(self, key, chunks):
+        """Pass chunks through while writing them to the cache
+
+        The entry is written to a temporary file and only moved into place once
+        chunks is exhausted, so an interrupted download never leaves a partial
+        entry behind.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        committed = False
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp_path, path)
+            committed = True
+        finally:
+            if not committed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,159 @@
+import gzip
+import json
+import struct
+
+import numpy as np
+from flask import Response, current_app, request
+
+try:
+    import brotli
+except ImportError:  # optional: without it responses are gzip-compressed only
+    brotli = None
+
+# Media types a client can ask for in Accept instead of the default point-list JSON
+COLUMNAR_JSON = 'application/vnd.health-tracker.columnar+json'
+BINARY_SERIES = 'application/vnd.health-tracker.series'
+SERIES_FORMATS = {'application/json': 'json', COLUMNAR_JSON: 'columnar', BINARY_SERIES: 'binary'}
+
+# Binary responses start with this magic, then the little-endian uint32 length of the JSON header
+BINARY_MAGIC = b'HTS1'
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+
+_EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+def negotiate_series_format():
+    """Pick 'json', 'columnar' or 'binary' from the request's Accept header
+
+    Clients that send no Accept header, or accept anything, get the default JSON.
+    """
+    return SERIES_FORMATS[request.accept_mimetypes.best_match(list(SERIES_FORMATS), 'application/json')]
+
+
+def epoch_days(dates):
+    """Days since 1970-01-01 of a datetime64 array, as int32"""
+    return (np.asarray(dates, dtype='datetime64[D]') - _EPOCH).astype(np.int32)
+
+
+def encode_columnar(payload):
+    """Replace the NumPy arrays in a payload with compact JSON columns
+
+    Date arrays become {'start': first date, 'deltas': days since the
+    previous date (0 for the first)}; other arrays become plain lists, with
+    null for NaN.
+    """
+    if isinstance(payload, dict):
+        return {key: encode_columnar(value) for key, value in payload.items()}
+    if isinstance(payload, (list, tuple)):
+        return [encode_columnar(value) for value in payload]
+    if not isinstance(payload, np.ndarray):
+        return payload
+    if payload.dtype.kind == 'M':
+        days = epoch_days(payload)
+        return {
+            'start': str(payload[0].astype('datetime64[D]')) if len(days) else None,
+            'deltas': np.diff(days, prepend=days[:1]).tolist()
+        }
+    if payload.dtype.kind == 'f' and np.isnan(payload).any():
+        return np.where(np.isnan(payload), None, payload).tolist()
+    return payload.tolist()
+
+
+def encode_binary(payload, float_dtype='<f8'):
+    """Pack a payload's NumPy arrays as raw typed arrays behind a JSON header
+
+    Layout: BINARY_MAGIC, the uint32 header length, the UTF-8 JSON header
+    (space-padded so the arrays start on an 8-byte boundary), then the arrays,
+    each starting on an 8-byte boundary so a browser can view them in place
+    as Int32Array / Float32Array / Float64Array. In the header each array is
+    replaced by {'$array': i}, and '$arrays'[i] gives its 'dtype' ('int32',
+    'float32' or 'float64'), 'length' and 'offset' from the end of the
+    header. Dates are sent as int32 days since 1970-01-01, with 'unit': 'day'.
+
+    Args:
+        payload: JSON-serializable dict whose values may include NumPy arrays
+        float_dtype: '<f8' or '<f4' for the float arrays
+
+    Returns:
+        Response body bytes
+    """
+    arrays, specs = [], []
+    offset = 0
+
+    def collect(value):
+        nonlocal offset
+        if isinstance(value, dict):
+            return {key: collect(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [collect(item) for item in value]
+        if not isinstance(value, np.ndarray):
+            return value
+
+        spec = {}
+        if value.dtype.kind == 'M':
+            value = epoch_days(value)
+            spec['unit'] = 'day'
+        elif value.dtype.kind in 'iub':
+            value = value.astype('<i4')
+        else:
+            value = value.astype(float_dtype)
+        spec.update(dtype=value.dtype.name, length=len(value), offset=offset)
+        arrays.append(value.tobytes())
+        specs.append(spec)
+        offset += -(-value.nbytes // 8) * 8
+        return {'$array': len(specs) - 1}
+
+    header = collect(payload)
+    header['$arrays'] = specs
+    header = json.dumps(header, separators=(',', ':')).encode()
+    header += b' ' * (-(len(header) + 8) % 8)
+
+    body = bytearray(BINARY_MAGIC + struct.pack('<I', len(header)) + header)
+    for data in arrays:
+        body += data + b'\0' * (-len(data) % 8)
+    return bytes(body)
+
+
+def compressed_response(body, mimetype):
+    """A response with body compressed as the client accepts: brotli if available, else gzip"""
+    if isinstance(body, str):
+        body = body.encode()
+    response = Response(body, mimetype=mimetype)
+    response.vary.update(('Accept', 'Accept-Encoding'))
+
+    # An empty Accept-Encoding would match anything, but a missing one means no compression
+    if len(body) < COMPRESS_MIN_BYTES or not request.accept_encodings:
+        return response
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli is not None else ['gzip'])
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=5))
+    elif encoding == 'gzip':
+        response.set_data(gzip.compress(body, compresslevel=6))
+    else:
+        return response
+    response.content_encoding = encoding
+    return response
+
+
+def series_response(payload, json_payload):
+    """Respond with a series payload in the format the client asked for
+
+    Args:
+        payload: Dict holding the series as NumPy arrays (see encode_columnar
+            and encode_binary); binary float arrays are float64, or float32
+            with the precision=32 query parameter
+        json_payload: Callable building the default JSON payload, only called
+            when the client wants it
+
+    Returns:
+        A possibly compressed Response
+    """
+    series_format = negotiate_series_format()
+    if series_format == 'binary':
+        float_dtype = '<f4' if request.args.get('precision') == '32' else '<f8'
+        return compressed_response(encode_binary(payload, float_dtype), BINARY_SERIES)
+    if series_format == 'columnar':
+        return compressed_response(current_app.json.dumps(encode_columnar(payload)), COLUMNAR_JSON)
+    return compressed_response(current_app.json.dumps(json_payload()), 'application/json')
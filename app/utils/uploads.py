@@ -0,0 +1,109 @@
+import gzip
+import io
+import shutil
+import tempfile
+import zipfile
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZIP_MAGIC = b'PK\x03\x04'
+
+# Zip archives keep their index at the end, so unseekable zip streams are spooled
+# to memory up to this size, then to a temporary file
+ZIP_SPOOL_SIZE = 8 * 1024 * 1024
+
+
+class _PrefixedStream(io.RawIOBase):
+    """Unseekable stream with bytes already read from it put back in front"""
+
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            n = min(len(buffer), len(self._prefix))
+            buffer[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class _ForwardOnly(io.BufferedIOBase):
+    """Read-only view of a stream that reports itself as unseekable"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+    read1 = read
+
+    def close(self):
+        self._stream.close()
+        super().close()
+
+
+def _seekable(stream):
+    try:
+        return stream.seekable()
+    except (AttributeError, ValueError):
+        return False
+
+
+def open_upload(stream, filename=None):
+    """Return a binary file object reading the CSV inside an uploaded stream
+
+    Plain, gzip and zip uploads are accepted; the format is detected from the
+    first bytes rather than the file name. Plain and gzip streams are read
+    incrementally, so parsing can start before the upload has fully arrived.
+
+    Args:
+        stream: Binary file-like object, e.g. FileStorage.stream or request.stream
+        filename: Upload file name, used only in error messages
+
+    Returns:
+        A readable binary file object
+
+    Raises:
+        ValueError: If a zip upload does not contain exactly one .csv file
+    """
+    head = b''
+    while len(head) < len(ZIP_MAGIC):
+        chunk = stream.read(len(ZIP_MAGIC) - len(head))
+        if not chunk:
+            break
+        head += chunk
+    if _seekable(stream):
+        stream.seek(-len(head), io.SEEK_CUR)
+    else:
+        stream = io.BufferedReader(_PrefixedStream(head, stream))
+
+    if head.startswith(GZIP_MAGIC):
+        decompressed = gzip.GzipFile(fileobj=stream, mode='rb')
+        # GzipFile claims to be seekable even when its source is not
+        return decompressed if _seekable(stream) else _ForwardOnly(decompressed)
+
+    if head.startswith(ZIP_MAGIC):
+        if not _seekable(stream):
+            spooled = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_SIZE)
+            shutil.copyfileobj(stream, spooled)
+            spooled.seek(0)
+            stream = spooled
+        archive = zipfile.ZipFile(stream)
+        members = [info for info in archive.infolist()
+                   if not info.is_dir() and info.filename.lower().endswith('.csv')]
+        if len(members) != 1:
+            raise ValueError(f"Expected exactly one CSV file in '{filename or 'upload'}', found {len(members)}")
+        return archive.open(members[0])
+
+    return stream
+
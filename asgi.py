@@ -0,0 +1,18 @@
+"""ASGI entry point, e.g. `uvicorn asgi:app --workers 2`
+
+The Flask app is wrapped with asgiref's WsgiToAsgi, which runs each request
+in a thread pool; set ANALYSIS_WORKERS so correlation calculations run in
+worker processes instead of holding those threads and the GIL. Needs the
+optional dependencies: pip install asgiref uvicorn
+"""
+import os
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError as e:
+    raise ImportError("ASGI serving needs asgiref: pip install asgiref uvicorn") from e
+
+from app import create_app
+
+env = os.environ.get('FLASK_ENV', 'development')
+app = WsgiToAsgi(create_app(env))
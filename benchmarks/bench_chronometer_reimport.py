@@ -0,0 +1,49 @@
+"""Benchmark re-importing a 5-year Chronometer export
+
+Times a first import, an identical re-import (skipped by its file
+fingerprint), and a re-import with the last day edited and one day added
+(only changed days written).
+
+Usage:
+    python benchmarks/bench_chronometer_reimport.py [--days 1825] [--servings 10]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app, db
+from app.utils.chronometer_importer import ChronometerImporter
+from chronometer_export import chronometer_csv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=5 * 365, help='Days in the export')
+    parser.add_argument('--servings', type=int, default=10, help='Servings logged per day')
+    args = parser.parse_args()
+    
+    export = chronometer_csv(args.days, args.servings)
+    lines = export.splitlines(keepends=True)
+    last = lines[-1].rstrip('\n').split(',')
+    last[5] = str(float(last[5]) + 1)  # energy of the last serving
+    new_day = ['2099-01-01'] + last[1:]
+    edited = ''.join(lines[:-1]) + ','.join(last) + '\n' + ','.join(new_day) + '\n'
+    
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        importer = ChronometerImporter()
+        print(f"export: {len(export) / 2 ** 20:.1f} MiB, {len(lines) - 1:,} rows")
+        for name, body in [('first import', export), ('unchanged', export), ('edited + new day', edited)]:
+            start = time.perf_counter()
+            importer.import_from_csv(io.BytesIO(body.encode('utf-8')), store_categories=True, name=name)
+            print(f"{name:<18} {(time.perf_counter() - start) * 1000:>9.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
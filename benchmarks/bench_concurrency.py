@@ -0,0 +1,155 @@
+"""Load test: light polling requests alongside long correlation calculations
+
+Serves the app on a local threaded WSGI server in a separate process and,
+for --duration seconds, keeps --heavy clients posting calculations while
+--pollers clients poll a metric series as the dashboard does. The
+calculations are lag scans (--kind lag, tens of milliseconds once the
+metric frame is cached, so the pool keeps running them inline) or
+correlations with 2000 bootstrap and permutation resamples (--kind
+resample, which always go to the pool). The run is repeated with
+calculations inline in the server's threads and with ANALYSIS_WORKERS
+worker processes, reporting the throughput of both kinds of request and
+the polling latency.
+
+Usage:
+    python benchmarks/bench_concurrency.py [--kind resample] [--workers 2] [--heavy 4] [--pollers 8]
+        [--duration 15] [--years 3]
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from werkzeug.serving import make_server
+
+from app import create_app, db
+from synthetic import load_health_data
+
+HEAVY = {
+    'lag': ('post', '/analysis/api/lag-correlation',
+            {'json': {'target': {'name': 'sleep_score', 'source': 'oura'}, 'max_lag': 14, 'min_pairs': 10}}),
+    'resample': ('post', '/analysis/correlation',
+                 {'data': {'metric1_name': 'sleep_score', 'metric1_source': 'oura', 'metric2_name': 'steps',
+                           'metric2_source': 'oura', 'date_range': 'all', 'n_resamples': 2000, 'seed': 1}}),
+}
+POLL = ('get', '/analysis/api/metric_data?metric_name=steps&source=oura', {})
+
+
+def client(url, request, stop, latencies, errors):
+    """Send request in a loop until stop is set, recording each latency"""
+    method, path, body = request
+    session = requests.Session()
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url + path, timeout=300, **body)
+            response.raise_for_status()
+        except requests.RequestException:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def serve(path, workers, ready, stop):
+    """Serve the app with ANALYSIS_WORKERS=workers until stop is set; runs in its own process"""
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = create_app('testing', {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'ANALYSIS_WORKERS': workers})
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ready.put(server.server_port)
+    stop.wait()
+    server.shutdown()
+    pool = app.extensions.get('compute_pool')
+    if pool is not None:
+        pool.shutdown()
+
+
+def run(path, workers, args):
+    """Load a server with ANALYSIS_WORKERS=workers and return the measurements
+
+    The server runs in a process of its own, so the clients' threads do not
+    compete with it for the GIL.
+    """
+    context = multiprocessing.get_context('spawn')
+    ready, server_stop = context.Queue(), context.Event()
+    server = context.Process(target=serve, args=(path, workers, ready, server_stop))
+    server.start()
+    url = f'http://127.0.0.1:{ready.get(timeout=60)}'
+    try:
+        # Start the worker processes and warm the frame caches outside the measurement
+        for method, request_path, body in (HEAVY[args.kind], POLL):
+            for _ in range(max(workers, 1)):
+                requests.request(method, url + request_path, timeout=300, **body).raise_for_status()
+
+        stop = threading.Event()
+        heavy, polls, errors = [], [], []
+        clients = [threading.Thread(target=client, args=(url, HEAVY[args.kind], stop, heavy, errors))
+                   for _ in range(args.heavy)]
+        clients += [threading.Thread(target=client, args=(url, POLL, stop, polls, errors))
+                    for _ in range(args.pollers)]
+        start = time.perf_counter()
+        for t in clients:
+            t.start()
+        time.sleep(args.duration)
+        stop.set()
+        for t in clients:
+            t.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server_stop.set()
+        server.join()
+
+    polls.sort()
+    return {
+        'heavy_per_s': len(heavy) / elapsed,
+        'heavy_median_ms': statistics.median(heavy) * 1000 if heavy else float('nan'),
+        'polls_per_s': len(polls) / elapsed,
+        'poll_p50_ms': polls[len(polls) // 2] * 1000 if polls else float('nan'),
+        'poll_p95_ms': polls[int(len(polls) * 0.95)] * 1000 if polls else float('nan'),
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--kind', choices=sorted(HEAVY), default='lag', help='Calculation the heavy clients post')
+    parser.add_argument('--workers', type=int, default=max(2, os.cpu_count() or 1), help='ANALYSIS_WORKERS to compare with inline')
+    parser.add_argument('--heavy', type=int, default=4, help='Clients posting lag-scan correlations')
+    parser.add_argument('--pollers', type=int, default=8, help='Clients polling a metric series')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds of load per run')
+    parser.add_argument('--years', type=float, default=3, help='Years of synthetic data')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        app = create_app('testing', {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+        with app.app_context():
+            db.create_all()
+            rows = load_health_data(args.years, oura_metrics=15, chronometer=30)
+            db.engine.dispose()
+        print(f"{rows:,} rows; {args.heavy} {args.kind} clients, {args.pollers} pollers, {args.duration:g} s per run, "
+              f"{os.cpu_count()} CPU(s)")
+        print(f"{'calculations':<14} {'heavy/s':>8} {'heavy p50':>10} {'polls/s':>8} {'poll p50':>9} {'poll p95':>9} {'errors':>7}")
+        for workers in (0, args.workers):
+            result = run(path, workers, args)
+            label = f'{workers} workers' if workers else 'inline'
+            print(f"{label:<14} {result['heavy_per_s']:>8.2f} {result['heavy_median_ms']:>7.0f} ms "
+                  f"{result['polls_per_s']:>8.1f} {result['poll_p50_ms']:>6.1f} ms {result['poll_p95_ms']:>6.1f} ms "
+                  f"{result['errors']:>7}")
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark a 100x100 correlation table inline and on the worker pool
+
+Correlates --metrics synthetic daily metrics against each other with
+pairwise_correlations, inline and with 2, 4, ... up to --workers processes,
+and reports pairs per second and the speedup over inline. The pool is
+started and warmed up before timing, as it is on a running server.
+
+Usage:
+    python benchmarks/bench_correlation_pool.py [--metrics 100] [--days 1095] [--workers 4]
+        [--method spearman] [--repeat 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.correlation import pairwise_correlations, shutdown_worker_pools
+
+
+def table_data(metrics, days, seed=0, missing=0.05):
+    """(days x metrics) values sharing a latent daily factor, with missing days as NaN"""
+    rng = np.random.default_rng(seed)
+    latent = np.cumsum(rng.normal(0, 0.3, days))
+    values = latent[:, None] * rng.uniform(-0.8, 0.8, metrics) + rng.normal(0, 1, (days, metrics))
+    values[rng.random(values.shape) < missing] = np.nan
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--metrics', type=int, default=100, help='Metrics on each axis of the table')
+    parser.add_argument('--days', type=int, default=3 * 365, help='Days of data')
+    parser.add_argument('--workers', type=int, default=max(4, os.cpu_count() or 1), help='Most worker processes tried')
+    parser.add_argument('--method', default='spearman', choices=('pearson', 'spearman', 'kendall'))
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per setting (median reported)')
+    args = parser.parse_args()
+
+    values = table_data(args.metrics, args.days)
+    pairs = args.metrics ** 2
+    print(f"{args.metrics}x{args.metrics} {args.method} table, {args.days} days, {os.cpu_count()} CPU(s)")
+    print(f"{'workers':<8} {'seconds':>8} {'pairs/s':>9} {'speedup':>8}")
+
+    settings = [1]
+    while settings[-1] * 2 <= args.workers:
+        settings.append(settings[-1] * 2)
+    inline = None
+    try:
+        for workers in settings:
+            def run():
+                return pairwise_correlations(values, values, args.method, min_pairs=10,
+                                             n_jobs=workers, min_parallel_pairs=1)
+            run()
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                run()
+                times.append(time.perf_counter() - start)
+            seconds = statistics.median(times)
+            inline = inline or seconds
+            label = str(workers) if workers > 1 else 'inline'
+            print(f"{label:<8} {seconds:>8.2f} {pairs / seconds:>9.0f} {inline / seconds:>7.2f}x")
+    finally:
+        shutdown_worker_pools()
+
+
+if __name__ == '__main__':
+    main()
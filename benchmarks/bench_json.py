@@ -0,0 +1,106 @@
+"""Time JSON payloads of 10-year paired data: row-by-row building vs arrays, stdlib vs orjson
+
+Builds the dashboard correlation's paired_data and the correlation
+endpoint's data_points for --years of two synthetic daily metrics, the old
+way (iterrows / reset_index().values with per-value float() and pd.isna())
+and from whole arrays, then encodes each payload with the standard library
+JSON provider and, when installed, the orjson one.
+
+Usage:
+    python benchmarks/bench_json.py [--years 10] [--repeat 7]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.utils.json_provider import OrjsonProvider, NumpyJSONProvider, orjson, date_strings, nullable_floats
+
+
+def paired_frame(years, seed=0, missing=0.1):
+    """Daily metric1/metric2 columns indexed by date objects, with missing days as NaN"""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(end='2025-03-01', periods=int(years * 365), freq='D').date
+    frame = pd.DataFrame({'metric1': rng.normal(75, 8, len(index)), 'metric2': rng.normal(8000, 2500, len(index))},
+                         index=index)
+    frame[rng.random(frame.shape) < missing] = np.nan
+    return frame
+
+
+def paired_rows(df):
+    paired = []
+    for idx, row in df.iterrows():
+        if not pd.isna(row['metric1']) and not pd.isna(row['metric2']):
+            paired.append({'date': idx.strftime('%Y-%m-%d'), 'x': float(row['metric1']), 'y': float(row['metric2'])})
+    return paired
+
+
+def paired_arrays(df):
+    df = df.dropna()
+    return [{'date': day, 'x': x, 'y': y}
+            for day, x, y in zip(date_strings(df.index), df['metric1'].to_numpy(dtype=float).tolist(),
+                                 df['metric2'].to_numpy(dtype=float).tolist())]
+
+
+def points_rows(df):
+    return [{'date': row[0].strftime('%Y-%m-%d'),
+             'metric1': None if pd.isna(row[1]) else float(row[1]),
+             'metric2': None if pd.isna(row[2]) else float(row[2])}
+            for row in df.reset_index().values]
+
+
+def points_arrays(df):
+    return [{'date': day, 'metric1': value1, 'metric2': value2}
+            for day, value1, value2 in zip(date_strings(df.index), nullable_floats(df['metric1']),
+                                           nullable_floats(df['metric2']))]
+
+
+def median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=float, default=10, help='Years of daily paired data')
+    parser.add_argument('--repeat', type=int, default=7, help='Timed runs per case (median reported)')
+    args = parser.parse_args()
+
+    df = paired_frame(args.years)
+    providers = [('stdlib', create_app('testing', {'JSON_BACKEND': 'stdlib'}))]
+    if orjson is not None:
+        providers.append(('orjson', create_app('testing', {'JSON_BACKEND': 'orjson'})))
+    else:
+        print("orjson is not installed; timing the standard library provider only")
+    for _, app in providers:
+        assert isinstance(app.json, OrjsonProvider if _ == 'orjson' else NumpyJSONProvider)
+
+    print(f"{len(df):,} days of paired data")
+    print(f"{'payload':<12} {'build':<7} {'build ms':>9} " + ' '.join(f"{name + ' ms':>10}" for name, _ in providers)
+          + f" {'total ms':>9}")
+    for payload, builders in (('paired_data', (('rows', paired_rows), ('arrays', paired_arrays))),
+                              ('data_points', (('rows', points_rows), ('arrays', points_arrays)))):
+        for build, builder in builders:
+            built = builder(df)
+            build_ms = median_ms(lambda: builder(df), args.repeat)
+            encode_ms = []
+            for _, app in providers:
+                with app.app_context():
+                    encode_ms.append(median_ms(lambda: app.json.response({payload: built}), args.repeat))
+            print(f"{payload:<12} {build:<7} {build_ms:>9.1f} " + ' '.join(f"{ms:>10.1f}" for ms in encode_ms)
+                  + f" {build_ms + min(encode_ms):>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark per-user query latency as the number of users grows
+
+Fills a SQLite database with synthetic users in stages (10, 100, then 1,000
+users by default), each with the same metrics and days of data, and after
+each stage times one user's metric series and full metric frame queries.
+With indexes leading with the owner, latency stays flat while the tables
+grow a hundredfold.
+
+Usage:
+    python benchmarks/bench_multiuser.py [--users 10 100 1000] [--metrics 10] [--days 180]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.config import TestingConfig
+from app.models.base import HealthData, DataType, User
+from app.utils.analyzer import HealthAnalyzer
+
+
+def add_users(first_id, last_id, metrics, days):
+    """Insert users first_id..last_id with a value for every metric on every day"""
+    now = datetime.utcnow()
+    start = date(2024, 1, 1)
+    rng = random.Random(first_id)
+    db.session.execute(User.__table__.insert(), [
+        {'id': user_id, 'username': f'user{user_id}', 'created_at': now}
+        for user_id in range(first_id, last_id + 1)
+    ])
+    db.session.execute(DataType.__table__.insert(), [
+        {'id': user_id * metrics + m, 'user_id': user_id, 'source': 'synthetic',
+         'metric_name': f'metric_{m}', 'metric_units': 'units', 'created_at': now, 'updated_at': now}
+        for user_id in range(first_id, last_id + 1) for m in range(metrics)
+    ])
+    for user_id in range(first_id, last_id + 1):
+        db.session.execute(HealthData.__table__.insert(), [
+            {'user_id': user_id, 'data_type_id': user_id * metrics + m, 'date': start + timedelta(days=d),
+             'metric_value': rng.gauss(50, 10), 'created_at': now, 'updated_at': now}
+            for m in range(metrics) for d in range(days)
+        ])
+    db.session.commit()
+
+
+def median_ms(fn, user_ids):
+    timings = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        fn(HealthAnalyzer(user_id=user_id))
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 100, 1000], help='User counts to measure at')
+    parser.add_argument('--metrics', type=int, default=10, help='Metrics per user')
+    parser.add_argument('--days', type=int, default=180, help='Days of data per metric')
+    parser.add_argument('--samples', type=int, default=25, help='Users timed at each stage')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    TestingConfig.SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+    app = create_app('testing')
+    try:
+        with app.app_context():
+            db.create_all()
+            # The default user created with the tables has id 1
+            loaded = 1
+            print(f"{'users':>6} {'rows':>11} {'metric series':>14} {'metric frame':>13}")
+            for users in sorted(args.users):
+                add_users(loaded + 1, users + 1, args.metrics, args.days)
+                loaded = users + 1
+                rows = db.session.query(HealthData).execution_options(all_users=True).count()
+                sample = random.Random(users).sample(range(2, loaded + 1), min(args.samples, users))
+                series = median_ms(lambda analyzer: analyzer.get_metric_data('metric_0', 'synthetic'), sample)
+                frame = median_ms(lambda analyzer: analyzer._query_metric_frame(), sample)
+                print(f"{users:>6,} {rows:>11,} {series:>11.2f} ms {frame:>10.2f} ms")
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
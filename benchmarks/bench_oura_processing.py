@@ -0,0 +1,56 @@
+"""Benchmark Oura payload processing on a synthetic 5-year import
+
+Usage:
+    python benchmarks/bench_oura_processing.py [--days 1825] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.utils.oura_importer import OuraImporter
+from oura_payloads import sleep_payloads, activity_payload, stress_payload
+
+
+def best_time(func, repeat):
+    """Return (best wall time in seconds, last result) over repeat runs"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=5 * 365, help='Days of data to generate')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per processor; the best is reported')
+    args = parser.parse_args()
+    
+    sleep_data, daily_sleep_data = sleep_payloads(args.days, samples=False)
+    activity_data = activity_payload(args.days)
+    stress_data = stress_payload(args.days)
+    
+    app = create_app('testing')
+    with app.app_context():
+        importer = OuraImporter('benchmark')
+        cases = [
+            ('sleep', lambda: importer._process_sleep_data(sleep_data, daily_sleep_data)),
+            ('activity', lambda: importer._process_activity_data(activity_data)),
+            ('stress', lambda: importer._process_stress_data(stress_data)),
+        ]
+        
+        print(f"{'processor':<10} {'records':>8} {'best (ms)':>10} {'records/s':>12}")
+        for name, func in cases:
+            elapsed, records = best_time(func, args.repeat)
+            print(f"{name:<10} {len(records):>8} {elapsed * 1000:>10.1f} {len(records) / elapsed:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Compare peak memory of buffered vs streamed parsing of a long-range Oura sleep pull
+
+Usage:
+    python benchmarks/bench_oura_streaming.py [--days 1825]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.utils.json_stream import iter_json_records
+from app.utils.oura_importer import OuraImporter, STREAM_CHUNK_SIZE, STREAM_SKIP_PATHS
+from oura_payloads import sleep_payloads
+
+SLEEP_ENDPOINT = '/v2/usercollection/sleep'
+
+
+def chunked(body):
+    """Serve an encoded body in STREAM_CHUNK_SIZE pieces, as response.iter_content() would"""
+    for i in range(0, len(body), STREAM_CHUNK_SIZE):
+        yield body[i:i + STREAM_CHUNK_SIZE]
+
+
+def measure(func):
+    """Return (peak traced memory in bytes, wall time in seconds, result)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=5 * 365, help='Days of data to generate')
+    args = parser.parse_args()
+    
+    sleep_data, daily_sleep_data = sleep_payloads(args.days)
+    body = json.dumps(sleep_data).encode('utf-8')
+    del sleep_data
+    
+    app = create_app('testing')
+    with app.app_context():
+        importer = OuraImporter('benchmark')
+        cases = [
+            ('buffered', lambda: importer._process_sleep_data(
+                json.loads(b''.join(chunked(body))), daily_sleep_data)),
+            ('streamed', lambda: importer._process_sleep_data(
+                {'data': iter_json_records(chunked(body), skip=STREAM_SKIP_PATHS[SLEEP_ENDPOINT])},
+                daily_sleep_data)),
+        ]
+        
+        print(f"sleep payload: {len(body) / 2 ** 20:.1f} MiB over {args.days} days")
+        print(f"{'parse':<10} {'records':>8} {'peak (MiB)':>11} {'time (ms)':>10}")
+        for name, func in cases:
+            peak, elapsed, records = measure(func)
+            print(f"{name:<10} {len(records):>8} {peak / 2 ** 20:>11.1f} {elapsed * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Benchmark scheduled Oura syncs of many accounts against a local stub API
+
+Syncs every account once through OuraSyncScheduler and reports throughput,
+the most requests in flight at once (bounded by the worker pool) and the
+most requests any one account made within a rate period (bounded by its
+rate budget). Requests are timed as they arrive at the stub, so the window
+is shortened by --tolerance to allow for thread scheduling between taking
+a request from the budget and sending it.
+
+Usage:
+    python benchmarks/bench_oura_sync.py [--accounts 200] [--workers 8] [--latency 0.05]
+        [--rate-limit 3] [--rate-period 1] [--tolerance 0.2]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.config import TestingConfig
+from app.models.base import User
+from app.utils.oura_sync import OuraSyncScheduler
+from tests.oura_stub import OuraStubServer
+
+
+def max_in_window(times, window):
+    """Most timestamps falling within any window seconds"""
+    times = sorted(times)
+    best, first = 0, 0
+    for last, t in enumerate(times):
+        while t - times[first] > window:
+            first += 1
+        best = max(best, last - first + 1)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--accounts', type=int, default=200, help='Accounts with an Oura token')
+    parser.add_argument('--workers', type=int, default=8, help='Accounts synced at once')
+    parser.add_argument('--latency', type=float, default=0.05, help='Stub API latency per request, seconds')
+    parser.add_argument('--days', type=int, default=30, help='Days fetched per account')
+    parser.add_argument('--rate-limit', type=int, default=3, help='Requests allowed per account per period')
+    parser.add_argument('--rate-period', type=float, default=1.0, help='Rate period, seconds')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Arrival time jitter allowed, seconds')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    # Worker threads need connections of their own, so the engine must start on a file database
+    TestingConfig.SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+    app = create_app('testing')
+    try:
+        with OuraStubServer(latency=args.latency) as stub:
+            app.config.update(
+                OURA_API_BASE_URL=stub.url,
+                OURA_SYNC_LOOKBACK_DAYS=args.days - 1,
+                OURA_SYNC_RATE_LIMIT=args.rate_limit,
+                OURA_SYNC_RATE_PERIOD=args.rate_period,
+            )
+            with app.app_context():
+                db.create_all()
+                db.session.add_all([User(username=f'user{i}', oura_token=f'token-{i}') for i in range(args.accounts)])
+                db.session.commit()
+
+            scheduler = OuraSyncScheduler(app, workers=args.workers)
+            start = time.perf_counter()
+            results = scheduler.run_once(now=float('inf'))
+            elapsed = time.perf_counter() - start
+
+            by_token = defaultdict(list)
+            for token, _, at in stub.requests:
+                by_token[token].append(at)
+            statuses = defaultdict(int)
+            for result in results:
+                statuses[result.status] += 1
+
+            print(f"accounts: {len(results)} ({dict(statuses)}), {len(stub.requests):,} requests, "
+                  f"{sum(r.row_count for r in results):,} records")
+            print(f"wall time: {elapsed:.2f} s ({len(results) / elapsed:.1f} accounts/s)")
+            print(f"max requests in flight: {stub.max_in_flight} (workers: {args.workers})")
+            window = args.rate_period - args.tolerance
+            print(f"max requests per account per {window:g} s: "
+                  f"{max(max_in_window(times, window) for times in by_token.values())} "
+                  f"(budget: {args.rate_limit} per {args.rate_period:g} s)")
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
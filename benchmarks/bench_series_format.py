@@ -0,0 +1,82 @@
+"""Compare the point-list JSON, columnar JSON and binary series formats
+
+Loads --years of synthetic daily data and requests --metrics metrics' full
+series from POST /analysis/api/metric_series in each format. Reports the
+time to encode the series (from the arrays get_metrics_series returns to
+the response body), the whole request's time (query included, the same
+for every format) and the body size uncompressed and gzip-compressed.
+
+Usage:
+    python benchmarks/bench_series_format.py [--years 10] [--metrics 20] [--repeat 5]
+"""
+import argparse
+import gzip
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app, db
+from app.routes.analysis import _series_columns, _series_points
+from app.utils.series_format import BINARY_SERIES, COLUMNAR_JSON, encode_binary, encode_columnar
+from synthetic import load_health_data
+
+FORMATS = (
+    ('points json', 'application/json', '',
+     lambda app, results: app.json.dumps({key: _series_points(r) for key, r in results.items()})),
+    ('columnar json', COLUMNAR_JSON, '',
+     lambda app, results: app.json.dumps(encode_columnar({key: _series_columns(r) for key, r in results.items()}))),
+    ('binary f64', BINARY_SERIES, '',
+     lambda app, results: encode_binary({key: _series_columns(r) for key, r in results.items()}, '<f8')),
+    ('binary f32', BINARY_SERIES, '?precision=32',
+     lambda app, results: encode_binary({key: _series_columns(r) for key, r in results.items()}, '<f4')),
+)
+
+
+def median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=float, default=10, help='Years of synthetic data')
+    parser.add_argument('--metrics', type=int, default=20, help='Metrics requested together')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed requests per format (median reported)')
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        load_health_data(args.years, oura_metrics=min(args.metrics, 15), chronometer=max(args.metrics - 15, 0))
+        from app.utils.analyzer import HealthAnalyzer
+        analyzer = HealthAnalyzer()
+        metrics = [{'name': m['metric_name'], 'source': m['source']}
+                   for m in analyzer.get_available_metrics()][:args.metrics]
+        results = {f"{source}:{name}": series for (name, source), series in analyzer.get_metrics_series(
+            [(m['name'], m['source']) for m in metrics]).items()}
+        points = sum(len(series['values']) for series in results.values())
+
+    client = app.test_client()
+    body = {'metrics': metrics, 'points': 0}
+    print(f"{len(metrics)} metrics, {points:,} points")
+    print(f"{'format':<14} {'encode ms':>10} {'request ms':>11} {'KiB':>7} {'gzip KiB':>9}")
+    for label, accept, query, encode in FORMATS:
+        with app.app_context():
+            encode_ms = median_ms(lambda: encode(app, results), args.repeat)
+        url = '/analysis/api/metric_series' + query
+        data = client.post(url, json=body, headers={'Accept': accept}).data
+        request_ms = median_ms(lambda: client.post(url, json=body, headers={'Accept': accept}), args.repeat)
+        print(f"{label:<14} {encode_ms:>10.1f} {request_ms:>11.1f} {len(data) / 1024:>7.0f} "
+              f"{len(gzip.compress(data, compresslevel=6)) / 1024:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
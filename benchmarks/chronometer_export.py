@@ -0,0 +1,28 @@
+"""Synthetic Chronometer servings export for benchmarks"""
+import csv
+import io
+import random
+from datetime import date, timedelta
+
+CATEGORIES = ('Breakfast', 'Lunch', 'Dinner', 'Snacks')
+
+
+def chronometer_csv(n_days=5 * 365, servings=10, end=date(2025, 1, 1), seed=0):
+    """Return a servings export covering n_days days as CSV text
+
+    Every nutrient column the importer reads is present, with servings
+    rows per day.
+    """
+    from app.utils.chronometer_importer import ChronometerImporter
+    
+    rng = random.Random(seed)
+    columns = [config['csv_col'] for config in ChronometerImporter().nutrition_metrics.values()]
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['Day', 'Time', 'Group', 'Food Name', 'Amount'] + columns + ['Category'])
+    for i in range(n_days):
+        day = (end - timedelta(days=n_days - 1 - i)).isoformat()
+        for k in range(servings):
+            writer.writerow([day, f'{7 + k}:00', CATEGORIES[k % 4], f'Food {k}', '1 serving'] +
+                            [round(rng.uniform(0, 50), 2) for _ in columns] + [CATEGORIES[k % 4]])
+    return out.getvalue()
@@ -0,0 +1,126 @@
+"""Synthetic Oura API v2 payloads for benchmarks
+
+Payloads follow the shape of the daily_sleep, sleep, daily_activity and
+daily_stress endpoints closely enough to exercise every field the importer
+reads, including the 5-minute heart rate / HRV series inside sleep sessions.
+"""
+from datetime import date, timedelta
+import random
+
+
+def _days(n_days, end):
+    return [(end - timedelta(days=i)).isoformat() for i in range(n_days - 1, -1, -1)]
+
+
+def sleep_payloads(n_days=5 * 365, end=date(2025, 1, 1), seed=0, naps=0.2, samples=True):
+    """Return (sleep_data, daily_sleep_data) covering n_days days
+
+    Args:
+        n_days: Number of days to generate
+        end: Last day in the payload
+        seed: Random seed
+        naps: Probability of an extra short session on a day
+        samples: Whether to include 5-minute heart rate / HRV series
+    """
+    rng = random.Random(seed)
+    daily, sessions = [], []
+    for day in _days(n_days, end):
+        daily.append({
+            'id': f'daily-{day}',
+            'day': day,
+            'score': rng.randint(55, 95),
+            'timestamp': f'{day}T00:00:00+00:00',
+            'contributors': {
+                key: rng.randint(40, 100) for key in (
+                    'deep_sleep', 'efficiency', 'latency', 'rem_sleep',
+                    'restfulness', 'timing', 'total_sleep')
+            }
+        })
+        n_sessions = 2 if rng.random() < naps else 1
+        for k in range(n_sessions):
+            long_sleep = k == 0
+            time_in_bed = rng.randint(6 * 3600, 9 * 3600) if long_sleep else rng.randint(1200, 5400)
+            n_samples = time_in_bed // 300
+            session = {
+                'id': f'sleep-{day}-{k}',
+                'day': day,
+                'type': 'long_sleep' if long_sleep else 'late_nap',
+                'average_heart_rate': rng.uniform(48, 70),
+                'average_hrv': rng.uniform(20, 90),
+                'average_breath': rng.uniform(12, 18),
+                'lowest_heart_rate': rng.randint(40, 55),
+                'efficiency': rng.randint(70, 98),
+                'time_in_bed': time_in_bed,
+                'rem_sleep_duration': rng.randint(0, time_in_bed // 4),
+                'deep_sleep_duration': rng.randint(0, time_in_bed // 5),
+                'light_sleep_duration': rng.randint(0, time_in_bed // 2),
+                'awake_duration': rng.randint(0, time_in_bed // 10),
+                'sleep_phase_5_min': ''.join(rng.choice('1234') for _ in range(n_samples)),
+                'movement_30_sec': ''.join(rng.choice('1234') for _ in range(n_samples * 10)),
+                'readiness': {
+                    'score': rng.randint(50, 95),
+                    'temperature_deviation': rng.uniform(-1, 1),
+                    'contributors': {
+                        key: rng.randint(40, 100) for key in (
+                            'activity_balance', 'body_temperature', 'hrv_balance',
+                            'previous_day_activity', 'previous_night', 'recovery_index',
+                            'resting_heart_rate', 'sleep_balance')
+                    }
+                } if long_sleep else None
+            }
+            if samples:
+                session['heart_rate'] = {
+                    'interval': 300.0,
+                    'timestamp': f'{day}T00:00:00+00:00',
+                    'items': [round(rng.uniform(45, 75), 1) for _ in range(n_samples)]
+                }
+                session['hrv'] = {
+                    'interval': 300.0,
+                    'timestamp': f'{day}T00:00:00+00:00',
+                    'items': [round(rng.uniform(15, 100), 1) for _ in range(n_samples)]
+                }
+            sessions.append(session)
+    return {'data': sessions, 'next_token': None}, {'data': daily, 'next_token': None}
+
+
+def activity_payload(n_days=5 * 365, end=date(2025, 1, 1), seed=0):
+    """Return a daily_activity payload covering n_days days"""
+    rng = random.Random(seed)
+    data = []
+    for day in _days(n_days, end):
+        data.append({
+            'id': f'activity-{day}',
+            'day': day,
+            'score': rng.randint(50, 100),
+            'active_calories': rng.randint(100, 900),
+            'total_calories': rng.randint(1800, 3200),
+            'steps': rng.randint(2000, 20000),
+            'equivalent_walking_distance': rng.randint(1500, 16000),
+            'sedentary_time': rng.randint(4 * 3600, 12 * 3600),
+            'met': {
+                'interval': 60.0,
+                'average': rng.uniform(1.1, 2.0),
+                'min': rng.uniform(0.8, 1.0),
+                'max': rng.uniform(3.0, 9.0),
+                'items': [round(rng.uniform(0.9, 6.0), 1) for _ in range(1440)],
+                'timestamp': f'{day}T04:00:00+00:00'
+            },
+            'contributors': {
+                key: rng.randint(40, 100) for key in (
+                    'meet_daily_targets', 'move_every_hour', 'recovery_time',
+                    'stay_active', 'training_frequency', 'training_volume')
+            }
+        })
+    return {'data': data, 'next_token': None}
+
+
+def stress_payload(n_days=5 * 365, end=date(2025, 1, 1), seed=0):
+    """Return a daily_stress payload covering n_days days"""
+    rng = random.Random(seed)
+    return {'data': [{
+        'id': f'stress-{day}',
+        'day': day,
+        'stress_high': rng.randint(0, 20000),
+        'recovery_high': rng.randint(0, 20000),
+        'day_summary': rng.choice(['restored', 'normal', 'stressful'])
+    } for day in _days(n_days, end)], 'next_token': None}
@@ -0,0 +1,392 @@
+"""Benchmark suite: import, analysis, derived data and browsing timings with baseline comparison
+
+Loads seeded synthetic data (see synthetic.py) into a temporary SQLite
+database, times every case and writes the results as JSON. Given a baseline
+from an earlier run, cases whose median grew by more than --threshold (and
+by more than --min-ms) are flagged as regressions, and the exit status is 1.
+
+Usage:
+    python benchmarks/suite.py [--years 3] [--oura-metrics 10] [--chronometer-metrics 20]
+        [--fixture-years 1] [--repeat 7] [--filter analyzer] [--list]
+        [--output results.json] [--baseline baseline.json] [--threshold 0.25] [--min-ms 1]
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import g
+
+from app import create_app, db
+from app.config import TestingConfig
+from app.models.base import User
+from synthetic import load_health_data, write_fixtures
+
+# (name, function) of every case, in run order. A case function receives the
+# Suite and returns the callable to time, or a (setup, run) pair whose setup
+# runs untimed before every run.
+CASES = []
+
+
+def case(name):
+    """Register a benchmark case"""
+    def decorator(func):
+        CASES.append((name, func))
+        return func
+    return decorator
+
+
+class Suite:
+    """Data and helpers shared by the benchmark cases"""
+
+    def __init__(self, app, args, fixtures):
+        self.app = app
+        self.args = args
+        self.fixtures = fixtures
+        self.client = app.test_client()
+        self._users = 0
+
+    @contextmanager
+    def as_user(self, user_id):
+        """Run a block as another user, e.g. to import into an empty account"""
+        previous = g.get('user_id')
+        g.user_id = user_id
+        try:
+            yield
+        finally:
+            g.user_id = previous
+
+    def new_user(self):
+        """Create an empty user and return its id"""
+        self._users += 1
+        return User.get_or_create(f'benchmark-{self._users}').id
+
+    def metrics(self, source):
+        """Names of the synthetic metrics from source"""
+        from app.models.base import DataType
+        return [name for name, in db.session.query(DataType.metric_name).filter(
+            DataType.source == source).order_by(DataType.id)]
+
+
+def measure(setup, run, repeat, warmup=1):
+    """Time run() repeat times after warmup runs, calling setup() untimed before each"""
+    times = []
+    for i in range(warmup + repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        elapsed = (time.perf_counter() - start) * 1000
+        if i >= warmup:
+            times.append(elapsed)
+    return {
+        'median_ms': round(statistics.median(times), 3),
+        'min_ms': round(min(times), 3),
+        'mean_ms': round(statistics.fmean(times), 3),
+        'stdev_ms': round(statistics.stdev(times), 3) if len(times) > 1 else 0.0,
+        'repeat': repeat,
+    }
+
+
+def compare(results, baseline, threshold=0.25, min_ms=1.0):
+    """Compare results with a baseline run
+
+    Args:
+        results: Results dict from run_suite
+        baseline: Results dict of an earlier run
+        threshold: Relative growth of the median flagged as a regression
+        min_ms: Smallest absolute growth flagged, so noise in fast cases is ignored
+
+    Returns:
+        List of (name, baseline median, median, ratio, status) rows, status
+        being 'regression', 'improvement', 'ok' or 'new'
+    """
+    rows = []
+    for name, stats in results['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            rows.append((name, None, stats['median_ms'], None, 'new'))
+            continue
+        ratio = stats['median_ms'] / base['median_ms'] if base['median_ms'] else float('inf')
+        if ratio > 1 + threshold and stats['median_ms'] - base['median_ms'] > min_ms:
+            status = 'regression'
+        elif ratio < 1 / (1 + threshold) and base['median_ms'] - stats['median_ms'] > min_ms:
+            status = 'improvement'
+        else:
+            status = 'ok'
+        rows.append((name, base['median_ms'], stats['median_ms'], ratio, status))
+    return rows
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args, report=print):
+    """Load the synthetic data, run the selected cases and return the results dict"""
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    # Set before create_app: the engine is created with the app
+    TestingConfig.SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+    app = create_app('testing')
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as fixture_dir, app.app_context():
+            db.create_all()
+            rows = load_health_data(args.years, args.oura_metrics, args.chronometer_metrics, seed=args.seed)
+            fixtures = write_fixtures(fixture_dir, args.fixture_years, seed=args.seed)
+            report(f"{rows:,} rows of synthetic data, {args.fixture_years:g} years of import fixtures")
+            suite = Suite(app, args, fixtures)
+            for name, func in CASES:
+                if args.filter and not any(pattern in name for pattern in args.filter):
+                    continue
+                prepared = func(suite)
+                setup, run = prepared if isinstance(prepared, tuple) else (None, prepared)
+                results[name] = stats = measure(setup, run, args.repeat)
+                report(f"{name:<40} {stats['median_ms']:>10.2f} ms  (min {stats['min_ms']:.2f}, "
+                       f"stdev {stats['stdev_ms']:.2f})")
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+        os.unlink(path)
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'commit': _commit()},
+        'parameters': {key: getattr(args, key) for key in (
+            'years', 'oura_metrics', 'chronometer_metrics', 'fixture_years', 'seed', 'repeat')},
+        'results': results,
+    }
+
+
+# --- Importers ---
+
+@case('import.oura')
+def import_oura(suite):
+    from app.utils.oura_importer import OuraImporter
+    bodies = {}
+    for endpoint, path in suite.fixtures.items():
+        if endpoint.startswith('/'):
+            with open(path, 'rb') as f:
+                bodies[endpoint] = f.read()
+    start, end = '2000-01-01', '2100-01-01'
+    users = []
+
+    def setup():
+        users.append(suite.new_user())
+
+    def run():
+        with suite.as_user(users[-1]):
+            importer = OuraImporter('benchmark')
+            importer._get_data = lambda endpoint, params=None, stream=False: json.loads(bodies[endpoint])
+            importer.import_sleep_data(start, end)
+            importer.import_activity_data(start, end)
+            importer.import_stress_data(start, end)
+    return setup, run
+
+
+@case('import.chronometer')
+def import_chronometer(suite):
+    from app.utils.chronometer_importer import ChronometerImporter
+    with open(suite.fixtures['chronometer'], 'rb') as f:
+        body = f.read()
+    users = []
+
+    def setup():
+        users.append(suite.new_user())
+
+    def run():
+        with suite.as_user(users[-1]):
+            ChronometerImporter().import_from_csv(io.BytesIO(body), store_categories=True, name='benchmark.csv')
+    return setup, run
+
+
+@case('import.chronometer.unchanged')
+def import_chronometer_unchanged(suite):
+    from app.utils.chronometer_importer import ChronometerImporter
+    with open(suite.fixtures['chronometer'], 'rb') as f:
+        body = f.read()
+    user_id = suite.new_user()
+
+    def run():
+        with suite.as_user(user_id):
+            ChronometerImporter().import_from_csv(io.BytesIO(body), store_categories=True, name='benchmark.csv')
+    return run
+
+
+# --- Analyzer ---
+
+def _clear_frame_cache(suite):
+    suite.app.extensions.pop('health_analyzer_frames', None)
+
+
+@case('analyzer.metric_frame.cold')
+def metric_frame_cold(suite):
+    from app.utils.analyzer import HealthAnalyzer
+    return (lambda: _clear_frame_cache(suite)), (lambda: HealthAnalyzer().get_metric_dataframe())
+
+
+@case('analyzer.metric_frame.warm')
+def metric_frame_warm(suite):
+    from app.utils.analyzer import HealthAnalyzer
+    return lambda: HealthAnalyzer().get_metric_dataframe()
+
+
+@case('analyzer.metric_frame.derived')
+def metric_frame_derived(suite):
+    from app.utils.analyzer import HealthAnalyzer
+    return lambda: HealthAnalyzer().get_metric_dataframe(include_derived=True)
+
+
+@case('analyzer.correlation')
+def correlation(suite):
+    from app.utils.analyzer import HealthAnalyzer
+    first, second = suite.metrics('oura')[:2]
+    return lambda: HealthAnalyzer().calculate_correlation(first, 'oura', second, 'oura')
+
+
+@case('analyzer.correlation.spearman_shifted')
+def correlation_spearman(suite):
+    from app.utils.analyzer import HealthAnalyzer
+    oura, chronometer = suite.metrics('oura')[0], suite.metrics('chronometer')[1]
+    return lambda: HealthAnalyzer().calculate_correlation(
+        oura, 'oura', chronometer, 'chronometer', method='spearman', time_shift={'oura': -1}, use_density=True)
+
+
+@case('analyzer.multiple_correlations')
+def multiple_correlations(suite):
+    from app.utils.analyzer import HealthAnalyzer
+    target = suite.metrics('oura')[0]
+    return lambda: HealthAnalyzer().calculate_multiple_correlations(target, 'oura', top_n=10)
+
+
+@case('route.correlation_table')
+def correlation_table(suite):
+    form = {
+        'x_metrics': [f'oura:{name}' for name in suite.metrics('oura')[:5]],
+        'y_metrics': [f'chronometer:{name}' for name in suite.metrics('chronometer')[:5]],
+        'date_range': 'all',
+    }
+
+    def run():
+        response = suite.client.post('/analysis/correlation_table', data=form)
+        assert response.status_code == 200, response.status_code
+    return run
+
+
+# --- Derived data ---
+
+@case('derived.operations')
+def derived_operations(suite):
+    from app.models.base import DataType
+    from app.utils.derived_operations import OperationRegistry, get_data_for_derivation
+    source, other = DataType.query.filter(DataType.source == 'oura').order_by(DataType.id).limit(2)
+    params = {
+        'time_shift': {'days': 1},
+        'multiply': {'value_type': 'data_type', 'data_type_id': other.id},
+        'divide': {'value_type': 'data_type', 'data_type_id': other.id},
+        'moving_average': {'window': 7},
+    }
+
+    def run():
+        data = get_data_for_derivation(source.id)
+        for operation in OperationRegistry.get_all_operations():
+            operation.apply(data, params[operation.slug])
+    return run
+
+
+@case('route.derive')
+def derive(suite):
+    from app.models.base import DataType
+    source = DataType.query.filter(DataType.source == 'oura').order_by(DataType.id).first()
+    count = [0]
+
+    def run():
+        count[0] += 1
+        response = suite.client.post('/data/browse/derive', data={
+            'source_type_id': source.id, 'operation': 'moving_average', 'window': 7,
+            'new_name': f'{source.metric_name}_ma7_{count[0]}'})
+        assert response.status_code == 302, response.status_code
+    return run
+
+
+# --- Browsing ---
+
+@case('route.browse.first_page')
+def browse_first_page(suite):
+    return lambda: suite.client.get('/data/browse?per_page=50')
+
+
+@case('route.browse.deep_page')
+def browse_deep_page(suite):
+    return lambda: suite.client.get('/data/browse?per_page=50&page=200')
+
+
+@case('route.browse.filtered')
+def browse_filtered(suite):
+    metric = suite.metrics('chronometer')[0]
+    return lambda: suite.client.get(f'/data/browse?source=chronometer&metric={metric}&per_page=50&page=3')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=float, default=3, help='Years of synthetic data in the database')
+    parser.add_argument('--oura-metrics', type=int, default=10, help='Oura-like metrics (at most 15)')
+    parser.add_argument('--chronometer-metrics', type=int, default=20, help='Chronometer-like nutrients')
+    parser.add_argument('--fixture-years', type=float, default=1, help='Years covered by the import fixtures')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic data')
+    parser.add_argument('--repeat', type=int, default=7, help='Timed runs per case')
+    parser.add_argument('--filter', nargs='+', help='Only run cases whose name contains one of these')
+    parser.add_argument('--list', action='store_true', help='List the cases and exit')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Results JSON of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Relative slowdown flagged as a regression')
+    parser.add_argument('--min-ms', type=float, default=1.0, help='Smallest absolute slowdown flagged')
+    args = parser.parse_args()
+
+    if args.list:
+        for name, _ in CASES:
+            print(name)
+        return 0
+
+    results = run_suite(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('parameters') != results['parameters']:
+        print(f"Warning: baseline parameters differ: {baseline.get('parameters')}")
+    rows = compare(results, baseline, args.threshold, args.min_ms)
+    print(f"\n{'case':<40} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, base, current, ratio, status in rows:
+        base_str = f"{base:.2f}" if base is not None else '-'
+        change = f"{(ratio - 1) * 100:+.0f}%" if ratio is not None else ''
+        flag = '  REGRESSION' if status == 'regression' else ('  improved' if status == 'improvement' else '')
+        print(f"{name:<40} {base_str:>10} {current:>10.2f} {change:>8}{flag}")
+    regressions = [row for row in rows if row[4] == 'regression']
+    print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
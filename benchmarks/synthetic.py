@@ -0,0 +1,167 @@
+"""Seeded synthetic health data for the benchmark suite
+
+Generates years of Oura-like and Chronometer-like daily metrics, either
+straight into the database (load_health_data) or as Oura API payload and
+Chronometer CSV export fixtures (write_fixtures). The same seed always
+gives the same data. Values share a latent daily factor, so metrics are
+correlated the way real ones are, and a few days are missing per metric.
+
+Usage:
+    python benchmarks/synthetic.py OUT_DIR [--years 1] [--seed 0]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chronometer_export import chronometer_csv
+from oura_payloads import sleep_payloads, activity_payload, stress_payload
+
+END = date(2025, 1, 1)
+
+# (metric_name, units, mean, standard deviation) of Oura-like metrics
+OURA_METRICS = [
+    ('sleep_score', 'score', 78, 8),
+    ('total_sleep', 'minutes', 440, 45),
+    ('deep_sleep', 'minutes', 85, 20),
+    ('rem_sleep', 'minutes', 100, 25),
+    ('light_sleep', 'minutes', 250, 35),
+    ('avg_hr', 'bpm', 56, 5),
+    ('avg_hrv', 'ms', 48, 12),
+    ('avg_resp', 'breaths/min', 15, 1),
+    ('sleep_efficiency', '%', 88, 5),
+    ('readiness_score', 'score', 76, 9),
+    ('activity_score', 'score', 80, 10),
+    ('steps', 'count', 9000, 3000),
+    ('active_calories', 'kcal', 450, 150),
+    ('stress_high', 'minutes', 120, 60),
+    ('recovery_high', 'minutes', 90, 45),
+]
+
+# Oura API endpoints the importer calls, with the fixture file serving each
+OURA_FIXTURES = {
+    '/v2/usercollection/daily_sleep': 'oura_daily_sleep.json',
+    '/v2/usercollection/sleep': 'oura_sleep.json',
+    '/v2/usercollection/daily_activity': 'oura_daily_activity.json',
+    '/v2/usercollection/daily_stress': 'oura_daily_stress.json',
+}
+CHRONOMETER_FIXTURE = 'chronometer_servings.csv'
+
+
+def chronometer_metrics():
+    """(metric_name, units, mean, standard deviation) of Chronometer nutrients, Energy first"""
+    from app.utils.chronometer_importer import ChronometerImporter
+
+    metrics = []
+    for name, config in ChronometerImporter().nutrition_metrics.items():
+        mean = 2200 if name == 'Energy' else 10 + len(metrics) * 7 % 90
+        metrics.append((name, config['unit'], mean, mean * 0.25))
+    return metrics
+
+
+def metric_series(years=3, oura_metrics=10, chronometer=20, end=END, seed=0, missing=0.05):
+    """Generate daily values for each metric
+
+    Args:
+        years: Years of data, ending on end
+        oura_metrics: Number of Oura-like metrics (at most len(OURA_METRICS))
+        chronometer: Number of Chronometer nutrients
+        end: Last day of data
+        seed: Random seed
+        missing: Probability of a day being missing for a metric
+
+    Returns:
+        Dict mapping (source, metric_name, units) to a list of (date, value)
+    """
+    rng = random.Random(seed)
+    n_days = int(years * 365)
+    days = [end - timedelta(days=n_days - 1 - i) for i in range(n_days)]
+    # A slowly wandering latent factor shared by all metrics, plus weekly rhythm
+    latent, level = [], 0.0
+    for i in range(n_days):
+        level = 0.9 * level + rng.gauss(0, 0.45)
+        latent.append(level + (0.5 if i % 7 in (5, 6) else 0.0))
+
+    metrics = [('oura', *metric) for metric in OURA_METRICS[:oura_metrics]]
+    metrics += [('chronometer', *metric) for metric in chronometer_metrics()[:chronometer]]
+    series = {}
+    for index, (source, name, units, mean, sd) in enumerate(metrics):
+        loading = rng.uniform(-0.8, 0.8) if index else 0.8
+        series[(source, name, units)] = [
+            (day, round(mean + sd * (loading * factor + rng.gauss(0, 0.6)), 2))
+            for day, factor in zip(days, latent) if rng.random() >= missing
+        ]
+    return series
+
+
+def load_health_data(years=3, oura_metrics=10, chronometer=20, end=END, seed=0):
+    """Insert metric_series(...) for the current user (needs an app context)
+
+    Returns:
+        Number of HealthData rows inserted
+    """
+    from app import db
+    from app.models.base import DataType, HealthData
+
+    now = datetime.utcnow()
+    rows = 0
+    for (source, name, units), points in metric_series(years, oura_metrics, chronometer, end, seed).items():
+        data_type = DataType(source=source, metric_name=name, metric_units=units)
+        db.session.add(data_type)
+        db.session.flush()
+        db.session.execute(HealthData.__table__.insert(), [
+            {'data_type_id': data_type.id, 'date': day, 'metric_value': value,
+             'created_at': now, 'updated_at': now}
+            for day, value in points
+        ])
+        rows += len(points)
+    db.session.commit()
+    return rows
+
+
+def write_fixtures(directory, years=1, end=END, seed=0, servings=10):
+    """Write Oura API payloads and a Chronometer servings export covering years
+
+    Returns:
+        Dict mapping each Oura endpoint, and 'chronometer', to its fixture path
+    """
+    n_days = int(years * 365)
+    os.makedirs(directory, exist_ok=True)
+    sleep, daily_sleep = sleep_payloads(n_days, end, seed, samples=False)
+    payloads = {
+        '/v2/usercollection/daily_sleep': daily_sleep,
+        '/v2/usercollection/sleep': sleep,
+        '/v2/usercollection/daily_activity': activity_payload(n_days, end, seed),
+        '/v2/usercollection/daily_stress': stress_payload(n_days, end, seed),
+    }
+    paths = {}
+    for endpoint, payload in payloads.items():
+        paths[endpoint] = os.path.join(directory, OURA_FIXTURES[endpoint])
+        with open(paths[endpoint], 'w') as f:
+            json.dump(payload, f)
+    paths['chronometer'] = os.path.join(directory, CHRONOMETER_FIXTURE)
+    with open(paths['chronometer'], 'w', newline='') as f:
+        f.write(chronometer_csv(n_days, servings, end, seed))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', help='Directory the fixtures are written to')
+    parser.add_argument('--years', type=float, default=1, help='Years of data')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    from app import create_app
+    with create_app('testing').app_context():
+        for name, path in write_fixtures(args.directory, args.years, seed=args.seed).items():
+            print(f"{name}: {path} ({os.path.getsize(path) / 2 ** 20:.1f} MiB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -14,4 +14,14 @@ setup(
         "scipy",
         "requests",
     ],
+    extras_require={
+        "asgi": ["asgiref", "uvicorn"],
+        "brotli": ["brotli"],
+        "orjson": ["orjson"],
+    },
+    entry_points={
+        "console_scripts": [
+            "health-tracker=app.cli:main",
+        ],
+    },
 ) 
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""Local stand-in for the Oura API v2 used by the sync tests and benchmark
+
+The server answers the usercollection endpoints the importer calls with a
+small synthetic record for every day in the requested range, and records
+each request's token and path. Tokens listed in rate_limited get a 429
+response with a Retry-After header instead.
+"""
+import json
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _days(params):
+    start = date.fromisoformat(params['start_date'][0])
+    end = date.fromisoformat(params['end_date'][0])
+    return [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+
+def _record(endpoint, day, seed):
+    value = (len(seed) * 7 + date.fromisoformat(day).toordinal()) % 40 + 50
+    if endpoint == 'daily_sleep':
+        return {'day': day, 'score': value}
+    if endpoint == 'sleep':
+        return {'day': day, 'type': 'long_sleep', 'average_heart_rate': value, 'average_hrv': value / 2,
+                'average_breath': 15.0, 'time_in_bed': 28800, 'rem_sleep_duration': 5400,
+                'deep_sleep_duration': 7200, 'light_sleep_duration': 14400, 'awake_duration': 1800}
+    if endpoint == 'daily_activity':
+        return {'day': day, 'score': value, 'steps': value * 100, 'active_calories': value * 5}
+    if endpoint == 'daily_stress':
+        return {'day': day, 'stress_high': value * 60, 'recovery_high': value * 30}
+    return None
+
+
+class OuraStubServer:
+    """Threaded HTTP server imitating the Oura API; use as a context manager"""
+
+    def __init__(self, latency=0.0, retry_after=60):
+        self.latency = latency
+        self.retry_after = retry_after
+        self.rate_limited = set()
+        self.requests = []  # (token, endpoint, monotonic time)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def tokens(self):
+        """Return the number of requests made with each token"""
+        counts = {}
+        for token, _, _ in self.requests:
+            counts[token] = counts.get(token, 0) + 1
+        return counts
+
+    def _handle(self, handler):
+        url = urlparse(handler.path)
+        endpoint = url.path.rsplit('/', 1)[-1]
+        token = handler.headers.get('Authorization', '').removeprefix('Bearer ')
+        with self._lock:
+            self.requests.append((token, endpoint, time.monotonic()))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            self._respond(handler, url, endpoint, token)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _respond(self, handler, url, endpoint, token):
+        if self.latency:
+            time.sleep(self.latency)
+
+        if token in self.rate_limited:
+            status, payload = 429, {'detail': 'Too many requests'}
+        else:
+            days = _days(parse_qs(url.query))
+            records = [_record(endpoint, day, token) for day in days]
+            status, payload = 200, {'data': [r for r in records if r is not None], 'next_token': None}
+
+        body = json.dumps(payload).encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            handler.send_header('Retry-After', str(self.retry_after))
+        handler.end_headers()
+        handler.wfile.write(body)
@@ -0,0 +1,480 @@
+from datetime import date, timedelta
+
+import gzip
+import json
+import struct
+import sys
+import os
+# Add the parent directory to the path to make app importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from sqlalchemy import event
+
+from tests.test_base import BaseTestCase
+from app import db
+from app.models.base import HealthData, DataType
+from app.utils.series_format import BINARY_MAGIC, BINARY_SERIES, COLUMNAR_JSON
+
+class AnalysisAPITestCase(BaseTestCase):
+    """Test case for the JSON analysis API endpoints."""
+    
+    def setUp(self):
+        """Create 60 days of data for a few related metrics."""
+        super().setUp()
+        
+        self.end_date = date(2025, 3, 1)
+        metrics = {
+            ('oura', 'sleep_score', 'score'): lambda i: 70 + (i * 7) % 20,
+            ('chronometer', 'Energy', 'kcal'): lambda i: 1800 + (i * 37) % 600,
+            ('chronometer', 'Protein', 'g'): lambda i: 60 + (i * 13) % 50,
+            ('oura', 'steps', 'count'): lambda i: 6000 + (i * 911) % 5000,
+        }
+        
+        for (source, name, units), value_fn in metrics.items():
+            data_type = DataType(source=source, metric_name=name, metric_units=units)
+            db.session.add(data_type)
+            db.session.flush()
+            for i in range(60):
+                db.session.add(HealthData(
+                    date=self.end_date - timedelta(days=i),
+                    data_type_id=data_type.id,
+                    metric_value=float(value_fn(i))
+                ))
+        
+        db.session.commit()
+    
+    def test_metric_data_resolution_and_budget(self):
+        """Test downsampled and monthly metric data, and the cache of reduced series."""
+        url = '/analysis/api/metric_data?metric_name=steps&source=oura'
+        payload = self.client.get(url).get_json()
+        self.assertEqual(len(payload['data']), 60)
+        self.assertEqual(payload['data'][0], {'date': '2025-01-01', 'value': 6000.0 + 59 * 911 % 5000, 'units': 'count'})
+        
+        payload = self.client.get(url + '&points=20').get_json()
+        self.assertEqual(len(payload['data']), 20)
+        self.assertEqual(payload['total_points'], 60)
+        self.assertEqual(payload['data'][-1]['date'], '2025-03-01')
+        
+        payload = self.client.get(url + '&resolution=month').get_json()
+        self.assertEqual([(p['date'], p['count']) for p in payload['data']],
+                         [('2025-01-01', 31), ('2025-02-01', 28), ('2025-03-01', 1)])
+        
+        self.assertFalse(self.client.get(url + '&resolution=hour').get_json()['success'])
+        
+        # A repeated request reuses the reduced series until the data changes
+        cache = self.app.extensions['health_analyzer_series'][1]
+        key = ('steps', 'oura', None, None, None, 'day', 20, 'lttb')
+        reduced = cache[key]['series']
+        self.client.get(url + '&points=20')
+        self.assertIs(cache[key]['series'], reduced)
+        steps = DataType.query.filter_by(metric_name='steps').one()
+        HealthData.query.filter_by(data_type_id=steps.id, date=self.end_date).one().metric_value += 1
+        db.session.commit()
+        self.client.get(url + '&points=20')
+        self.assertIsNot(cache[key]['series'], reduced)
+        
+        # Moving a value between two inner days keeps the count, ends and total but still misses
+        reduced = cache[key]['series']
+        first, second = HealthData.query.filter_by(data_type_id=steps.id).order_by(HealthData.date)[10:12]
+        first.metric_value, second.metric_value = first.metric_value + 500, second.metric_value - 500
+        db.session.commit()
+        self.client.get(url + '&points=20')
+        self.assertIsNot(cache[key]['series'], reduced)
+    
+    def test_metric_series_batch(self):
+        """Test that several metrics' series come from one data query."""
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            response = self.client.post('/analysis/api/metric_series', json={
+                'metrics': [{'name': 'sleep_score', 'source': 'oura'}, {'name': 'steps', 'source': 'oura'},
+                            {'name': 'Fiber', 'source': 'chronometer'}],
+                'limit': 30
+            })
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        
+        self.assertEqual(response.status_code, 200)
+        payload = response.get_json()
+        self.assertEqual(sorted(payload['series']), ['oura:sleep_score', 'oura:steps'])
+        self.assertEqual(payload['missing'], ['chronometer:Fiber'])
+        steps = payload['series']['oura:steps']
+        self.assertEqual(steps['units'], 'count')
+        self.assertEqual(len(steps['data']), 30)
+        self.assertEqual(steps['data'][-1], {'date': '2025-03-01', 'value': 6000.0})
+        
+        single = self.client.get('/analysis/api/metric_data?metric_name=steps&source=oura').get_json()
+        self.assertEqual([p['value'] for p in single['data'][-30:]], [p['value'] for p in steps['data']])
+        self.assertEqual(len([s for s in statements if 'FROM health_data' in s]), 1)
+        
+        response = self.client.post('/analysis/api/metric_series', json={'metrics': [{'name': 'steps'}]})
+        self.assertEqual(response.status_code, 400)
+        for points in (-1, 'many'):
+            response = self.client.post('/analysis/api/metric_series', json={
+                'metrics': [{'name': 'steps', 'source': 'oura'}], 'points': points})
+            self.assertEqual(response.status_code, 400)
+    
+    def test_metrics_data_aligned(self):
+        """Test that the batched metrics data endpoint returns values aligned on shared dates."""
+        response = self.client.post('/analysis/api/metrics_data', json={
+            'metrics': [{'name': 'sleep_score', 'source': 'oura'}, {'name': 'Fiber', 'source': 'chronometer'},
+                        {'name': 'steps', 'source': 'oura'}],
+            'start_date': '2025-02-20',
+            'limit': 5
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        payload = response.get_json()
+        self.assertEqual(payload['dates'], ['2025-02-25', '2025-02-26', '2025-02-27', '2025-02-28', '2025-03-01'])
+        self.assertEqual([m['name'] for m in payload['metrics']], ['sleep_score', 'Fiber', 'steps'])
+        self.assertEqual(payload['metrics'][1], {'name': 'Fiber', 'source': 'chronometer', 'units': None,
+                                                 'values': [None] * 5})
+        steps = self.client.get('/analysis/api/metric_data?metric_name=steps&source=oura').get_json()
+        self.assertEqual(payload['metrics'][2]['values'], [p['value'] for p in steps['data'][-5:]])
+        
+        response = self.client.post('/analysis/api/metrics_data', json={
+            'metrics': [{'name': 'steps', 'source': 'oura'}], 'end_date': '03/01/2025'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_series_formats(self):
+        """Test the columnar and binary formats chosen through Accept, and gzip compression."""
+        url = '/analysis/api/metric_data?metric_name=steps&source=oura&points=0'
+        points = self.client.get(url).get_json()
+        values = [p['value'] for p in points['data']]
+        
+        response = self.client.get(url, headers={'Accept': COLUMNAR_JSON})
+        self.assertEqual(response.mimetype, COLUMNAR_JSON)
+        columnar = response.get_json()
+        self.assertEqual(columnar['data']['dates']['start'], points['data'][0]['date'])
+        self.assertEqual(columnar['data']['dates']['deltas'], [0] + [1] * 59)
+        self.assertEqual(columnar['data']['values'], values)
+        self.assertEqual(columnar['total_points'], 60)
+        
+        response = self.client.post('/analysis/api/metric_series?precision=32', json={
+            'metrics': [{'name': 'steps', 'source': 'oura'}], 'points': 0
+        }, headers={'Accept': BINARY_SERIES, 'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.mimetype, BINARY_SERIES)
+        self.assertIn('Accept', response.vary)
+        # 60 points pack into less than COMPRESS_MIN_BYTES, so they are sent as they are
+        self.assertIsNone(response.content_encoding)
+        body = response.data
+        self.assertTrue(body.startswith(BINARY_MAGIC))
+        (length,) = struct.unpack('<I', body[4:8])
+        header = json.loads(body[8:8 + length])
+        steps = header['series']['oura:steps']
+        values_spec = header['$arrays'][steps['data']['values']['$array']]
+        self.assertEqual(values_spec['dtype'], 'float32')
+        decoded = np.frombuffer(body, 'float32', values_spec['length'], 8 + length + values_spec['offset'])
+        self.assertEqual(decoded.tolist(), values)
+        
+        # The longer default JSON is compressed, once the client accepts it
+        self.assertIsNone(self.client.get(url).content_encoding)
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.content_encoding, 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.data)), points)
+    
+    def test_dashboard_correlation_points(self):
+        """Test the scatter pairs and time trend points of the dashboard correlation."""
+        # Drop a few steps days, so those dates have no pair
+        steps = DataType.query.filter_by(metric_name='steps').one()
+        HealthData.query.filter(HealthData.data_type_id == steps.id,
+                                HealthData.date > self.end_date - timedelta(days=3)).delete()
+        db.session.commit()
+        
+        response = self.client.post('/analysis/api/dashboard-correlation', json={
+            'metrics': [{'name': 'sleep_score', 'source': 'oura'}, {'name': 'steps', 'source': 'oura'}]
+        })
+        self.assertEqual(response.status_code, 200)
+        paired = response.get_json()['paired_data']
+        self.assertEqual(len(paired), 57)
+        self.assertEqual(paired[-1], {'date': '2025-02-26', 'x': float(70 + 3 * 7 % 20), 'y': float(6000 + 3 * 911)})
+        
+        response = self.client.post('/analysis/api/dashboard-correlation', json={
+            'metrics': [{'name': 'sleep_score', 'source': 'oura'}]
+        })
+        self.assertEqual(response.status_code, 200)
+        points = response.get_json()['data_points']
+        self.assertEqual(len(points), 60)
+        self.assertEqual(points[0], {'date': '2025-01-01', 'value': float(70 + 59 * 7 % 20)})
+    
+    def test_dashboard_renders_catalog_only(self):
+        """Test that the dashboard page embeds the metric catalog without series data."""
+        response = self.client.get('/analysis/dashboard')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'"oura:steps"', response.data)
+        self.assertIn(b'/analysis/api/metric_series', response.data)
+        self.assertNotIn(b'"2025-03-01"', response.data)
+    
+    def test_rolling_correlation_api(self):
+        """Test the rolling correlation endpoint with a single metric pair."""
+        response = self.client.post('/analysis/api/rolling-correlation', json={
+            'metrics': [
+                {'name': 'sleep_score', 'source': 'oura'},
+                {'name': 'Protein', 'source': 'chronometer'}
+            ],
+            'window': 14
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        payload = response.get_json()
+        self.assertEqual(payload['window'], 14)
+        self.assertEqual(len(payload['dates']), 60)
+        self.assertEqual(len(payload['results']), 1)
+        self.assertEqual(len(payload['results'][0]['series']), 60)
+        self.assertGreater(payload['results'][0]['summary']['windows'], 0)
+    
+    def test_rolling_correlation_api_multiple_pairs(self):
+        """Test the rolling correlation endpoint with several pairs at once."""
+        response = self.client.post('/analysis/api/rolling-correlation', json={
+            'pairs': [
+                {'metric1': {'name': 'sleep_score', 'source': 'oura'},
+                 'metric2': {'name': 'Energy', 'source': 'chronometer'}},
+                {'metric1': {'name': 'steps', 'source': 'oura'},
+                 'metric2': {'name': 'missing', 'source': 'oura'}}
+            ],
+            'window': 7,
+            'start_date': '2025-02-01'
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        payload = response.get_json()
+        self.assertEqual(len(payload['dates']), 29)
+        self.assertIn('series', payload['results'][0])
+        self.assertIn('error', payload['results'][1])
+    
+    def test_rolling_correlation_api_validation(self):
+        """Test the rolling correlation endpoint's input validation."""
+        response = self.client.post('/analysis/api/rolling-correlation', json={
+            'metrics': [{'name': 'sleep_score', 'source': 'oura'}]
+        })
+        self.assertEqual(response.status_code, 400)
+        
+        response = self.client.post('/analysis/api/rolling-correlation', json={
+            'metrics': [
+                {'name': 'sleep_score', 'source': 'oura'},
+                {'name': 'Protein', 'source': 'chronometer'}
+            ],
+            'start_date': '03/01/2025'
+        })
+        self.assertEqual(response.status_code, 400)
+    
+    def _add_leading_metric(self):
+        """Add a metric whose value two days earlier drives sleep_score."""
+        sleep_type = DataType.query.filter_by(source='oura', metric_name='sleep_score').first()
+        magnesium = DataType(source='chronometer', metric_name='Magnesium', metric_units='mg')
+        db.session.add(magnesium)
+        db.session.flush()
+        
+        for row in HealthData.query.filter_by(data_type_id=sleep_type.id).all():
+            db.session.add(HealthData(
+                date=row.date - timedelta(days=2),
+                data_type_id=magnesium.id,
+                metric_value=row.metric_value * 4 + (row.date.day % 3)
+            ))
+        db.session.commit()
+    
+    def test_lag_correlation_api_pair(self):
+        """Test the lag-scan endpoint for a single metric pair."""
+        self._add_leading_metric()
+        
+        response = self.client.post('/analysis/api/lag-correlation', json={
+            'metrics': [
+                {'name': 'sleep_score', 'source': 'oura'},
+                {'name': 'Magnesium', 'source': 'chronometer'}
+            ],
+            'max_lag': 4
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        payload = response.get_json()
+        self.assertEqual(len(payload['lags']), 9)
+        self.assertEqual(payload['best_lag']['lag'], 2)
+        self.assertGreater(payload['best_lag']['coefficient'], 0.9)
+    
+    def test_lag_correlation_api_target_vs_all(self):
+        """Test the lag-scan endpoint in target-vs-all mode."""
+        self._add_leading_metric()
+        
+        response = self.client.post('/analysis/api/lag-correlation', json={
+            'target': {'name': 'sleep_score', 'source': 'oura'},
+            'max_lag': 3,
+            'include_curves': True
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()['results']
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[0]['metric']['name'], 'Magnesium')
+        self.assertEqual(results[0]['best_lag'], 2)
+        self.assertEqual(len(results[0]['lags']), 7)
+    
+    def test_lag_correlation_api_validation(self):
+        """Test the lag-scan endpoint's input validation."""
+        response = self.client.post('/analysis/api/lag-correlation', json={
+            'metrics': [
+                {'name': 'sleep_score', 'source': 'oura'},
+                {'name': 'Protein', 'source': 'chronometer'}
+            ],
+            'method': 'kendall'
+        })
+        self.assertEqual(response.status_code, 400)
+        
+        response = self.client.post('/analysis/api/lag-correlation', json={'max_lag': 3})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_correlation_table_permutation_fdr(self):
+        """Test the correlation table with permutation p-values and BH q-values."""
+        response = self.client.post('/analysis/correlation_table', data={
+            'x_metrics': ['chronometer:Protein', 'chronometer:Energy'],
+            'y_metrics': ['oura:sleep_score', 'oura:steps'],
+            'date_range': 'all',
+            'significance_test': 'permutation',
+            'n_resamples': '100',
+            'seed': '1',
+            'fdr_correction': 'yes'
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Permutation p-values from 100 resamples', response.data)
+        self.assertIn(b'q: ', response.data)
+    
+    def test_resample_count_validated_and_capped(self):
+        """Test that bad resample counts are rejected and huge ones capped."""
+        for url in ('/analysis/correlation', '/analysis/correlation_table'):
+            for value in ('many', '-5'):
+                response = self.client.post(url, data={'n_resamples': value})
+                self.assertEqual(response.status_code, 400, (url, value))
+        
+        self.app.config['RESAMPLING_MAX_RESAMPLES'] = 50
+        response = self.client.post('/analysis/correlation_table', data={
+            'x_metrics': ['chronometer:Protein'],
+            'y_metrics': ['oura:sleep_score'],
+            'date_range': 'all',
+            'significance_test': 'permutation',
+            'n_resamples': str(10 ** 9),
+            'seed': '1'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Permutation p-values from 50 resamples', response.data)
+    
+    def test_correlation_table_bootstrap_ci(self):
+        """Test that the correlation table shows a bootstrap interval in each cell."""
+        response = self.client.post('/analysis/correlation_table', data={
+            'x_metrics': ['chronometer:Protein', 'chronometer:Energy'],
+            'y_metrics': ['oura:sleep_score', 'oura:steps'],
+            'date_range': 'all',
+            'method': 'spearman',
+            'n_resamples': '100',
+            'seed': '1',
+            'bootstrap_ci': 'yes'
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'95% bootstrap intervals from 100 resamples per cell', response.data)
+        self.assertIn(b'95% CI: ', response.data)
+    
+    def _add_energy_driven_metric(self):
+        """Add a metric that only tracks sleep_score through Energy."""
+        energy_type = DataType.query.filter_by(source='chronometer', metric_name='Energy').first()
+        sleep_type = DataType.query.filter_by(source='oura', metric_name='sleep_score').first()
+        carbs_type = DataType(source='chronometer', metric_name='Carbs', metric_units='g')
+        db.session.add(carbs_type)
+        db.session.flush()
+        
+        # Make sleep_score follow Energy too, so Carbs and sleep are confounded
+        for i, record in enumerate(HealthData.query.filter_by(data_type_id=energy_type.id).order_by(HealthData.date)):
+            sleep = HealthData.query.filter_by(data_type_id=sleep_type.id, date=record.date).first()
+            sleep.metric_value = record.metric_value / 30 + (i * 7) % 5
+            db.session.add(HealthData(
+                date=record.date,
+                data_type_id=carbs_type.id,
+                metric_value=record.metric_value / 8 + (i * 11) % 7
+            ))
+        db.session.commit()
+    
+    def test_partial_correlation_api_pair(self):
+        """Test that controlling for Energy removes a confounded correlation."""
+        self._add_energy_driven_metric()
+        response = self.client.post('/analysis/api/partial-correlation', json={
+            'metrics': [
+                {'name': 'sleep_score', 'source': 'oura'},
+                {'name': 'Carbs', 'source': 'chronometer'}
+            ],
+            'covariates': [{'name': 'Energy', 'source': 'chronometer'}]
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        payload = response.get_json()
+        self.assertGreater(payload['bivariate']['coefficient'], 0.9)
+        self.assertLess(abs(payload['partial']['coefficient']), 0.5)
+        self.assertEqual(payload['partial']['valid_pairs'], 60)
+        self.assertEqual(payload['covariates'][0]['name'], 'Energy')
+    
+    def test_partial_correlation_api_target_vs_all(self):
+        """Test the partial correlation scan of one target against every other metric."""
+        response = self.client.post('/analysis/api/partial-correlation', json={
+            'target': {'name': 'sleep_score', 'source': 'oura'},
+            'covariates': [{'name': 'Energy', 'source': 'chronometer'}]
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()['results']
+        self.assertEqual({r['metric']['name'] for r in results}, {'Protein', 'steps'})
+        self.assertTrue(all('q_value' in r for r in results))
+    
+    def test_regression_api(self):
+        """Test a two-target regression with standardized coefficients."""
+        response = self.client.post('/analysis/api/regression', json={
+            'targets': [
+                {'name': 'sleep_score', 'source': 'oura'},
+                {'name': 'steps', 'source': 'oura'}
+            ],
+            'predictors': [
+                {'name': 'Energy', 'source': 'chronometer'},
+                {'name': 'Protein', 'source': 'chronometer'}
+            ]
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()['results']
+        self.assertEqual(len(results), 2)
+        for result in results:
+            self.assertEqual(result['valid_pairs'], 60)
+            self.assertGreaterEqual(result['r_squared'], 0)
+            self.assertLessEqual(result['r_squared'], 1)
+            self.assertEqual([c['metric']['name'] for c in result['coefficients']], ['Energy', 'Protein'])
+    
+    def test_regression_api_validation(self):
+        """Test the regression endpoint's input validation."""
+        response = self.client.post('/analysis/api/regression', json={
+            'target': {'name': 'sleep_score', 'source': 'oura'}
+        })
+        self.assertEqual(response.status_code, 400)
+        
+        response = self.client.post('/analysis/api/regression', json={
+            'target': {'name': 'sleep_score', 'source': 'oura'},
+            'predictors': [{'name': 'missing', 'source': 'chronometer'}]
+        })
+        self.assertEqual(response.status_code, 400)
+    
+    def test_whole_number_parameters_validated(self):
+        """Test that non-integer counts and windows are rejected rather than failing."""
+        pair = [{'name': 'sleep_score', 'source': 'oura'}, {'name': 'Protein', 'source': 'chronometer'}]
+        target = {'name': 'sleep_score', 'source': 'oura'}
+        requests = [
+            ('rolling-correlation', {'metrics': pair, 'window': 'month'}),
+            ('rolling-correlation', {'metrics': pair, 'min_periods': [5]}),
+            ('lag-correlation', {'metrics': pair, 'max_lag': 'week'}),
+            ('lag-correlation', {'target': target, 'top_n': 'all'}),
+            ('partial-correlation', {'metrics': pair, 'min_pairs': None}),
+            ('regression', {'target': target, 'predictors': pair[1:], 'min_pairs': 'ten'})
+        ]
+        for endpoint, body in requests:
+            with self.subTest(endpoint=endpoint, body=body):
+                response = self.client.post(f'/analysis/api/{endpoint}', json=body)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('whole number', response.get_json()['error'])
+
@@ -1,7 +1,9 @@
 from datetime import date, timedelta
+import numpy as np
 import pandas as pd
 import sys
 import os
+from unittest.mock import patch
 
 # Add the parent directory to the path to make app importable
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -9,7 +11,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from tests.test_base import BaseTestCase
 from app import db
-from app.models.base import HealthData, DataType
+from app.models.base import HealthData, DataType, DEFAULT_USER_ID
 from app.utils.analyzer import HealthAnalyzer
 
 class MockHealthAnalyzer:
@@ -416,6 +418,38 @@ class AnalyzerTestCase(BaseTestCase):
         # The filtered data should have at least one entry
         self.assertGreaterEqual(len(filtered_data), 1)
     
+    def test_get_metrics_data(self):
+        """Test that batched metric data is aligned on dates and matches get_metric_data."""
+        protein = DataType.query.filter_by(metric_name='protein').one()
+        HealthData.query.filter(
+            HealthData.data_type_id == protein.id, HealthData.date >= date(2025, 2, 25)
+        ).delete()
+        db.session.commit()
+        metrics = [('sleep_score', 'oura'), ('protein', 'chronometer'), ('missing', 'oura')]
+        
+        result = self.analyzer.get_metrics_data(metrics)
+        self.assertEqual(result['metrics'], metrics)
+        self.assertEqual(result['units'], ['score', 'g', None])
+        self.assertEqual(result['values'].shape, (30, 3))
+        self.assertEqual(result['dates'][-1], np.datetime64('2025-03-01'))
+        for i, metric in enumerate(metrics[:2]):
+            rows = self.analyzer.get_metric_data(*metric)
+            column = result['values'][:, i]
+            self.assertEqual([row[1] for row in rows], column[~np.isnan(column)].tolist())
+        self.assertTrue(np.isnan(result['values'][-5:, 1]).all())
+        self.assertTrue(np.isnan(result['values'][:, 2]).all())
+        
+        # Each metric keeps its own last 3 days
+        limited = self.analyzer.get_metrics_data(metrics[:2], limit=3)
+        self.assertEqual(len(limited['dates']), 6)
+        self.assertEqual(np.count_nonzero(~np.isnan(limited['values']), axis=0).tolist(), [3, 3])
+        self.assertEqual(limited['values'][-3:, 0].tolist(),
+                         [row[1] for row in self.analyzer.get_metric_data('sleep_score', 'oura', limit=3)])
+        
+        frame = self.analyzer.get_metrics_data(metrics[:2], start_date=date(2025, 2, 1), as_frame=True)
+        expected = self.analyzer.get_metric_dataframe(start_date=date(2025, 2, 1))
+        pd.testing.assert_frame_equal(frame, expected[frame.columns], check_freq=False)
+    
     def test_calculate_correlation(self):
         """Test calculating correlation between two metrics."""
         # Calculate correlation between sleep score and energy
@@ -786,4 +820,144 @@ class AnalyzerTestCase(BaseTestCase):
         
         # Density correlation should be negative
         if 'coefficient' in corr_density:
-            self.assertLess(corr_density['coefficient'], -0.8) 
\ No newline at end of file
+            self.assertLess(corr_density['coefficient'], -0.8) 
+    
+    def test_rolling_correlation_matches_pandas(self):
+        """Test that rolling correlations match a per-window recomputation."""
+        result = self.analyzer.calculate_rolling_correlation(
+            'sleep_score', 'oura',
+            'protein', 'chronometer',
+            window=7, min_periods=7
+        )
+        
+        self.assertNotIn('error', result)
+        self.assertEqual(result['window'], 7)
+        self.assertEqual(len(result['series']), 30)
+        
+        # Recompute with pandas for comparison
+        df = self.analyzer.get_metric_dataframe()
+        df.index = pd.to_datetime(df.index)
+        expected = df['oura:sleep_score'].rolling(7).corr(df['chronometer:protein'])
+        
+        for point, exp in zip(result['series'], expected):
+            if pd.isna(exp):
+                self.assertIsNone(point['coefficient'])
+            else:
+                self.assertAlmostEqual(point['coefficient'], exp, places=9)
+        
+        self.assertEqual(result['summary']['windows'], 24)
+    
+    def test_rolling_correlation_with_missing_days(self):
+        """Test that missing days are kept as calendar gaps in rolling windows."""
+        # Remove five consecutive days of protein data
+        protein_type = DataType.query.filter_by(source='chronometer', metric_name='protein').first()
+        HealthData.query.filter(
+            HealthData.data_type_id == protein_type.id,
+            HealthData.date >= date(2025, 2, 10),
+            HealthData.date <= date(2025, 2, 14)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        
+        result = self.analyzer.calculate_rolling_correlation(
+            'sleep_score', 'oura',
+            'protein', 'chronometer',
+            window=7, min_periods=5
+        )
+        
+        series = {p['date']: p for p in result['series']}
+        self.assertEqual(len(series), 30)
+        
+        # The window ending on Feb 14 only has two valid pairs
+        self.assertEqual(series['2025-02-14']['pairs'], 2)
+        self.assertIsNone(series['2025-02-14']['coefficient'])
+        # A window ending after the gap is full again
+        self.assertEqual(series['2025-02-21']['pairs'], 7)
+        self.assertIsNotNone(series['2025-02-21']['coefficient'])
+    
+    def test_rolling_correlation_unknown_metric(self):
+        """Test rolling correlation with a metric that does not exist."""
+        result = self.analyzer.calculate_rolling_correlation(
+            'sleep_score', 'oura',
+            'missing_metric', 'test'
+        )
+        
+        self.assertIn('error', result)
+    
+    def test_calculate_correlation_with_resampling(self):
+        """Test bootstrap and permutation results attached to a correlation."""
+        result = self.analyzer.calculate_correlation(
+            'sleep_score', 'oura',
+            'protein', 'chronometer',
+            n_resamples=200, seed=7
+        )
+        
+        resampling = result['correlation']['resampling']
+        low, high = resampling['bootstrap_ci']
+        self.assertLessEqual(low, result['correlation']['coefficient'])
+        self.assertGreaterEqual(high, result['correlation']['coefficient'])
+        self.assertEqual(resampling['n_permutations'], 200)
+        self.assertGreater(resampling['permutation_p_value'], 0)
+        
+        # The same seed reproduces the same results
+        again = self.analyzer.calculate_correlation(
+            'sleep_score', 'oura',
+            'protein', 'chronometer',
+            n_resamples=200, seed=7
+        )
+        self.assertEqual(again['correlation']['resampling'], resampling)
+
+    
+    def test_multiple_correlations_match_pairwise(self):
+        """Test that the batched multiple correlations match calculate_correlation pair by pair."""
+        for handle_missing, time_shift in (('drop', None), ('interpolate', {'oura': -1})):
+            results = self.analyzer.calculate_multiple_correlations(
+                'sleep_score', 'oura', min_pairs=5, handle_missing=handle_missing, time_shift=time_shift)
+            
+            self.assertEqual({r['metric']['name'] for r in results}, {'energy', 'protein'})
+            for result in results:
+                pair = self.analyzer.calculate_correlation(
+                    'sleep_score', 'oura', result['metric']['name'], 'chronometer',
+                    min_pairs=5, handle_missing=handle_missing, time_shift=time_shift)
+                self.assertAlmostEqual(result['correlation'], pair['correlation']['coefficient'], places=12)
+                self.assertAlmostEqual(result['p_value'], pair['correlation']['p_value'], places=12)
+                self.assertEqual(result['valid_pairs'], pair['correlation']['valid_pairs'])
+    
+    def test_density_block_matches_column_division(self):
+        """Test that the block density columns equal per-column division."""
+        df = self.analyzer.get_metric_dataframe(include_derived=True)
+        
+        expected = df['chronometer:protein'].div(df['chronometer:energy']).multiply(100)
+        pd.testing.assert_series_equal(df['chronometer:density_protein'], expected, check_names=False)
+        self.assertNotIn('chronometer:density_energy', df.columns)
+    
+    def test_metric_frame_cache_invalidation(self):
+        """Test that cached frames and density blocks are rebuilt only when their source changes."""
+        self.analyzer.get_metric_dataframe(include_derived=True)
+        cache = self.app.extensions['health_analyzer_frames'][DEFAULT_USER_ID][(None, None)]
+        density_block = cache['density']['chronometer:energy'][1]
+        
+        # A repeated call reuses both the frame and the density block, without scanning the data
+        with patch.object(HealthAnalyzer, '_source_fingerprints') as fingerprints:
+            self.analyzer.get_metric_dataframe(include_derived=True)
+        fingerprints.assert_not_called()
+        self.assertIs(cache['density']['chronometer:energy'][1], density_block)
+        
+        # Editing Oura data rebuilds the frame but keeps the chronometer density block
+        sleep = HealthData.query.join(DataType).filter(DataType.source == 'oura').first()
+        sleep.metric_value = 55.0
+        db.session.commit()
+        df = self.analyzer.get_metric_dataframe(include_derived=True)
+        entry = self.app.extensions['health_analyzer_frames'][DEFAULT_USER_ID][(None, None)]
+        self.assertEqual(df.loc[sleep.date, 'oura:sleep_score'], 55.0)
+        self.assertIs(entry['density']['chronometer:energy'][1], density_block)
+        
+        # Editing chronometer data recomputes the density block
+        protein = HealthData.query.join(DataType).filter(DataType.metric_name == 'protein').first()
+        protein.metric_value = 500.0
+        db.session.commit()
+        df = self.analyzer.get_metric_dataframe(include_derived=True)
+        self.assertIsNot(entry['density']['chronometer:energy'][1], density_block)
+        self.assertAlmostEqual(
+            df.loc[protein.date, 'chronometer:density_protein'],
+            500.0 / df.loc[protein.date, 'chronometer:energy'] * 100
+        )
@@ -0,0 +1,39 @@
+import os
+import sys
+
+# Add the parent directory and the benchmarks to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+from tests.test_base import BaseTestCase
+from app.models.base import HealthData
+from app.utils.analyzer import HealthAnalyzer
+from synthetic import metric_series, load_health_data
+from suite import compare
+
+
+class SyntheticDataTestCase(BaseTestCase):
+    """Test case for the benchmark data generator and baseline comparison."""
+
+    def test_seeded_series(self):
+        """Test that the same seed gives the same, correlated data."""
+        series = metric_series(years=1, oura_metrics=3, chronometer=2, seed=7)
+        self.assertEqual(series, metric_series(years=1, oura_metrics=3, chronometer=2, seed=7))
+        self.assertNotEqual(series, metric_series(years=1, oura_metrics=3, chronometer=2, seed=8))
+        self.assertEqual([source for source, _, _ in series], ['oura'] * 3 + ['chronometer'] * 2)
+        self.assertTrue(all(300 < len(points) <= 365 for points in series.values()))
+
+        rows = load_health_data(years=1, oura_metrics=3, chronometer=2, seed=7)
+        self.assertEqual(HealthData.query.count(), rows)
+        frame = HealthAnalyzer().get_metric_dataframe()
+        self.assertEqual(frame.shape[1], 5)
+        self.assertGreater(frame.corr().abs().where(frame.corr() < 1).max().max(), 0.2)
+
+    def test_compare(self):
+        """Test that only slowdowns beyond both thresholds are regressions."""
+        baseline = {'results': {'slow': {'median_ms': 100.0}, 'fast': {'median_ms': 0.5},
+                                'faster': {'median_ms': 50.0}}}
+        results = {'results': {'slow': {'median_ms': 140.0}, 'fast': {'median_ms': 1.0},
+                               'faster': {'median_ms': 20.0}, 'added': {'median_ms': 5.0}}}
+        statuses = {row[0]: row[4] for row in compare(results, baseline, threshold=0.25, min_ms=1.0)}
+        self.assertEqual(statuses, {'slow': 'regression', 'fast': 'ok', 'faster': 'improvement', 'added': 'new'})
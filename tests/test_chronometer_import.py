@@ -3,11 +3,15 @@ import os
 import tempfile
 from datetime import date
 import pandas as pd
-from io import StringIO
+from io import StringIO, BytesIO
+import gzip
+import zipfile
 
 from tests.test_base import BaseTestCase
-from app.models.base import HealthData, DataType
+from app.models.base import HealthData, DataType, ImportFingerprint
+from unittest.mock import patch
 from app.utils.chronometer_importer import ChronometerImporter
+from app import db
 
 class ChronometerImportTestCase(BaseTestCase):
     
@@ -243,5 +247,115 @@ class ChronometerImportTestCase(BaseTestCase):
             # Clean up the temporary file
             os.unlink(temp_file_path)
 
+    def _energy_on(self, day):
+        energy_type = DataType.query.filter_by(source='chronometer', metric_name='Energy').first()
+        self.assertIsNotNone(energy_type)
+        return HealthData.query.filter_by(data_type_id=energy_type.id, date=day).first().metric_value
+    
+    def test_import_compressed_uploads(self):
+        """Test that gzip and zip uploads are imported from the upload stream"""
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('export/servings.csv', self.csv_data)
+        uploads = [
+            (gzip.compress(self.csv_data.encode('utf-8')), 'servings.csv.gz'),
+            (archive.getvalue(), 'servings.zip')
+        ]
+        
+        for body, filename in uploads:
+            with self.subTest(filename=filename):
+                HealthData.query.delete()
+                response = self.client.post('/data/import', data={
+                    'data_source': 'chronometer_csv',
+                    'chronometer_file': (BytesIO(body), filename)
+                }, content_type='multipart/form-data', follow_redirects=True)
+                
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(b'successfully', response.data.lower())
+                self.assertEqual(self._energy_on(date(2023, 1, 1)), 552)
+    
+    def test_import_raw_body(self):
+        """Test the raw-body import endpoint with plain and gzip bodies"""
+        response = self.client.post('/data/api/import/chronometer?categories=yes',
+                                    data=self.csv_data.encode('utf-8'), content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.json['nutrition_points'], 0)
+        self.assertEqual(response.json['category_points'], 6)
+        
+        response = self.client.post('/data/api/import/chronometer',
+                                    data=gzip.compress(self.csv_data.replace('150', '160', 1).encode('utf-8')),
+                                    content_type='application/gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['category_points'], 0)
+        self.assertEqual(self._energy_on(date(2023, 1, 1)), 562)
+    
+    def test_import_raw_body_limits(self):
+        """Test that MAX_CONTENT_LENGTH is enforced and bad archives are rejected"""
+        self.app.config['MAX_CONTENT_LENGTH'] = 100
+        response = self.client.post('/data/api/import/chronometer',
+                                    data=self.csv_data.encode('utf-8'), content_type='text/csv')
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(HealthData.query.count(), 0)
+        
+        self.app.config['MAX_CONTENT_LENGTH'] = None
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('a.csv', self.csv_data)
+            zf.writestr('b.csv', self.csv_data)
+        response = self.client.post('/data/api/import/chronometer',
+                                    data=archive.getvalue(), content_type='application/zip')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exactly one CSV', response.json['error'])
+
+    def test_reimport_unchanged_file_is_skipped(self):
+        """Test that re-importing an identical file skips parsing entirely"""
+        importer = ChronometerImporter()
+        nutrition_data, _ = importer.import_from_csv(self.csv_file.name)
+        self.assertGreater(len(nutrition_data), 0)
+        self.assertEqual(ImportFingerprint.query.filter_by(kind='file').count(), 1)
+        self.assertEqual(ImportFingerprint.query.filter_by(kind='day').count(), 2)
+        
+        with patch('app.utils.chronometer_importer.pd.read_csv') as read_csv:
+            self.assertEqual(importer.import_from_csv(self.csv_file.name), ([], []))
+            self.assertEqual(importer.import_from_csv(BytesIO(self.csv_data.encode('utf-8'))), ([], []))
+            read_csv.assert_not_called()
+        
+        # Importing with categories is a different import
+        _, category_data = importer.import_from_csv(self.csv_file.name, store_categories=True)
+        self.assertEqual(len(category_data), 6)
+    
+    def test_reimport_writes_only_changed_days(self):
+        """Test that only days whose totals changed are written again"""
+        importer = ChronometerImporter()
+        importer.import_from_csv(self.csv_file.name)
+        
+        changed_csv = self.csv_data.replace('2023-01-02,Salmon,200,412', '2023-01-02,Salmon,200,400')
+        with patch.object(ChronometerImporter, '_store_data', autospec=True,
+                          side_effect=ChronometerImporter._store_data) as store_data:
+            nutrition_data, _ = importer.import_from_csv(BytesIO(changed_csv.encode('utf-8')), name='changed.csv')
+        
+        stored = store_data.call_args.args[1]
+        self.assertEqual({item['date'] for item in stored}, {date(2023, 1, 2)})
+        self.assertEqual({item['date'] for item in nutrition_data}, {date(2023, 1, 1), date(2023, 1, 2)})
+        self.assertEqual(self._energy_on(date(2023, 1, 2)), 655)
+    
+    def test_reimport_after_deletion_or_edit(self):
+        """Test that deleted rows and manual edits are restored by a re-import"""
+        importer = ChronometerImporter()
+        importer.import_from_csv(self.csv_file.name)
+        
+        energy_type = DataType.query.filter_by(source='chronometer', metric_name='Energy').first()
+        HealthData.query.filter_by(data_type_id=energy_type.id, date=date(2023, 1, 1)).delete()
+        db.session.commit()
+        importer.import_from_csv(self.csv_file.name)
+        self.assertEqual(self._energy_on(date(2023, 1, 1)), 552)
+        
+        data_point = HealthData.query.filter_by(data_type_id=energy_type.id, date=date(2023, 1, 2)).first()
+        response = self.client.post('/data/edit-data-point', data={'data_id': data_point.id, 'metric_value': 1})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self._energy_on(date(2023, 1, 2)), 1)
+        importer.import_from_csv(self.csv_file.name)
+        self.assertEqual(self._energy_on(date(2023, 1, 2)), 667)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+from datetime import date
+from unittest.mock import patch
+
+from flask import g
+from sqlalchemy.exc import SQLAlchemyError
+
+from tests.test_base import BaseTestCase
+from app.models.base import HealthData, DataType, User, ImportFingerprint
+from app.utils.chronometer_importer import ChronometerImporter
+
+
+class ImportCommandTestCase(BaseTestCase):
+    """Test case for the bulk Chronometer import command."""
+    
+    def setUp(self):
+        super().setUp()
+        self.export_dir = tempfile.mkdtemp()
+        self._write('2023_01.csv', """Day,Name,Energy (kcal),Protein (g),Category
+2023-01-01,Oatmeal,150,5,Breakfast
+2023-01-01,Chicken Breast,330,62,Dinner
+2023-01-02,Banana,105,1.3,Breakfast
+""")
+        # Overlaps the first export on 2023-01-02 with a corrected log
+        self._write('2023_02.csv', """Day,Name,Energy (kcal),Protein (g),Category
+2023-01-02,Banana,105,1.3,Breakfast
+2023-01-02,Salmon,412,40,Dinner
+2023-01-03,Greek Yogurt,150,15,Snacks
+""")
+        self.runner = self.app.test_cli_runner()
+    
+    def tearDown(self):
+        shutil.rmtree(self.export_dir, ignore_errors=True)
+        super().tearDown()
+    
+    def _write(self, name, content):
+        with open(os.path.join(self.export_dir, name), 'w') as f:
+            f.write(content)
+    
+    def _value(self, metric_name, day):
+        return HealthData.query.join(DataType).filter(
+            DataType.source == 'chronometer',
+            DataType.metric_name == metric_name,
+            HealthData.date == day
+        ).one().metric_value
+    
+    def _import(self, *args):
+        result = self.runner.invoke(args=['import', os.path.join(self.export_dir, '*.csv'), *args])
+        self.assertEqual(result.exit_code, 0, result.output)
+        return result
+    
+    def test_import_merges_files(self):
+        """Test that later files replace earlier ones per day and throughput is reported."""
+        result = self._import('--workers', '1')
+        
+        self.assertIn('Parsed 2/2 files', result.output)
+        self.assertIn('rows/s', result.output)
+        self.assertIn('MB/s', result.output)
+        self.assertEqual(self._value('Energy', date(2023, 1, 1)), 480)
+        self.assertEqual(self._value('Energy', date(2023, 1, 2)), 517)
+        self.assertEqual(self._value('Protein', date(2023, 1, 3)), 15)
+        self.assertEqual(DataType.query.filter(DataType.metric_name.like('Food Category:%')).count(), 0)
+    
+    def test_parallel_import_matches_serial(self):
+        """Test that parsing in a process pool gives the same stored data."""
+        self._import('--workers', '2', '--categories')
+        parallel = {(hd.data_type.metric_name, hd.date): hd.metric_value for hd in HealthData.query.all()}
+        
+        HealthData.query.delete()
+        self._import('--workers', '1', '--categories')
+        serial = {(hd.data_type.metric_name, hd.date): hd.metric_value for hd in HealthData.query.all()}
+        
+        self.assertEqual(parallel, serial)
+        self.assertEqual(parallel[('Food Category: Dinner', date(2023, 1, 2))], 412)
+    
+    def test_dry_run_and_bad_files(self):
+        """Test that a dry run stores nothing and unreadable files are skipped."""
+        self._write('2023_03.csv', "Name,Energy (kcal)\nApple,72\n")
+        result = self._import('--workers', '1', '--dry-run')
+        
+        self.assertIn("Skipping", result.output)
+        self.assertIn('Parsed 2/3 files', result.output)
+        self.assertIn('would be stored', result.output)
+        self.assertEqual(HealthData.query.count(), 0)
+    
+    def test_reimport_skips_unchanged_days(self):
+        """Test that a repeated import reports and writes only changed days."""
+        self._import('--workers', '1')
+        result = self._import('--workers', '1')
+        self.assertIn('0 of 3 days changed', result.output)
+        
+        self._write('2023_02.csv', """Day,Name,Energy (kcal),Protein (g),Category
+2023-01-02,Banana,105,1.3,Breakfast
+2023-01-03,Greek Yogurt,150,15,Snacks
+""")
+        result = self._import('--workers', '1')
+        self.assertIn('1 of 3 days changed', result.output)
+        self.assertEqual(self._value('Energy', date(2023, 1, 2)), 105)
+    
+    def test_import_is_one_transaction(self):
+        """Test that a failure in any storage step leaves nothing behind."""
+        with patch.object(ChronometerImporter, '_update_data_source', side_effect=SQLAlchemyError('locked')):
+            result = self.runner.invoke(args=['import', os.path.join(self.export_dir, '*.csv'), '--workers', '1'])
+        
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertEqual(HealthData.query.count(), 0)
+        self.assertEqual(ImportFingerprint.query.count(), 0)
+        
+        result = self._import('--workers', '1')
+        self.assertIn('3 of 3 days changed', result.output)
+        self.assertEqual(self._value('Energy', date(2023, 1, 2)), 517)
+    
+    def test_import_for_user(self):
+        """Test that --user imports into that user's data only."""
+        self._import('--workers', '1', '--user', 'alice')
+        g.pop('user_id')  # the runner shares the test's app context
+        
+        self.assertEqual(HealthData.query.count(), 0)
+        alice = User.query.filter_by(username='alice').one()
+        owners = {hd.user_id for hd in HealthData.query.execution_options(all_users=True)}
+        self.assertEqual(owners, {alice.id})
+    
+    def test_no_matching_files(self):
+        """Test that a pattern matching nothing is a usage error."""
+        result = self.runner.invoke(args=['import', os.path.join(self.export_dir, '*.json')])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn('No files match', result.output)
@@ -0,0 +1,98 @@
+import os
+import sys
+import tempfile
+from concurrent.futures import Future
+from datetime import date, timedelta
+from unittest.mock import patch
+
+# Add the parent directory to the path to make app importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests.test_base import BaseTestCase
+from app import create_app, db
+from app.config import TestingConfig
+from app.models.base import HealthData, User
+from app.utils.analyzer import HealthAnalyzer
+from app.utils.compute_pool import OffloadedAnalyzer, request_analyzer, _call_analyzer
+
+
+class ComputePoolDisabledTestCase(BaseTestCase):
+    """Test case for apps without a compute pool."""
+
+    def test_inline_by_default(self):
+        """Test that analysis runs inline unless ANALYSIS_WORKERS is set."""
+        self.assertNotIn('compute_pool', self.app.extensions)
+        self.assertIsInstance(request_analyzer(), HealthAnalyzer)
+
+    def test_in_memory_database(self):
+        """Test that workers are not started for an in-memory database."""
+        app = create_app('testing', {'ANALYSIS_WORKERS': 2})
+        self.assertNotIn('compute_pool', app.extensions)
+
+
+class ComputePoolTestCase(BaseTestCase):
+    """Test case for analysis offloaded to worker processes."""
+
+    def setUp(self):
+        # Worker processes open the database themselves, so the app starts on a file database
+        fd, self.pool_db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        with patch.multiple(TestingConfig, SQLALCHEMY_DATABASE_URI=f'sqlite:///{self.pool_db_path}',
+                            ANALYSIS_WORKERS=1, ANALYSIS_POOL_MIN_MS=0):
+            super().setUp()
+        self.pool = self.app.extensions['compute_pool']
+        self.other_user = User.get_or_create('other').id
+        for i in range(40):
+            day = date(2024, 1, 1) + timedelta(days=i)
+            db.session.add(HealthData.create(day, 'oura', 'sleep_score', 70.0 + (i * 7) % 20, 'score'))
+            db.session.add(HealthData.create(day, 'chronometer', 'Protein', 60.0 + (i * 13) % 50, 'g'))
+        db.session.commit()
+
+    def tearDown(self):
+        self.pool.shutdown()
+        db.engine.dispose()
+        super().tearDown()
+        os.unlink(self.pool_db_path)
+
+    def test_offloaded_api_matches_inline(self):
+        """Test that offloaded calculations give the inline results, for the request's user."""
+        request = {'metrics': [{'name': 'sleep_score', 'source': 'oura'}, {'name': 'Protein', 'source': 'chronometer'}],
+                   'window': 14}
+        response = self.client.post('/analysis/api/rolling-correlation', json=request)
+        self.assertEqual(response.status_code, 200)
+        inline = HealthAnalyzer().calculate_rolling_correlations(
+            [('sleep_score', 'oura', 'Protein', 'chronometer')], 14)
+        self.assertEqual(response.get_json()['results'][0]['summary'], inline['results'][0]['summary'])
+
+        analyzer = request_analyzer(user_id=self.other_user)
+        self.assertIsInstance(analyzer, OffloadedAnalyzer)
+        self.assertEqual(analyzer.get_available_metrics(), [])
+        result = analyzer.calculate_correlation('sleep_score', 'oura', 'Protein', 'chronometer')
+        self.assertIn('error', result)
+
+    def test_workers_size_their_own_resampling(self):
+        """Test that an n_jobs sized for the server is not passed on to a worker."""
+        done = Future()
+        done.set_result(({}, 0.0))
+        with patch.object(self.pool, 'submit', return_value=done) as submit:
+            request_analyzer().calculate_correlation('sleep_score', 'oura', 'Protein', 'chronometer',
+                                                     n_resamples=100, n_jobs=8)
+
+        args = submit.call_args.args
+        self.assertIs(args[0], _call_analyzer)
+        self.assertEqual(args[2], 'calculate_correlation')
+        self.assertEqual(args[4], {'n_resamples': 100})
+
+    def test_light_calls_run_inline(self):
+        """Test that calls using little CPU time stay inline and resampling calls are offloaded."""
+        self.pool.min_seconds = 0.25
+        analyzer = request_analyzer()
+        with patch.object(self.pool, 'submit') as submit:
+            analyzer.calculate_correlation('sleep_score', 'oura', 'Protein', 'chronometer')
+        submit.assert_not_called()
+        self.assertLess(self.pool._durations[('calculate_correlation', False)], 0.25)
+        self.assertTrue(self.pool.offloads(('calculate_correlation', True)))
+
+        # A kind of call is offloaded once its running mean CPU time reaches the threshold
+        self.pool.record(('calculate_correlation', False), 5.0)
+        self.assertTrue(self.pool.offloads(('calculate_correlation', False)))
@@ -0,0 +1,446 @@
+import unittest
+import sys
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from multiprocessing.shared_memory import SharedMemory
+from scipy import stats
+
+# Add the parent directory to the path to make app importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.correlation import (
+    rolling_pearson, pairwise_pearson, pearson_pvalues, lag_scan, benjamini_hochberg,
+    bootstrap_confidence_interval, permutation_pvalue, permutation_test_matrix,
+    bootstrap_ci_matrix, partial_pearson, ols_fit, pairwise_correlations, SharedArrays, _call_shared,
+    _run_tasks, worker_pool
+)
+
+
+def _sleep_task(arrays, seconds):
+    """Pool task that reads the shared arrays after sleeping"""
+    time.sleep(seconds)
+    return float(arrays['x'].sum())
+
+
+class RollingPearsonTestCase(unittest.TestCase):
+    """Test case for the incremental rolling correlation kernel."""
+    
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.x = rng.normal(50, 10, 400)
+        self.y = 0.5 * self.x + rng.normal(0, 5, 400)
+    
+    def test_matches_pandas_rolling_corr(self):
+        """Test that results match pandas' per-window computation."""
+        coefficients, counts = rolling_pearson(self.x, self.y, 30)
+        expected = pd.Series(self.x).rolling(30).corr(pd.Series(self.y)).to_numpy()
+        
+        np.testing.assert_allclose(coefficients[29:], expected[29:], atol=1e-10)
+        self.assertTrue(np.isnan(coefficients[:29]).all())
+        self.assertEqual(counts[-1], 30)
+    
+    def test_missing_values(self):
+        """Test that windows only use rows where both series have data."""
+        x = self.x.copy()
+        y = self.y.copy()
+        x[10:40] = np.nan
+        y[100:105] = np.nan
+        
+        coefficients, counts = rolling_pearson(x, y, 30, min_periods=10)
+        expected = pd.Series(x).rolling(30, min_periods=10).corr(pd.Series(y)).to_numpy()
+        
+        np.testing.assert_allclose(coefficients, expected, atol=1e-10, equal_nan=True)
+        self.assertEqual(counts[39], 0)
+    
+    def test_many_pairs_at_once(self):
+        """Test that 2-D input computes each column pair independently."""
+        x = np.column_stack([self.x, self.y, self.x])
+        y = np.column_stack([self.y, self.x, -self.x])
+        
+        coefficients, _ = rolling_pearson(x, y, 20)
+        single, _ = rolling_pearson(self.x, self.y, 20)
+        
+        self.assertEqual(coefficients.shape, (400, 3))
+        np.testing.assert_allclose(coefficients[:, 0], single, equal_nan=True)
+        np.testing.assert_allclose(coefficients[:, 1], single, equal_nan=True)
+        np.testing.assert_allclose(coefficients[19:, 2], -1.0)
+    
+    def test_constant_window_is_nan(self):
+        """Test that windows with zero variance yield NaN instead of noise."""
+        x = np.ones(50)
+        coefficients, _ = rolling_pearson(x, self.y[:50], 10)
+        self.assertTrue(np.isnan(coefficients).all())
+    
+    def test_invalid_window(self):
+        """Test that windows shorter than two days are rejected."""
+        with self.assertRaises(ValueError):
+            rolling_pearson(self.x, self.y, 1)
+
+
+class PairwisePearsonTestCase(unittest.TestCase):
+    """Test case for the masked all-pairs correlation kernel."""
+    
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        base = rng.normal(size=(200, 1))
+        self.x = base + rng.normal(scale=0.5, size=(200, 4))
+        self.y = -base + rng.normal(scale=0.8, size=(200, 3))
+        # Knock out different days in different columns
+        self.x[rng.random((200, 4)) < 0.15] = np.nan
+        self.y[rng.random((200, 3)) < 0.15] = np.nan
+    
+    def test_matches_pandas_pairwise_complete(self):
+        """Test that every pair matches pandas' pairwise-complete correlation."""
+        coefficients, counts = pairwise_pearson(self.x, self.y)
+        frame = pd.DataFrame(np.hstack([self.x, self.y]))
+        expected = frame.corr().to_numpy()[:4, 4:]
+        
+        np.testing.assert_allclose(coefficients, expected, atol=1e-10)
+        self.assertEqual(counts.shape, (4, 3))
+        self.assertEqual(counts[0, 0], int((~np.isnan(self.x[:, 0]) & ~np.isnan(self.y[:, 0])).sum()))
+    
+    def test_pvalues_match_scipy(self):
+        """Test that t-distribution p-values match scipy's pearsonr."""
+        coefficients, counts = pairwise_pearson(self.x, self.y)
+        p_values = pearson_pvalues(coefficients, counts)
+        
+        mask = ~np.isnan(self.x[:, 1]) & ~np.isnan(self.y[:, 2])
+        r, p = stats.pearsonr(self.x[mask, 1], self.y[mask, 2])
+        self.assertAlmostEqual(coefficients[1, 2], r, places=10)
+        self.assertAlmostEqual(p_values[1, 2], p, places=8)
+    
+    def test_min_periods(self):
+        """Test that pairs with too little overlap are NaN."""
+        coefficients, _ = pairwise_pearson(self.x[:5], self.y[:5], min_periods=10)
+        self.assertTrue(np.isnan(coefficients).all())
+
+
+class LagScanTestCase(unittest.TestCase):
+    """Test case for the lag-scan cross-correlation kernel."""
+    
+    def test_matches_shifted_correlations(self):
+        """Test each lag against an explicit shift and correlation."""
+        rng = np.random.default_rng(3)
+        target = rng.normal(size=300)
+        # The second metric leads the target by two days
+        leader = np.concatenate([target[2:], rng.normal(size=2)]) + rng.normal(scale=0.3, size=300)
+        other = rng.normal(size=300)
+        other[50:60] = np.nan
+        y = np.column_stack([leader, other])
+        
+        lags, coefficients, counts = lag_scan(target, y, 5)
+        
+        self.assertEqual(list(lags), list(range(-5, 6)))
+        self.assertEqual(coefficients.shape, (11, 2))
+        for i, lag in enumerate(lags):
+            for j in range(2):
+                expected = pd.Series(target).corr(pd.Series(y[:, j]).shift(lag))
+                self.assertAlmostEqual(coefficients[i, j], expected, places=10)
+        
+        self.assertEqual(lags[np.nanargmax(np.abs(coefficients[:, 0]))], 2)
+        self.assertEqual(counts[5, 0], 300)
+        self.assertEqual(counts[0, 0], 295)
+
+
+class ResamplingTestCase(unittest.TestCase):
+    """Test case for the bootstrap, permutation and FDR helpers."""
+    
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.x = rng.normal(size=80)
+        self.y = 0.5 * self.x + rng.normal(size=80)
+    
+    def test_benjamini_hochberg_matches_reference(self):
+        """Test q-values against scipy's BH adjustment."""
+        p_values = np.array([0.01, 0.04, 0.03, 0.2, np.nan])
+        q_values = benjamini_hochberg(p_values)
+        
+        np.testing.assert_allclose(q_values[:4], stats.false_discovery_control(p_values[:4]))
+        np.testing.assert_allclose(q_values[:4], [0.04, 0.16 / 3, 0.16 / 3, 0.2])
+        self.assertTrue(np.isnan(q_values[4]))
+    
+    def test_bootstrap_interval_contains_estimate(self):
+        """Test that the bootstrap interval brackets the observed correlation."""
+        observed = stats.pearsonr(self.x, self.y)[0]
+        result = bootstrap_confidence_interval(self.x, self.y, n_resamples=400, seed=1)
+        
+        self.assertLess(result['low'], observed)
+        self.assertGreater(result['high'], observed)
+        self.assertEqual(result['n_resamples'], 400)
+        self.assertFalse(result['truncated'])
+    
+    def test_seeded_results_do_not_depend_on_workers(self):
+        """Test that a seed gives the same answer inline and on a process pool."""
+        inline = permutation_pvalue(self.x, self.y, n_resamples=300, seed=5, batch_size=100)
+        pooled = permutation_pvalue(self.x, self.y, n_resamples=300, seed=5, batch_size=100, n_jobs=2)
+        
+        self.assertEqual(inline, pooled)
+        self.assertLess(inline['p_value'], 0.01)
+    
+    def test_permutation_matrix(self):
+        """Test the table-wide permutation test on related and unrelated columns."""
+        rng = np.random.default_rng(2)
+        noise = rng.normal(size=80)
+        p_values, used, truncated = permutation_test_matrix(
+            np.column_stack([self.x, noise]), self.y[:, None], n_resamples=200, seed=3
+        )
+        
+        self.assertEqual(p_values.shape, (2, 1))
+        self.assertEqual(used, 200)
+        self.assertFalse(truncated)
+        self.assertLess(p_values[0, 0], 0.01)
+        self.assertGreater(p_values[1, 0], 0.01)
+    
+    def test_spearman_matrix_ranks_each_pair(self):
+        """Test that Spearman with missing days permutes ranks of each pair's complete rows."""
+        x = np.column_stack([self.x, self.x ** 3])
+        x[::7, 0] = np.nan
+        p_values, used, truncated = permutation_test_matrix(
+            x, self.y[:, None], n_resamples=200, seed=3, method='spearman'
+        )
+        
+        self.assertEqual(used, 200)
+        self.assertFalse(truncated)
+        seeds = np.random.SeedSequence(3).generate_state(2).tolist()
+        for i in range(2):
+            rows = ~np.isnan(x[:, i])
+            expected = permutation_pvalue(x[rows, i], self.y[rows], 200, 'spearman', seeds[i])
+            self.assertEqual(p_values[i, 0], expected['p_value'])
+    
+    def test_pearson_matrix_with_gaps_matches_pairs(self):
+        """Test that pairs with missing days get the p-value of their own complete rows."""
+        rng = np.random.default_rng(6)
+        x = rng.normal(size=(365, 2))
+        y = 0.5 * x[:, :1] + rng.normal(size=(365, 1))
+        # The second x column only overlaps y on 100 days, as sources covering different ranges do
+        y = np.column_stack([y, y])
+        y[:265, 1] = np.nan
+        x[:, 1] = x[:, 0]
+        p_values, used, truncated = permutation_test_matrix(x, y, n_resamples=500, seed=8)
+        
+        self.assertEqual(used, 500)
+        self.assertFalse(truncated)
+        seeds = np.random.SeedSequence(8).generate_state(4).tolist()
+        for i, j in ((0, 1), (1, 1)):
+            rows = ~np.isnan(y[:, j])
+            expected = permutation_pvalue(x[rows, i], y[rows, j], 500, 'pearson', seeds[j * 2 + i])
+            self.assertEqual(p_values[i, j], expected['p_value'])
+        self.assertLess(p_values[0, 1], 0.01)
+        self.assertLess(p_values[0, 0], 0.01)
+    
+    def test_bootstrap_ci_matrix(self):
+        """Test per-cell bootstrap intervals against the single-pair interval."""
+        rng = np.random.default_rng(4)
+        x = np.column_stack([self.x, rng.normal(size=80)])
+        y = np.column_stack([self.y, self.y[::-1]])
+        y[:5, 1] = np.nan
+        low, high, truncated = bootstrap_ci_matrix(x, y, n_resamples=300, seed=2)
+        
+        self.assertEqual(low.shape, (2, 2))
+        self.assertFalse(truncated)
+        self.assertTrue(np.all(low < high))
+        self.assertGreater(low[0, 0], 0)
+        
+        seeds = np.random.SeedSequence(2).generate_state(4).tolist()
+        rows = ~np.isnan(y[:, 1])
+        expected = bootstrap_confidence_interval(x[rows, 1], y[rows, 1], 300, seed=seeds[3])
+        self.assertAlmostEqual(low[1, 1], expected['low'])
+        self.assertAlmostEqual(high[1, 1], expected['high'])
+    
+    def test_time_budget_truncates(self):
+        """Test that an exhausted time budget stops before all batches run."""
+        result = permutation_pvalue(self.x, self.y, n_resamples=5000, seed=5,
+                                    batch_size=10, time_budget=0)
+        
+        self.assertTrue(result['truncated'])
+        self.assertLess(result['n_resamples'], 5000)
+
+
+class CorrelationTableTestCase(unittest.TestCase):
+    """Test case for per-pair correlation tables on the worker pool."""
+    
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        latent = rng.normal(size=120)
+        self.x = latent[:, None] * rng.uniform(-1, 1, 6) + rng.normal(size=(120, 6))
+        self.y = latent[:, None] * rng.uniform(-1, 1, 5) + rng.normal(size=(120, 5))
+        self.x[rng.random(self.x.shape) < 0.1] = np.nan
+        self.y[rng.random(self.y.shape) < 0.1] = np.nan
+        self.y[:, 4] = np.nan
+        self.y[:3, 4] = 1.0
+    
+    def test_matches_scipy_per_pair(self):
+        """Test that every cell matches scipy on the pair's complete rows."""
+        for method, test in (('pearson', stats.pearsonr), ('spearman', stats.spearmanr),
+                             ('kendall', stats.kendalltau)):
+            table = pairwise_correlations(self.x, self.y, method, min_pairs=10)
+            for i in range(6):
+                for j in range(4):
+                    rows = ~np.isnan(self.x[:, i]) & ~np.isnan(self.y[:, j])
+                    expected = test(self.x[rows, i], self.y[rows, j])
+                    self.assertAlmostEqual(table['coefficients'][i, j], expected[0], places=12)
+                    self.assertAlmostEqual(table['p_values'][i, j], expected[1], places=12)
+                    self.assertEqual(table['valid_pairs'][i, j], rows.sum())
+            # Three rows are too few to correlate
+            self.assertTrue(np.all(table['valid_pairs'][:, 4] <= 3))
+            self.assertTrue(np.all(np.isnan(table['coefficients'][:, 4])))
+    
+    def test_filled_rows(self):
+        """Test that filled copies are correlated once a pair has enough original rows."""
+        x_filled = pd.DataFrame(self.x).interpolate().to_numpy()
+        y_filled = pd.DataFrame(self.y).interpolate().to_numpy()
+        table = pairwise_correlations(self.x, self.y, min_pairs=10, x_filled=x_filled, y_filled=y_filled)
+        
+        rows = ~np.isnan(x_filled[:, 0]) & ~np.isnan(y_filled[:, 1])
+        self.assertGreater(table['calc_pairs'][0, 1], table['valid_pairs'][0, 1])
+        self.assertEqual(table['calc_pairs'][0, 1], rows.sum())
+        self.assertAlmostEqual(table['coefficients'][0, 1],
+                               stats.pearsonr(x_filled[rows, 0], y_filled[rows, 1])[0], places=12)
+        self.assertEqual(table['calc_pairs'][0, 4], 0)
+    
+    def test_pool_matches_inline(self):
+        """Test that a table split across worker processes reassembles to the inline result."""
+        inline = pairwise_correlations(self.x, self.y, 'spearman', min_pairs=2)
+        pooled = pairwise_correlations(self.x, self.y, 'spearman', min_pairs=2, n_jobs=2, min_parallel_pairs=1)
+        
+        for key in ('coefficients', 'p_values', 'valid_pairs', 'calc_pairs'):
+            np.testing.assert_array_equal(pooled[key], inline[key])
+        self.assertEqual(pooled['errors'], inline['errors'])
+        
+        with self.assertRaises(ValueError):
+            pairwise_correlations(self.x, self.y, 'distance')
+    
+    def test_shared_arrays_released(self):
+        """Test that shared arrays round-trip and their block is unlinked on exit."""
+        with SharedArrays(x=self.x, flags=np.arange(5)) as shared:
+            totals = _call_shared(lambda arrays, task: {k: np.nansum(v) for k, v in arrays.items()},
+                                  shared.spec, None)
+            name = shared.spec[0]
+        
+        self.assertAlmostEqual(totals['x'], np.nansum(self.x))
+        self.assertEqual(totals['flags'], 10)
+        with self.assertRaises(FileNotFoundError):
+            SharedMemory(name=name)
+    
+    def test_time_budget_waits_for_running_tasks(self):
+        """Test that an exhausted budget skips queued tasks but lets running ones finish."""
+        worker_pool(2).submit(abs, 1).result()
+        
+        started = time.monotonic()
+        results = _run_tasks(_sleep_task, [0.5] * 8, {'x': np.arange(4.0)}, n_jobs=2, time_budget=0.1)
+        elapsed = time.monotonic() - started
+        
+        finished = [result for result in results if result is not None]
+        self.assertGreaterEqual(elapsed, 0.45)
+        self.assertLess(elapsed, 1.9)
+        self.assertTrue(1 <= len(finished) <= 3)
+        self.assertEqual(set(finished), {6.0})
+
+
+class PartialPearsonTestCase(unittest.TestCase):
+    """Test case for the batched partial correlation kernel."""
+    
+    def setUp(self):
+        rng = np.random.default_rng(21)
+        self.energy = rng.normal(2000, 300, 200)
+        self.x = 0.02 * self.energy + rng.normal(size=200)
+        self.y = np.column_stack([
+            0.03 * self.energy + rng.normal(size=200),
+            self.x + rng.normal(size=200)
+        ])
+        self.y[10:15, 0] = np.nan
+    
+    def _residual_correlation(self, x, y, z):
+        """Reference: correlate the residuals of explicit least-squares fits."""
+        valid = ~np.isnan(x) & ~np.isnan(y) & ~np.isnan(z).any(axis=1)
+        design = np.column_stack([np.ones(valid.sum()), z[valid]])
+        residual = lambda v: v - design @ np.linalg.lstsq(design, v, rcond=None)[0]
+        return stats.pearsonr(residual(x[valid]), residual(y[valid]))[0], valid.sum()
+    
+    def test_matches_residual_correlation(self):
+        """Test every column against a separate residual-on-residual fit."""
+        z = self.energy[:, None]
+        coefficients, counts = partial_pearson(self.x, self.y, z)
+        
+        for j in range(2):
+            expected, n = self._residual_correlation(self.x, self.y[:, j], z)
+            self.assertAlmostEqual(coefficients[j], expected, places=10)
+            self.assertEqual(counts[j], n)
+        
+        # Controlling for the shared driver removes the spurious correlation
+        self.assertGreater(pairwise_pearson(self.x[:, None], self.y[:, :1])[0][0, 0], 0.5)
+        self.assertLess(abs(coefficients[0]), 0.2)
+    
+    def test_without_covariates_is_pearson(self):
+        """Test that an empty covariate set reduces to plain correlation."""
+        coefficients, _ = partial_pearson(self.x, self.y, np.empty((200, 0)))
+        expected, _ = pairwise_pearson(self.x[:, None], self.y)
+        
+        np.testing.assert_allclose(coefficients, expected[0], atol=1e-10)
+    
+    def test_column_explained_by_covariate(self):
+        """Test that a column equal to a covariate gives NaN instead of noise."""
+        coefficients, _ = partial_pearson(self.x, self.energy, self.energy[:, None])
+        
+        self.assertTrue(np.isnan(coefficients))
+    
+    def test_pvalues_lose_a_degree_per_covariate(self):
+        """Test partial p-values against the t distribution with n - 2 - k dof."""
+        p_value = pearson_pvalues(0.3, 20, n_covariates=2)
+        t_stat = 0.3 * np.sqrt(16 / (1 - 0.09))
+        
+        self.assertAlmostEqual(float(p_value), 2 * stats.t.sf(t_stat, 16), places=12)
+
+
+class OlsFitTestCase(unittest.TestCase):
+    """Test case for the multi-target least-squares fit."""
+    
+    def test_matches_single_predictor_regression(self):
+        """Test slope, standard error and p-value against scipy's linregress."""
+        rng = np.random.default_rng(8)
+        x = rng.normal(size=60)
+        y = 2.5 * x + 1.0 + rng.normal(size=60)
+        
+        fit = ols_fit(x, y)
+        reference = stats.linregress(x, y)
+        
+        self.assertAlmostEqual(fit['coefficients'][0, 0], reference.slope, places=10)
+        self.assertAlmostEqual(fit['intercept'][0], reference.intercept, places=10)
+        self.assertAlmostEqual(fit['std_errors'][0, 0], reference.stderr, places=10)
+        self.assertAlmostEqual(fit['p_values'][0, 0], reference.pvalue, places=10)
+        self.assertAlmostEqual(fit['standardized'][0, 0], reference.rvalue, places=10)
+        self.assertAlmostEqual(fit['r_squared'][0], reference.rvalue ** 2, places=10)
+    
+    def test_multiple_targets_with_different_gaps(self):
+        """Test that targets missing on different days match separate fits."""
+        rng = np.random.default_rng(9)
+        X = rng.normal(size=(80, 3))
+        Y = X @ rng.normal(size=(3, 4)) + rng.normal(size=(80, 4))
+        Y[:5, 1] = np.nan
+        Y[40:50, 3] = np.nan
+        X[70, 2] = np.nan
+        
+        fit = ols_fit(X, Y)
+        
+        for t in range(4):
+            valid = ~np.isnan(X).any(axis=1) & ~np.isnan(Y[:, t])
+            design = np.column_stack([np.ones(valid.sum()), X[valid]])
+            expected = np.linalg.lstsq(design, Y[valid, t], rcond=None)[0]
+            np.testing.assert_allclose(fit['coefficients'][t], expected[1:], atol=1e-10)
+            self.assertAlmostEqual(fit['intercept'][t], expected[0], places=10)
+            self.assertEqual(fit['counts'][t], valid.sum())
+    
+    def test_too_few_days(self):
+        """Test that a target with fewer days than parameters is left as NaN."""
+        X = np.arange(12, dtype=float).reshape(4, 3)
+        fit = ols_fit(X, np.arange(4, dtype=float))
+        
+        self.assertTrue(np.isnan(fit['r_squared'][0]))
+        self.assertTrue(np.isnan(fit['coefficients']).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# Add the parent directory to the path to make app importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.downsampling import lttb_indices, minmax_indices, aggregate_periods, reduce_series
+
+
+def reference_lttb(x, y, threshold):
+    """Point-by-point LTTB as usually written, for comparison"""
+    n = len(x)
+    every = (n - 2) / (threshold - 2)
+    selected, a = [0], 0
+    for i in range(threshold - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        next_lo, next_hi = hi, min(int((i + 2) * every) + 1, n)
+        if i == threshold - 3:
+            avg_x, avg_y = x[-1], y[-1]
+        else:
+            avg_x, avg_y = np.mean(x[next_lo:next_hi]), np.mean(y[next_lo:next_hi])
+        areas = [abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a])) for j in range(lo, hi)]
+        a = lo + int(np.argmax(areas))
+        selected.append(a)
+    return selected + [n - 1]
+
+
+class DownsamplingTestCase(unittest.TestCase):
+    """Test case for series downsampling and period aggregation."""
+    
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.dates = np.arange(np.datetime64('2020-01-01'), np.datetime64('2024-01-01'))
+        self.values = np.cumsum(rng.normal(size=len(self.dates)))
+    
+    def test_lttb_matches_reference(self):
+        """Test that the bucketed LTTB picks the same points as the textbook version."""
+        x = self.dates.astype(np.int64).astype(float)
+        for threshold in (3, 50, 333):
+            indices = lttb_indices(x, self.values, threshold)
+            self.assertEqual(indices.tolist(), reference_lttb(x, self.values, threshold))
+        
+        self.assertEqual(lttb_indices(x[:10], self.values[:10], 50).tolist(), list(range(10)))
+        self.assertEqual(lttb_indices(x, self.values, 2).tolist(), [0, len(x) - 1])
+    
+    def test_minmax_keeps_extremes(self):
+        """Test that min/max buckets stay within budget and keep the extremes and ends."""
+        indices = minmax_indices(self.values, 100)
+        
+        self.assertLessEqual(len(indices), 100)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        for i in (0, len(self.values) - 1, self.values.argmin(), self.values.argmax()):
+            self.assertIn(i, indices)
+    
+    def test_aggregate_periods_matches_pandas(self):
+        """Test weekly and monthly means against pandas resampling."""
+        keep = np.random.default_rng(4).random(len(self.dates)) > 0.2
+        series = pd.Series(self.values[keep], index=pd.DatetimeIndex(self.dates[keep]))
+        for resolution, rule in (('week', 'W-MON'), ('month', 'MS')):
+            dates, means, counts = aggregate_periods(self.dates[keep], self.values[keep], resolution)
+            expected = series.resample(rule, label='left', closed='left').agg(['mean', 'count'])
+            expected = expected[expected['count'] > 0]
+            
+            np.testing.assert_array_equal(dates, expected.index.values.astype('datetime64[D]'))
+            np.testing.assert_allclose(means, expected['mean'])
+            np.testing.assert_array_equal(counts, expected['count'])
+        
+        # Weeks start on Mondays
+        weeks, _, _ = aggregate_periods(self.dates, self.values, 'week')
+        self.assertTrue(np.all(pd.DatetimeIndex(weeks).dayofweek == 0))
+    
+    def test_reduce_series_budget(self):
+        """Test that every resolution respects the point budget."""
+        for resolution in ('day', 'week', 'month'):
+            for method in ('lttb', 'minmax'):
+                dates, values, counts = reduce_series(self.dates, self.values, resolution, 40, method)
+                self.assertLessEqual(len(values), 40)
+                self.assertEqual(len(dates), len(values))
+                self.assertEqual(counts is None, resolution == 'day')
+        
+        dates, values, _ = reduce_series(self.dates, self.values, 'month')
+        self.assertEqual(len(values), 48)
+        with self.assertRaises(ValueError):
+            reduce_series(self.dates, self.values, 'hour')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import json
+import sys
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# Add the parent directory to the path to make app importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.utils.json_provider import (NumpyJSONProvider, OrjsonProvider, orjson, date_strings,
+                                     nullable_floats)
+
+
+class JSONProviderTestCase(unittest.TestCase):
+    """Test cases for the JSON providers and payload helpers"""
+
+    def setUp(self):
+        self.payload = {
+            'count': np.int64(3),
+            'mean': np.float32(0.5),
+            'values': np.array([1.5, 2.0]),
+            'days': np.array(['2025-03-01', '2025-03-02'], dtype='datetime64[D]'),
+            'day': date(2025, 3, 1),
+            'label': 'sleep'
+        }
+        self.expected = {
+            'count': 3, 'mean': 0.5, 'values': [1.5, 2.0], 'days': ['2025-03-01', '2025-03-02'],
+            'day': 'Sat, 01 Mar 2025 00:00:00 GMT', 'label': 'sleep'
+        }
+
+    def test_stdlib_provider_encodes_numpy(self):
+        """Test that NumPy scalars and arrays are encoded, and dates keep Flask's format."""
+        app = create_app('testing', {'JSON_BACKEND': 'stdlib'})
+        self.assertIsInstance(app.json, NumpyJSONProvider)
+        self.assertNotIsInstance(app.json, OrjsonProvider)
+        self.assertEqual(json.loads(app.json.dumps(self.payload)), self.expected)
+
+        with app.test_request_context():
+            response = app.json.response(self.payload)
+        self.assertEqual(response.get_json(), self.expected)
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_provider_matches_stdlib(self):
+        """Test that the orjson provider produces the same documents as the standard library one."""
+        app = create_app('testing', {'JSON_BACKEND': 'orjson'})
+        self.assertIsInstance(app.json, OrjsonProvider)
+        self.assertEqual(json.loads(app.json.dumps(self.payload)), self.expected)
+        self.assertEqual(json.loads(app.json.dumps({'value': np.nan})), {'value': None})
+
+    def test_backend_choice(self):
+        """Test that JSON_BACKEND is validated, and auto uses orjson only when installed."""
+        app = create_app('testing')
+        self.assertIs(type(app.json), OrjsonProvider if orjson is not None else NumpyJSONProvider)
+        with self.assertRaises(ValueError):
+            create_app('testing', {'JSON_BACKEND': 'ujson'})
+        if orjson is None:
+            with self.assertRaises(RuntimeError):
+                create_app('testing', {'JSON_BACKEND': 'orjson'})
+
+    def test_payload_helpers(self):
+        """Test date strings from several date types, and NaN as None."""
+        expected = ['2025-03-01', '2025-03-02']
+        self.assertEqual(date_strings(pd.Index([date(2025, 3, 1), date(2025, 3, 2)])), expected)
+        self.assertEqual(date_strings(pd.date_range('2025-03-01', periods=2)), expected)
+        self.assertEqual(date_strings([]), [])
+        self.assertEqual(nullable_floats(np.array([1.0, np.nan])), [1.0, None])
+        self.assertEqual(nullable_floats(pd.Series([1, 2])), [1.0, 2.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import sys
+import os
+import json
+
+# Add the parent directory to the path to make app importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.json_stream import iter_json_records
+
+
+def _chunks(document, size):
+    """Split an encoded JSON document into fixed-size byte chunks"""
+    encoded = json.dumps(document, indent=1).encode('utf-8')
+    return [encoded[i:i + size] for i in range(0, len(encoded), size)]
+
+
+class IterJsonRecordsTestCase(unittest.TestCase):
+    """Test case for the incremental JSON array reader."""
+    
+    def setUp(self):
+        self.records = [
+            {'day': '2023-01-01', 'score': 81, 'ratio': 1.25e-3, 'flag': True, 'note': None},
+            {'day': '2023-01-02', 'score': -12, 'label': 'café "quoted"', 'items': [60.5, 61, 62.25]},
+            12345.5
+        ]
+        self.document = {'meta': {'count': [1, 2]}, 'data': self.records, 'next_token': None}
+    
+    def test_matches_json_loads_for_any_chunk_size(self):
+        """Test that records split across chunks (mid-number, mid-string, mid-UTF-8) are decoded intact."""
+        for size in (1, 2, 3, 7, 64, 10 ** 6):
+            with self.subTest(size=size):
+                self.assertEqual(list(iter_json_records(_chunks(self.document, size))), self.records)
+    
+    def test_records_are_yielded_lazily(self):
+        """Test that the first record is available before the rest of the stream is read."""
+        consumed = []
+        
+        def chunks():
+            for chunk in _chunks(self.document, 16):
+                consumed.append(chunk)
+                yield chunk
+        
+        records = iter_json_records(chunks())
+        self.assertEqual(next(records), self.records[0])
+        self.assertLess(len(consumed), len(_chunks(self.document, 16)))
+    
+    def test_skip_paths(self):
+        """Test that skipped key paths are removed from each record."""
+        records = list(iter_json_records(_chunks(self.document, 5), skip=[('items',), ('meta', 'x'), ('note',)]))
+        self.assertNotIn('note', records[0])
+        self.assertNotIn('items', records[1])
+        self.assertEqual(records[2], 12345.5)
+    
+    def test_empty_and_missing_data(self):
+        """Test documents without records."""
+        self.assertEqual(list(iter_json_records([b'{}'])), [])
+        self.assertEqual(list(iter_json_records([b'{"data": []}'])), [])
+        self.assertEqual(list(iter_json_records([b'{"next_token": "abc"}'])), [])
+        self.assertEqual(list(iter_json_records([' {"data" : [1 , 2] } '])), [1, 2])
+    
+    def test_truncated_document(self):
+        """Test that a truncated stream raises ValueError."""
+        with self.assertRaises(ValueError):
+            list(iter_json_records([b'{"data": [{"day": "2023-01-01"}, {"day": ']))
+        with self.assertRaises(ValueError):
+            list(iter_json_records([b'[1, 2]']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import sys
+from datetime import date, timedelta
+from unittest.mock import patch
+
+# Add the parent directory to the path to make app importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests.test_base import BaseTestCase
+from app import db
+from app.config import TestingConfig
+from app.models.base import HealthData
+from app.utils.metrics import Counter, Histogram
+
+
+class MetricTypesTestCase(BaseTestCase):
+    """Test case for the counter and histogram exposition format."""
+
+    def test_counter_and_histogram_samples(self):
+        """Test labelled samples, label escaping and cumulative buckets."""
+        counter = Counter('rows_total', 'Rows', ('source',))
+        counter.inc(3, source='oura')
+        counter.inc(source='say "hi"')
+        self.assertEqual(list(counter.samples()), [
+            'rows_total{source="oura"} 3',
+            'rows_total{source="say \\"hi\\""} 1',
+        ])
+
+        histogram = Histogram('latency_seconds', 'Latency', ('phase',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, phase='store')
+        self.assertEqual(list(histogram.samples()), [
+            'latency_seconds_bucket{phase="store",le="0.1"} 2',
+            'latency_seconds_bucket{phase="store",le="1.0"} 3',
+            'latency_seconds_bucket{phase="store",le="+Inf"} 4',
+            'latency_seconds_sum{phase="store"} 2.65',
+            'latency_seconds_count{phase="store"} 4',
+        ])
+
+
+class MetricsDisabledTestCase(BaseTestCase):
+    """Test case for the default app without metrics."""
+
+    def test_no_metrics_by_default(self):
+        """Test that /metrics is only served when enabled."""
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertNotIn('metrics', self.app.extensions)
+
+
+class MetricsTestCase(BaseTestCase):
+    """Test case for the /metrics endpoint and its instrumentation."""
+
+    CSV = """Day,Name,Quantity,Energy (kcal),Protein (g),Category
+2023-01-01,Oatmeal,100,150,5,Breakfast
+2023-01-02,Banana,1,105,1.3,Breakfast
+"""
+
+    def setUp(self):
+        with patch.object(TestingConfig, 'METRICS', True):
+            super().setUp()
+        self.metrics = self.app.extensions['metrics']
+        for i in range(20):
+            day = date(2023, 1, 1) + timedelta(days=i)
+            db.session.add(HealthData.create(day, 'custom', 'weight', 70.0 + i % 3, 'kg'))
+            db.session.add(HealthData.create(day, 'custom', 'steps', 5000.0 + i * 100, 'count'))
+        db.session.commit()
+
+    def _import(self, body):
+        response = self.client.post('/data/api/import/chronometer', data=body.encode('utf-8'), content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+
+    def test_request_latency(self):
+        """Test that requests are counted and timed per endpoint."""
+        for _ in range(3):
+            self.client.get('/analysis/api/metric_data?metric_name=weight&source=custom')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        text = response.get_data(as_text=True)
+        self.assertIn('# TYPE health_tracker_http_request_duration_seconds histogram', text)
+        self.assertIn('health_tracker_http_requests_total{endpoint="analysis.metric_data",method="GET",status="200"} 3', text)
+        self.assertIn('health_tracker_http_request_duration_seconds_count{endpoint="analysis.metric_data",method="GET"} 3', text)
+        self.assertIn('health_tracker_phase_duration_seconds_count{phase="analyzer.metric_data"} 3', text)
+        self.assertIn('# TYPE health_tracker_db_pool_connections gauge', text)
+
+    def test_import_rows(self):
+        """Test inserted, updated and unchanged row counts of Chronometer imports."""
+        self._import(self.CSV)
+        inserted = self.metrics.import_rows.value(source='chronometer', outcome='inserted')
+        self.assertGreater(inserted, 0)
+        self.assertEqual(self.metrics.import_rows.value(source='chronometer', outcome='updated'), 0)
+
+        self._import(self.CSV.replace('150,5', '160,5'))
+        self.assertEqual(self.metrics.import_rows.value(source='chronometer', outcome='inserted'), inserted)
+        self.assertEqual(self.metrics.import_rows.value(source='chronometer', outcome='updated'), 1)
+        self.assertGreater(self.metrics.import_rows.value(source='chronometer', outcome='unchanged'), 0)
+        self.assertEqual(self.metrics.phase_duration.count(phase='chronometer.store'), 2)
+
+    def test_frame_cache_hits(self):
+        """Test that metric frame cache lookups are counted as hits and misses."""
+        request = {'metrics': [{'name': 'weight', 'source': 'custom'}, {'name': 'steps', 'source': 'custom'}],
+                   'window': 7}
+        for _ in range(2):
+            response = self.client.post('/analysis/api/rolling-correlation', json=request)
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.metrics.cache_requests.value(cache='analyzer_frame', result='miss'), 1)
+        self.assertEqual(self.metrics.cache_requests.value(cache='analyzer_frame', result='hit'), 1)
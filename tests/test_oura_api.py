@@ -27,6 +27,13 @@ class MockOuraResponse:
         if self.status_code != 200:
             raise Exception(f"HTTP Error: {self.status_code}")
 
+class MockStreamingOuraResponse(MockOuraResponse):
+    """Mock response that also serves its body in small chunks, like requests with stream=True"""
+    def iter_content(self, chunk_size=1):
+        body = self.text.encode('utf-8')
+        for i in range(0, len(body), 7):
+            yield body[i:i + 7]
+
 class OuraAPITestCase(BaseTestCase):
     """Test case for the Oura API integration using personal token."""
     
@@ -219,6 +226,81 @@ class OuraAPITestCase(BaseTestCase):
         self.assertIsNotNone(source)
         self.assertEqual(source.source_type, 'api')
     
+    def test_process_sleep_data_multiple_sessions(self):
+        """Test that a day's sessions are combined and the long_sleep session supplies readiness."""
+        daily = {"data": [{"day": "2023-01-01", "score": 80, "contributors": {"rem_sleep": 70, "timing": 90}}]}
+        sessions = {"data": [
+            {"day": "2023-01-01", "type": "long_sleep", "average_heart_rate": 60, "average_hrv": 40,
+             "average_breath": 15, "time_in_bed": 27000, "rem_sleep_duration": 5400, "lowest_heart_rate": 50,
+             "readiness": {"score": 77, "contributors": {"hrv_balance": 66}}},
+            {"day": "2023-01-01", "type": "late_nap", "average_heart_rate": 70, "average_hrv": 30,
+             "average_breath": 16, "time_in_bed": 3000, "rem_sleep_duration": 600},
+            {"day": "2023-01-05", "type": "long_sleep", "average_heart_rate": 55}
+        ]}
+        
+        importer = OuraImporter(self.personal_token)
+        records = importer._process_sleep_data(sessions, daily)
+        values = {r['metric_name']: r['metric_value'] for r in records}
+        
+        # Sessions for days without a daily summary are ignored, and each metric appears once
+        self.assertEqual({r['date'] for r in records}, {date(2023, 1, 1)})
+        self.assertEqual(len(values), len(records))
+        
+        self.assertEqual(values['sleep_score'], 80)
+        self.assertEqual(values['rem_sleep_score'], 70)
+        self.assertEqual(values['sleep_timing_score'], 90)
+        self.assertEqual(values['rem_sleep'], 100)  # (5400 + 600) seconds in minutes
+        self.assertAlmostEqual(values['avg_hr'], 60 * 0.9 + 70 * 0.1)
+        self.assertEqual(values['lowest_hr'], 50)
+        self.assertEqual(values['readiness_score'], 77)
+        self.assertEqual(values['hrv_balance_score'], 66)
+        self.assertNotIn('deep_sleep', values)
+    
+    def test_process_sleep_data_session_stats(self):
+        """Test the optional spread of session averages across a day"""
+        daily = {"data": [{"day": "2023-01-01", "score": 80}]}
+        sessions = {"data": [
+            {"day": "2023-01-01", "average_heart_rate": 60, "average_hrv": 40, "average_breath": 15, "time_in_bed": 27000},
+            {"day": "2023-01-01", "average_heart_rate": 70, "average_hrv": 30, "average_breath": 16, "time_in_bed": 3000}
+        ]}
+        importer = OuraImporter(self.personal_token)
+        
+        values = {r['metric_name'] for r in importer._process_sleep_data(sessions, daily)}
+        self.assertNotIn('session_min_hr', values)
+        
+        self.app.config['OURA_SESSION_STATS'] = True
+        values = {r['metric_name']: r['metric_value'] for r in importer._process_sleep_data(sessions, daily)}
+        self.assertEqual(values['session_min_hr'], 60)
+        self.assertEqual(values['session_max_hr'], 70)
+        self.assertAlmostEqual(values['session_std_hr'], 3.0)  # sqrt(0.9 * 1 + 0.1 * 81)
+        self.assertEqual(values['session_min_hrv'], 30)
+        self.assertEqual(values['session_max_resp'], 16)
+    
+    @patch('app.utils.oura_importer.requests.get')
+    def test_import_sleep_data_streamed(self, mock_get):
+        """Test that streamed responses give the same records, without the high-resolution series."""
+        sleep_data = json.loads(json.dumps(self.mock_sleep_data))
+        for session in sleep_data['data']:
+            session['heart_rate'] = {'interval': 300.0, 'items': [55.0, None, 57.5]}
+        mock_get.side_effect = [
+            MockOuraResponse(json_data=self.mock_daily_sleep_data),
+            MockOuraResponse(json_data=self.mock_sleep_data)
+        ]
+        expected = OuraImporter(self.personal_token).import_sleep_data(self.start_date, self.end_date)
+        
+        mock_get.side_effect = [
+            MockStreamingOuraResponse(json_data=self.mock_daily_sleep_data),
+            MockStreamingOuraResponse(json_data=sleep_data)
+        ]
+        importer = OuraImporter(self.personal_token)
+        self.assertEqual(importer.import_sleep_data(self.start_date, self.end_date), expected)
+        self.assertTrue(mock_get.call_args.kwargs['stream'])
+        
+        mock_get.side_effect = None
+        mock_get.return_value = MockStreamingOuraResponse(json_data=sleep_data)
+        payload = importer._get_data("/v2/usercollection/sleep", stream=True)
+        self.assertTrue(all('heart_rate' not in session for session in payload['data']))
+    
     @patch('app.utils.oura_importer.requests.get')
     def test_import_activity_data(self, mock_get):
         """Test importing activity data from the Oura API."""
@@ -0,0 +1,166 @@
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+from unittest.mock import patch
+
+# Add the parent directory to the path to make app importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests.test_base import BaseTestCase
+from tests.oura_stub import OuraStubServer
+from app import db
+from app.config import TestingConfig
+from app.models.base import HealthData, SyncRun, User
+from app.utils.oura_sync import OuraSyncScheduler, RateBudget, RateLimited
+
+
+class FakeClock:
+    """Clock advanced only by its sleep method"""
+
+    def __init__(self, now=0.0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class RateBudgetTestCase(BaseTestCase):
+    """Test case for per-account request budgets."""
+
+    def test_limit_per_window(self):
+        """Test that no more than limit requests start in any period."""
+        clock = FakeClock()
+        budget = RateBudget(3, 3, clock=clock, sleep=clock.sleep)
+
+        waits = [budget.acquire() for _ in range(7)]
+        self.assertEqual(waits, [0.0, 0.0, 0.0, 3.0, 0.0, 0.0, 3.0])
+        self.assertEqual(clock.slept, [3.0, 3.0])
+        self.assertEqual(budget.requests, 7)
+
+        clock.now += 10
+        self.assertEqual([budget.acquire() for _ in range(3)], [0.0, 0.0, 0.0])
+
+    def test_max_wait_and_pause(self):
+        """Test that a paused budget refuses requests it cannot serve in time."""
+        clock = FakeClock()
+        budget = RateBudget(10, 10, max_wait=5, clock=clock, sleep=clock.sleep)
+        budget.pause(20)
+
+        with self.assertRaises(RateLimited) as raised:
+            budget.acquire()
+        self.assertAlmostEqual(raised.exception.retry_after, 20.0)
+        self.assertEqual(budget.requests, 0)
+
+        clock.now += 17
+        self.assertAlmostEqual(budget.acquire(), 3.0)
+
+
+class OuraSyncTestCase(BaseTestCase):
+    """Test case for scheduled Oura syncs against a local stub API."""
+
+    def setUp(self):
+        # Worker threads need connections of their own, so the app starts on a file database
+        fd, self.sync_db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        with patch.object(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{self.sync_db_path}'):
+            super().setUp()
+        self.stub = OuraStubServer().__enter__()
+        self.app.config.update(OURA_API_BASE_URL=self.stub.url, OURA_SYNC_LOOKBACK_DAYS=6)
+        self.users = []
+        for name in ('alice', 'bob', 'carol'):
+            user = User.get_or_create(name)
+            user.oura_token = f'{name}-token'
+            self.users.append(user.id)
+        User.get_or_create('no-oura')
+        db.session.commit()
+
+    def tearDown(self):
+        self.stub.__exit__(None, None, None)
+        db.engine.dispose()
+        super().tearDown()
+        os.unlink(self.sync_db_path)
+
+    def _runs(self, user_id):
+        return SyncRun.query.execution_options(user_id=user_id).order_by(SyncRun.started_at).all()
+
+    def test_sync_all_accounts(self):
+        """Test that every account with a token is synced into its own data and recorded."""
+        scheduler = OuraSyncScheduler(self.app, workers=2)
+        results = scheduler.run_once(now=float('inf'))
+
+        self.assertEqual(sorted(result.user_id for result in results), sorted(self.users))
+        self.assertTrue(all(result.status == 'ok' and result.row_count > 0 for result in results))
+        self.assertEqual(self.stub.tokens(), {f'{name}-token': 5 for name in ('alice', 'bob', 'carol')})
+
+        for user_id in self.users:
+            run, = self._runs(user_id)
+            self.assertEqual((run.status, run.request_count), ('ok', 5))
+            self.assertEqual(run.start_date, run.end_date - timedelta(days=6))
+            self.assertGreater(run.row_count, 0)
+            self.assertIsNotNone(run.duration)
+            days = db.session.query(HealthData.date).distinct().execution_options(user_id=user_id).count()
+            self.assertEqual(days, 7)
+
+    def test_incremental_jittered_schedule(self):
+        """Test that runs are spread by jitter and later syncs start near the last one's end."""
+        clock = FakeClock(1717243200.0)  # 2024-06-01 12:00 UTC
+        scheduler = OuraSyncScheduler(self.app, interval=3600, jitter=600, clock=clock, sleep=clock.sleep)
+
+        first = scheduler.schedule()
+        self.assertTrue(all(clock.now <= due < clock.now + 600 for due, *_ in first))
+        self.assertEqual(len({due for due, *_ in first}), 3)
+        self.assertEqual(scheduler.run_once(), [])
+
+        clock.now += 600
+        self.assertEqual(len(scheduler.run_once()), 3)
+        self.assertEqual(scheduler.run_once(), [])
+
+        for due, user_id, token, start_date in scheduler.schedule():
+            self.assertTrue(clock.now + 3300 <= due <= clock.now + 3900)
+            last = self._runs(user_id)[-1]
+            self.assertEqual(start_date, last.end_date - timedelta(days=2))
+
+        clock.now += 3900
+        self.assertEqual(len(scheduler.run_once()), 3)
+        self.assertEqual(len(self._runs(self.users[0])), 2)
+
+    def test_rate_limited_account(self):
+        """Test that a 429 is recorded and pauses only that account's budget."""
+        self.stub.rate_limited.add('bob-token')
+        scheduler = OuraSyncScheduler(self.app)
+        statuses = {result.user_id: result.status for result in scheduler.run_once(now=float('inf'))}
+
+        self.assertEqual(statuses[self.users[1]], 'rate_limited')
+        self.assertEqual(statuses[self.users[0]], 'ok')
+        self.assertIn('429', self._runs(self.users[1])[0].error)
+
+        # Retry-After (60 s) is longer than OURA_SYNC_MAX_WAIT, so the next sync is deferred without a request
+        requests = len(self.stub.requests)
+        result = scheduler.sync_account(self.users[1], 'bob-token', date.today())
+        self.assertEqual((result.status, result.request_count), ('rate_limited', 0))
+        self.assertEqual(len(self.stub.requests), requests)
+
+    def test_worker_pool_is_bounded(self):
+        """Test that no more accounts than workers are synced at once."""
+        self.stub.latency = 0.02
+        OuraSyncScheduler(self.app, workers=2).run_once(now=float('inf'))
+        self.assertLessEqual(self.stub.max_in_flight, 2)
+
+    def test_sync_command_and_history_api(self):
+        """Test the sync-oura command and the sync history endpoint."""
+        result = self.app.test_cli_runner().invoke(args=['sync-oura', '--once', '--workers', '1'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Synced 3 account(s)', result.output)
+        self.assertIn('5 requests', result.output)
+
+        with self.client.session_transaction() as session:
+            session['user_id'] = self.users[0]
+        runs = self.client.get('/data/api/sync-runs').get_json()
+        self.assertEqual(len(runs), 1)
+        self.assertEqual((runs[0]['status'], runs[0]['request_count']), ('ok', 5))
@@ -8,8 +8,9 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from tests.test_base import BaseTestCase
-from app.models.base import HealthData, DataType
+from app.models.base import HealthData, DataType, DataCoverage
 from app.utils.oura_importer import OuraImporter
+from app.utils.analyzer import HealthAnalyzer
 from app import db
 
 class MockOuraResponse:
@@ -237,23 +238,83 @@ class OuraTagsTestCase(BaseTestCase):
         end_date = "2023-01-04"
         processed_data = importer.import_tags_data(start_date, end_date)
         
-        # There should be data for all 4 days (Jan 1-4) for the mood_great tag
-        # Verify that the processed data contains entries for all days
-        self.assertEqual(len(processed_data), 4)  # One entry per day
-        
-        # Create a dictionary to check each day's tag count
-        day_counts = {}
-        for item in processed_data:
-            if item['metric_name'] == 'tag_mood_great':
-                day_counts[item['date']] = item['metric_value']
-        
-        # Verify counts for each day
-        jan1 = datetime.strptime("2023-01-01", "%Y-%m-%d").date()
-        jan2 = datetime.strptime("2023-01-02", "%Y-%m-%d").date()
-        jan3 = datetime.strptime("2023-01-03", "%Y-%m-%d").date()
-        jan4 = datetime.strptime("2023-01-04", "%Y-%m-%d").date()
-        
-        self.assertEqual(day_counts[jan1], 1)  # One tag on Jan 1
-        self.assertEqual(day_counts[jan2], 1)  # One tag on Jan 2
-        self.assertEqual(day_counts[jan3], 0)  # Zero tags on Jan 3
-        self.assertEqual(day_counts[jan4], 1)  # One tag on Jan 4 
\ No newline at end of file
+        # Only the three days with a tag are stored; Jan 3 is an implicit zero
+        self.assertEqual(len(processed_data), 3)
+        
+        tag_type = DataType.query.filter_by(source='oura', metric_name='tag_mood_great').first()
+        self.assertEqual(HealthData.query.filter_by(data_type_id=tag_type.id).count(), 3)
+        coverage = DataCoverage.query.filter_by(data_type_id=tag_type.id).one()
+        self.assertEqual((coverage.start_date, coverage.end_date), (date(2023, 1, 1), date(2023, 1, 4)))
+        
+        # Reading the metric densifies the covered range
+        points = HealthAnalyzer().get_metric_data('tag_mood_great', 'oura')
+        day_counts = {point.date: point.metric_value for point in points}
+        
+        self.assertEqual(len(day_counts), 4)  # One entry per day
+        self.assertEqual(day_counts[date(2023, 1, 1)], 1)  # One tag on Jan 1
+        self.assertEqual(day_counts[date(2023, 1, 2)], 1)  # One tag on Jan 2
+        self.assertEqual(day_counts[date(2023, 1, 3)], 0)  # Zero tags on Jan 3
+        self.assertEqual(day_counts[date(2023, 1, 4)], 1)  # One tag on Jan 4
+        
+        df = HealthAnalyzer().get_metric_dataframe()
+        self.assertEqual(list(df['oura:tag_mood_great']), [1, 1, 0, 1])
+        
+        # Covered days count towards the metric's number of days with data
+        metrics = {metric['metric_name']: metric for metric in HealthAnalyzer().get_available_metrics()}
+        self.assertEqual(metrics['tag_mood_great']['count'], 4)
+    
+    @patch('app.utils.oura_importer.requests.get')
+    def test_reimport_replaces_dense_rows(self, mock_get):
+        """Test that re-importing a range drops stale and explicit zero rows"""
+        tag_type = DataType(source='oura', metric_name='tag_mood_great', metric_units='count')
+        db.session.add(tag_type)
+        db.session.flush()
+        
+        # Rows as written by a dense import, plus a tag since removed in the app
+        for day, value in [(1, 1), (2, 0), (3, 2), (4, 0)]:
+            db.session.add(HealthData(date=date(2023, 1, day), data_type_id=tag_type.id, metric_value=value))
+        db.session.commit()
+        
+        mock_get.return_value = MockOuraResponse(json_data={"data": [
+            {"id": "1", "start_time": "2023-01-01T08:30:00+00:00", "tag_type_code": "mood_great"}
+        ]})
+        OuraImporter("test_token").import_tags_data("2023-01-01", "2023-01-04")
+        
+        stored = HealthData.query.filter_by(data_type_id=tag_type.id).all()
+        self.assertEqual([(row.date, row.metric_value) for row in stored], [(date(2023, 1, 1), 1)])
+        
+        points = HealthAnalyzer().get_metric_data('tag_mood_great', 'oura')
+        self.assertEqual([point.metric_value for point in points], [1, 0, 0, 0])
+        
+        # A second, adjacent import extends the same coverage record
+        mock_get.return_value = MockOuraResponse(json_data={"data": [
+            {"id": "2", "start_time": "2023-01-06T08:30:00+00:00", "tag_type_code": "mood_great"}
+        ]})
+        OuraImporter("test_token").import_tags_data("2023-01-05", "2023-01-07")
+        
+        coverage = DataCoverage.query.filter_by(data_type_id=tag_type.id).one()
+        self.assertEqual((coverage.start_date, coverage.end_date), (date(2023, 1, 1), date(2023, 1, 7)))
+        points = HealthAnalyzer().get_metric_data('tag_mood_great', 'oura', limit=3)
+        self.assertEqual([(point.date.day, point.metric_value) for point in points], [(5, 0), (6, 1), (7, 0)])
+    
+    def test_metric_counts_with_overlapping_coverage(self):
+        """Test that overlapping coverage days are counted once and coverage-only metrics are listed"""
+        tag_type = DataType(source='oura', metric_name='tag_mood_great', metric_units='count')
+        quiet_type = DataType(source='oura', metric_name='tag_quiet', metric_units='count')
+        db.session.add_all([tag_type, quiet_type])
+        db.session.flush()
+        
+        # Jan 1-4 and Jan 3-6 overlap; Jan 9 is stored outside both
+        db.session.add_all([
+            DataCoverage(data_type_id=tag_type.id, start_date=date(2023, 1, 1), end_date=date(2023, 1, 4)),
+            DataCoverage(data_type_id=tag_type.id, start_date=date(2023, 1, 3), end_date=date(2023, 1, 6),
+                         fill_value=1.0),
+            DataCoverage(data_type_id=quiet_type.id, start_date=date(2023, 1, 10), end_date=date(2023, 1, 12))
+        ])
+        for day in (2, 4, 9):
+            db.session.add(HealthData(date=date(2023, 1, day), data_type_id=tag_type.id, metric_value=2))
+        db.session.commit()
+        
+        metrics = {metric['metric_name']: metric for metric in HealthAnalyzer().get_available_metrics()}
+        self.assertEqual(metrics['tag_mood_great']['count'], 7)
+        self.assertEqual(metrics['tag_quiet']['count'], 3)
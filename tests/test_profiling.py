@@ -0,0 +1,80 @@
+import os
+import sys
+from datetime import date, timedelta
+from unittest.mock import patch
+
+# Add the parent directory to the path to make app importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests.test_base import BaseTestCase
+from app import db
+from app.config import TestingConfig
+from app.models.base import HealthData
+from app.utils.profiling import phase, current_profile
+
+
+class ProfilingDisabledTestCase(BaseTestCase):
+    """Test case for the default, unprofiled app."""
+
+    def test_no_instrumentation_by_default(self):
+        """Test that profiling is off unless enabled."""
+        response = self.client.get('/data/api/metrics')
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertEqual(self.client.get('/debug/perf').status_code, 404)
+
+        with phase('unprofiled'):
+            self.assertIsNone(current_profile())
+
+
+class ProfilingTestCase(BaseTestCase):
+    """Test case for opt-in request profiling."""
+
+    def setUp(self):
+        with patch.multiple(TestingConfig, PROFILING=True, PROFILING_TRACE_MEMORY=True):
+            super().setUp()
+        self.profiler = self.app.extensions['profiler']
+        for i in range(10):
+            db.session.add(HealthData.create(date(2023, 1, 1) + timedelta(days=i), 'custom', 'weight', 70.0 + i, 'kg'))
+        db.session.commit()
+
+    def _metric_data(self):
+        return self.client.get('/analysis/api/metric_data?metric_name=weight&source=custom')
+
+    def test_server_timing_header(self):
+        """Test that responses report SQL, phase and memory timings."""
+        response = self._metric_data()
+        self.assertTrue(response.get_json()['success'])
+
+        timing = response.headers['Server-Timing']
+        self.assertRegex(timing, r'^total;dur=[0-9.]+')
+        self.assertRegex(timing, r'sql;dur=[0-9.]+;desc="[1-9][0-9]* queries"')
+        self.assertIn('analyzer.metric_data;dur=', timing)
+        self.assertIn('mem;desc="peak ', timing)
+
+    def test_perf_endpoint_and_slow_log(self):
+        """Test endpoint totals and the rolling, capped slow request log."""
+        self.profiler.slow_ms = 0
+        self.profiler.slow_requests = type(self.profiler.slow_requests)(maxlen=3)
+        for _ in range(4):
+            self._metric_data()
+        self.client.get('/data/api/metrics')
+
+        perf = self.client.get('/debug/perf').get_json()
+        totals = perf['endpoints']['analysis.metric_data']
+        self.assertEqual(totals['count'], 4)
+        self.assertGreater(totals['sql_count'], 0)
+        self.assertGreaterEqual(totals['max_ms'], totals['avg_ms'])
+
+        slow = perf['slow_requests']
+        self.assertEqual(len(slow), 3)
+        self.assertEqual(slow[0]['endpoint'], 'data.api_metrics')
+        self.assertIn('analyzer.metric_data', slow[1]['phases'])
+        self.assertIsNotNone(slow[1]['peak_memory_bytes'])
+
+    def test_sampling(self):
+        """Test that unsampled requests are not profiled."""
+        self.profiler.sample_rate = 0.0
+        response = self._metric_data()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertEqual(self.profiler.profiled, 0)
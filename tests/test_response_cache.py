@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+from datetime import date, timedelta
+from unittest.mock import patch
+
+# Add the parent directory to the path to make app importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests.test_base import BaseTestCase
+from tests.test_oura_api import MockOuraResponse, MockStreamingOuraResponse
+from app.utils.oura_importer import OuraImporter
+from app.utils.response_cache import ResponseCache
+
+
+class ResponseCacheTestCase(BaseTestCase):
+    """Test case for the on-disk Oura API response cache."""
+    
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.app.config.update(OURA_RESPONSE_CACHE=True, OURA_CACHE_DIR=self.cache_dir)
+        self.payload = {"data": [{"day": "2023-01-01", "stress_high": 120, "recovery_high": 300}], "next_token": None}
+        self.params = {"start_date": "2023-01-01", "end_date": "2023-01-07"}
+    
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        super().tearDown()
+    
+    def _age_entry(self, cache, key, seconds):
+        """Move an entry's fetch time into the past"""
+        path = cache._path(key)
+        fetched_at = time.time() - seconds
+        os.utime(path, (fetched_at, fetched_at))
+    
+    def test_disabled_by_default(self):
+        """Test that no cache is used unless configured."""
+        self.app.config['OURA_RESPONSE_CACHE'] = False
+        self.assertIsNone(OuraImporter("token").cache)
+    
+    def test_keys(self):
+        """Test that keys depend on endpoint, params and token, but not param order."""
+        cache = ResponseCache(self.cache_dir)
+        key = cache.key("/v2/usercollection/sleep", self.params, "token")
+        
+        self.assertEqual(key, cache.key("/v2/usercollection/sleep", dict(reversed(list(self.params.items()))), "token"))
+        self.assertNotEqual(key, cache.key("/v2/usercollection/daily_sleep", self.params, "token"))
+        self.assertNotEqual(key, cache.key("/v2/usercollection/sleep", self.params, "other"))
+        self.assertNotIn("token", key)
+    
+    def test_round_trip_is_compressed(self):
+        """Test that bodies are stored gzip-compressed and read back intact."""
+        cache = ResponseCache(self.cache_dir)
+        key = cache.key("/v2/usercollection/sleep", self.params, "token")
+        body = json.dumps({"data": [{"day": "2023-01-01"}] * 200}).encode('utf-8')
+        cache.put(key, body)
+        
+        self.assertEqual(cache.read(key), body)
+        self.assertEqual(b''.join(cache.iter_chunks(key, 100)), body)
+        self.assertLess(os.path.getsize(cache._path(key)), len(body) / 4)
+    
+    def test_freshness(self):
+        """Test that settled ranges never expire and recent ones expire after the TTL."""
+        cache = ResponseCache(self.cache_dir, ttl=3600, settle_days=2)
+        settled = {"end_date": (date.today() - timedelta(days=30)).isoformat()}
+        recent = {"end_date": date.today().isoformat()}
+        settled_key = cache.key("/v2/usercollection/sleep", settled, "token")
+        recent_key = cache.key("/v2/usercollection/sleep", recent, "token")
+        
+        self.assertFalse(cache.is_fresh(settled_key, settled))
+        cache.put(settled_key, b'{}')
+        cache.put(recent_key, b'{}')
+        self.assertTrue(cache.is_fresh(recent_key, recent))
+        
+        self._age_entry(cache, settled_key, 7200)
+        self._age_entry(cache, recent_key, 7200)
+        self.assertTrue(cache.is_fresh(settled_key, settled))
+        self.assertFalse(cache.is_fresh(recent_key, recent))
+    
+    @patch('app.utils.oura_importer.requests.get')
+    def test_repeat_import_needs_no_network(self, mock_get):
+        """Test that re-importing a cached historic range makes no requests."""
+        mock_get.return_value = MockOuraResponse(json_data=self.payload)
+        first = OuraImporter("token").import_stress_data("2023-01-01", "2023-01-07")
+        self.assertEqual(mock_get.call_count, 1)
+        
+        mock_get.side_effect = AssertionError("network used")
+        second = OuraImporter("token").import_stress_data("2023-01-01", "2023-01-07")
+        self.assertEqual(second, first)
+        
+        # A different token has its own entries
+        with self.assertRaises(AssertionError):
+            OuraImporter("other").import_stress_data("2023-01-01", "2023-01-07")
+    
+    @patch('app.utils.oura_importer.requests.get')
+    def test_streamed_responses_are_cached(self, mock_get):
+        """Test that streamed bodies are cached once fully read, and served streamed."""
+        mock_get.return_value = MockStreamingOuraResponse(json_data=self.payload)
+        importer = OuraImporter("token")
+        endpoint = "/v2/usercollection/daily_stress"
+        key = importer.cache.key(endpoint, self.params, "token")
+        
+        # An abandoned download leaves nothing behind
+        records = importer._get_data(endpoint, self.params, stream=True)['data']
+        next(iter(records), None)
+        records.close()
+        self.assertFalse(importer.cache.is_fresh(key, self.params))
+        self.assertEqual(os.listdir(os.path.dirname(importer.cache._path(key))), [])
+        
+        self.assertEqual(list(importer._get_data(endpoint, self.params, stream=True)['data']), self.payload['data'])
+        self.assertTrue(importer.cache.is_fresh(key, self.params))
+        
+        mock_get.reset_mock()
+        self.assertEqual(list(importer._get_data(endpoint, self.params, stream=True)['data']), self.payload['data'])
+        self.assertEqual(importer._get_data(endpoint, self.params), self.payload)
+        mock_get.assert_not_called()
+
+
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
@@ -281,6 +281,21 @@ class RouteTestCase(BaseTestCase):
         self.assertIsNotNone(protein_data)
         self.assertEqual(protein_data.metric_value, 100)
     
+    def test_oura_csv_import_rejected(self):
+        """Test that an Oura CSV upload is turned away rather than failing."""
+        from io import BytesIO
+        
+        response = self.client.post(
+            '/data/import',
+            data={'data_source': 'oura_csv', 'file': (BytesIO(b'date,score\n2023-03-01,80\n'), 'oura.csv')},
+            content_type='multipart/form-data',
+            follow_redirects=True
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Oura CSV files cannot be imported', response.data)
+        self.assertEqual(HealthData.query.count(), 0)
+    
     def test_data_date_view(self):
         """Test the date view route with sample data."""
         self._clear_test_data()  # Ensure clean state
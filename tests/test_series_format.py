@@ -0,0 +1,89 @@
+import unittest
+import json
+import struct
+import sys
+import os
+
+import numpy as np
+
+# Add the parent directory to the path to make app importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.series_format import BINARY_MAGIC, encode_columnar, encode_binary
+
+
+def decode_binary(body):
+    """Read an encode_binary body back the way a browser client would"""
+    assert body[:4] == BINARY_MAGIC
+    (length,) = struct.unpack('<I', body[4:8])
+    header = json.loads(body[8:8 + length])
+    base = 8 + length
+    arrays = [np.frombuffer(body, dtype=spec['dtype'], count=spec['length'], offset=base + spec['offset'])
+              for spec in header.pop('$arrays')]
+
+    def restore(value):
+        if isinstance(value, dict):
+            if '$array' in value:
+                return arrays[value['$array']]
+            return {key: restore(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [restore(item) for item in value]
+        return value
+    return restore(header)
+
+
+class SeriesFormatTestCase(unittest.TestCase):
+    """Test cases for the columnar and binary series formats"""
+
+    def setUp(self):
+        self.dates = np.array(['2024-02-27', '2024-02-28', '2024-03-04'], dtype='datetime64[D]')
+        self.values = np.array([61.5, np.nan, 0.1])
+
+    def test_columnar_encoding(self):
+        """Test that dates become a start date and day deltas, and NaN becomes null."""
+        encoded = encode_columnar({'units': 'kg', 'data': [{'dates': self.dates, 'values': self.values,
+                                                           'counts': np.array([1, 2, 7])}]})
+
+        self.assertEqual(encoded, {'units': 'kg', 'data': [{
+            'dates': {'start': '2024-02-27', 'deltas': [0, 1, 5]},
+            'values': [61.5, None, 0.1],
+            'counts': [1, 2, 7]
+        }]})
+        empty = encode_columnar({'dates': self.dates[:0]})
+        self.assertEqual(empty, {'dates': {'start': None, 'deltas': []}})
+
+    def test_binary_round_trip(self):
+        """Test that binary arrays are aligned, typed and decode to the original values."""
+        payload = {'units': 'kg', 'series': {'a': {'dates': self.dates, 'values': self.values,
+                                                  'counts': np.array([1, 2, 7])}}}
+
+        for float_dtype, name in (('<f8', 'float64'), ('<f4', 'float32')):
+            body = encode_binary(payload, float_dtype)
+            decoded = decode_binary(body)
+            self.assertEqual(decoded['units'], 'kg')
+            series = decoded['series']['a']
+            self.assertEqual(series['values'].dtype.name, name)
+            np.testing.assert_allclose(series['values'], self.values, rtol=1e-6)
+            self.assertEqual(series['dates'].dtype.name, 'int32')
+            np.testing.assert_array_equal(series['dates'].astype('datetime64[D]'), self.dates)
+            np.testing.assert_array_equal(series['counts'], [1, 2, 7])
+
+            # Every array must start on an 8-byte boundary to be viewed as a typed array in place
+            (length,) = struct.unpack('<I', body[4:8])
+            self.assertEqual((8 + length) % 8, 0)
+            offsets = [a['offset'] for a in json.loads(body[8:8 + length])['$arrays']]
+            self.assertTrue(all(offset % 8 == 0 for offset in offsets))
+
+    def test_binary_is_smaller_than_point_json(self):
+        """Test that a long float32 series packs into about 8 bytes per point."""
+        dates = np.arange('2015-01-01', '2025-01-01', dtype='datetime64[D]')
+        values = np.random.default_rng(0).normal(70, 5, len(dates))
+        points = json.dumps([{'date': str(d), 'value': v} for d, v in zip(dates, values.tolist())])
+
+        body = encode_binary({'dates': dates, 'values': values}, '<f4')
+        self.assertLess(len(body), len(dates) * 8 + 256)
+        self.assertLess(len(body) * 5, len(points))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import sys
+import os
+import io
+import gzip
+import zipfile
+
+# Add the parent directory to the path to make app importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.uploads import open_upload
+
+
+class TrickleStream(io.RawIOBase):
+    """Unseekable stream returning at most a few bytes per read, like a slow socket"""
+    
+    def __init__(self, data, step=3):
+        self._data = data
+        self._step = step
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        n = min(len(buffer), self._step, len(self._data))
+        buffer[:n] = self._data[:n]
+        self._data = self._data[n:]
+        return n
+
+
+class OpenUploadTestCase(unittest.TestCase):
+    """Test case for reading CSV uploads from plain and compressed streams."""
+    
+    def setUp(self):
+        self.csv = b"Day,Energy (kcal)\n2023-01-01,2000\n2023-01-02,1800\n"
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('notes/readme.txt', 'not data')
+            zf.writestr('export.csv', self.csv)
+        self.bodies = {
+            'plain': self.csv,
+            'gzip': gzip.compress(self.csv),
+            'zip': archive.getvalue()
+        }
+    
+    def test_seekable_streams(self):
+        """Test that each format is detected from its content."""
+        for kind, body in self.bodies.items():
+            with self.subTest(kind=kind):
+                with open_upload(io.BytesIO(body), 'upload.bin') as f:
+                    self.assertEqual(f.read(), self.csv)
+    
+    def test_unseekable_streams(self):
+        """Test streams that cannot be rewound and return short reads."""
+        for kind, body in self.bodies.items():
+            with self.subTest(kind=kind):
+                with open_upload(TrickleStream(body)) as f:
+                    self.assertEqual(f.read(), self.csv)
+    
+    def test_zip_without_single_csv(self):
+        """Test that zip archives must hold exactly one CSV file."""
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('readme.txt', 'not data')
+        
+        with self.assertRaises(ValueError):
+            open_upload(io.BytesIO(archive.getvalue()), 'export.zip')
+    
+    def test_empty_stream(self):
+        """Test that an empty upload reads as empty."""
+        self.assertEqual(open_upload(io.BytesIO(b'')).read(), b'')
+
+
+if __name__ == '__main__':
+    unittest.main()
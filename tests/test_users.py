@@ -0,0 +1,172 @@
+import os
+import sys
+from datetime import date, timedelta
+
+from flask import g
+
+# Add the parent directory to the path to make app importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests.test_base import BaseTestCase
+from app import db
+from app.models.base import HealthData, DataType, User, DEFAULT_USER_ID, data_version
+from app.utils.analyzer import HealthAnalyzer
+
+
+class UserPartitioningTestCase(BaseTestCase):
+    """Test case for partitioning data by user."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.get_or_create('alice')
+        self.alice.set_password('alice-password')
+        db.session.commit()
+        for user_id, weight in [(DEFAULT_USER_ID, 70.0), (self.alice.id, 55.0)]:
+            g.user_id = user_id
+            for i in range(3):
+                db.session.add(HealthData.create(date(2023, 1, 1) + timedelta(days=i), 'custom', 'weight',
+                                                 weight + i, 'kg'))
+            db.session.commit()
+        g.user_id = None
+
+    def _switch(self, username, password=None):
+        password = password if password is not None else f'{username}-password'
+        response = self.client.post('/user', data={'username': username, 'password': password})
+        self.assertEqual(response.status_code, 302)
+
+    def _session_user(self):
+        with self.client.session_transaction() as session:
+            return session.get('user_id')
+
+    def test_default_user_exists(self):
+        """Test that the default user is created with the tables."""
+        self.assertEqual(db.session.get(User, DEFAULT_USER_ID).username, 'default')
+
+    def test_rows_are_owned_and_scoped(self):
+        """Test that each user sees only their own data types and data points."""
+        self.assertEqual(DataType.query.count(), 1)
+        self.assertEqual([hd.metric_value for hd in HealthData.query.order_by(HealthData.date)],
+                         [70.0, 71.0, 72.0])
+
+        g.user_id = self.alice.id
+        self.assertEqual(DataType.query.one().user_id, self.alice.id)
+        self.assertEqual({hd.user_id for hd in HealthData.query}, {self.alice.id})
+        HealthData.query.filter(HealthData.date == date(2023, 1, 1)).delete()
+        db.session.commit()
+        self.assertEqual(HealthData.query.count(), 2)
+
+        g.user_id = None
+        self.assertEqual(HealthData.query.count(), 3)
+        all_rows = db.session.query(HealthData).execution_options(all_users=True).count()
+        self.assertEqual(all_rows, 5)
+
+    def test_analyzer_scoping_and_caches(self):
+        """Test that analyzers read and cache one user's data."""
+        default_df = HealthAnalyzer().get_metric_dataframe()
+        alice_df = HealthAnalyzer(user_id=self.alice.id).get_metric_dataframe()
+        self.assertEqual(default_df['custom:weight'].tolist(), [70.0, 71.0, 72.0])
+        self.assertEqual(alice_df['custom:weight'].tolist(), [55.0, 56.0, 57.0])
+
+        points = HealthAnalyzer(user_id=self.alice.id).get_metric_data('weight', 'custom', limit=1)
+        self.assertEqual([p.metric_value for p in points], [57.0])
+
+        caches = self.app.extensions['health_analyzer_frames']
+        self.assertEqual(set(caches), {DEFAULT_USER_ID, self.alice.id})
+
+        # Another user's edit leaves the default user's cached frame in place
+        frame = caches[DEFAULT_USER_ID][(None, None)]['frame']
+        g.user_id = self.alice.id
+        HealthData.query.filter(HealthData.date == date(2023, 1, 3)).one().metric_value = 60.0
+        db.session.commit()
+        g.user_id = None
+        HealthAnalyzer().get_metric_dataframe()
+        self.assertIs(caches[DEFAULT_USER_ID][(None, None)]['frame'], frame)
+        self.assertEqual(HealthAnalyzer(user_id=self.alice.id).get_metric_dataframe()['custom:weight'].iloc[-1], 60.0)
+
+    def test_data_version_bumped_per_user(self):
+        """Test that inserts, edits and bulk deletes bump only the owner's data version."""
+        default_version, alice_version = data_version(DEFAULT_USER_ID), data_version(self.alice.id)
+
+        HealthData.query.filter(HealthData.date == date(2023, 1, 1)).one().metric_value = 80.0
+        db.session.commit()
+        self.assertEqual(data_version(DEFAULT_USER_ID), default_version + 1)
+
+        g.user_id = self.alice.id
+        HealthData.query.filter(HealthData.date == date(2023, 1, 2)).delete()
+        db.session.add(HealthData.create(date(2023, 1, 9), 'custom', 'weight', 58.0, 'kg'))
+        db.session.commit()
+        g.user_id = None
+        self.assertEqual(data_version(self.alice.id), alice_version + 2)
+        self.assertEqual(data_version(DEFAULT_USER_ID), default_version + 1)
+
+    def test_switch_user_route(self):
+        """Test that switching users in the session scopes requests to that user."""
+        response = self.client.get('/analysis/api/metric_data?metric_name=weight&source=custom')
+        self.assertEqual([d['value'] for d in response.get_json()['data']], [70.0, 71.0, 72.0])
+
+        self._switch('alice')
+        response = self.client.get('/analysis/api/metric_data?metric_name=weight&source=custom')
+        self.assertEqual([d['value'] for d in response.get_json()['data']], [55.0, 56.0, 57.0])
+
+        self._switch('bob')
+        bob = User.query.filter_by(username='bob').one()
+        self.assertTrue(bob.check_password('bob-password'))
+        self.assertEqual(self.client.get('/data/api/metrics').get_json(), [])
+
+    def test_switch_user_requires_password(self):
+        """Test that signing in as another user needs that user's password."""
+        self._switch('alice', 'wrong')
+        self.assertIsNone(self._session_user())
+
+        # Users created without a password cannot be signed in to until one is set
+        carol = User.get_or_create('carol')
+        self._switch('carol', '')
+        self.assertIsNone(self._session_user())
+        self.assertIsNone(carol.password_hash)
+
+        # Nor can a new user be registered without one
+        self._switch('dave', '')
+        self.assertIsNone(User.query.filter_by(username='dave').first())
+
+        self._switch('alice')
+        self.assertEqual(self._session_user(), self.alice.id)
+
+        # The default user, whom visitors see without signing in, needs no password
+        self._switch('default', '')
+        self.assertEqual(self._session_user(), DEFAULT_USER_ID)
+
+    def test_set_password_command(self):
+        """Test that the set-password command lets a user sign in."""
+        User.get_or_create('carol')
+        result = self.app.test_cli_runner().invoke(args=['set-password', 'carol', '--password', 'secret'])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        self._switch('carol', 'secret')
+        self.assertEqual(self._session_user(), User.query.filter_by(username='carol').one().id)
+
+    def test_oura_token_kept_per_user(self):
+        """Test that a submitted Oura token is stored with the current user."""
+        self._switch('alice')
+        self.client.post('/data/connect/oura', data={'personal_token': 'alice-token'})
+        self.assertEqual(db.session.get(User, self.alice.id).oura_token, 'alice-token')
+        self.assertIsNone(db.session.get(User, DEFAULT_USER_ID).oura_token)
+
+        # Switching users drops the previous user's token from the session
+        self._switch('bob')
+        with self.client.session_transaction() as session:
+            self.assertNotIn('oura_personal_token', session)
+
+    def test_default_user_token_stays_in_session(self):
+        """Test that visitors who have not signed in neither store nor read a saved Oura token."""
+        self.client.post('/data/connect/oura', data={'personal_token': 'visitor-token'})
+        self.assertIsNone(db.session.get(User, DEFAULT_USER_ID).oura_token)
+        with self.client.session_transaction() as session:
+            self.assertEqual(session['oura_personal_token'], 'visitor-token')
+
+        # A token saved on the default user before is not offered to another visitor
+        db.session.get(User, DEFAULT_USER_ID).oura_token = 'old-token'
+        db.session.commit()
+        other = self.app.test_client()
+        response = other.post('/data/import/oura', data={'start_date': '2023-01-01', 'end_date': '2023-01-02'},
+                              follow_redirects=True)
+        self.assertIn(b'You need to connect your Oura Ring first', response.data)